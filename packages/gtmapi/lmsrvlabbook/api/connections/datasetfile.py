@@ -14,12 +14,50 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from typing import Optional, Tuple
+import base64
 import graphene
 from lmsrvlabbook.api.objects.datasetfile import DatasetFile
 
 
 class DatasetFileConnection(graphene.relay.Connection):
-    """A connection for paging through labbook files. """
+    """A connection for paging through dataset files.
+
+    Cursors encode both the position and the key of an edge, so the next page can be read directly from the
+    manifest index starting after the key. Positional cursors (only the position) are still accepted.
+    """
     class Meta:
         node = DatasetFile
 
+    @staticmethod
+    def encode_cursor(index: int, key: str) -> str:
+        """Method to create a cursor for an edge
+
+        Args:
+            index: position of the edge
+            key: key of the edge
+
+        Returns:
+            str
+        """
+        return base64.b64encode(f"{index}|{key}".encode("UTF-8")).decode("UTF-8")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[int, Optional[str]]:
+        """Method to parse a cursor into its position and key (None for positional cursors)
+
+        Args:
+            cursor: a cursor created by `encode_cursor()` or a positional cursor
+
+        Returns:
+            tuple
+        """
+        try:
+            value = base64.b64decode(cursor).decode("UTF-8")
+            if "|" in value:
+                index, key = value.split("|", 1)
+                return int(index), key
+            return int(value), None
+        except ValueError:
+            raise ValueError("`after` cursor is invalid")
+
@@ -1,7 +1,7 @@
 from typing import List, Optional
 import graphene
-import base64
 import math
+import time
 import flask
 from gtmcore.activity import ActivityStore
 
@@ -11,6 +11,8 @@ from lmsrvcore.api.interfaces import GitRepository
 from lmsrvcore.utilities import configure_git_credentials
 
 from gtmcore.dataset.manifest import Manifest
+from gtmcore.dataset.manifest.scrubber import IntegrityScrubber
+from gtmcore.dispatcher import Dispatcher, dataset_jobs
 from gtmcore.workflows.gitlab import GitLabManager, ProjectPermissions, GitLabException
 from gtmcore.inventory.inventory import InventoryManager
 from gtmcore.logging import LMLogger
@@ -83,6 +85,9 @@ class Dataset(graphene.ObjectType):
     # List of all files and directories within the section
     all_files = graphene.relay.ConnectionField(DatasetFileConnection)
 
+    # List of all files and directories within a directory, given a relative root directory
+    files = graphene.relay.ConnectionField(DatasetFileConnection, root_dir=graphene.String())
+
     # Access a detail record directly, which is useful when fetching detail items
     detail_record = graphene.Field(ActivityDetailObject, key=graphene.String())
     detail_records = graphene.List(ActivityDetailObject, keys=graphene.List(graphene.String))
@@ -366,18 +371,22 @@ class Dataset(graphene.ObjectType):
         return info.context.dataset_loader.load(f"{get_logged_in_username()}&{self.owner}&{self.name}").then(
             lambda dataset: DatasetType(id=dataset.storage_type, storage_type=dataset.storage_type))
 
-    def helper_resolve_all_files(self, dataset, kwargs):
-        """Helper method to populate the DatasetFileConnection"""
+    def helper_resolve_files(self, dataset, kwargs, prefix=None):
+        """Helper method to populate the DatasetFileConnection, reading only the requested page from the manifest"""
         manifest = Manifest(dataset, get_logged_in_username())
 
-        if "after" in kwargs:
-            after_index = int(base64.b64decode(kwargs["after"]))
+        if kwargs.get("after"):
+            after_index, after_key = DatasetFileConnection.decode_cursor(kwargs["after"])
+            start_index = after_index + 1
         else:
-            after_index = 0
+            after_index, after_key = None, None
+            start_index = 0
 
-        # Generate naive cursors
-        edges, indexes = manifest.list(first=kwargs.get("first"), after_index=after_index)
-        cursors = [base64.b64encode("{}".format(x).encode("UTF-8")).decode("UTF-8") for x in indexes]
+        # Positions count the files listed, which don't include the `prefix` directory itself
+        edges, has_next_page = manifest.list_page(first=kwargs.get("first"), after=after_key,
+                                                  after_index=after_index, prefix=prefix)
+        cursors = [DatasetFileConnection.encode_cursor(start_index + cnt, edge['key'])
+                   for cnt, edge in enumerate(edges)]
 
         edge_objs = []
         for edge, cursor in zip(edges, cursors):
@@ -388,18 +397,14 @@ class Dataset(graphene.ObjectType):
             edge_objs.append(DatasetFileConnection.Edge(node=DatasetFile(**create_data), cursor=cursor))
 
         has_previous_page = False
-        has_next_page = len(edges) > 0
         start_cursor = None
         end_cursor = None
         if cursors:
             start_cursor = cursors[0]
             end_cursor = cursors[-1]
-            if indexes[-1] == len(manifest.manifest) - 1:
-                has_next_page = False
 
-        if kwargs.get("after"):
-            if int(base64.b64decode(kwargs["after"])) > 0:
-                has_previous_page = True
+        if after_index is not None and after_index > 0:
+            has_previous_page = True
 
         page_info = graphene.relay.PageInfo(has_next_page=has_next_page, has_previous_page=has_previous_page,
                                             start_cursor=start_cursor, end_cursor=end_cursor)
@@ -409,7 +414,17 @@ class Dataset(graphene.ObjectType):
     def resolve_all_files(self, info, **kwargs):
         """Resolver for getting all files in a Dataset"""
         return info.context.dataset_loader.load(f"{get_logged_in_username()}&{self.owner}&{self.name}").then(
-            lambda dataset: self.helper_resolve_all_files(dataset, kwargs))
+            lambda dataset: self.helper_resolve_files(dataset, kwargs))
+
+    def resolve_files(self, info, **kwargs):
+        """Resolver for getting all files within a directory of a Dataset"""
+        prefix = None
+        if kwargs.get('root_dir'):
+            prefix = kwargs['root_dir'] + '/'
+            prefix = prefix.replace('//', '/')
+
+        return info.context.dataset_loader.load(f"{get_logged_in_username()}&{self.owner}&{self.name}").then(
+            lambda dataset: self.helper_resolve_files(dataset, kwargs, prefix=prefix))
 
     @staticmethod
     def helper_resolve_visibility(dataset, info):
@@ -496,10 +511,40 @@ class Dataset(graphene.ObjectType):
         return info.context.dataset_loader.load(f"{get_logged_in_username()}&{self.owner}&{self.name}").then(
             lambda dataset: self.helper_resolve_backend_configuration(dataset))
 
+    def helper_resolve_content_hash_mismatches(self, dataset):
+        """Helper to get the files that did not match the manifest in the latest integrity scrub of the dataset's
+        cache. If the results are out of date, a scrub job is dispatched to update them in the background
+
+        Files of unmanaged datasets live in the user's own directory and can change at any time, so they are checked
+        by the backend instead of the scrubber"""
+        if not dataset.is_managed():
+            return dataset.backend.verify_contents(dataset, logger.info)
+
+        username = get_logged_in_username()
+        scrubber = IntegrityScrubber.from_config(Manifest(dataset, username))
+        try:
+            if scrubber.needs_scrub() and scrubber.state.try_claim(time.time()):
+                try:
+                    job_key = Dispatcher().dispatch_task(dataset_jobs.scrub_dataset_cache,
+                                                         kwargs={'logged_in_username': username,
+                                                                 'dataset_owner': self.owner,
+                                                                 'dataset_name': self.name},
+                                                         metadata={'dataset': f"{username}|{self.owner}|{self.name}",
+                                                                   'method': 'scrub_dataset_cache'})
+                    logger.info(f"Dispatched scrub_dataset_cache({self.owner}/{self.name}) to Job {job_key}")
+                except Exception:
+                    scrubber.state.release_claim()
+                    raise
+
+            return scrubber.mismatches()
+        finally:
+            scrubber.close()
+
     def resolve_content_hash_mismatches(self, info):
-        """Field to look up any content hash mismatches. Note this can be slow for big datasets!"""
+        """Field to look up any content hash mismatches. For managed datasets this is from the latest background
+        integrity scrub, so use the VerifyDataset mutation to check every file immediately"""
         return info.context.dataset_loader.load(f"{get_logged_in_username()}&{self.owner}&{self.name}").then(
-            lambda dataset: dataset.backend.verify_contents(dataset, logger.info))
+            lambda dataset: self.helper_resolve_content_hash_mismatches(dataset))
 
     def helper_resolve_commits_ahead_behind(self, dataset) -> None:
         """Helper to get the commits ahead and behind for a dataset. This is done together so only 1 fetch will
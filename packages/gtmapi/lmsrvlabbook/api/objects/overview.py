@@ -2,8 +2,6 @@ import base64
 import graphene
 import os
 import glob
-from collections import OrderedDict
-from operator import itemgetter
 from typing import List
 
 from gtmcore.logging import LMLogger
@@ -186,58 +184,23 @@ class DatasetOverview(graphene.ObjectType):
     readme = graphene.String()
 
     def _get_dataset_file_info(self, dataset) -> dict:
-        """helper method to iterate over the manifest and get file info for the overview page
+        """helper method to get file info for the overview page from the statistics maintained by the manifest
 
         Returns:
             None
         """
         m = Manifest(dataset, get_logged_in_username())
-
-        count = 0
-        total_bytes = 0
-        file_type_distribution: OrderedDict = OrderedDict()
-        for key in m.manifest:
-            item = m.manifest[key]
-            if key[-1] == '/':
-                # Skip directories
-                continue
-
-            filename = os.path.basename(key)
-            if filename[0] == '.':
-                # Skip hidden files
-                continue
-
-            if '.' not in filename:
-                # Skip files without an extension
-                continue
-
-            # Count file type distribution
-            _, ext = os.path.splitext(filename)
-            if ext:
-                file_type = ext
-                if file_type in file_type_distribution:
-                    file_type_distribution[file_type] += 1
-                else:
-                    file_type_distribution[file_type] = 1
-
-            # Count total file size
-            total_bytes += int(item['b'])
-
-            # Count files
-            count += 1
+        stats = m.statistics()
 
         # Format the output for file type distribution
         formatted_file_type_info: List[str] = list()
-        file_type_distribution = OrderedDict(sorted(file_type_distribution.items(),
-                                                    key=itemgetter(1),
-                                                    reverse=True))
-        for file_type in file_type_distribution:
-            percentage = float(file_type_distribution[file_type]) / float(count)
+        for file_type, num_files in stats.file_type_distribution:
+            percentage = float(num_files) / float(stats.num_files)
             formatted_file_type_info.append(f"{percentage:.2f}|{file_type}")
 
-        self._dataset_file_info = {'num_files': count,
-                                   'total_bytes': total_bytes,
-                                   'local_bytes': count,
+        self._dataset_file_info = {'num_files': stats.num_files,
+                                   'total_bytes': stats.total_bytes,
+                                   'local_bytes': stats.local_bytes,
                                    'file_type_distribution': formatted_file_type_info
                                    }
 
@@ -285,25 +248,13 @@ class DatasetOverview(graphene.ObjectType):
 
         return self._dataset_file_info['file_type_distribution']
 
-    @staticmethod
-    def _helper_local_bytes(dataset):
-        """Helper to compute total size of a dataset on disk"""
-        m = Manifest(dataset, get_logged_in_username())
-        total_size = 0
-
-        for dirpath, dirnames, filenames in os.walk(m.current_revision_dir):
-            for f in filenames:
-                if f == '.smarthash':
-                    continue
-                fp = os.path.join(dirpath, f)
-                total_size += os.path.getsize(fp)
-
-        return total_size
-
     def resolve_local_bytes(self, info):
-        """Resolver for getting total bytes of files in the dataset"""
-        return info.context.dataset_loader.load(f"{get_logged_in_username()}&{self.owner}&{self.name}").then(
-            lambda dataset: self._helper_local_bytes(dataset))
+        """Resolver for getting total bytes of files in the dataset that are available locally"""
+        if self._dataset_file_info is None:
+            return info.context.dataset_loader.load(f"{get_logged_in_username()}&{self.owner}&{self.name}").then(
+                lambda dataset: self._get_dataset_file_info(dataset)['local_bytes'])
+
+        return self._dataset_file_info['local_bytes']
 
     def resolve_readme(self, info):
         """Resolve the readme document inside the dataset"""
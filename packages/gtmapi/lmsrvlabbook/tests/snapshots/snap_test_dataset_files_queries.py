@@ -13,7 +13,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 1'] = {
             'allFiles': {
                 'edges': [
                     {
-                        'cursor': 'MA==',
+                        'cursor': 'MHxvdGhlcl9kaXIv',
                         'node': {
                             'isDir': True,
                             'isLocal': True,
@@ -22,7 +22,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 1'] = {
                         }
                     },
                     {
-                        'cursor': 'MQ==',
+                        'cursor': 'MXxvdGhlcl9kaXIvdGVzdDQudHh0',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -31,7 +31,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 1'] = {
                         }
                     },
                     {
-                        'cursor': 'Mg==',
+                        'cursor': 'MnxvdGhlcl9kaXIvdGVzdDUudHh0',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -40,7 +40,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 1'] = {
                         }
                     },
                     {
-                        'cursor': 'Mw==',
+                        'cursor': 'M3x0ZXN0MS50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -49,7 +49,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 1'] = {
                         }
                     },
                     {
-                        'cursor': 'NA==',
+                        'cursor': 'NHx0ZXN0Mi50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -58,7 +58,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 1'] = {
                         }
                     },
                     {
-                        'cursor': 'NQ==',
+                        'cursor': 'NXx0ZXN0My50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -68,7 +68,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 1'] = {
                     }
                 ],
                 'pageInfo': {
-                    'endCursor': 'NQ==',
+                    'endCursor': 'NXx0ZXN0My50eHQ=',
                     'hasNextPage': False,
                     'hasPreviousPage': False
                 }
@@ -86,7 +86,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 2'] = {
             'allFiles': {
                 'edges': [
                     {
-                        'cursor': 'MA==',
+                        'cursor': 'MHxvdGhlcl9kaXIv',
                         'node': {
                             'isDir': True,
                             'isLocal': True,
@@ -95,7 +95,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 2'] = {
                         }
                     },
                     {
-                        'cursor': 'MQ==',
+                        'cursor': 'MXxvdGhlcl9kaXIvdGVzdDQudHh0',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -105,7 +105,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 2'] = {
                     }
                 ],
                 'pageInfo': {
-                    'endCursor': 'MQ==',
+                    'endCursor': 'MXxvdGhlcl9kaXIvdGVzdDQudHh0',
                     'hasNextPage': True,
                     'hasPreviousPage': False
                 }
@@ -123,7 +123,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 3'] = {
             'allFiles': {
                 'edges': [
                     {
-                        'cursor': 'Mg==',
+                        'cursor': 'MnxvdGhlcl9kaXIvdGVzdDUudHh0',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -133,7 +133,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 3'] = {
                     }
                 ],
                 'pageInfo': {
-                    'endCursor': 'Mg==',
+                    'endCursor': 'MnxvdGhlcl9kaXIvdGVzdDUudHh0',
                     'hasNextPage': True,
                     'hasPreviousPage': True
                 }
@@ -151,7 +151,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 4'] = {
             'allFiles': {
                 'edges': [
                     {
-                        'cursor': 'Mg==',
+                        'cursor': 'MnxvdGhlcl9kaXIvdGVzdDUudHh0',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -160,7 +160,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 4'] = {
                         }
                     },
                     {
-                        'cursor': 'Mw==',
+                        'cursor': 'M3x0ZXN0MS50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -169,7 +169,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 4'] = {
                         }
                     },
                     {
-                        'cursor': 'NA==',
+                        'cursor': 'NHx0ZXN0Mi50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -178,7 +178,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 4'] = {
                         }
                     },
                     {
-                        'cursor': 'NQ==',
+                        'cursor': 'NXx0ZXN0My50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -188,7 +188,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files 4'] = {
                     }
                 ],
                 'pageInfo': {
-                    'endCursor': 'NQ==',
+                    'endCursor': 'NXx0ZXN0My50eHQ=',
                     'hasNextPage': False,
                     'hasPreviousPage': True
                 }
@@ -206,7 +206,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 1'] = {
             'allFiles': {
                 'edges': [
                     {
-                        'cursor': 'MA==',
+                        'cursor': 'MHxvdGhlcl9kaXIv',
                         'node': {
                             'isDir': True,
                             'isLocal': True,
@@ -215,7 +215,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 1'] = {
                         }
                     },
                     {
-                        'cursor': 'MQ==',
+                        'cursor': 'MXxvdGhlcl9kaXIvdGVzdDQudHh0',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -224,7 +224,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 1'] = {
                         }
                     },
                     {
-                        'cursor': 'Mg==',
+                        'cursor': 'MnxvdGhlcl9kaXIvdGVzdDUudHh0',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -233,7 +233,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 1'] = {
                         }
                     },
                     {
-                        'cursor': 'Mw==',
+                        'cursor': 'M3x0ZXN0MS50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -242,7 +242,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 1'] = {
                         }
                     },
                     {
-                        'cursor': 'NA==',
+                        'cursor': 'NHx0ZXN0Mi50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -251,7 +251,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 1'] = {
                         }
                     },
                     {
-                        'cursor': 'NQ==',
+                        'cursor': 'NXx0ZXN0My50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -261,7 +261,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 1'] = {
                     }
                 ],
                 'pageInfo': {
-                    'endCursor': 'NQ==',
+                    'endCursor': 'NXx0ZXN0My50eHQ=',
                     'hasNextPage': False,
                     'hasPreviousPage': False
                 }
@@ -279,7 +279,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 2'] = {
             'allFiles': {
                 'edges': [
                     {
-                        'cursor': 'MA==',
+                        'cursor': 'MHxvdGhlcl9kaXIv',
                         'node': {
                             'isDir': True,
                             'isLocal': True,
@@ -288,7 +288,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 2'] = {
                         }
                     },
                     {
-                        'cursor': 'MQ==',
+                        'cursor': 'MXxvdGhlcl9kaXIvdGVzdDQudHh0',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -297,7 +297,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 2'] = {
                         }
                     },
                     {
-                        'cursor': 'Mg==',
+                        'cursor': 'MnxvdGhlcl9kaXIvdGVzdDUudHh0',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -306,7 +306,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 2'] = {
                         }
                     },
                     {
-                        'cursor': 'Mw==',
+                        'cursor': 'M3x0ZXN0MS50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': False,
@@ -315,7 +315,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 2'] = {
                         }
                     },
                     {
-                        'cursor': 'NA==',
+                        'cursor': 'NHx0ZXN0Mi50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': False,
@@ -324,7 +324,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 2'] = {
                         }
                     },
                     {
-                        'cursor': 'NQ==',
+                        'cursor': 'NXx0ZXN0My50eHQ=',
                         'node': {
                             'isDir': False,
                             'isLocal': True,
@@ -334,7 +334,7 @@ snapshots['TestDatasetFilesQueries.test_get_dataset_files_missing 2'] = {
                     }
                 ],
                 'pageInfo': {
-                    'endCursor': 'NQ==',
+                    'endCursor': 'NXx0ZXN0My50eHQ=',
                     'hasNextPage': False,
                     'hasPreviousPage': False
                 }
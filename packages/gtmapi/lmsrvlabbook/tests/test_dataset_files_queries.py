@@ -199,3 +199,66 @@ class TestDatasetFilesQueries(object):
         r = fixture_single_dataset[2].execute(query)
         assert 'errors' not in r
         snapshot.assert_match(r)
+
+    def test_get_dataset_files_paging(self, fixture_single_dataset):
+        query = """{
+                    dataset(name: "test-dataset", owner: "default") {
+                      allFiles(first: 2) {
+                        edges{
+                            node {
+                              key
+                            }
+                            cursor
+                        }
+                        pageInfo{
+                          hasNextPage
+                          endCursor
+                        }
+                      }
+                    }
+                    }
+                """
+        r = fixture_single_dataset[2].execute(query)
+        assert 'errors' not in r
+        keys = [e['node']['key'] for e in r['data']['dataset']['allFiles']['edges']]
+        assert keys == ['other_dir/', 'other_dir/test4.txt']
+        assert r['data']['dataset']['allFiles']['pageInfo']['hasNextPage'] is True
+
+        # Page through the rest using the returned cursors
+        while r['data']['dataset']['allFiles']['pageInfo']['hasNextPage']:
+            end_cursor = r['data']['dataset']['allFiles']['pageInfo']['endCursor']
+            r = fixture_single_dataset[2].execute(query.replace("first: 2", f'first: 2, after: "{end_cursor}"'))
+            assert 'errors' not in r
+            keys.extend([e['node']['key'] for e in r['data']['dataset']['allFiles']['edges']])
+
+        assert keys == ['other_dir/', 'other_dir/test4.txt', 'other_dir/test5.txt',
+                        'test1.txt', 'test2.txt', 'test3.txt']
+
+    def test_get_dataset_files_in_directory(self, fixture_single_dataset):
+        query = """{
+                    dataset(name: "test-dataset", owner: "default") {
+                      files(rootDir: "other_dir", first: 1) {
+                        edges{
+                            node {
+                              key
+                            }
+                            cursor
+                        }
+                        pageInfo{
+                          hasNextPage
+                          endCursor
+                        }
+                      }
+                    }
+                    }
+                """
+        r = fixture_single_dataset[2].execute(query)
+        assert 'errors' not in r
+        assert [e['node']['key'] for e in r['data']['dataset']['files']['edges']] == ['other_dir/test4.txt']
+        assert r['data']['dataset']['files']['pageInfo']['hasNextPage'] is True
+
+        end_cursor = r['data']['dataset']['files']['pageInfo']['endCursor']
+        r = fixture_single_dataset[2].execute(query.replace("first: 1", f'first: 10, after: "{end_cursor}"'))
+        assert 'errors' not in r
+        assert [e['node']['key'] for e in r['data']['dataset']['files']['edges']] == ['other_dir/test5.txt']
+        assert r['data']['dataset']['files']['pageInfo']['hasNextPage'] is False
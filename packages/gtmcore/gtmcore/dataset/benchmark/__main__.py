@@ -0,0 +1,3 @@
+from gtmcore.dataset.benchmark.runner import main
+
+main()
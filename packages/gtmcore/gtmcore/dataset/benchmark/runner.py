@@ -0,0 +1,367 @@
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+import argparse
+import math
+import os
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+
+import yaml
+
+from gtmcore.configuration import Configuration
+from gtmcore.configuration.configuration import deepupdate
+from gtmcore.dataset import Dataset
+from gtmcore.dataset.benchmark.service import StandInObjectService, StandInObjectServiceProcess
+from gtmcore.dataset.io import PushObject, PullObject
+from gtmcore.dataset.storage.gigantum import GigantumObjectStore
+from gtmcore.inventory.inventory import InventoryManager
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+# Distributions of file sizes for synthetic datasets. Each is a function of a random number generator that returns
+# the size of the next file.
+FILE_SIZE_DISTRIBUTIONS: Dict[str, Callable[[random.Random], int]] = {
+    # Many small files, between 1 KiB and 256 KiB
+    'small': lambda rng: int(math.exp(rng.uniform(math.log(1024), math.log(262144)))),
+    # Mostly small files with a long tail of large ones, between 1 KiB and 64 MiB
+    'mixed': lambda rng: min(67108864, max(1024, int(rng.lognormvariate(math.log(262144), 2.5)))),
+    # Few large files that are uploaded in multiple parts, between 32 MiB and 128 MiB
+    'large': lambda rng: rng.randint(33554432, 134217728),
+}
+
+# Size of the blocks written to synthetic files. Each block is either random or repeated text.
+SYNTHETIC_BLOCK_SIZE = 65536
+
+BenchmarkResult = NamedTuple('BenchmarkResult', [('operation', str), ('num_files', int), ('num_bytes', int),
+                                                 ('failures', int), ('seconds', float), ('cpu_seconds', float),
+                                                 ('peak_rss_bytes', int), ('num_requests', int)])
+
+
+def generate_file_sizes(distribution: str, total_bytes: int, seed: int = 0) -> List[int]:
+    """Function to draw file sizes from a distribution until they add up to at least `total_bytes`
+
+    Args:
+        distribution: name of a distribution in FILE_SIZE_DISTRIBUTIONS
+        total_bytes: total size of the files
+        seed: seed for the random number generator
+
+    Returns:
+        list of file sizes in bytes
+    """
+    if distribution not in FILE_SIZE_DISTRIBUTIONS:
+        raise ValueError(f"Unsupported file size distribution: {distribution}")
+
+    rng = random.Random(seed)
+    sizes: List[int] = list()
+    while sum(sizes) < total_bytes:
+        sizes.append(FILE_SIZE_DISTRIBUTIONS[distribution](rng))
+    return sizes
+
+
+def write_synthetic_objects(object_dir: str, sizes: List[int], compressible_fraction: float = 0.5,
+                            seed: int = 0) -> List[str]:
+    """Function to write files of the given sizes, named by the hash of their contents like objects in the cache
+
+    Args:
+        object_dir: directory to write the files to
+        sizes: size of each file
+        compressible_fraction: fraction of each file's blocks that are repeated text instead of random bytes
+        seed: seed for the random number generator
+
+    Returns:
+        list of absolute paths to the files
+    """
+    rng = random.Random(seed)
+    compressible_block = (b"gigantum benchmark data " * (SYNTHETIC_BLOCK_SIZE // 24 + 1))[:SYNTHETIC_BLOCK_SIZE]
+    os.makedirs(object_dir, exist_ok=True)
+
+    paths = list()
+    for file_num, size in enumerate(sizes):
+        tmp_path = os.path.join(object_dir, f".{file_num}.tmp")
+        hasher = blake2b()
+        with open(tmp_path, 'wb') as fh:
+            # Start each file with a unique header, so files of the same size are different objects
+            header = f"{seed}:{file_num}\n".encode()[:size]
+            fh.write(header)
+            hasher.update(header)
+
+            remaining = size - len(header)
+            while remaining > 0:
+                num_bytes = min(SYNTHETIC_BLOCK_SIZE, remaining)
+                if rng.random() < compressible_fraction:
+                    block = compressible_block[:num_bytes]
+                else:
+                    block = os.urandom(num_bytes)
+                fh.write(block)
+                hasher.update(block)
+                remaining -= num_bytes
+
+        path = os.path.join(object_dir, hasher.hexdigest())
+        os.replace(tmp_path, path)
+        paths.append(path)
+
+    return paths
+
+
+class _MemorySampler(object):
+    """Class to sample the resident set size of the current process in a background thread, to find the peak during
+    an operation. Falls back to the peak for the whole process if /proc is not available
+    """
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.peak_rss_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _current_rss() -> Optional[int]:
+        try:
+            with open('/proc/self/statm', 'rt') as sf:
+                return int(sf.read().split()[1]) * resource.getpagesize()
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            rss = self._current_rss()
+            if rss is None:
+                return
+            self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> '_MemorySampler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._stop.set()
+        self._thread.join()
+        if not self.peak_rss_bytes:
+            # ru_maxrss is in KiB on Linux
+            self.peak_rss_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_seconds() -> float:
+    """Function to get the CPU time used by this process and its finished children (e.g. compression workers)
+
+    Returns:
+        float
+    """
+    total = 0.0
+    for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]:
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+# A stand-in service running in this process or a child process
+StandInService = Union[StandInObjectService, StandInObjectServiceProcess]
+
+
+class StandInObjectStore(GigantumObjectStore):
+    """The GigantumObjectStore backend, sending requests to a stand-in object service instead of the configured object
+    service
+    """
+    def __init__(self, service: StandInService) -> None:
+        super().__init__()
+        self.service = service
+
+    def _object_service_endpoint(self, dataset: Dataset) -> str:  # type: ignore
+        return self.service.url
+
+
+def _measure(operation: str, service: StandInService, num_bytes: int,
+             fn: Callable[[], Tuple[int, int]]) -> BenchmarkResult:
+    """Function to run an operation and measure its resource use
+
+    Args:
+        operation: name of the operation
+        service: the stand-in service, to count requests
+        num_bytes: number of uncompressed bytes transferred
+        fn: function that runs the operation and returns the number of successful and failed objects
+
+    Returns:
+        BenchmarkResult
+    """
+    start_requests = service.request_count
+    start_cpu = _cpu_seconds()
+    start = time.monotonic()
+    with _MemorySampler() as sampler:
+        num_success, num_failure = fn()
+    seconds = time.monotonic() - start
+
+    return BenchmarkResult(operation=operation, num_files=num_success + num_failure, num_bytes=num_bytes,
+                           failures=num_failure, seconds=seconds, cpu_seconds=_cpu_seconds() - start_cpu,
+                           peak_rss_bytes=sampler.peak_rss_bytes,
+                           num_requests=service.request_count - start_requests)
+
+
+def run_benchmark(dataset: Dataset, service: StandInService, object_paths: List[str], work_dir: str,
+                  compression_workers: int = 1) -> List[BenchmarkResult]:
+    """Function to push objects to the stand-in service and pull them back, measuring each operation
+
+    Args:
+        dataset: dataset whose client config is used for chunk sizes and worker counts
+        service: a running stand-in service. It should not already contain the objects
+        object_paths: files to push, named by their object id
+        work_dir: directory to pull objects into
+        compression_workers: number of processes to compress objects with during the push, or 1 to compress in the
+                             transfer thread
+
+    Returns:
+        list of the BenchmarkResult for the push and the pull
+    """
+    backend = StandInObjectStore(service)
+    backend.set_default_configuration('benchmark', 'benchmark-bearer-token', 'benchmark-id-token')
+    revision = dataset.git.repo.head.commit.hexsha
+    num_bytes = sum(os.path.getsize(p) for p in object_paths)
+
+    push_objects = [PushObject(object_path=p, revision=revision, dataset_path=f"file-{i}")
+                    for i, p in enumerate(object_paths)]
+
+    def push() -> Tuple[int, int]:
+        executor = ProcessPoolExecutor(max_workers=compression_workers) if compression_workers > 1 else None
+        backend.compression_executor = executor
+        try:
+            backend.prepare_push(dataset, push_objects)
+            result = backend.push_objects(dataset, push_objects, lambda completed_bytes: None)
+        finally:
+            backend.compression_executor = None
+            if executor:
+                executor.shutdown()
+        return len(result.success), len(result.failure)
+
+    pull_dir = os.path.join(work_dir, 'pulled')
+    os.makedirs(pull_dir, exist_ok=True)
+    pull_objects = [PullObject(object_path=os.path.join(pull_dir, os.path.basename(p)), revision=revision,
+                               dataset_path=f"file-{i}")
+                    for i, p in enumerate(object_paths)]
+
+    def pull() -> Tuple[int, int]:
+        backend.prepare_pull(dataset, pull_objects)
+        result = backend.pull_objects(dataset, pull_objects, lambda completed_bytes: None)
+        return len(result.success), len(result.failure)
+
+    return [_measure('push', service, num_bytes, push),
+            _measure('pull', service, num_bytes, pull)]
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    """Function to format benchmark results as a table
+
+    Args:
+        results: list of BenchmarkResults
+
+    Returns:
+        str
+    """
+    lines = [f"{'operation':<10}{'files':>8}{'MB':>10}{'failed':>8}{'seconds':>10}{'files/s':>10}{'MB/s':>10}"
+             f"{'cpu s':>10}{'cpu %':>8}{'peak MB':>10}{'requests':>10}"]
+    for r in results:
+        seconds = max(r.seconds, 1e-9)
+        lines.append(f"{r.operation:<10}{r.num_files:>8}{r.num_bytes / 1e6:>10.1f}{r.failures:>8}{r.seconds:>10.2f}"
+                     f"{r.num_files / seconds:>10.1f}{r.num_bytes / 1e6 / seconds:>10.1f}{r.cpu_seconds:>10.2f}"
+                     f"{100 * r.cpu_seconds / seconds:>8.0f}{r.peak_rss_bytes / 1e6:>10.1f}{r.num_requests:>10}")
+    return "\n".join(lines)
+
+
+def _create_benchmark_dataset(working_dir: str, config_overrides: dict) -> Dataset:
+    """Function to create a dataset in a temporary working directory, with a copy of the client config
+
+    Args:
+        working_dir: directory to use as the working directory
+        config_overrides: values to update in the client config
+
+    Returns:
+        Dataset
+    """
+    config = Configuration().config
+    deepupdate(config, {'git': {'working_directory': working_dir}})
+    deepupdate(config, config_overrides)
+
+    config_file = os.path.join(working_dir, 'benchmark-config.yaml')
+    with open(config_file, 'wt') as cf:
+        yaml.safe_dump(config, cf)
+
+    im = InventoryManager(config_file)
+    return im.create_dataset('benchmark', 'benchmark', 'benchmark-dataset', description="Transfer benchmark",
+                             storage_type="gigantum_object_v1")
+
+
+def _parse_override(value: str) -> dict:
+    """Function to parse a config override like `datasets.backends.gigantum_object_v1.num_workers=8`
+
+    Args:
+        value: dotted key and YAML value, separated by `=`
+
+    Returns:
+        nested dict
+    """
+    if '=' not in value:
+        raise argparse.ArgumentTypeError(f"Overrides must be in the form key.path=value: {value}")
+
+    key, raw_value = value.split('=', 1)
+    result: dict = {}
+    current = result
+    parts = key.split('.')
+    for part in parts[:-1]:
+        current[part] = {}
+        current = current[part]
+    current[parts[-1]] = yaml.safe_load(raw_value)
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark pushing and pulling dataset objects against a local '
+                                                 'stand-in for the object service')
+    parser.add_argument('--distribution', choices=sorted(FILE_SIZE_DISTRIBUTIONS.keys()), action='append',
+                        help='File size distribution of the synthetic dataset. Can be repeated. Defaults to mixed')
+    parser.add_argument('--total-mb', type=float, default=256, help='Total size of each synthetic dataset in MB')
+    parser.add_argument('--compressible-fraction', type=float, default=0.5,
+                        help='Fraction of the data that is easily compressible')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to delay each request')
+    parser.add_argument('--upload-mbps', type=float, default=None, help='Upload bandwidth limit in MB/s')
+    parser.add_argument('--download-mbps', type=float, default=None, help='Download bandwidth limit in MB/s')
+    parser.add_argument('--compression-workers', type=int, default=1,
+                        help='Number of processes to compress objects with during a push')
+    parser.add_argument('--set', type=_parse_override, default=[], action='append', dest='overrides',
+                        help='Override a client config value, e.g. datasets.backends.gigantum_object_v1.num_workers=8')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for generating synthetic datasets')
+    args = parser.parse_args(argv)
+
+    distributions = args.distribution or ['mixed']
+    config_overrides: dict = {}
+    for override in args.overrides:
+        deepupdate(config_overrides, override)
+
+    working_dir = tempfile.mkdtemp(prefix='gigantum-transfer-benchmark-')
+    try:
+        dataset = _create_benchmark_dataset(working_dir, config_overrides)
+        for distribution in distributions:
+            sizes = generate_file_sizes(distribution, int(args.total_mb * 1e6), seed=args.seed)
+            run_dir = os.path.join(working_dir, distribution)
+            object_paths = write_synthetic_objects(os.path.join(run_dir, 'objects'), sizes,
+                                                   compressible_fraction=args.compressible_fraction, seed=args.seed)
+
+            upload_bandwidth = args.upload_mbps * 1e6 if args.upload_mbps else None
+            download_bandwidth = args.download_mbps * 1e6 if args.download_mbps else None
+            with StandInObjectServiceProcess(latency=args.latency, upload_bandwidth=upload_bandwidth,
+                                             download_bandwidth=download_bandwidth) as service:
+                results = run_benchmark(dataset, service, object_paths, run_dir,
+                                        compression_workers=args.compression_workers)
+
+            print(f"\n{distribution}: {len(sizes)} files, {sum(sizes) / 1e6:.1f} MB")
+            print(format_results(results))
+            shutil.rmtree(run_dir)
+    finally:
+        shutil.rmtree(working_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+from multiprocessing.connection import Connection
+from typing import Dict, Optional
+import asyncio
+import multiprocessing
+import socket
+import threading
+import time
+import uuid
+
+from aiohttp import web
+import requests
+
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+# Number of bytes read from a request or written to a response at a time
+STREAM_CHUNK_SIZE = 65536
+
+
+class SimulatedLink(object):
+    """Class to delay data as if it were sent over a link with a fixed bandwidth, shared by every request in one
+    direction. Must only be used from the service's event loop.
+    """
+    def __init__(self, bandwidth: Optional[float] = None) -> None:
+        self.bandwidth = bandwidth
+        self._next_free = 0.0
+
+    async def transfer(self, num_bytes: int) -> None:
+        """Method to wait until `num_bytes` would have been transferred
+
+        Args:
+            num_bytes: number of bytes sent or received
+
+        Returns:
+            None
+        """
+        if not self.bandwidth:
+            return
+
+        now = time.monotonic()
+        start = max(now, self._next_free)
+        self._next_free = start + num_bytes / self.bandwidth
+        await asyncio.sleep(self._next_free - now)
+
+
+class StandInObjectService(object):
+    """Class to run a local stand-in for the Gigantum object service and the presigned S3 endpoints it signs URLs for
+
+    The service runs an aiohttp server on localhost in a background thread, and stores objects in memory. It
+    implements the requests made by the GigantumObjectStore backend, including multipart uploads, the batched
+    existence check, and range requests on downloads. Every request is delayed by `latency` seconds, and object data
+    is sent and received at no more than `upload_bandwidth` and `download_bandwidth` bytes per second.
+
+    Use it as a context manager, or call `start()` and `stop()`.
+    """
+    def __init__(self, latency: float = 0.0, upload_bandwidth: Optional[float] = None,
+                 download_bandwidth: Optional[float] = None) -> None:
+        self.latency = latency
+        self.upload_link = SimulatedLink(upload_bandwidth)
+        self.download_link = SimulatedLink(download_bandwidth)
+
+        # Compressed object data by object id, and parts of multipart uploads in progress by upload id
+        self.objects: Dict[str, bytes] = dict()
+        self.multipart_uploads: Dict[str, Dict[int, bytes]] = dict()
+        self.request_count = 0
+
+        self.url = ""
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _app(self) -> web.Application:
+        """Method to create the application with every route of the object service and S3
+
+        Returns:
+            web.Application
+        """
+        @web.middleware
+        async def delay(request, handler):
+            if request.path == '/_stats':
+                return await handler(request)
+            self.request_count += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return await handler(request)
+
+        app = web.Application(middlewares=[delay])
+        app.add_routes([web.get('/_stats', self._stats),
+                        web.head('/{namespace}/{dataset}', self._check_access),
+                        web.post('/{namespace}/{dataset}/exists', self._exists),
+                        web.get('/{namespace}/{dataset}/{object_id}', self._presign_get),
+                        web.put('/{namespace}/{dataset}/{object_id}', self._presign_put),
+                        web.post('/{namespace}/{dataset}/{object_id}/multipart', self._create_multipart),
+                        web.put('/{namespace}/{dataset}/{object_id}/multipart/{upload_id}/part/{part_number}',
+                                self._presign_part),
+                        web.post('/{namespace}/{dataset}/{object_id}/multipart/{upload_id}',
+                                 self._complete_multipart),
+                        web.delete('/{namespace}/{dataset}/{object_id}/multipart/{upload_id}', self._abort_multipart),
+                        web.get('/s3/{object_id}', self._s3_get),
+                        web.put('/s3/{object_id}', self._s3_put),
+                        web.put('/s3/{object_id}/{upload_id}/{part_number}', self._s3_put_part)])
+        return app
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response({'requests': self.request_count, 'objects': len(self.objects)})
+
+    async def _check_access(self, request: web.Request) -> web.Response:
+        return web.Response(status=200, headers={'x-access-level': 'a'})
+
+    async def _exists(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        return web.json_response({'existing': [x for x in data['object_ids'] if x in self.objects]})
+
+    async def _presign_get(self, request: web.Request) -> web.Response:
+        object_id = request.match_info['object_id']
+        if object_id not in self.objects:
+            return web.json_response({'error': 'Object not found'}, status=404)
+        return web.json_response({'presigned_url': f"{self.url}/s3/{object_id}",
+                                  'namespace': request.match_info['namespace'],
+                                  'obj_id': object_id,
+                                  'dataset': request.match_info['dataset']})
+
+    async def _presign_put(self, request: web.Request) -> web.Response:
+        object_id = request.match_info['object_id']
+        if object_id in self.objects:
+            # The object already exists, so it should be skipped
+            return web.json_response({'error': 'Object exists'}, status=403)
+        return web.json_response({'presigned_url': f"{self.url}/s3/{object_id}", 'key_id': 'stand-in'})
+
+    async def _create_multipart(self, request: web.Request) -> web.Response:
+        object_id = request.match_info['object_id']
+        if object_id in self.objects:
+            return web.json_response({'error': 'Object exists'}, status=403)
+
+        upload_id = uuid.uuid4().hex
+        self.multipart_uploads[upload_id] = dict()
+        return web.json_response({'upload_id': upload_id})
+
+    async def _presign_part(self, request: web.Request) -> web.Response:
+        upload_id = request.match_info['upload_id']
+        if upload_id not in self.multipart_uploads:
+            return web.json_response({'error': 'Upload not found'}, status=404)
+        return web.json_response({'presigned_url': f"{self.url}/s3/{request.match_info['object_id']}/{upload_id}/"
+                                                   f"{request.match_info['part_number']}"})
+
+    async def _complete_multipart(self, request: web.Request) -> web.Response:
+        upload_id = request.match_info['upload_id']
+        parts = self.multipart_uploads.get(upload_id)
+        if parts is None:
+            return web.Response(status=404, text="Upload not found")
+
+        completed_parts = await request.json()
+        part_numbers = [p['PartNumber'] for p in completed_parts]
+        if part_numbers != sorted(parts.keys()):
+            return web.Response(status=400, text=f"Invalid parts: {part_numbers}")
+
+        self.objects[request.match_info['object_id']] = b''.join(parts[n] for n in part_numbers)
+        del self.multipart_uploads[upload_id]
+        return web.Response(status=200)
+
+    async def _abort_multipart(self, request: web.Request) -> web.Response:
+        self.multipart_uploads.pop(request.match_info['upload_id'], None)
+        return web.Response(status=204)
+
+    async def _read_body(self, request: web.Request) -> bytes:
+        """Method to read an upload, at the speed of the upload link
+
+        Args:
+            request: the PUT request
+
+        Returns:
+            bytes
+        """
+        data = bytearray()
+        while True:
+            chunk = await request.content.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            await self.upload_link.transfer(len(chunk))
+            data.extend(chunk)
+        return bytes(data)
+
+    async def _s3_put(self, request: web.Request) -> web.Response:
+        data = await self._read_body(request)
+        self.objects[request.match_info['object_id']] = data
+        return web.Response(status=200, headers={'Etag': f'"{uuid.uuid4().hex}"'})
+
+    async def _s3_put_part(self, request: web.Request) -> web.Response:
+        upload_id = request.match_info['upload_id']
+        if upload_id not in self.multipart_uploads:
+            return web.Response(status=404, text="Upload not found")
+
+        data = await self._read_body(request)
+        self.multipart_uploads[upload_id][int(request.match_info['part_number'])] = data
+        return web.Response(status=200, headers={'Etag': f'"{uuid.uuid4().hex}"'})
+
+    async def _s3_get(self, request: web.Request) -> web.StreamResponse:
+        data = self.objects.get(request.match_info['object_id'])
+        if data is None:
+            return web.Response(status=404, text="Object not found")
+
+        status = 200
+        start = 0
+        if request.http_range.start is not None:
+            start = request.http_range.start
+            if start >= len(data):
+                return web.Response(status=416)
+            status = 206
+
+        response = web.StreamResponse(status=status)
+        response.content_length = len(data) - start
+        response.content_type = 'application/octet-stream'
+        if status == 206:
+            response.headers['Content-Range'] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+        await response.prepare(request)
+
+        view = memoryview(data)
+        for offset in range(start, len(data), STREAM_CHUNK_SIZE):
+            chunk = view[offset:offset + STREAM_CHUNK_SIZE]
+            await self.download_link.transfer(len(chunk))
+            await response.write(bytes(chunk))
+        await response.write_eof()
+        return response
+
+    def start(self) -> None:
+        """Method to start the service in a background thread, listening on a free port on localhost
+
+        Returns:
+            None
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        self.url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+        self._loop = asyncio.new_event_loop()
+        self._runner = web.AppRunner(self._app())
+        self._loop.run_until_complete(self._runner.setup())
+        self._loop.run_until_complete(web.SockSite(self._runner, sock).start())
+
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Method to stop the service
+
+        Returns:
+            None
+        """
+        if not self._loop or not self._runner:
+            return
+
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._runner = None
+
+    def __enter__(self) -> 'StandInObjectService':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+
+def _serve(conn: Connection, service_kwargs: dict) -> None:
+    """Function to run a StandInObjectService in a child process until the parent sends a message
+
+    Args:
+        conn: connection to the parent process
+        service_kwargs: arguments for the StandInObjectService
+
+    Returns:
+        None
+    """
+    with StandInObjectService(**service_kwargs) as service:
+        conn.send(service.url)
+        conn.recv()
+
+
+class StandInObjectServiceProcess(object):
+    """Class to run a StandInObjectService in a child process, so the CPU time and memory used to serve requests are
+    not counted with the client's. Takes the same arguments as StandInObjectService.
+    """
+    def __init__(self, **service_kwargs) -> None:
+        self.service_kwargs = service_kwargs
+        self.url = ""
+        self._conn: Optional[Connection] = None
+        self._process: Optional[multiprocessing.Process] = None
+
+    @property
+    def request_count(self) -> int:
+        """Property to get the number of requests the service has handled"""
+        response = requests.get(f"{self.url}/_stats", timeout=10)
+        return response.json()['requests']
+
+    def start(self) -> None:
+        """Method to start the service process and wait until it is listening
+
+        Returns:
+            None
+        """
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(child_conn, self.service_kwargs), daemon=True)
+        self._process.start()
+        self.url = self._conn.recv()
+
+    def stop(self) -> None:
+        """Method to stop the service process
+
+        Returns:
+            None
+        """
+        if self._conn and self._process:
+            self._conn.send("stop")
+            self._process.join()
+            self._conn.close()
+        self._conn = None
+        self._process = None
+
+    def __enter__(self) -> 'StandInObjectServiceProcess':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
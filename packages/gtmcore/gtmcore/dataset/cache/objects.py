@@ -0,0 +1,328 @@
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import os
+import sqlite3
+import threading
+import time
+
+from gtmcore.dataset.cache.cache import CacheManager
+from gtmcore.dataset.manifest.chunking import is_temp_file
+from gtmcore.dataset.manifest.fasthash import FastHashStore, is_fast_hash_file
+from gtmcore.dataset.manifest.pushqueue import PushQueue
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+# Name of the SQLite database (in the cache root) used to track when each object was last accessed
+OBJECT_ACCESS_DB_FILE = ".objects.db"
+
+# Temporary files older than this (in seconds) were left by a write that was interrupted, and are removed
+STALE_TEMP_FILE_SECONDS = 86400
+
+CachedObject = namedtuple('CachedObject', ['object_id', 'object_path', 'size', 'num_links', 'inode', 'last_access'])
+EvictionResult = namedtuple('EvictionResult', ['evicted', 'bytes_freed', 'total_bytes'])
+
+
+class ObjectCacheManager(object):
+    """Class to keep the object cache of a dataset within a byte budget
+
+    Objects are stored once in `<cache_root>/objects/<level1>/<level2>/<object id>` and hard linked into each revision
+    directory. An object is considered referenced if it is linked into any revision directory (i.e. it has more than
+    one link), and its last access is recorded every time it is linked into a revision.
+
+    When the cache is over budget, unreferenced objects are evicted first, then referenced objects are evicted in least
+    recently used order, removing them from the revision directories that link them. Evicted files are no longer
+    local, so they are re-downloaded through the normal pull path when needed. Objects that still need to be pushed
+    are never evicted, and neither are objects linked from outside of the cache (e.g. a local data directory), since
+    removing them would not free any space.
+    """
+    def __init__(self, cache_mgr: CacheManager, max_bytes: Optional[int] = None) -> None:
+        """
+
+        Args:
+            cache_mgr: Cache manager for the dataset
+            max_bytes: Optional byte budget for the object cache. If omitted, the `datasets.cache_max_bytes`
+                       configuration value is used. If neither is set, the cache is unbounded.
+        """
+        self.cache_mgr = cache_mgr
+
+        if max_bytes is None:
+            max_bytes = cache_mgr.dataset.client_config.config['datasets'].get('cache_max_bytes')
+        self.max_bytes: Optional[int] = int(max_bytes) if max_bytes else None
+
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    @property
+    def object_dir(self) -> str:
+        """The location of the object directory"""
+        return os.path.join(self.cache_mgr.cache_root, 'objects')
+
+    @property
+    def access_db_file(self) -> str:
+        """The location of the object access database"""
+        return os.path.join(self.cache_mgr.cache_root, OBJECT_ACCESS_DB_FILE)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Method to get a connection to the object access database, creating it if needed
+
+        Returns:
+            sqlite3.Connection
+        """
+        if self._connection and not os.path.exists(self.access_db_file):
+            self.close()
+
+        if not self._connection:
+            self._connection = sqlite3.connect(self.access_db_file, timeout=60, check_same_thread=False)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS objects (object_id TEXT PRIMARY KEY NOT NULL, "
+                                     "last_access REAL NOT NULL)")
+            self._connection.commit()
+        return self._connection
+
+    def close(self) -> None:
+        """Method to close the underlying database connection
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+
+    def record_access(self, object_ids: Iterable[str], access_time: Optional[float] = None) -> None:
+        """Method to record that objects have been accessed (e.g. linked into a revision)
+
+        Args:
+            object_ids: ids (content hashes) of the objects that were accessed
+            access_time: Optional time of access. Defaults to now.
+
+        Returns:
+            None
+        """
+        if access_time is None:
+            access_time = time.time()
+        rows = [(object_id, access_time) for object_id in set(object_ids) if object_id]
+        if not rows:
+            return
+
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO objects (object_id, last_access) VALUES (?, ?)", rows)
+
+    def _last_access(self) -> Dict[str, float]:
+        """Method to load the recorded last access time of every object
+
+        Returns:
+            dict of object id -> last access time
+        """
+        with self._lock:
+            return {row[0]: row[1] for row in self._connect().execute("SELECT object_id, last_access FROM objects")}
+
+    def _forget(self, object_ids: Iterable[str]) -> None:
+        """Method to remove the access records of objects that are no longer in the cache
+
+        Args:
+            object_ids: ids of the objects to remove
+
+        Returns:
+            None
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("DELETE FROM objects WHERE object_id = ?", [(o,) for o in object_ids])
+
+    def _scan_object_dir(self) -> Iterator[os.DirEntry]:
+        """Generator to walk the two levels of sub-directories in the object directory, skipping the push queue,
+        partial downloads and temporary files. Stale temporary files are removed along the way.
+
+        Returns:
+            Iterator of os.DirEntry for each object file
+        """
+        if not os.path.isdir(self.object_dir):
+            return
+
+        stale_before = time.time() - STALE_TEMP_FILE_SECONDS
+
+        with os.scandir(self.object_dir) as level1_entries:
+            for level1 in level1_entries:
+                if level1.name.startswith('.') or not level1.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(level1.path) as level2_entries:
+                    for level2 in level2_entries:
+                        if not level2.is_dir(follow_symlinks=False):
+                            continue
+                        with os.scandir(level2.path) as object_entries:
+                            for entry in object_entries:
+                                if is_temp_file(entry.name):
+                                    self._remove_stale_temp_file(entry, stale_before)
+                                # Hidden files are partial downloads and temporary files
+                                elif not entry.name.startswith('.') and entry.is_file(follow_symlinks=False):
+                                    yield entry
+
+    @staticmethod
+    def _remove_stale_temp_file(entry: os.DirEntry, stale_before: float) -> None:
+        """Method to remove a temporary file if it was last modified before a time, i.e. its write was interrupted
+
+        Args:
+            entry: the temporary file
+            stale_before: time before which the file is stale
+
+        Returns:
+            None
+        """
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime < stale_before:
+                os.remove(entry.path)
+                logger.info(f"Removed stale temporary file {entry.path}")
+        except FileNotFoundError:
+            pass
+        except OSError as err:
+            logger.warning(f"Failed to remove stale temporary file {entry.path}: {err}")
+
+    def list_objects(self) -> List[CachedObject]:
+        """Method to list every object in the cache, with its size, number of links, and last access
+
+        Objects that have no recorded access (e.g. written before access was tracked) use their modification time.
+        Access records for objects that no longer exist are removed.
+
+        Returns:
+            list of CachedObject
+        """
+        last_access = self._last_access()
+
+        objects = list()
+        for entry in self._scan_object_dir():
+            try:
+                file_info = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            objects.append(CachedObject(object_id=entry.name, object_path=entry.path, size=file_info.st_size,
+                                        num_links=file_info.st_nlink, inode=file_info.st_ino,
+                                        last_access=last_access.pop(entry.name, file_info.st_mtime)))
+
+        if last_access:
+            self._forget(last_access.keys())
+
+        return objects
+
+    def total_bytes(self) -> int:
+        """Method to compute the total size of all objects in the cache
+
+        Returns:
+            int
+        """
+        return sum([obj.size for obj in self.list_objects()])
+
+    def _pinned_object_ids(self) -> Set[str]:
+        """Method to get the ids of all objects that are queued to be pushed and must not be evicted
+
+        Returns:
+            set
+        """
+        push_queue = PushQueue(self.cache_mgr.cache_root)
+        try:
+            return push_queue.object_ids()
+        finally:
+            push_queue.close()
+
+    def _revision_links(self, inodes: Set[int]) -> Dict[int, List[Tuple[str, str]]]:
+        """Method to find the files in all revision directories that are linked to the provided inodes
+
+        Args:
+            inodes: inode numbers of the objects to find
+
+        Returns:
+            dict of inode -> list of (revision directory, relative path)
+        """
+        links: Dict[int, List[Tuple[str, str]]] = dict()
+        with os.scandir(self.cache_mgr.cache_root) as entries:
+            revision_dirs = [e.path for e in entries
+                             if e.is_dir(follow_symlinks=False) and e.name not in ['objects', '.manifest']]
+
+        for revision_dir in revision_dirs:
+            for root, _, files in os.walk(revision_dir):
+                for filename in files:
+                    if is_fast_hash_file(filename):
+                        continue
+                    abs_path = os.path.join(root, filename)
+                    try:
+                        inode = os.stat(abs_path, follow_symlinks=False).st_ino
+                    except FileNotFoundError:
+                        continue
+                    if inode in inodes:
+                        links.setdefault(inode, list()).append((revision_dir,
+                                                                os.path.relpath(abs_path, revision_dir)))
+        return links
+
+    def evict(self, max_bytes: Optional[int] = None, keep: Optional[Iterable[str]] = None) -> EvictionResult:
+        """Method to evict objects until the cache is within its byte budget
+
+        Args:
+            max_bytes: Optional byte budget, overriding the configured budget
+            keep: Optional ids of objects that should not be evicted (e.g. objects that were just downloaded)
+
+        Returns:
+            EvictionResult
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+
+        objects = self.list_objects()
+        total_bytes = sum([obj.size for obj in objects])
+        if max_bytes is None or total_bytes <= max_bytes:
+            return EvictionResult(evicted=[], bytes_freed=0, total_bytes=total_bytes)
+
+        protected = self._pinned_object_ids()
+        if keep:
+            protected.update(keep)
+        candidates = [obj for obj in objects if obj.object_id not in protected]
+
+        # Unreferenced objects first, then least recently used
+        candidates = sorted(candidates, key=lambda obj: (obj.num_links > 1, obj.last_access))
+
+        evicted: List[str] = list()
+        bytes_freed = 0
+        revision_links: Optional[Dict[int, List[Tuple[str, str]]]] = None
+        removed_paths: Dict[str, List[str]] = dict()
+        for obj in candidates:
+            if total_bytes - bytes_freed <= max_bytes:
+                break
+
+            links: List[Tuple[str, str]] = list()
+            if obj.num_links > 1:
+                if revision_links is None:
+                    # Only walk the revision directories once, and only if referenced objects must be evicted
+                    revision_links = self._revision_links({o.inode for o in candidates if o.num_links > 1})
+                links = revision_links.get(obj.inode, list())
+                if obj.num_links > len(links) + 1:
+                    # Linked from outside the cache, so removing it would not free any space
+                    continue
+
+            try:
+                for revision_dir, relative_path in links:
+                    os.remove(os.path.join(revision_dir, relative_path))
+                    removed_paths.setdefault(revision_dir, list()).append(relative_path)
+                os.remove(obj.object_path)
+            except OSError as err:
+                logger.warning(f"Failed to evict object {obj.object_id} from the dataset file cache")
+                logger.exception(err)
+                continue
+
+            evicted.append(obj.object_id)
+            bytes_freed += obj.size
+
+        # Files removed from a revision are no longer local, so they must not be reported as deleted
+        for revision_dir, relative_paths in removed_paths.items():
+            fast_hash_data = FastHashStore(revision_dir)
+            fast_hash_data.delete_many(relative_paths)
+            fast_hash_data.close()
+
+        self._forget(evicted)
+
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} objects ({bytes_freed} bytes) from {self.cache_mgr.cache_root}")
+
+        return EvictionResult(evicted=evicted, bytes_freed=bytes_freed, total_bytes=total_bytes - bytes_freed)
@@ -0,0 +1,364 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+import asyncio
+import time
+import uuid
+
+from redis import StrictRedis
+from redis.exceptions import RedisError
+
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+# Priority classes for transfers, lower values are served first. Files a user asked for are interactive, while pushes
+# and downloading every file in a dataset run in the background.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_CLASSES = {'interactive': PRIORITY_INTERACTIVE, 'background': PRIORITY_BACKGROUND}
+
+# Default number of bytes that can be sent at once after the bucket has been idle (4 MiB)
+DEFAULT_BURST_BYTES = 4194304
+
+# Seconds a lower priority transfer waits before checking again if higher priority transfers are waiting
+PRIORITY_POLL_INTERVAL = 0.05
+
+# Seconds after its expected retry that a waiting transfer is forgotten, if its process stopped while waiting
+WAITER_TIMEOUT = 5.0
+
+# Prefix of the Redis keys that store the state of the buckets
+BANDWIDTH_KEY_PREFIX = "dataset_bandwidth"
+
+
+# Lua script to take tokens for a chunk, run atomically in Redis so the bucket can be shared by every process.
+# KEYS[1] is the bucket, and KEYS[2:] are the sets of waiting transfers with a higher priority. Returns "0" if the
+# tokens were taken, or the number of seconds to wait before trying again.
+TRY_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local num_bytes = tonumber(ARGV[2])
+local poll_interval = ARGV[3]
+
+local state = redis.call('HMGET', KEYS[1], 'rate', 'burst', 'tokens', 'updated')
+local rate = tonumber(state[1]) or 0
+if rate <= 0 then
+    return '0'
+end
+
+for i = 2, #KEYS do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now)
+    if redis.call('ZCARD', KEYS[i]) > 0 then
+        return poll_interval
+    end
+end
+
+local burst = tonumber(state[2])
+local tokens = tonumber(state[3]) or burst
+local updated = tonumber(state[4]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+
+local required = math.min(num_bytes, burst)
+local delay = '0'
+if tokens >= required then
+    tokens = tokens - num_bytes
+else
+    delay = tostring((required - tokens) / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+return delay
+"""
+
+
+class TokenBucket(object):
+    """Class to limit the rate of bytes sent or received by every transfer sharing the bucket
+
+    Tokens (bytes) are added at `rate` bytes per second, up to `burst_bytes`. A transfer takes tokens for each chunk
+    before sending it (or after receiving it), waiting until enough are available. A chunk larger than the burst only
+    needs a full bucket, and leaves the bucket in debt so the average rate is still respected.
+
+    While a transfer of a higher priority class is waiting for tokens, lower priority transfers wait too, so background
+    transfers only use bandwidth that interactive transfers leave idle. The state of the bucket is kept in Redis, so it
+    is shared by transfers running in different jobs. The rate can be changed at any time, and applies to transfers
+    already in progress.
+    """
+    def __init__(self, client: StrictRedis, key: str, clock: Callable[[], float] = time.time) -> None:
+        self.client = client
+        self.key = key
+        self._clock = clock
+        self._try_acquire_script = client.register_script(TRY_ACQUIRE_SCRIPT)
+
+    @property
+    def rate(self) -> Optional[float]:
+        """Property to get the rate in bytes per second, or None if unlimited"""
+        rate = self.client.hget(self.key, 'rate')
+        return float(rate) if rate and float(rate) > 0 else None
+
+    @property
+    def burst_bytes(self) -> int:
+        """Property to get the maximum number of tokens in the bucket"""
+        burst_bytes = self.client.hget(self.key, 'burst')
+        return int(burst_bytes) if burst_bytes else DEFAULT_BURST_BYTES
+
+    def _waiting_key(self, priority: int) -> str:
+        """Method to get the key of the set of transfers of a priority class waiting for tokens
+
+        Args:
+            priority: priority class
+
+        Returns:
+            str
+        """
+        return f"{self.key}:waiting:{priority}"
+
+    def set_rate(self, rate: Optional[float], burst_bytes: int = DEFAULT_BURST_BYTES) -> None:
+        """Method to change the rate of the bucket
+
+        Args:
+            rate: bytes per second. None or a value <= 0 removes the limit
+            burst_bytes: maximum number of tokens in the bucket
+
+        Returns:
+            None
+        """
+        if burst_bytes <= 0:
+            raise ValueError("burst_bytes must be greater than 0")
+
+        rate = float(rate) if rate and rate > 0 else 0.0
+        self.client.hset(self.key, 'rate', str(rate))
+        self.client.hset(self.key, 'burst', str(burst_bytes))
+
+    def try_acquire(self, num_bytes: int, priority: int = PRIORITY_BACKGROUND) -> float:
+        """Method to take tokens for a chunk if they are available
+
+        Args:
+            num_bytes: size of the chunk
+            priority: priority class of the transfer
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of seconds to wait before trying again
+        """
+        keys = [self.key] + [self._waiting_key(p) for p in sorted(PRIORITY_CLASSES.values()) if p < priority]
+        delay = self._try_acquire_script(keys=keys, args=[repr(self._clock()), num_bytes,
+                                                          repr(PRIORITY_POLL_INTERVAL)])
+        return float(delay)
+
+    @contextmanager
+    def _waiting(self, priority: int):
+        """Context manager to register a transfer as waiting for tokens, so lower priority transfers hold off
+
+        Args:
+            priority: priority class of the transfer
+
+        Returns:
+            Callable to call each time the transfer tries again, with the number of seconds it will wait
+        """
+        waiting_key = self._waiting_key(priority)
+        waiter_id = uuid.uuid4().hex
+
+        def refresh(delay: float) -> None:
+            # Registrations expire in case the process stops while waiting
+            self.client.zadd(waiting_key, {waiter_id: self._clock() + delay + WAITER_TIMEOUT})
+
+        try:
+            yield refresh
+        finally:
+            self.client.zrem(waiting_key, waiter_id)
+
+    def acquire(self, num_bytes: int, priority: int = PRIORITY_BACKGROUND) -> None:
+        """Method to block the calling thread until tokens for a chunk are taken
+
+        Args:
+            num_bytes: size of the chunk
+            priority: priority class of the transfer
+
+        Returns:
+            None
+        """
+        delay = self.try_acquire(num_bytes, priority)
+        if not delay:
+            return
+
+        with self._waiting(priority) as refresh:
+            while delay:
+                refresh(delay)
+                time.sleep(delay)
+                delay = self.try_acquire(num_bytes, priority)
+
+    async def acquire_async(self, num_bytes: int, priority: int = PRIORITY_BACKGROUND) -> None:
+        """Method to wait in the event loop until tokens for a chunk are taken
+
+        Args:
+            num_bytes: size of the chunk
+            priority: priority class of the transfer
+
+        Returns:
+            None
+        """
+        delay = self.try_acquire(num_bytes, priority)
+        if not delay:
+            return
+
+        with self._waiting(priority) as refresh:
+            while delay:
+                refresh(delay)
+                await asyncio.sleep(delay)
+                delay = self.try_acquire(num_bytes, priority)
+
+
+class Throttle(object):
+    """Class to bind a token bucket to the priority class of a single transfer, so it can be passed to the code that
+    sends or receives data
+
+    If Redis can't be reached during the transfer, the rest of the transfer is not limited instead of failing.
+    """
+    def __init__(self, bucket: TokenBucket, priority: int = PRIORITY_BACKGROUND) -> None:
+        self.bucket = bucket
+        self.priority = priority
+        self.disabled = False
+
+    def _disable(self, err: RedisError) -> None:
+        logger.warning(f"Failed to limit bandwidth, continuing transfer without a limit: {err}")
+        self.disabled = True
+
+    def acquire(self, num_bytes: int) -> None:
+        """Method to block until the chunk can be transferred
+
+        Args:
+            num_bytes: size of the chunk
+
+        Returns:
+            None
+        """
+        if self.disabled:
+            return
+
+        try:
+            self.bucket.acquire(num_bytes, self.priority)
+        except RedisError as err:
+            self._disable(err)
+
+    async def acquire_async(self, num_bytes: int) -> None:
+        """Method to wait in the event loop until the chunk can be transferred
+
+        Args:
+            num_bytes: size of the chunk
+
+        Returns:
+            None
+        """
+        if self.disabled:
+            return
+
+        try:
+            await self.bucket.acquire_async(num_bytes, self.priority)
+        except RedisError as err:
+            self._disable(err)
+
+
+def _parse_rate(value) -> Optional[float]:
+    """Function to parse a rate from the client or backend configuration
+
+    Args:
+        value: rate in bytes per second, as a number or string. None or an empty string means unlimited
+
+    Returns:
+        float or None
+    """
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+class BandwidthLimiter(object):
+    """Class to hold the upload and download buckets shared by every transfer
+
+    A dataset can override the rates with the `upload_rate_limit` and `download_rate_limit` backend configuration
+    parameters. Transfers of that dataset then share a bucket of their own, so the override doesn't change the limit
+    of other transfers.
+    """
+    def __init__(self, client: StrictRedis, key_prefix: str = BANDWIDTH_KEY_PREFIX,
+                 clock: Callable[[], float] = time.time) -> None:
+        self.client = client
+        self.key_prefix = key_prefix
+        self._clock = clock
+        self.upload = TokenBucket(client, f"{key_prefix}:upload", clock=clock)
+        self.download = TokenBucket(client, f"{key_prefix}:download", clock=clock)
+
+        # Rates and burst size last set from the client config, so transfers without a limit don't need Redis
+        self.rates: Dict[str, Optional[float]] = {'upload': None, 'download': None}
+        self.burst_bytes = DEFAULT_BURST_BYTES
+
+    def configure(self, bandwidth_config: Optional[dict]) -> None:
+        """Method to set the rates of the shared buckets
+
+        Rates come from the `datasets.bandwidth` section of the client config. Backends call this at the start of each
+        push or pull, so changes take effect on the next transfer, and apply to any limited transfers already running.
+
+        Args:
+            bandwidth_config: the `datasets.bandwidth` section of the client config
+
+        Returns:
+            None
+        """
+        bandwidth_config = bandwidth_config or dict()
+        self.burst_bytes = int(bandwidth_config.get('burst_bytes') or DEFAULT_BURST_BYTES)
+
+        for direction, bucket in [('upload', self.upload), ('download', self.download)]:
+            rate = bandwidth_config.get(f'{direction}_rate')
+            try:
+                self.rates[direction] = _parse_rate(rate)
+            except ValueError:
+                logger.warning(f"Ignoring invalid {direction} rate limit: {rate}")
+                self.rates[direction] = None
+
+            bucket.set_rate(self.rates[direction], self.burst_bytes)
+
+    def throttle(self, direction: str, priority: int = PRIORITY_BACKGROUND, dataset_id: Optional[str] = None,
+                 rate_limit: Optional[str] = None) -> Optional[Throttle]:
+        """Method to get a throttle for a transfer
+
+        Args:
+            direction: 'upload' or 'download'
+            priority: priority class of the transfer
+            dataset_id: id of the dataset being transferred (e.g. `namespace/name`), required to apply `rate_limit`
+            rate_limit: the dataset's rate limit for the direction, overriding the client config if set
+
+        Returns:
+            Throttle, or None if the transfer is not limited
+        """
+        if direction not in self.rates:
+            raise ValueError(f"Unsupported transfer direction: {direction}")
+
+        bucket = self.upload if direction == 'upload' else self.download
+        rate = self.rates[direction]
+        if dataset_id and rate_limit not in [None, ""]:
+            try:
+                rate = _parse_rate(rate_limit)
+                bucket = TokenBucket(self.client, f"{self.key_prefix}:{direction}:dataset:{dataset_id}",
+                                     clock=self._clock)
+                bucket.set_rate(rate, self.burst_bytes)
+            except ValueError:
+                logger.warning(f"Ignoring invalid {direction} rate limit for {dataset_id}: {rate_limit}")
+
+        if rate is None or rate <= 0:
+            return None
+        return Throttle(bucket, priority)
+
+
+_bandwidth_limiter: Optional[BandwidthLimiter] = None
+
+
+def get_bandwidth_limiter(redis_config: dict) -> BandwidthLimiter:
+    """Function to get the bandwidth limiter for the current process
+
+    Args:
+        redis_config: the Redis connection details (the `lock.redis` section of the client config)
+
+    Returns:
+        BandwidthLimiter
+    """
+    global _bandwidth_limiter
+    if _bandwidth_limiter is None:
+        _bandwidth_limiter = BandwidthLimiter(StrictRedis(host=redis_config['host'], port=redis_config['port'],
+                                                          db=redis_config['db']))
+    return _bandwidth_limiter
@@ -0,0 +1,175 @@
+import asyncio
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+# Record of each change the controller considered, exposed in job metadata
+ConcurrencyDecision = NamedTuple('ConcurrencyDecision', [('timestamp', float), ('limit', int),
+                                                         ('throughput', float), ('latency', float),
+                                                         ('error_rate', float), ('reason', str)])
+
+
+class AdaptiveConcurrencyController(object):
+    """Class to adjust the number of in-flight transfer requests from observed throughput, latency and errors
+
+    This uses additive-increase/multiplicative-decrease (AIMD). Completed requests are collected into windows of
+    `window_size` requests. At the end of each window:
+
+        * if any request failed, the limit is multiplied by `decrease_factor`
+        * if the mean request latency has grown past `latency_tolerance` times the best window seen so far without
+          throughput improving over the previous window (i.e. the link is saturated and requests are just queueing),
+          the limit is multiplied by `decrease_factor`
+        * otherwise the limit is increased by 1
+
+    The limit always stays between `min_limit` and `max_limit`. Workers call `acquire()` before starting a request
+    and `release()` when it is done.
+    """
+    def __init__(self, min_limit: int = 1, max_limit: int = 16, initial_limit: Optional[int] = None,
+                 window_size: int = 8, decrease_factor: float = 0.5, latency_tolerance: float = 2.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        if min_limit < 1 or max_limit < min_limit:
+            raise ValueError(f"Invalid concurrency limits: min {min_limit}, max {max_limit}")
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = min(max(initial_limit or min_limit, min_limit), max_limit)
+        self.window_size = window_size
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.decisions: List[ConcurrencyDecision] = list()
+
+        self._clock = clock
+        self._in_flight = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+        self._best_latency: Optional[float] = None
+        self._last_throughput = 0.0
+        self._reset_window()
+
+    def _reset_window(self) -> None:
+        """Method to start collecting a new window of requests
+
+        Returns:
+            None
+        """
+        self._window_start = self._clock()
+        self._window_requests = 0
+        self._window_errors = 0
+        self._window_bytes = 0
+        self._window_latency = 0.0
+
+    @property
+    def in_flight(self) -> int:
+        """Property to get the number of requests currently running"""
+        return self._in_flight
+
+    async def acquire(self) -> None:
+        """Method to wait until a request may start under the current limit
+
+        Returns:
+            None
+        """
+        if self._condition is None:
+            # Created on first use so it is bound to the running loop
+            self._condition = asyncio.Condition()
+
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    async def release(self, num_bytes: int = 0, latency: float = 0.0, error: bool = False) -> None:
+        """Method to record a completed request and let waiting requests start
+
+        Args:
+            num_bytes: number of bytes transferred by the request
+            latency: seconds the request took
+            error: True if the request failed
+
+        Returns:
+            None
+        """
+        # Recording may change the limit, so waiting requests re-check it when notified
+        self.record(num_bytes, latency, error)
+        if self._condition is not None:
+            async with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+        else:
+            self._in_flight -= 1
+
+    def record(self, num_bytes: int = 0, latency: float = 0.0, error: bool = False) -> None:
+        """Method to add a completed request to the current window, updating the limit if the window is full
+
+        Args:
+            num_bytes: number of bytes transferred by the request
+            latency: seconds the request took
+            error: True if the request failed
+
+        Returns:
+            None
+        """
+        self._window_requests += 1
+        self._window_bytes += num_bytes
+        self._window_latency += latency
+        if error:
+            self._window_errors += 1
+
+        if self._window_requests >= self.window_size:
+            self._evaluate()
+
+    def _evaluate(self) -> None:
+        """Method to apply the AIMD rule to the current window and start a new one
+
+        Returns:
+            None
+        """
+        elapsed = max(self._clock() - self._window_start, 1e-6)
+        throughput = self._window_bytes / elapsed
+        latency = self._window_latency / self._window_requests
+        error_rate = self._window_errors / self._window_requests
+
+        if self._window_errors:
+            new_limit = int(self.limit * self.decrease_factor)
+            reason = "errors"
+        elif self._best_latency and latency > self._best_latency * self.latency_tolerance \
+                and throughput <= self._last_throughput:
+            new_limit = int(self.limit * self.decrease_factor)
+            reason = "latency"
+        else:
+            new_limit = self.limit + 1
+            reason = "increase"
+
+        if self._best_latency is None or latency < self._best_latency:
+            self._best_latency = latency
+        self._last_throughput = throughput
+
+        new_limit = min(max(new_limit, self.min_limit), self.max_limit)
+        if new_limit == self.limit and reason == "increase":
+            reason = "at ceiling"
+        elif new_limit == self.limit:
+            reason = f"{reason}, at floor"
+
+        if new_limit != self.limit:
+            logger.info(f"Changing transfer concurrency from {self.limit} to {new_limit} ({reason}). Throughput: "
+                        f"{throughput / 1048576:.2f} MiB/s, latency: {latency:.2f}s, error rate: {error_rate:.2f}")
+
+        self.limit = new_limit
+        self.decisions.append(ConcurrencyDecision(time.time(), new_limit, throughput, latency, error_rate, reason))
+        self._reset_window()
+
+    def summary(self, max_decisions: int = 20) -> dict:
+        """Method to get the state of the controller and its most recent decisions, e.g. to save in job metadata
+
+        Args:
+            max_decisions: maximum number of recent decisions to include
+
+        Returns:
+            dict
+        """
+        return {"limit": self.limit,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "decisions": [d._asdict() for d in self.decisions[-max_decisions:]]}
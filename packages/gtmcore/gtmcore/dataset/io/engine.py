@@ -0,0 +1,134 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional
+import threading
+import time
+
+from gtmcore.dataset.dataset import Dataset
+from gtmcore.dataset.manifest import Manifest
+from gtmcore.dataset.io import PushObject, PushResult, PullResult
+from gtmcore.dataset.io.bandwidth import PRIORITY_BACKGROUND
+from gtmcore.dataset.io.manager import IOManager
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+
+class TransferProgress(object):
+    """Class to aggregate the progress of every object transfer into a single channel
+
+    Backends call `update()` (possibly from several threads) with the number of bytes completed since their last
+    call. The running total is passed to `report_fn(completed_bytes, total_bytes)` at most once every
+    `min_interval` seconds, and once more when `close()` is called.
+    """
+    def __init__(self, total_bytes: int, report_fn: Callable[[int, int], None], min_interval: float = 0.5,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.total_bytes = total_bytes
+        self.min_interval = min_interval
+
+        self._report_fn = report_fn
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._completed_bytes = 0
+        self._last_report: Optional[float] = None
+
+    @property
+    def completed_bytes(self) -> int:
+        """Property to get the total number of bytes completed so far"""
+        return self._completed_bytes
+
+    @property
+    def percent_complete(self) -> float:
+        """Property to get the percentage of bytes completed"""
+        if not self.total_bytes:
+            return 0.0
+        return (float(self._completed_bytes) / float(self.total_bytes)) * 100
+
+    def update(self, completed_bytes: int) -> None:
+        """Method to add completed bytes, reporting the total if enough time has passed since the last report
+
+        Args:
+            completed_bytes: number of bytes completed since the last call
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._completed_bytes += completed_bytes
+            now = self._clock()
+            if self._last_report is not None and now - self._last_report < self.min_interval:
+                return
+            self._last_report = now
+
+        self._report_fn(self._completed_bytes, self.total_bytes)
+
+    def close(self) -> None:
+        """Method to report the final total
+
+        Returns:
+            None
+        """
+        self._report_fn(self._completed_bytes, self.total_bytes)
+
+
+class TransferEngine(object):
+    """Class to run all object transfers for a dataset in the current process
+
+    Rather than splitting objects into batches run by separate background jobs and polling each one, every object
+    goes through the storage backend's transfer pipeline in a single call. The backend bounds the number of requests
+    in flight, and progress is reported through one TransferProgress. Compressing objects for upload is the only CPU
+    bound step, so it alone runs in a process pool. Transfers share bandwidth with other transfers in the process
+    according to their priority class.
+    """
+    def __init__(self, dataset: Dataset, manifest: Manifest, compression_workers: Optional[int] = None,
+                 priority: int = PRIORITY_BACKGROUND) -> None:
+        self.dataset = dataset
+        self.manifest = manifest
+        self.io_manager = IOManager(dataset, manifest)
+        self.priority = priority
+
+        if compression_workers is None:
+            compression_workers = dataset.client_config.upload_cpu_limit
+        self.compression_workers = compression_workers
+
+    def push(self, objs: List[PushObject], progress: TransferProgress) -> PushResult:
+        """Method to push objects to the dataset's backend
+
+        Args:
+            objs: list of PushObjects to push
+            progress: channel to report the number of bytes uploaded
+
+        Returns:
+            PushResult
+        """
+        executor: Optional[ProcessPoolExecutor] = None
+        if self.compression_workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.compression_workers)
+
+        self.dataset.backend.compression_executor = executor
+        self.dataset.backend.transfer_priority = self.priority
+        try:
+            return self.io_manager.push_objects(objs, progress_update_fn=progress.update)
+        finally:
+            self.dataset.backend.compression_executor = None
+            self.dataset.backend.transfer_priority = PRIORITY_BACKGROUND
+            if executor:
+                executor.shutdown()
+            progress.close()
+
+    def pull(self, keys: List[str], progress: TransferProgress) -> PullResult:
+        """Method to pull objects from the dataset's backend. The revision is not linked, so the caller can link
+        every requested key once
+
+        Args:
+            keys: list of keys (relative paths) to pull
+            progress: channel to report the number of bytes downloaded
+
+        Returns:
+            PullResult
+        """
+        self.dataset.backend.transfer_priority = self.priority
+        try:
+            return self.io_manager.pull_objects(keys, progress_update_fn=progress.update, link_revision=False)
+        finally:
+            self.dataset.backend.transfer_priority = PRIORITY_BACKGROUND
+            progress.close()
@@ -1,5 +1,5 @@
 import os
-from typing import List, Callable, Optional, Tuple
+from typing import Dict, List, Callable, Optional, Set, Tuple
 import subprocess
 import glob
 from natsort import natsorted
@@ -10,6 +10,7 @@ from gtmcore.dataset.dataset import Dataset
 from gtmcore.dataset.manifest import Manifest
 from gtmcore.dataset.storage.backend import UnmanagedStorageBackend, ManagedStorageBackend
 from gtmcore.dataset.io import PushObject, PushResult, PullResult, PullObject
+from gtmcore.dataset.io.scheduler import order_largest_first
 
 from gtmcore.logging import LMLogger
 
@@ -23,87 +24,113 @@ class IOManager(object):
         self.dataset = dataset
         self.manifest = manifest
 
-        self.push_dir = os.path.join(self.manifest.cache_mgr.cache_root, 'objects', '.push')
+        self.push_queue = self.manifest.push_queue
 
         # Property to keep status state if needed when appending messages
         self._status_msg = ""
 
-    def _commit_in_branch(self, commit_hash: str) -> bool:
-        """Method to check if a commit is in the current branch, ignoring the last commit.
+        # Objects found to already exist in the backend when computing push batches, which don't need to be uploaded
+        self.existing_push_objects: List[PushObject] = list()
 
-        This is used for the purpose of only pushing objects that are part of the current branch. We ignore the last
-        commit because objects to push are stored in a file named with the revision at which the files were written.
-        This is different from the revision that contains the files (after written and untracked, changes are
-        committed and then an activity record is created with another commit). The last commit can be used in a
-        different branch where objects were written, but can't contain any objects to push in the current branch.
+    def _revisions_in_branch(self) -> Set[str]:
+        """Method to get the commits in the current branch, ignoring the last commit.
 
-        Args:
-            commit_hash(str): Commit hash to check if in branch
+        This is used for the purpose of only pushing objects that are part of the current branch. We ignore the last
+        commit because objects to push are queued with the revision at which the files were written. This is
+        different from the revision that contains the files (after written and untracked, changes are committed and
+        then an activity record is created with another commit). The last commit can be used in a different branch
+        where objects were written, but can't contain any objects to push in the current branch.
 
         Returns:
-            bool
+            set of commit hashes
         """
         try:
-            subprocess.run(['git', 'merge-base', '--is-ancestor', commit_hash, 'HEAD~1'], check=True,
-                           cwd=self.dataset.root_dir)
-            return True
+            result = subprocess.run(['git', 'rev-list', 'HEAD~1'], check=True, cwd=self.dataset.root_dir,
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
         except subprocess.CalledProcessError:
-            return False
+            # There is no commit before HEAD
+            return set()
+
+        return set(result.stdout.decode().split())
+
+    def _revisions_to_push(self) -> List[str]:
+        """Method to get the queued revisions that are in the current branch
+
+        Returns:
+            list of commit hashes
+        """
+        queued_revisions = self.push_queue.revisions()
+        if not queued_revisions:
+            return list()
+
+        branch_revisions = self._revisions_in_branch()
+        return [r for r in queued_revisions if r in branch_revisions]
 
     def objects_to_push(self, remove_duplicates: bool = False) -> List[PushObject]:
         """Return a list of named tuples of all objects that need to be pushed
 
+        Args:
+            remove_duplicates: If True, only include one object for each object id
+
         Returns:
             List[namedtuple]
         """
-        objects = list()
-        if os.path.exists(self.push_dir):
-            push_files = [f for f in os.listdir(self.push_dir) if os.path.isfile(os.path.join(self.push_dir, f))]
-
-            if push_files:
-                object_ids: List[str] = list()
-                for pf in push_files:
-                    if os.path.basename(pf) == '.DS_Store':
-                        continue
+        revisions = self._revisions_to_push()
+        if not revisions:
+            return list()
 
-                    if not self._commit_in_branch(pf):
-                        continue
+        objects = self.push_queue.objects(revisions, remove_duplicates=remove_duplicates)
+        return natsorted(objects, key=attrgetter('dataset_path'))
 
-                    with open(os.path.join(self.push_dir, pf), 'rt') as pfh:
-                        lines = pfh.readlines()
-                        lines = sorted(lines)
-                        for line in lines:
-                            line = line.strip()
-                            dataset_path, object_path = line.split(',')
-                            _, object_id = object_path.rsplit('/', 1)
+    def num_objects_to_push(self, remove_duplicates: bool = False) -> int:
+        """Helper to get the total number of objects to push, without loading them
 
-                            # Handle de-duplicating objects if the backend supports it
-                            if remove_duplicates is True:
-                                if object_id in object_ids:
-                                    continue
+        Args:
+            remove_duplicates: If True, count each object id once
 
-                                object_ids.append(object_id)
+        Returns:
+            int
+        """
+        revisions = self._revisions_to_push()
+        if not revisions:
+            return 0
 
-                            objects.append(PushObject(dataset_path=dataset_path, object_path=object_path, revision=pf))
+        return self.push_queue.count(revisions, remove_duplicates=remove_duplicates)
 
-            objects = natsorted(objects, key=attrgetter('dataset_path'))
+    def push_object_sizes(self, objs: List[PushObject]) -> List[int]:
+        """Method to get the size of objects to push without reading the object cache
 
-        return objects
+        Whole file objects are looked up in the manifest and chunks in the chunk index. Only objects found in neither
+        (chunk lists, or versions of a file that has changed since) are stat'ed.
 
-    def num_objects_to_push(self, remove_duplicates: bool = False) -> int:
-        """Helper to get the total number of objects to push
+        Args:
+            objs: list of PushObjects
 
         Returns:
-            int
+            list of sizes in bytes, in the same order as `objs`
         """
-        return len(self.objects_to_push(remove_duplicates))
+        object_ids = [os.path.basename(obj.object_path) for obj in objs]
+
+        sizes: Dict[str, int] = dict()
+        for obj, object_id in zip(objs, object_ids):
+            entry = self.manifest.manifest.get(obj.dataset_path)
+            if entry and entry.get('h') == object_id:
+                sizes[object_id] = int(entry['b'])
+
+        unknown_ids = [object_id for object_id in object_ids if object_id not in sizes]
+        if unknown_ids:
+            sizes.update(self.manifest.chunk_store.chunk_sizes(unknown_ids))
+
+        return [sizes[object_id] if object_id in sizes else os.path.getsize(obj.object_path)
+                for obj, object_id in zip(objs, object_ids)]
 
     def push_objects(self, objs: List[PushObject], progress_update_fn: Callable) -> PushResult:
         """Method to push the provided objects
 
         This method hands most of the work over to the StorageBackend implementation for the dataset. It is expected
         that the StorageBackend will return a PushResult named tuple so the user can be properly notified and
-        everything stays consistent.
+        everything stays consistent. Objects are handed over largest first, so the backend's workers finish at about
+        the same time.
 
         Args:
             objs: list of PushObjects, detailing the objects to push to the backend
@@ -116,6 +143,7 @@ class IOManager(object):
         if isinstance(self, UnmanagedStorageBackend):
             raise TypeError("Cannot push objects using an Unmanaged dataset storage type")
 
+        objs = order_largest_first(objs, self.push_object_sizes(objs))
         try:
             self.dataset.backend.prepare_push(self.dataset, objs)  # type: ignore
             result = self.dataset.backend.push_objects(self.dataset, objs, progress_update_fn)  # type: ignore
@@ -143,6 +171,68 @@ class IOManager(object):
 
         return result
 
+    def _pull_chunked_objects(self, objs: List[PullObject], progress_update_fn: Callable) -> PullResult:
+        """Method to materialize files that are stored as chunks, only downloading chunks that are not available
+        locally (e.g. in a previous version of the file)
+
+        Args:
+            objs: list of PullObjects for files that are stored as chunks
+            progress_update_fn: A callable with arg "completed_bytes" (int) indicating how many bytes have been
+                                downloaded in since last called
+
+        Returns:
+            PullResult
+        """
+        chunk_store = self.manifest.chunk_store
+        chunk_lists = {obj.dataset_path: self.manifest.manifest[obj.dataset_path]['c'] for obj in objs}
+
+        def ignore_progress(*args, **kwargs) -> None:
+            """Chunk lists are not included in the size of the files being downloaded"""
+            pass
+
+        # Download any missing chunk lists, then any missing chunks
+        missing_chunk_lists: Dict[str, PullObject] = dict()
+        for obj in objs:
+            chunk_list_path = chunk_store.object_path(chunk_lists[obj.dataset_path])
+            if not os.path.isfile(chunk_list_path):
+                missing_chunk_lists[chunk_list_path] = PullObject(object_path=chunk_list_path, revision=obj.revision,
+                                                                  dataset_path=obj.dataset_path)
+        if missing_chunk_lists:
+            self.dataset.backend.pull_objects(self.dataset, list(missing_chunk_lists.values()), ignore_progress)
+
+        missing_chunks: Dict[str, PullObject] = dict()
+        for obj in objs:
+            try:
+                for chunk_id, _ in chunk_store.missing_chunks(chunk_lists[obj.dataset_path]):
+                    if chunk_id not in missing_chunks:
+                        missing_chunks[chunk_id] = PullObject(object_path=chunk_store.object_path(chunk_id),
+                                                              revision=obj.revision, dataset_path=obj.dataset_path)
+            except (IOError, ValueError) as err:
+                # The chunk list failed to download. The file is reported as failed below.
+                logger.exception(err)
+        if missing_chunks:
+            self.dataset.backend.pull_objects(self.dataset, list(missing_chunks.values()), progress_update_fn)
+
+        # Assemble files from their chunks
+        success = list()
+        failure = list()
+        for obj in objs:
+            _, object_id = obj.object_path.rsplit('/', 1)
+            try:
+                chunk_store.assemble_object(object_id, chunk_lists[obj.dataset_path], progress_update_fn)
+                success.append(obj)
+            except (IOError, ValueError) as err:
+                logger.exception(err)
+                failure.append(obj)
+
+        # Downloaded chunks are now stored in the assembled files
+        chunk_store.remove_chunk_objects(missing_chunks.keys())
+
+        message = "Successfully synced all objects"
+        if failure:
+            message = "Some objects failed to download and will be retried on the next sync operation. Check results."
+        return PullResult(success=success, failure=failure, message=message)
+
     def pull_objects(self, keys: List[str], progress_update_fn: Callable, link_revision: bool = True) -> PullResult:
         """Method to pull a single object
 
@@ -155,21 +245,44 @@ class IOManager(object):
             progress_update_fn: A callable with arg "completed_bytes" (int) indicating how many bytes have been
                                 downloaded in since last called
             link_revision: flag indicating if you should link the files. Typically true, but useful to be false when
-                           multiple processes are downloading files (e.g. the `pull_objects` background job).
+                           multiple workers are downloading files (e.g. the `TransferEngine`).
 
         Returns:
             PullResult
         """
         objs: List[PullObject] = self._gen_pull_objects(keys)
 
+        # Files stored as chunks are assembled from chunks instead of downloaded whole
+        chunked_objs = list()
+        whole_objs = list()
+        whole_obj_sizes = list()
+        for obj in objs:
+            entry = self.manifest.manifest[obj.dataset_path]
+            if entry.get('c') and not os.path.isfile(obj.object_path):
+                chunked_objs.append(obj)
+            else:
+                whole_objs.append(obj)
+                whole_obj_sizes.append(int(entry['b']))
+
+        # Download the largest objects first, so the backend's workers finish at about the same time
+        whole_objs = order_largest_first(whole_objs, whole_obj_sizes)
+
         # Pull the object
         self.dataset.backend.prepare_pull(self.dataset, objs)
-        result = self.dataset.backend.pull_objects(self.dataset, objs, progress_update_fn)
+        result = PullResult(success=[], failure=[], message="Successfully synced all objects")
+        if whole_objs:
+            result = self.dataset.backend.pull_objects(self.dataset, whole_objs, progress_update_fn)
+        if chunked_objs:
+            chunked_result = self._pull_chunked_objects(chunked_objs, progress_update_fn)
+            message = result.message if not chunked_result.failure else chunked_result.message
+            result = PullResult(success=result.success + chunked_result.success,
+                                failure=result.failure + chunked_result.failure,
+                                message=message)
         self.dataset.backend.finalize_pull(self.dataset)
 
         # Relink the revision
         if link_revision:
-            self.manifest.link_revision()
+            self.manifest.link_revision(changed_keys=keys)
 
         # Return pull result
         return result
@@ -203,9 +316,9 @@ class IOManager(object):
 
         return keys_to_pull
 
-    def compute_pull_batches(self, keys: Optional[List[str]] = None,
-                             pull_all: Optional[bool] = False) -> Tuple[List[List[str]], int, int]:
-        """Method to compute object pull batches that attempt to spread io across available cores
+    def compute_pull_keys(self, keys: Optional[List[str]] = None,
+                          pull_all: Optional[bool] = False) -> Tuple[List[str], int]:
+        """Method to compute the keys that need to be downloaded and their total size
 
         Args:
             keys: List of keys to download (relative file paths)
@@ -215,50 +328,35 @@ class IOManager(object):
             list, int
         """
         if not keys and not pull_all:
-            raise ValueError("Either `keys` must be provided or `pull_all` set to True for batch computation.")
+            raise ValueError("Either `keys` must be provided or `pull_all` set to True to compute keys to pull.")
 
         if pull_all:
             keys = self._get_pull_all_keys()
 
-        num_cores = self.dataset.client_config.download_cpu_limit
-        key_batches: List[List] = [list() for _ in range(num_cores)]
-        size_sums = [0 for _ in range(num_cores)]
+        keys = keys or list()
+        total_bytes = sum(int(self.manifest.manifest[key]['b']) for key in keys)
 
-        # Build batches by dividing keys across batches by file size
-        if keys:
-            for key in keys:
-                data = self.manifest.get(key)
-                index = size_sums.index(min(size_sums))
-                key_batches[index].append(key)
-                file_size = int(data['size'])
-                size_sums[index] += file_size
+        return keys, total_bytes
 
-        # Prune Jobs back if there are lots of cores but not lots of work
-        key_batches = [x for x in key_batches if x != []]
+    @property
+    def existing_push_bytes(self) -> int:
+        """Property to get the number of bytes that didn't need to be pushed because the backend already had them"""
+        return sum(self.push_object_sizes(self.existing_push_objects))
 
-        return key_batches, sum(size_sums), (len(keys) if keys else 0)
+    def compute_push_objects(self) -> Tuple[List[PushObject], int]:
+        """Method to compute the objects that need to be uploaded and their total size
 
-    def compute_push_batches(self) -> Tuple[List[List[PushObject]], int, int]:
-        """Method to compute object push batches that attempt to spread io across available cores
+        Objects that already exist in the backend are left out and saved in `self.existing_push_objects`
 
         Returns:
-            list, int, int, int
+            list, int
         """
-        num_cores = self.dataset.client_config.upload_cpu_limit
-        obj_batches: List[List] = [list() for _ in range(num_cores)]
-        size_sums = [0 for _ in range(num_cores)]
-
         should_dedup = self.dataset.backend.client_should_dedup_on_push  # type: ignore
-        objs: List[PushObject] = self.objects_to_push(remove_duplicates=should_dedup)
-
-        # Build batches by dividing keys across batches by file size
-        for obj in objs:
-            index = size_sums.index(min(size_sums))
-            obj_batches[index].append(obj)
-            file_size = os.path.getsize(obj.object_path)
-            size_sums[index] += file_size
+        all_objs: List[PushObject] = self.objects_to_push(remove_duplicates=should_dedup)
 
-        # Prune Jobs back if there are lots of cores but not lots of work
-        obj_batches = [x for x in obj_batches if x != []]
+        # Don't upload objects the backend already has
+        objs: List[PushObject] = self.dataset.backend.remove_existing_objects(self.dataset, all_objs)  # type: ignore
+        remaining_paths = set(obj.object_path for obj in objs)
+        self.existing_push_objects = [obj for obj in all_objs if obj.object_path not in remaining_paths]
 
-        return obj_batches, sum(size_sums), len(objs)
+        return objs, sum(self.push_object_sizes(objs))
@@ -0,0 +1,24 @@
+from typing import List, Sequence, TypeVar
+
+T = TypeVar('T')
+
+
+def order_largest_first(items: Sequence[T], sizes: Sequence[int]) -> List[T]:
+    """Function to order items by size, largest first. Items of the same size keep their original order
+
+    Starting the largest items first means that whichever worker is free next takes the next largest item, so the
+    workers finish at about the same time instead of one large item running alone at the end.
+
+    Args:
+        items: items to order
+        sizes: size of each item, in the same order
+
+    Returns:
+        list
+    """
+    if len(items) != len(sizes):
+        raise ValueError("A size is required for each item")
+
+    order = sorted(range(len(items)), key=lambda i: -sizes[i])
+    return [items[i] for i in order]
+
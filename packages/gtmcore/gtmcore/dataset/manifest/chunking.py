@@ -0,0 +1,560 @@
+from hashlib import blake2b
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+import numpy as np
+
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+# Name of the SQLite database (in the cache root) used to track chunk lists and where chunks are stored locally
+CHUNK_INDEX_FILE = ".chunks.db"
+
+# Version of the chunk list format
+CHUNK_LIST_VERSION = 1
+
+# Number of bytes read from a file at a time while finding chunk boundaries (1 MiB)
+CHUNKING_READ_SIZE = 1048576
+
+# Suffix of the hidden temporary files objects are written to before they are moved into place
+TEMP_FILE_SUFFIX = ".tmp"
+
+# Table of random 32 bit values for each byte value, used by the rolling "gear" hash. The values must never change,
+# since they determine chunk boundaries (and so chunk ids) on every client.
+GEAR_TABLE = np.array([int.from_bytes(blake2b(bytes([i]), digest_size=4).digest(), 'little') for i in range(256)],
+                      dtype=np.uint32)
+
+
+def _combine_windows(newer: np.ndarray, older: np.ndarray, newer_width: int, older_width: int) -> np.ndarray:
+    """Helper to combine the rolling hashes of two adjacent windows into the hash of a single wider window
+
+    Each array contains one value per window, aligned so the last value of every array ends at the same byte.
+
+    Args:
+        newer: hashes of the most recent `newer_width` bytes
+        older: hashes of the `older_width` bytes before them
+        newer_width: width of the newer window
+        older_width: width of the older window
+
+    Returns:
+        np.ndarray
+    """
+    return newer[older_width:] + (older[:len(newer) - older_width] << np.uint32(newer_width))
+
+
+def gear_fingerprints(values: np.ndarray, window: int) -> np.ndarray:
+    """Function to compute the rolling gear hash `sum(GEAR[b[i - k]] << k for k in range(window))` for every position
+
+    Only the lowest `window` bits of the hash are used to find boundaries and they only depend on the last `window`
+    bytes, so the hash is computed over a fixed window. Windows are built up by doubling, so this only needs about
+    2 * log2(window) passes over the data instead of one per byte of the window.
+
+    Args:
+        values: gear table values for each byte
+        window: window size in bytes
+
+    Returns:
+        np.ndarray with len(values) - window + 1 values, where value j is the hash of the window ending at j + window - 1
+    """
+    result: Optional[np.ndarray] = None
+    result_width = 0
+    power = values
+    power_width = 1
+    remaining = window
+    while remaining:
+        if remaining & 1:
+            if result is None:
+                result = power
+            else:
+                result = _combine_windows(result, power, result_width, power_width)
+            result_width += power_width
+        remaining >>= 1
+        if remaining:
+            power = _combine_windows(power, power, power_width, power_width)
+            power_width *= 2
+
+    return result  # type: ignore
+
+
+class ContentDefinedChunker(object):
+    """Class to split a file into chunks at content-defined boundaries
+
+    A boundary is placed after every byte where the rolling hash of the preceding bytes has its lowest
+    log2(avg_chunk_size) bits set to zero, subject to the min and max chunk sizes. Since boundaries only depend on
+    nearby content, inserting or appending data only changes the chunks around the edit, and every other chunk keeps
+    the same id.
+    """
+    def __init__(self, avg_chunk_size: int, min_chunk_size: int, max_chunk_size: int,
+                 read_size: int = CHUNKING_READ_SIZE) -> None:
+        if avg_chunk_size & (avg_chunk_size - 1) != 0 or not 1 < avg_chunk_size <= 2 ** 32:
+            raise ValueError("Average chunk size must be a power of 2")
+        if not 0 < min_chunk_size <= avg_chunk_size <= max_chunk_size:
+            raise ValueError("Chunk sizes must satisfy 0 < min_chunk_size <= avg_chunk_size <= max_chunk_size")
+
+        self.avg_chunk_size = avg_chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.read_size = read_size
+
+        self.window = avg_chunk_size.bit_length() - 1
+        self.mask = np.uint32(avg_chunk_size - 1)
+
+    def _boundary_candidates(self, block: bytes, carry: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Method to find the positions in a block that could end a chunk
+
+        Args:
+            block: bytes read from the file
+            carry: gear values of the last (window - 1) bytes before the block
+
+        Returns:
+            tuple of the in-block positions after which a boundary could be placed and the carry for the next block
+        """
+        values = np.concatenate([carry, GEAR_TABLE[np.frombuffer(block, dtype=np.uint8)]])
+        fingerprints = gear_fingerprints(values, self.window)
+        candidates = np.flatnonzero((fingerprints & self.mask) == 0) + 1
+        return candidates, values[len(values) - len(carry):]
+
+    def chunks(self, fh: BinaryIO) -> Iterator[bytes]:
+        """Generator to split the contents of a file into chunks
+
+        Args:
+            fh: file handle opened in binary mode
+
+        Yields:
+            bytes of each chunk, in order
+        """
+        carry = np.zeros(self.window - 1, dtype=np.uint32)
+        pending: List[bytes] = list()
+        block_offset = 0
+        chunk_start = 0
+
+        while True:
+            block = fh.read(self.read_size)
+            if not block:
+                break
+
+            candidates, carry = self._boundary_candidates(block, carry)
+            block_pos = 0
+            block_end = block_offset + len(block)
+            for cut in (int(c) + block_offset for c in candidates):
+                # Force boundaries so chunks never exceed the max size
+                while cut - chunk_start > self.max_chunk_size:
+                    forced_cut = chunk_start + self.max_chunk_size
+                    pending.append(block[block_pos:forced_cut - block_offset])
+                    yield b''.join(pending)
+                    pending = list()
+                    chunk_start = forced_cut
+                    block_pos = forced_cut - block_offset
+
+                if cut - chunk_start < self.min_chunk_size:
+                    continue
+
+                pending.append(block[block_pos:cut - block_offset])
+                yield b''.join(pending)
+                pending = list()
+                chunk_start = cut
+                block_pos = cut - block_offset
+
+            while block_end - chunk_start > self.max_chunk_size:
+                forced_cut = chunk_start + self.max_chunk_size
+                pending.append(block[block_pos:forced_cut - block_offset])
+                yield b''.join(pending)
+                pending = list()
+                chunk_start = forced_cut
+                block_pos = forced_cut - block_offset
+
+            pending.append(block[block_pos:])
+            block_offset = block_end
+
+        if chunk_start < block_offset:
+            yield b''.join(pending)
+
+
+def encode_chunk_list(chunks: List[Tuple[str, int]]) -> bytes:
+    """Function to serialize a chunk list, which is stored as its own object
+
+    Args:
+        chunks: list of (chunk id, size in bytes) in file order
+
+    Returns:
+        bytes
+    """
+    return json.dumps({"v": CHUNK_LIST_VERSION, "chunks": chunks}, separators=(',', ':')).encode('utf-8')
+
+
+def decode_chunk_list(data: bytes) -> List[Tuple[str, int]]:
+    """Function to load a serialized chunk list
+
+    Args:
+        data: contents of a chunk list object
+
+    Returns:
+        list of (chunk id, size in bytes) in file order
+    """
+    chunk_list = json.loads(data.decode('utf-8'))
+    if chunk_list.get('v') != CHUNK_LIST_VERSION:
+        raise ValueError(f"Unsupported chunk list version: {chunk_list.get('v')}")
+    return [(chunk_id, int(size)) for chunk_id, size in chunk_list['chunks']]
+
+
+def temp_file_path(path: str) -> str:
+    """Helper to get a unique temporary file to write an object to before it is moved into place. The file is hidden,
+    so the object cache doesn't count it as an object
+
+    Args:
+        path: absolute path of the object
+
+    Returns:
+        str
+    """
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, f".{filename}.{uuid.uuid4().hex}{TEMP_FILE_SUFFIX}")
+
+
+def is_temp_file(filename: str) -> bool:
+    """Helper to check if a file in the object directory is a temporary file created by `temp_file_path()`
+
+    Args:
+        filename: base name of the file
+
+    Returns:
+        bool
+    """
+    return filename.startswith('.') and filename.endswith(TEMP_FILE_SUFFIX)
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """Helper to write a file so readers never see partial contents, even if other processes write the same object
+
+    Args:
+        path: absolute path to write
+        data: file contents
+
+    Returns:
+        None
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = temp_file_path(path)
+    try:
+        with open(temp_path, 'wb') as fh:
+            fh.write(data)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class ChunkStore(object):
+    """Class to manage chunked objects in a dataset's object cache
+
+    Large files can be stored as a list of content-defined chunks. The chunk list is an object itself, referenced by
+    the file's manifest entry, and each chunk is an object named by the hash of its contents. Only chunks that have not
+    been seen before are written to the object cache and pushed.
+
+    Locally, files are still stored (and linked into revisions) as whole objects. The chunk index records which
+    whole object contains each chunk, so a new version of a file can be assembled from the chunks of previous versions
+    and only the missing chunks need to be downloaded. Chunk objects themselves are removed once they have been pushed
+    or assembled into a file.
+    """
+    def __init__(self, cache_root: str) -> None:
+        self.cache_root = cache_root
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    @property
+    def index_file(self) -> str:
+        """The location of the chunk index"""
+        return os.path.join(self.cache_root, CHUNK_INDEX_FILE)
+
+    def object_path(self, object_id: str) -> str:
+        """Method to get the absolute path to an object in the object cache
+
+        Args:
+            object_id: id of the object (hash of its contents)
+
+        Returns:
+            str
+        """
+        return os.path.join(self.cache_root, 'objects', object_id[0:8], object_id[8:16], object_id)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Method to get a connection to the chunk index, creating it if needed
+
+        Returns:
+            sqlite3.Connection
+        """
+        if self._connection and not os.path.exists(self.index_file):
+            self.close()
+
+        if not self._connection:
+            os.makedirs(self.cache_root, exist_ok=True)
+            self._connection = sqlite3.connect(self.index_file, timeout=60, check_same_thread=False)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS chunk_lists (object_id TEXT PRIMARY KEY NOT NULL, "
+                                     "chunk_list_id TEXT NOT NULL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT NOT NULL, "
+                                     "object_id TEXT NOT NULL, offset INTEGER NOT NULL, size INTEGER NOT NULL, "
+                                     "PRIMARY KEY (chunk_id, object_id))")
+            self._connection.commit()
+        return self._connection
+
+    def close(self) -> None:
+        """Method to close the underlying database connection
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+
+    def get_chunk_list_id(self, object_id: str) -> Optional[str]:
+        """Method to get the id of the chunk list for an object, if the object has been chunked
+
+        Args:
+            object_id: id of the whole file object
+
+        Returns:
+            str
+        """
+        with self._lock:
+            row = self._connect().execute("SELECT chunk_list_id FROM chunk_lists WHERE object_id = ?",
+                                          (object_id,)).fetchone()
+        return row[0] if row else None
+
+    def _record_chunk_list(self, object_id: str, chunk_list_id: str, chunks: List[Tuple[str, int]]) -> None:
+        """Method to record an object's chunk list and the location of each of its chunks within the object
+
+        A chunk can be stored in many objects (e.g. every version of a file it is part of), so every location is
+        kept and any of them can be used while it still exists.
+
+        Args:
+            object_id: id of the whole file object
+            chunk_list_id: id of the chunk list object
+            chunks: list of (chunk id, size in bytes) in file order
+
+        Returns:
+            None
+        """
+        rows = list()
+        offset = 0
+        for chunk_id, size in chunks:
+            rows.append((chunk_id, object_id, offset, size))
+            offset += size
+
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO chunk_lists (object_id, chunk_list_id) VALUES (?, ?)",
+                             (object_id, chunk_list_id))
+                conn.executemany("INSERT OR REPLACE INTO chunks (chunk_id, object_id, offset, size) "
+                                 "VALUES (?, ?, ?, ?)", rows)
+
+    def known_chunks(self, chunk_ids: Iterable[str]) -> Set[str]:
+        """Method to get the chunks that have already been stored, i.e. that have been pushed, are queued to be pushed,
+        or were pulled
+
+        Args:
+            chunk_ids: ids of chunks to check
+
+        Returns:
+            set
+        """
+        chunk_ids = list(set(chunk_ids))
+        known: Set[str] = set()
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[start:start + 500]
+                known.update(row[0] for row in conn.execute(f"SELECT DISTINCT chunk_id FROM chunks WHERE chunk_id IN "
+                                                            f"({', '.join('?' * len(batch))})", batch))
+        return known
+
+    def chunk_sizes(self, chunk_ids: Iterable[str]) -> Dict[str, int]:
+        """Method to get the size of chunks that have been stored
+
+        Args:
+            chunk_ids: ids of chunks to look up
+
+        Returns:
+            dict of chunk id -> size in bytes, for the chunks that are known
+        """
+        chunk_ids = list(set(chunk_ids))
+        sizes: Dict[str, int] = dict()
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[start:start + 500]
+                sizes.update(conn.execute(f"SELECT chunk_id, size FROM chunks WHERE chunk_id IN "
+                                          f"({', '.join('?' * len(batch))})", batch).fetchall())
+        return sizes
+
+    def chunk_object(self, object_id: str, chunker: ContentDefinedChunker) -> List[str]:
+        """Method to split a whole file object into chunks, writing any new chunks and the chunk list to the cache
+
+        Args:
+            object_id: id of the whole file object, which must exist in the object cache
+            chunker: chunker used to find chunk boundaries
+
+        Returns:
+            list of absolute paths to the new objects that need to be pushed
+        """
+        existing_chunk_list_id = self.get_chunk_list_id(object_id)
+        if existing_chunk_list_id and os.path.isfile(self.object_path(existing_chunk_list_id)):
+            # Already chunked (e.g. a duplicate file), so nothing new to push
+            return list()
+
+        chunks: List[Tuple[str, int]] = list()
+        new_objects: List[str] = list()
+        with open(self.object_path(object_id), 'rb') as fh:
+            for data in chunker.chunks(fh):
+                chunk_id = blake2b(data).hexdigest()
+                chunks.append((chunk_id, len(data)))
+
+                chunk_path = self.object_path(chunk_id)
+                if chunk_id not in self.known_chunks([chunk_id]) and not os.path.isfile(chunk_path):
+                    _atomic_write(chunk_path, data)
+                    new_objects.append(chunk_path)
+
+        chunk_list_data = encode_chunk_list(chunks)
+        chunk_list_id = blake2b(chunk_list_data).hexdigest()
+        _atomic_write(self.object_path(chunk_list_id), chunk_list_data)
+        new_objects.append(self.object_path(chunk_list_id))
+
+        self._record_chunk_list(object_id, chunk_list_id, chunks)
+        return new_objects
+
+    def read_chunk_list(self, chunk_list_id: str) -> List[Tuple[str, int]]:
+        """Method to load a chunk list object from the object cache
+
+        Args:
+            chunk_list_id: id of the chunk list object
+
+        Returns:
+            list of (chunk id, size in bytes) in file order
+        """
+        with open(self.object_path(chunk_list_id), 'rb') as fh:
+            return decode_chunk_list(fh.read())
+
+    def _chunk_locations(self, chunk_id: str) -> List[Tuple[str, int]]:
+        """Method to get every whole file object known to contain a chunk
+
+        Args:
+            chunk_id: id of the chunk
+
+        Returns:
+            list of (object id, offset of the chunk in the object)
+        """
+        with self._lock:
+            return self._connect().execute("SELECT object_id, offset FROM chunks WHERE chunk_id = ?",
+                                           (chunk_id,)).fetchall()
+
+    def find_chunk(self, chunk_id: str) -> Optional[Tuple[str, int]]:
+        """Method to find a chunk in the local object cache, either as a chunk object or inside a whole file object
+
+        Args:
+            chunk_id: id of the chunk
+
+        Returns:
+            tuple of the absolute path to the file containing the chunk and the offset of the chunk in it
+        """
+        chunk_path = self.object_path(chunk_id)
+        if os.path.isfile(chunk_path):
+            return chunk_path, 0
+
+        for object_id, offset in self._chunk_locations(chunk_id):
+            if os.path.isfile(self.object_path(object_id)):
+                return self.object_path(object_id), offset
+        return None
+
+    def missing_chunks(self, chunk_list_id: str) -> List[Tuple[str, int]]:
+        """Method to get the chunks of a file that are not available locally and must be downloaded
+
+        Args:
+            chunk_list_id: id of the chunk list object, which must exist in the object cache
+
+        Returns:
+            list of (chunk id, size in bytes)
+        """
+        missing: List[Tuple[str, int]] = list()
+        seen: Set[str] = set()
+        for chunk_id, size in self.read_chunk_list(chunk_list_id):
+            if chunk_id not in seen and self.find_chunk(chunk_id) is None:
+                missing.append((chunk_id, size))
+            seen.add(chunk_id)
+        return missing
+
+    def assemble_object(self, object_id: str, chunk_list_id: str,
+                        progress_update_fn: Optional[Callable] = None) -> None:
+        """Method to materialize a whole file object from its chunks, which must all be available locally
+
+        The contents are verified against the object id before the object is written to the object cache.
+
+        Args:
+            object_id: id of the whole file object
+            chunk_list_id: id of the chunk list object
+            progress_update_fn: Optional callable with arg "completed_bytes" (int), called for each chunk that was
+                                already available locally (downloaded chunks have already been reported)
+
+        Returns:
+            None
+        """
+        chunks = self.read_chunk_list(chunk_list_id)
+        destination = self.object_path(object_id)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        temp_path = temp_file_path(destination)
+
+        h = blake2b()
+        try:
+            with open(temp_path, 'wb') as out_fh:
+                for chunk_id, size in chunks:
+                    location = self.find_chunk(chunk_id)
+                    if location is None:
+                        raise IOError(f"Chunk {chunk_id} is not available locally")
+                    source_path, offset = location
+
+                    with open(source_path, 'rb') as in_fh:
+                        in_fh.seek(offset)
+                        data = in_fh.read(size)
+                    if len(data) != size:
+                        raise IOError(f"Chunk {chunk_id} is truncated")
+
+                    h.update(data)
+                    out_fh.write(data)
+                    if progress_update_fn and source_path != self.object_path(chunk_id):
+                        progress_update_fn(completed_bytes=size)
+
+            if h.hexdigest() != object_id:
+                raise IOError(f"Assembled contents of {object_id} do not match the expected hash")
+
+            os.replace(temp_path, destination)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self._record_chunk_list(object_id, chunk_list_id, chunks)
+
+    def remove_chunk_objects(self, object_ids: Iterable[str]) -> None:
+        """Method to remove chunk objects that are no longer needed (e.g. after they have been pushed or assembled)
+
+        Only chunks that are also stored inside a local whole file object are removed, so no data is lost.
+
+        Args:
+            object_ids: ids of objects to consider. Objects that are not chunks are ignored.
+
+        Returns:
+            None
+        """
+        for object_id in set(object_ids):
+            chunk_path = self.object_path(object_id)
+            if not os.path.isfile(chunk_path):
+                continue
+
+            if any(os.path.isfile(self.object_path(location_id))
+                   for location_id, _ in self._chunk_locations(object_id) if location_id != object_id):
+                os.remove(chunk_path)
@@ -0,0 +1,347 @@
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union, overload
+import os
+import pickle
+import sqlite3
+import threading
+
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+T = TypeVar('T')
+
+# Name of the legacy pickled fast hash file. It is migrated into the index on first access
+LEGACY_FAST_HASH_FILE = ".smarthash"
+
+# Name of the SQLite fast hash index stored in each revision directory
+FAST_HASH_INDEX_FILE = ".smarthash.db"
+
+
+def is_fast_hash_file(filename: str) -> bool:
+    """Helper to check if a file in a revision directory is part of the fast hash index (including SQLite journal
+    files), so it can be ignored when walking the dataset
+
+    Args:
+        filename: base name of the file
+
+    Returns:
+        bool
+    """
+    return filename.startswith(LEGACY_FAST_HASH_FILE)
+
+
+def split_fast_hash(fast_hash_val: str) -> Tuple[str, str, str]:
+    """Helper to split a fast hash string into its relative path, size, and mtime components
+
+    Args:
+        fast_hash_val: a fast hash string of the form `relative path || size in bytes || mtime`
+
+    Returns:
+        tuple
+    """
+    relative_path, file_bytes, mtime = fast_hash_val.rsplit("||", 2)
+    return relative_path, file_bytes, mtime
+
+
+class FastHashStore(MutableMapping):
+    """Class to provide an indexed, on-disk store of fast hash data keyed by the relative path of each file
+
+    Each row stores the size, mtime, and inode of a file at the time it was last hashed. Reads and writes are per-key, so
+    updating the fast hash of a few files does not require re-writing the data for every file in the dataset.
+
+    The store behaves like a dictionary of `relative path -> fast hash string` to remain compatible with the original
+    pickle-backed implementation. The database file is only created on the first write.
+
+    Since a file is fast hashed when it is linked into or added to the revision, and removed from the store when it is
+    deleted or evicted, the store also maintains the total size of the files available locally (see `local_bytes()`).
+    """
+    def __init__(self, revision_dir: str) -> None:
+        self.revision_dir = revision_dir
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    @property
+    def index_file(self) -> str:
+        """Property to get the absolute path to the SQLite index file"""
+        return os.path.join(self.revision_dir, FAST_HASH_INDEX_FILE)
+
+    @property
+    def legacy_file(self) -> str:
+        """Property to get the absolute path to the legacy pickled fast hash file"""
+        return os.path.join(self.revision_dir, LEGACY_FAST_HASH_FILE)
+
+    def _connect(self, create: bool) -> Optional[sqlite3.Connection]:
+        """Method to get a connection to the index, optionally creating it and migrating legacy data
+
+        Args:
+            create: If True, create the index if it doesn't exist. If False, return None if it doesn't exist
+
+        Returns:
+            sqlite3.Connection
+        """
+        if self._connection:
+            return self._connection
+
+        if not create and not os.path.exists(self.index_file) and not os.path.exists(self.legacy_file):
+            return None
+
+        os.makedirs(self.revision_dir, exist_ok=True)
+        self._connection = sqlite3.connect(self.index_file, timeout=60, check_same_thread=False)
+        # Rows replaced by INSERT OR REPLACE must fire the delete trigger to keep the total size correct
+        self._connection.execute("PRAGMA recursive_triggers = ON")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS fast_hash (path TEXT PRIMARY KEY NOT NULL, "
+                                 "size INTEGER NOT NULL, mtime TEXT NOT NULL, inode INTEGER)")
+        self._create_local_bytes_triggers(self._connection)
+        self._connection.commit()
+        self._migrate_legacy_file()
+        return self._connection
+
+    @staticmethod
+    def _create_local_bytes_triggers(conn: sqlite3.Connection) -> None:
+        """Method to create the table holding the total size of all files (not directories) in the store, and the
+        triggers that maintain it. If the store was created before the total was tracked, it is computed once.
+
+        Args:
+            conn: connection to the index
+
+        Returns:
+            None
+        """
+        conn.execute("CREATE TABLE IF NOT EXISTS local_bytes (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                     "num_bytes INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO local_bytes (id, num_bytes) "
+                     "SELECT 0, COALESCE(SUM(size), 0) FROM fast_hash WHERE substr(path, -1) != '/'")
+        conn.execute("CREATE TRIGGER IF NOT EXISTS local_bytes_insert AFTER INSERT ON fast_hash "
+                     "WHEN substr(NEW.path, -1) != '/' BEGIN "
+                     "UPDATE local_bytes SET num_bytes = num_bytes + NEW.size WHERE id = 0; END")
+        conn.execute("CREATE TRIGGER IF NOT EXISTS local_bytes_delete AFTER DELETE ON fast_hash "
+                     "WHEN substr(OLD.path, -1) != '/' BEGIN "
+                     "UPDATE local_bytes SET num_bytes = num_bytes - OLD.size WHERE id = 0; END")
+        conn.execute("CREATE TRIGGER IF NOT EXISTS local_bytes_update AFTER UPDATE OF size ON fast_hash "
+                     "WHEN substr(NEW.path, -1) != '/' BEGIN "
+                     "UPDATE local_bytes SET num_bytes = num_bytes - OLD.size + NEW.size WHERE id = 0; END")
+
+    def _connect_for_write(self, create: bool) -> Optional[sqlite3.Connection]:
+        """Method to get a connection before modifying the index
+
+        Revision directories are removed when a dataset moves to a new revision. If that happened while the connection
+        was open, it refers to an unlinked file, so reconnect (recreating the index if requested).
+
+        Args:
+            create: If True, create the index if it doesn't exist
+
+        Returns:
+            sqlite3.Connection
+        """
+        if self._connection and not os.path.exists(self.index_file):
+            self.close()
+        return self._connect(create=create)
+
+    def _migrate_legacy_file(self) -> None:
+        """Method to load a legacy pickled fast hash file into the index and remove it
+
+        Returns:
+            None
+        """
+        if not os.path.exists(self.legacy_file):
+            return
+
+        try:
+            with open(self.legacy_file, 'rb') as mf:
+                data = pickle.load(mf)
+            self.update_many(data)
+            logger.info(f"Migrated {len(data)} fast hash entries from {self.legacy_file}")
+        except Exception as err:
+            # The fast hash is just a cache. If it can't be migrated, files will simply be re-hashed
+            logger.warning(f"Failed to migrate legacy fast hash file {self.legacy_file}")
+            logger.exception(err)
+
+        os.remove(self.legacy_file)
+
+    def __getitem__(self, relative_path: str) -> str:
+        value = self.get(relative_path)
+        if value is None:
+            raise KeyError(relative_path)
+        return value
+
+    @overload
+    def get(self, relative_path: str) -> Optional[str]:
+        ...
+
+    @overload
+    def get(self, relative_path: str, default: Union[str, T]) -> Union[str, T]:
+        ...
+
+    def get(self, relative_path: str, default: Any = None) -> Any:
+        """Method to look up the fast hash for a single file
+
+        Args:
+            relative_path: relative path to the file in the dataset
+            default: value to return if the file is not in the index
+
+        Returns:
+            str
+        """
+        with self._lock:
+            conn = self._connect(create=False)
+            if not conn:
+                return default
+            row = conn.execute("SELECT size, mtime FROM fast_hash WHERE path = ?", (relative_path,)).fetchone()
+
+        if row is None:
+            return default
+        return f"{relative_path}||{row[0]}||{row[1]}"
+
+    def __setitem__(self, relative_path: str, fast_hash_val: str) -> None:
+        self.update_many({relative_path: fast_hash_val})
+
+    def __delitem__(self, relative_path: str) -> None:
+        if relative_path not in self:
+            raise KeyError(relative_path)
+        self.delete_many([relative_path])
+
+    def __contains__(self, relative_path: object) -> bool:
+        with self._lock:
+            conn = self._connect(create=False)
+            if not conn:
+                return False
+            row = conn.execute("SELECT 1 FROM fast_hash WHERE path = ?", (relative_path,)).fetchone()
+        return row is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            conn = self._connect(create=False)
+            if not conn:
+                return iter([])
+            paths = [row[0] for row in conn.execute("SELECT path FROM fast_hash ORDER BY path")]
+        return iter(paths)
+
+    def __len__(self) -> int:
+        with self._lock:
+            conn = self._connect(create=False)
+            if not conn:
+                return 0
+            return conn.execute("SELECT COUNT(*) FROM fast_hash").fetchone()[0]
+
+    def update_many(self, fast_hashes: Dict[str, str], inodes: Optional[Dict[str, int]] = None) -> None:
+        """Method to insert or update the fast hash for many files in a single transaction
+
+        Args:
+            fast_hashes: dict of relative path -> fast hash string
+            inodes: optional dict of relative path -> inode number
+
+        Returns:
+            None
+        """
+        if not fast_hashes:
+            return
+
+        rows = list()
+        for relative_path, fast_hash_val in fast_hashes.items():
+            _, file_bytes, mtime = split_fast_hash(fast_hash_val)
+            inode = inodes.get(relative_path) if inodes else None
+            rows.append((relative_path, int(file_bytes), mtime, inode))
+
+        with self._lock:
+            conn = self._connect_for_write(create=True)
+            if conn:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO fast_hash (path, size, mtime, inode) "
+                                     "VALUES (?, ?, ?, ?)", rows)
+
+    def delete_many(self, relative_paths: Iterable[str]) -> None:
+        """Method to remove the fast hash for many files in a single transaction
+
+        Args:
+            relative_paths: relative paths to remove
+
+        Returns:
+            None
+        """
+        with self._lock:
+            conn = self._connect_for_write(create=False)
+            if not conn:
+                return
+            with conn:
+                conn.executemany("DELETE FROM fast_hash WHERE path = ?", [(p,) for p in relative_paths])
+
+    def get_inode(self, relative_path: str) -> Optional[int]:
+        """Method to get the inode recorded for a file when it was last fast hashed
+
+        Args:
+            relative_path: relative path to the file in the dataset
+
+        Returns:
+            int
+        """
+        with self._lock:
+            conn = self._connect(create=False)
+            if not conn:
+                return None
+            row = conn.execute("SELECT inode FROM fast_hash WHERE path = ?", (relative_path,)).fetchone()
+        return row[0] if row else None
+
+    def local_bytes(self) -> int:
+        """Method to get the total size of the files in the store, i.e. the files that are available locally in the
+        revision. This is maintained as the store changes, so the cost does not depend on the number of files.
+
+        Returns:
+            int
+        """
+        with self._lock:
+            conn = self._connect(create=False)
+            if not conn:
+                return 0
+            return conn.execute("SELECT num_bytes FROM local_bytes WHERE id = 0").fetchone()[0]
+
+    def snapshot(self) -> Dict[str, Tuple[int, float]]:
+        """Method to load the size and mtime of every file in the index with a single query. This is useful when
+        comparing every file in a revision against the index (e.g. computing status), since stat results can be
+        compared directly without formatting a fast hash string for each file
+
+        Returns:
+            dict of relative path -> (size in bytes, mtime)
+        """
+        with self._lock:
+            conn = self._connect(create=False)
+            if not conn:
+                return dict()
+            return {row[0]: (row[1], float(row[2]))
+                    for row in conn.execute("SELECT path, size, mtime FROM fast_hash")}
+
+    def missing_from(self, relative_paths: Iterable[str]) -> List[str]:
+        """Method to get all paths in the index that are not in the provided collection
+
+        Args:
+            relative_paths: relative paths that currently exist
+
+        Returns:
+            list
+        """
+        existing = set(relative_paths)
+        return sorted([p for p in self if p not in existing])
+
+    def clear(self) -> None:
+        """Method to remove all entries from the index
+
+        Returns:
+            None
+        """
+        with self._lock:
+            conn = self._connect_for_write(create=False)
+            if not conn:
+                return
+            with conn:
+                conn.execute("DELETE FROM fast_hash")
+
+    def close(self) -> None:
+        """Method to close the underlying database connection
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
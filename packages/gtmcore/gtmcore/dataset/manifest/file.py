@@ -1,13 +1,13 @@
-from typing import List, Dict, Optional, NamedTuple, TYPE_CHECKING
+from typing import Any, List, Dict, Iterator, Optional, NamedTuple, Tuple, TYPE_CHECKING
 import pickle
 import os
 from enum import Enum
 from collections import OrderedDict
 import json
-import redis
 import glob
-import copy
+from hashlib import blake2b
 
+from gtmcore.dataset.manifest.index import ManifestIndex
 from gtmcore.logging import LMLogger
 
 if TYPE_CHECKING:
@@ -16,6 +16,9 @@ if TYPE_CHECKING:
 
 logger = LMLogger.get_logger()
 
+# Base name of the manifest index files in the `.manifest` directory of the file cache
+MANIFEST_INDEX_NAME = "index"
+
 
 class PersistTaskType(Enum):
     """Enumeration of persist tasks"""
@@ -40,22 +43,30 @@ class ManifestJSONEncoder(json.JSONEncoder):
 
 
 class ManifestFileCache(object):
-    """Class to provide a caching layer on top of a collection of Dataset manifest files
+    """Class to provide an indexed caching layer on top of a collection of Dataset manifest files
+
+    Manifest data is stored in a SQLite index (see `ManifestIndex`) in the dataset's file cache. There is one index
+    for the dataset, plus one for each Project the dataset is linked to (since a linked dataset may be at a different
+    revision). The index is built from the manifest files on first access, and changes are exported back to the
+    git-tracked manifest files on `persist()`. The index records a signature of the manifest files (their names,
+    sizes, and mtimes), and is rebuilt if the files change outside of this class (e.g. on sync or checkout).
 
     Note: The checkout context of the underlying dataset CANNOT change while this class is instantiated. If it does,
     you need to reload the Dataset instance and reload the Manifest instance, or run Manifest.force_reload().
 
     """
-    def __init__(self, dataset: 'Dataset', logged_in_username: Optional[str] = None) -> None:
+    def __init__(self, dataset: 'Dataset', cache_root: str, logged_in_username: Optional[str] = None) -> None:
         self.dataset = dataset
+        self.cache_root = cache_root
         self.logged_in_username = logged_in_username
 
         self.ignore_file = os.path.join(dataset.root_dir, ".gigantumignore")
 
-        self._redis_client: Optional[redis.StrictRedis] = None
-        self._manifest: OrderedDict = OrderedDict()
+        self._index: Optional[ManifestIndex] = None
+        self._index_checked = False
         self._current_checkout_id = self.dataset.checkout_id
         self._persist_queue: List[PersistTask] = list()
+        self._pending: Dict[str, Optional[OrderedDict]] = dict()
 
         # TODO: Support ignoring files
         # self.ignored = self._load_ignored()
@@ -63,29 +74,75 @@ class ManifestFileCache(object):
         self._legacy_manifest_file = os.path.join(self.dataset.root_dir, 'manifest', 'manifest0')
 
     @property
-    def redis_client(self) -> redis.StrictRedis:
-        """Property to get a redis client for manifest caching
+    def index_file(self) -> str:
+        """Property to get the manifest index file for this dataset instance
 
         Returns:
-            redis.StrictRedis
+            str
         """
-        if not self._redis_client:
-            self._redis_client = redis.StrictRedis(db=1)
-        return self._redis_client
+        name = MANIFEST_INDEX_NAME
+        linked_to = self.dataset.linked_to()
+        if linked_to:
+            name = f"{name}-{linked_to.replace('|', '-')}"
+
+        return os.path.join(self.cache_root, '.manifest', f"{name}.db")
 
     @property
-    def manifest_cache_key(self) -> str:
-        """Property to get the manifest cache key for this dataset instance
+    def index(self) -> ManifestIndex:
+        """Property to get the manifest index, without building it
+
+        Returns:
+            ManifestIndex
+        """
+        if self._index is None:
+            self._remove_stale_indexes()
+            self._index = ManifestIndex(self.index_file)
+        return self._index
+
+    def _remove_stale_indexes(self) -> None:
+        """Method to remove index files left by previous versions, which were keyed by the checkout context and
+        rebuilt in a new file on every sync or checkout
+
+        Returns:
+            None
+        """
+        index_dir = os.path.join(self.cache_root, '.manifest')
+        if not os.path.isdir(index_dir):
+            return
+
+        for filename in os.listdir(index_dir):
+            if not filename.startswith(MANIFEST_INDEX_NAME):
+                try:
+                    os.remove(os.path.join(index_dir, filename))
+                except OSError as err:
+                    logger.warning(f"Failed to remove stale manifest index {filename}: {err}")
+
+    def _manifest_files(self) -> List[str]:
+        """Method to get the manifest files of the dataset, including the legacy manifest file if it exists
 
         Returns:
-            redis.StrictRedis
+            list of absolute paths
         """
-        key = f"DATASET-MANIFEST-CACHE|{self._current_checkout_id}"
+        manifest_files = glob.glob(os.path.join(self.dataset.root_dir, 'manifest', 'manifest-*'))
+        if os.path.exists(self._legacy_manifest_file):
+            manifest_files.append(self._legacy_manifest_file)
+        return manifest_files
 
-        if self.dataset.linked_to():
-            key = f"{key}|{self.dataset.linked_to()}"
+    def _source_signature(self) -> str:
+        """Method to compute a signature of the manifest files, which changes if any of them are added, removed, or
+        modified
 
-        return key
+        Returns:
+            str
+        """
+        h = blake2b()
+        for manifest_file in sorted(self._manifest_files()):
+            try:
+                file_info = os.stat(manifest_file)
+            except FileNotFoundError:
+                continue
+            h.update(f"{os.path.basename(manifest_file)}|{file_info.st_size}|{file_info.st_mtime_ns}\n".encode())
+        return h.hexdigest()
 
     def _load_legacy_manifest(self) -> OrderedDict:
         """Method to load the manifest file
@@ -145,114 +202,124 @@ class ManifestFileCache(object):
         with open(os.path.join(self.dataset.root_dir, 'manifest', f'manifest-{checkout_id}.json'), 'wt') as mf:
             json.dump(data, mf, cls=ManifestJSONEncoder)
 
-    def _load_manifest_data(self) -> OrderedDict:
-        """Method to load all manifest data, either from the memory cache or from all the manifest files
+    def _load_manifest_data(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Generator to load all manifest data from the manifest files, used to build the index
 
         Returns:
-            OrderedDict
+            Iterator of (relative path, manifest entry)
         """
-        manifest_data = OrderedDict()
-        cache_bytes = self.redis_client.get(self.manifest_cache_key)
-        if cache_bytes:
-            # Load from cache
-            manifest_data = json.loads(cache_bytes.decode(),
-                                       object_pairs_hook=OrderedDict)
-            self.redis_client.expire(self.manifest_cache_key, 3600)
-        else:
-            # Load from files
-            for manifest_file in glob.glob(os.path.join(self.dataset.root_dir, 'manifest', 'manifest-*')):
-                manifest_data.update(self._load_manifest_file(manifest_file))
-
-            # Check for legacy manifest and load if needed
-            if os.path.exists(self._legacy_manifest_file):
-                manifest_data.update(self._load_legacy_manifest())
-
-            # Cache manifest data
-            if manifest_data:
-                self.redis_client.set(self.manifest_cache_key, json.dumps(manifest_data, separators=(',', ':')))
-                self.redis_client.expire(self.manifest_cache_key, 3600)
+        for manifest_file in glob.glob(os.path.join(self.dataset.root_dir, 'manifest', 'manifest-*')):
+            yield from self._load_manifest_file(manifest_file).items()
 
-        return manifest_data
+        # Check for legacy manifest and load if needed
+        if os.path.exists(self._legacy_manifest_file):
+            yield from self._load_legacy_manifest().items()
 
     def evict(self) -> None:
-        """Method to remove an entry from the manifest data cache (stored in redis db 1)
+        """Method to clear the manifest index, so it is rebuilt from the manifest files on next access
         (used when needing to reload files that may still be under the same checkout context, e.g. a local
         linked dataset)
 
         Returns:
             None
         """
-        if self.redis_client.exists(self.manifest_cache_key):
-            self.redis_client.delete(self.manifest_cache_key)
-
-        self._manifest = OrderedDict()
+        self.index.invalidate()
+        self._index_checked = False
 
     def persist(self) -> None:
-        """Method to persist changes to the manifest to the cache and any associated manifest file
+        """Method to persist changes to the manifest to the index and any associated manifest file
+
+        The index is updated and the affected manifest files are rewritten in a single transaction, so if writing a
+        manifest file fails the index is left unchanged. Each manifest file is rewritten from its own contents, so
+        entries it has for paths that a later manifest file also has (which the index doesn't hold) are kept.
 
         Returns:
             None
         """
         try:
-            # Repack tasks by manifest file
-            file_groups: Dict[str, List[PersistTask]] = dict()
+            if not self._persist_queue:
+                return
+
+            # Repack changed paths by manifest file
+            file_groups: Dict[str, List[str]] = OrderedDict()
             for task in self._persist_queue:
-                if task.manifest_file in file_groups:
-                    file_groups[task.manifest_file].append(task)
-                else:
-                    file_groups[task.manifest_file] = [task]
-
-            # Update manifest files
-            for manifest_file in file_groups:
-                if manifest_file == "manifest0":
-                    data = self._load_legacy_manifest()
-                    for task in file_groups[manifest_file]:
-                        if task.task == PersistTaskType.DELETE:
-                            del data[task.relative_path]
-                        else:
-                            data[task.relative_path] = self._manifest[task.relative_path]
-
-                    self._write_legacy_manifest(data)
-                else:
-                    full_manifest_file_path = os.path.join(self.dataset.root_dir, 'manifest', manifest_file)
-                    data = self._load_manifest_file(full_manifest_file_path)
-                    for task in file_groups[manifest_file]:
-                        if task.task == PersistTaskType.DELETE:
-                            del data[task.relative_path]
+                file_groups.setdefault(task.manifest_file, list()).append(task.relative_path)
+
+            with self.index.transaction():
+                self.index.upsert_many({key: value for key, value in self._pending.items() if value is not None})
+                self.index.delete_many([key for key, value in self._pending.items() if value is None])
+
+                # Update manifest files
+                for manifest_file, relative_paths in file_groups.items():
+                    if manifest_file == "manifest0":
+                        data = self._load_legacy_manifest()
+                    else:
+                        data = self._load_manifest_file(os.path.join(self.dataset.root_dir, 'manifest',
+                                                                     manifest_file))
+
+                    for relative_path in relative_paths:
+                        # A path removed and added again may now belong to a different manifest file
+                        entry = self._pending.get(relative_path)
+                        if entry is not None and entry['fn'] == manifest_file:
+                            data[relative_path] = OrderedDict(entry)
                         else:
-                            data[task.relative_path] = copy.deepcopy(self._manifest[task.relative_path])
-                    checkout_id = manifest_file[9:-5]  # strips off manifest- and .json from file name to get id
-                    self._write_manifest_file(checkout_id, data)
+                            data.pop(relative_path, None)
 
-            # Persist to cache
-            self.redis_client.set(self.manifest_cache_key, json.dumps(self._manifest, separators=(',', ':')))
-            self.redis_client.expire(self.manifest_cache_key, 3600)
+                    if manifest_file == "manifest0":
+                        [data[key].pop('fn', None) for key in data]
+                        self._write_legacy_manifest(data)
+                    else:
+                        checkout_id = manifest_file[9:-5]  # strips off manifest- and .json from file name to get id
+                        self._write_manifest_file(checkout_id, data)
+
+                # The index matches the manifest files that were just written
+                self.index.set_source_signature(self._source_signature())
 
         except Exception as err:
             logger.error("An error occurred while trying to persist manifest data to disk.")
             logger.exception(err)
 
-            # Clear data so it all reloads from disk
-            self._manifest = OrderedDict()
+            # Clear the index so it all reloads from disk
+            self.evict()
             raise IOError("An error occurred while trying to persist manifest data to disk. Refresh and try again")
         finally:
             self._persist_queue = list()
+            self._pending = dict()
+
+    def get_manifest(self) -> ManifestIndex:
+        """Method to get the current manifest, building the index from the manifest files if needed
 
-    def get_manifest(self) -> OrderedDict:
-        """Method to get the current manifest
+        The first access checks the index against the manifest files, and rebuilds it if they have changed. Later
+        accesses trust the index, which is kept up to date by `persist()`.
 
         Returns:
-            OrderedDict
+            ManifestIndex
         """
-        if not self._manifest:
-            self._manifest = self._load_manifest_data()
+        if self._index_checked:
+            self.index.build(self._load_manifest_data)
+        else:
+            self.index.build(self._load_manifest_data, self._source_signature())
+            self._index_checked = True
+        return self.index
 
-        return self._manifest
+    def _get_entry(self, relative_path: str) -> Optional[Dict[str, Any]]:
+        """Helper to get a manifest entry, including changes that have not been persisted yet
 
-    def add_or_update(self, relative_path: str, content_hash: str, modified_on: str, num_bytes: str) -> None:
+        Args:
+            relative_path: relative path to the file
+
+        Returns:
+            dict
+        """
+        if relative_path in self._pending:
+            return self._pending[relative_path]
+        return self.get_manifest().get(relative_path)
+
+    def add_or_update(self, relative_path: str, content_hash: str, modified_on: str, num_bytes: str,
+                      chunk_list: Optional[str] = None) -> None:
         """Method to add or update a file in the manifest
 
-        Note: Changes are not persisted to the disk and cache until self.persist() is called. This is done
+        Note: Changes are not persisted to the index and disk until self.persist() is called. This is done
         in manifest.py in most cases.
 
         Args:
@@ -260,25 +327,27 @@ class ManifestFileCache(object):
             content_hash: content hash to the file
             modified_on: modified datetime of the file
             num_bytes: number of bytes in the file
+            chunk_list: optional id of the chunk list object, if the file is stored as chunks
 
         Returns:
             None
         """
-        # Make sure manifest is loaded
-        self.get_manifest()
-
         _, checkout_id = self._current_checkout_id.rsplit('-', 1)
-        if relative_path in self._manifest:
+        current_entry = self._get_entry(relative_path)
+        if current_entry:
             task_type = PersistTaskType.UPDATE
-            manifest_file = self._manifest[relative_path]['fn']
+            manifest_file = current_entry['fn']
         else:
             task_type = PersistTaskType.ADD
             manifest_file = f'manifest-{checkout_id}.json'
 
-        self._manifest[relative_path] = OrderedDict([('h', content_hash),
-                                                     ('m', modified_on),
-                                                     ('b', num_bytes),
-                                                     ('fn', manifest_file)])
+        entry = OrderedDict([('h', content_hash),
+                             ('m', modified_on),
+                             ('b', num_bytes),
+                             ('fn', manifest_file)])
+        if chunk_list:
+            entry['c'] = chunk_list
+        self._pending[relative_path] = entry
 
         self._persist_queue.append(PersistTask(relative_path=relative_path,
                                                task=task_type,
@@ -287,7 +356,7 @@ class ManifestFileCache(object):
     def remove(self, relative_path: str) -> None:
         """Method to remove a file from the manifest
 
-        Note: Changes are not persisted to the disk and cache until self.persist() is called. This is done
+        Note: Changes are not persisted to the index and disk until self.persist() is called. This is done
         in manifest.py in most cases.
 
         Args:
@@ -296,13 +365,12 @@ class ManifestFileCache(object):
         Returns:
             None
         """
-        # Make sure manifest is loaded
-        self.get_manifest()
+        current_entry = self._get_entry(relative_path)
+        if not current_entry:
+            raise KeyError(relative_path)
 
-        manifest_file = self._manifest[relative_path]['fn']
-        del self._manifest[relative_path]
+        self._pending[relative_path] = None
 
         self._persist_queue.append(PersistTask(relative_path=relative_path,
                                                task=PersistTaskType.DELETE,
-                                               manifest_file=manifest_file))
-
+                                               manifest_file=current_entry['fn']))
@@ -1,51 +1,90 @@
 from hashlib import blake2b
-import aiofiles
+import asyncio
+import io
+from concurrent.futures import Executor, ProcessPoolExecutor
 
-from typing import List, Optional
-import pickle
+from typing import AsyncIterator, List, Optional, Set, Tuple
+from itertools import islice
 import os
 from gtmcore.logging import LMLogger
+from gtmcore.dataset.manifest.fasthash import FastHashStore
+from gtmcore.dataset.manifest.eventloop import get_event_loop
 
 logger = LMLogger.get_logger()
 
+# Size of the buffer each hashing worker reads into (4 MiB)
+HASHING_BLOCK_SIZE = 4194304
+
+
+def hash_file_contents(abs_path: str, blocksize: int = HASHING_BLOCK_SIZE) -> Optional[str]:
+    """Function to compute the blake2b hash of a file, reading into a single reusable buffer
+
+    This is a module level function so it can be sent to a process pool worker.
+
+    Args:
+        abs_path: Absolute path to the file
+        blocksize: Size in bytes of the read buffer
+
+    Returns:
+        str
+    """
+    h = blake2b()
+    try:
+        if os.path.isfile(abs_path):
+            buffer = bytearray(blocksize)
+            view = memoryview(buffer)
+            with io.FileIO(abs_path, 'rb') as fh:
+                num_bytes = fh.readinto(buffer)
+                while num_bytes:
+                    h.update(view[:num_bytes])
+                    num_bytes = fh.readinto(buffer)
+        elif os.path.isdir(abs_path):
+            # If a directory, just hash the path as an alternative
+            h.update(abs_path.encode('utf-8'))
+        else:
+            return None
+    except Exception as err:
+        logger.exception(err)
+        return None
+
+    return h.hexdigest()
+
 
 class SmartHash(object):
     """Class to handle file hashing that is operationally optimized for Gigantum"""
 
-    def __init__(self, root_dir: str, file_cache_root: str, current_revision: str) -> None:
+    def __init__(self, root_dir: str, file_cache_root: str, current_revision: str,
+                 num_workers: Optional[int] = None) -> None:
         self.root_dir = root_dir
         self.file_cache_root = file_cache_root
-        self.current_revision = current_revision
-
-        self.fast_hash_data = self._load_fast_hash_file()
-
-        self.hashing_block_size = 65536
 
-    @property
-    def fast_hash_file(self):
-        hash_file_dir = os.path.join(self.file_cache_root, self.current_revision)
-        return os.path.join(hash_file_dir, ".smarthash")
+        self._current_revision = current_revision
+        self.fast_hash_data = FastHashStore(os.path.join(self.file_cache_root, self._current_revision))
 
-    def _load_fast_hash_file(self) -> dict:
-        """Method to load the cached fast hash file
+        self.hashing_block_size = HASHING_BLOCK_SIZE
 
-        Returns:
-            dict
-        """
-        if os.path.exists(self.fast_hash_file):
-            with open(self.fast_hash_file, 'rb') as mf:
-                return pickle.load(mf)
-        else:
-            return dict()
+        # Max number of processes used to hash file contents. If not set, use all available cores
+        if not num_workers:
+            num_workers = os.cpu_count() or 1
+        self.num_workers = num_workers
 
-    def _save_fast_hash_file(self) -> None:
-        """Method to save the cached fast hash file
+    @property
+    def current_revision(self) -> str:
+        """The dataset revision the fast hash index and file paths refer to"""
+        return self._current_revision
+
+    @current_revision.setter
+    def current_revision(self, revision: str) -> None:
+        """Setting the revision switches to the fast hash index stored in that revision's directory"""
+        if revision != self._current_revision:
+            self.fast_hash_data.close()
+            self._current_revision = revision
+            self.fast_hash_data = FastHashStore(os.path.join(self.file_cache_root, self._current_revision))
 
-        Returns:
-            dict
-        """
-        with open(self.fast_hash_file, 'wb') as mf:
-            pickle.dump(self.fast_hash_data, mf, pickle.HIGHEST_PROTOCOL)
+    @property
+    def fast_hash_file(self) -> str:
+        """The location of the fast hash index for the current revision"""
+        return self.fast_hash_data.index_file
 
     def get_abs_path(self, relative_path: str) -> str:
         """Method to generate the absolute path to the file
@@ -92,7 +131,7 @@ class SmartHash(object):
         Returns:
 
         """
-        return sorted(list(set(self.fast_hash_data.keys()).difference(file_list)))
+        return self.fast_hash_data.missing_from(file_list)
 
     def delete_fast_hashes(self, file_list: List[str]) -> None:
         """Method to remove fast hashes from the stored hash file
@@ -103,10 +142,7 @@ class SmartHash(object):
         Returns:
 
         """
-        for f in file_list:
-            del self.fast_hash_data[f]
-
-        self._save_fast_hash_file()
+        self.fast_hash_data.delete_many(file_list)
 
     def _compute_fast_hash(self, relative_path: str) -> Optional[str]:
         """
@@ -121,12 +157,36 @@ class SmartHash(object):
         Returns:
             str
         """
-        abs_path = self.get_abs_path(relative_path)
-        fast_hash_val = None
-        if os.path.exists(abs_path):
-            file_info = os.stat(abs_path)
-            fast_hash_val = f"{relative_path}||{file_info.st_size}||{file_info.st_mtime}"
-        return fast_hash_val
+        return self._format_fast_hash(relative_path, self._stat(relative_path))
+
+    def _stat(self, relative_path: str) -> Optional[os.stat_result]:
+        """Helper to stat a file in the current revision, returning None if it does not exist
+
+        Args:
+            relative_path: Relative path to the file in the dataset
+
+        Returns:
+            os.stat_result
+        """
+        try:
+            return os.stat(self.get_abs_path(relative_path))
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _format_fast_hash(relative_path: str, file_info: Optional[os.stat_result]) -> Optional[str]:
+        """Helper to build the fast hash string from a file's stat result
+
+        Args:
+            relative_path: Relative path to the file in the dataset
+            file_info: stat result for the file, or None if it doesn't exist
+
+        Returns:
+            str
+        """
+        if file_info is None:
+            return None
+        return f"{relative_path}||{file_info.st_size}||{file_info.st_mtime}"
 
     def fast_hash(self, path_list: list, save: bool = True) -> List[Optional[str]]:
         """
@@ -144,57 +204,95 @@ class SmartHash(object):
         """
         fast_hash_result: List[Optional[str]] = list()
         if len(path_list) > 0:
-            fast_hash_result = [self._compute_fast_hash(x) for x in path_list]
+            file_info = [self._stat(x) for x in path_list]
+            fast_hash_result = [self._format_fast_hash(p, st) for p, st in zip(path_list, file_info)]
 
             if save:
-                for p, h in zip(path_list, fast_hash_result):
-                    if h:
-                        self.fast_hash_data[p] = h
-
-                self._save_fast_hash_file()
+                # Only the provided paths are written to the index
+                self.fast_hash_data.update_many({p: h for p, h in zip(path_list, fast_hash_result) if h},
+                                                inodes={p: st.st_ino for p, st in zip(path_list, file_info) if st})
 
         return fast_hash_result
 
-    async def compute_file_hash(self, path: str, blocksize: int = 4096) -> Optional[str]:
+    async def compute_file_hash(self, path: str, blocksize: int = HASHING_BLOCK_SIZE,
+                                executor: Optional[Executor] = None) -> Optional[str]:
         """Method to compute the black2b hash for the provided file
 
         Args:
             path: Relative path to the file
             blocksize: Blocksize to use when reading the file and computing the hash
+            executor: Optional executor to run the hashing in. If omitted, the loop's default executor is used
 
         Returns:
             str
         """
-        h = blake2b()
-        try:
-            abs_path = self.get_abs_path(path)
-            if os.path.isfile(abs_path):
-                async with aiofiles.open(abs_path, 'rb') as fh:
-                    chunk = await fh.read(blocksize)
-                    while chunk:
-                        h.update(chunk)
-                        chunk = await fh.read(blocksize)
-            elif os.path.isdir(abs_path):
-                # If a directory, just hash the path as an alternative
-                h.update(abs_path.encode('utf-8'))
-            else:
-                return None
-        except Exception as err:
-            logger.exception(err)
-            return None
+        loop = get_event_loop()
+        return await loop.run_in_executor(executor, hash_file_contents, self.get_abs_path(path), blocksize)
+
+    async def _indexed_file_hash(self, index: int, path: str, executor: Optional[Executor]) -> Tuple[int, Optional[str]]:
+        """Helper to keep track of a file's position in the input list while hashing out of order"""
+        return index, await self.compute_file_hash(path, self.hashing_block_size, executor)
 
-        return h.hexdigest()
+    async def hash_as_completed(self, path_list: List[str],
+                                max_in_flight: Optional[int] = None) -> AsyncIterator[Tuple[int, Optional[str]]]:
+        """Method to compute the blake2b hash of many files in parallel, yielding results as each file completes
+
+        Files are fanned out across a process pool (up to `self.num_workers` processes). If only a single worker
+        is available or a single file is requested, hashing runs in the loop's default thread executor to avoid the
+        cost of starting processes.
+
+        At most `max_in_flight` files are submitted at a time, and a new file is only submitted once a result has
+        been consumed. A slow consumer therefore applies backpressure to hashing.
+
+        Args:
+            path_list: List of relative paths to hash
+            max_in_flight: Max number of files being hashed at once. Defaults to twice the number of workers
+
+        Yields:
+            tuple of the index of the file in `path_list` and the hash (None if the file could not be hashed)
+        """
+        if not path_list:
+            return
+
+        num_workers = min(self.num_workers, len(path_list))
+        executor: Optional[ProcessPoolExecutor] = None
+        if num_workers > 1:
+            executor = ProcessPoolExecutor(max_workers=num_workers)
+
+        if not max_in_flight:
+            max_in_flight = 2 * num_workers
+
+        pending: Set[asyncio.Future] = set()
+        try:
+            paths = enumerate(path_list)
+            for idx, path in islice(paths, max_in_flight):
+                pending.add(asyncio.ensure_future(self._indexed_file_hash(idx, path, executor)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for completed in done:
+                    yield completed.result()
+
+                    # Submit the next file once this result has been consumed
+                    for idx, path in islice(paths, 1):
+                        pending.add(asyncio.ensure_future(self._indexed_file_hash(idx, path, executor)))
+        finally:
+            for task in pending:
+                task.cancel()
+            if executor:
+                executor.shutdown(wait=True)
 
     async def hash(self, path_list: List[str]) -> List[Optional[str]]:
         """Method to compute the blake2b hash of a file's contents.
 
         Args:
-            path_list:
+            path_list: List of relative paths to hash
 
         Returns:
-            list
+            list of hashes in the same order as `path_list`
         """
-        hash_result_list: List[Optional[str]] = [await self.compute_file_hash(path,
-                                                 self.hashing_block_size) for path in path_list]
+        hash_result_list: List[Optional[str]] = [None] * len(path_list)
+        async for idx, hash_str in self.hash_as_completed(path_list):
+            hash_result_list[idx] = hash_str
 
         return hash_result_list
@@ -0,0 +1,437 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+import os
+import sqlite3
+import threading
+
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+# Version stored in the index once it has been fully built from the manifest files. An index with any other version
+# (e.g. a new or evicted index) is rebuilt on first access.
+INDEX_VERSION = 3
+
+# Triggers that maintain the file type statistics table
+STATISTICS_TRIGGERS = ['file_types_insert', 'file_types_delete', 'file_types_update']
+
+# Number of rows fetched per query when scanning the index. The index is scanned in batches (instead of holding a
+# cursor open) so locks are released between batches and other processes can write while a scan is in progress.
+SCAN_BATCH_SIZE = 5000
+
+# Number of hashes looked up per query. This must stay below SQLite's limit on the number of host parameters (999).
+HASH_LOOKUP_BATCH_SIZE = 500
+
+
+def file_type(relative_path: str) -> Optional[str]:
+    """Helper to get the file type (extension) a manifest entry is counted under in the dataset statistics.
+    Directories, hidden files, and files without an extension are not counted.
+
+    Args:
+        relative_path: relative path to the file
+
+    Returns:
+        str
+    """
+    if not relative_path or relative_path[-1] == '/':
+        return None
+
+    filename = os.path.basename(relative_path)
+    if filename[0] == '.' or '.' not in filename:
+        return None
+
+    _, ext = os.path.splitext(filename)
+    return ext or None
+
+
+# NamedTuple to capture aggregate statistics of the files in the manifest. `file_types` maps each file type to the
+# number of files of that type
+ManifestIndexStatistics = NamedTuple('ManifestIndexStatistics', [('num_files', int), ('total_bytes', int),
+                                                                 ('file_types', Dict[str, int])])
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """Helper to compute the smallest string that is greater than every string starting with `prefix`. This lets a
+    prefix query use the primary key index as a range scan (prefix <= path < upper bound)
+
+    Args:
+        prefix: a non-empty path prefix
+
+    Returns:
+        str
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class ManifestIndex(Mapping):
+    """Class to provide an indexed, on-disk store of manifest data keyed by the relative path of each file
+
+    The index behaves like a read-only dictionary of `relative path -> {'h': hash, 'm': mtime, 'b': bytes, 'fn':
+    manifest file}` (plus `'c': chunk list id` for chunked files), iterated in path order. Point lookups, ordered
+    range scans, and prefix queries only read the rows they need, so memory and latency scale with the size of the
+    request and not with the size of the dataset.
+
+    The git-tracked manifest files remain the source of truth. The index is built from them on first access and
+    changes are written to the index and exported to the manifest files in a single transaction
+    (see `ManifestFileCache.persist()`).
+
+    The number of files and bytes of each file type are maintained by triggers as entries are added, updated, and
+    removed, so dataset statistics can be read without scanning the manifest (see `statistics()`).
+    """
+    def __init__(self, index_file: str) -> None:
+        self.index_file = index_file
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Method to get a connection to the index, creating it if needed
+
+        Transactions are managed explicitly (see `transaction()`), so the connection is opened in autocommit mode.
+
+        Returns:
+            sqlite3.Connection
+        """
+        if self._connection and not os.path.exists(self.index_file):
+            # The cache directory was removed while the connection was open
+            self.close()
+
+        if not self._connection:
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            self._connection = sqlite3.connect(self.index_file, timeout=60, check_same_thread=False,
+                                               isolation_level=None)
+            # Entries replaced by INSERT OR REPLACE must fire the delete trigger to keep statistics correct
+            self._connection.execute("PRAGMA recursive_triggers = ON")
+            self._connection.create_function("file_type", 1, file_type)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS manifest (path TEXT PRIMARY KEY NOT NULL, "
+                                     "h, m, b, fn TEXT NOT NULL, c)")
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(manifest)")]
+            if 'c' not in columns:
+                # Index created before chunked files were supported. The version change triggers a rebuild.
+                self._connection.execute("ALTER TABLE manifest ADD COLUMN c")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS manifest_fn ON manifest (fn)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS manifest_h ON manifest (h)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS source (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                                     "signature TEXT)")
+            self._connection.execute("INSERT OR IGNORE INTO source (id) VALUES (0)")
+            self._create_statistics_triggers(self._connection)
+        return self._connection
+
+    @staticmethod
+    def _create_statistics_triggers(conn: sqlite3.Connection) -> None:
+        """Method to create the file type statistics table and the triggers that maintain it
+
+        Args:
+            conn: connection to the index
+
+        Returns:
+            None
+        """
+        conn.execute("CREATE TABLE IF NOT EXISTS file_types (ext TEXT PRIMARY KEY NOT NULL, "
+                     "num_files INTEGER NOT NULL, num_bytes INTEGER NOT NULL)")
+        # The conflict clause of the statement firing a trigger overrides any in the trigger body (e.g. INSERT OR
+        # REPLACE would reset the row), so rows are created with an explicit existence check
+        conn.execute("CREATE TRIGGER IF NOT EXISTS file_types_insert AFTER INSERT ON manifest "
+                     "WHEN file_type(NEW.path) IS NOT NULL BEGIN "
+                     "INSERT INTO file_types (ext, num_files, num_bytes) SELECT file_type(NEW.path), 0, 0 "
+                     "WHERE NOT EXISTS (SELECT 1 FROM file_types WHERE ext = file_type(NEW.path)); "
+                     "UPDATE file_types SET num_files = num_files + 1, num_bytes = num_bytes + CAST(NEW.b AS INTEGER) "
+                     "WHERE ext = file_type(NEW.path); END")
+        conn.execute("CREATE TRIGGER IF NOT EXISTS file_types_delete AFTER DELETE ON manifest "
+                     "WHEN file_type(OLD.path) IS NOT NULL BEGIN "
+                     "UPDATE file_types SET num_files = num_files - 1, num_bytes = num_bytes - CAST(OLD.b AS INTEGER) "
+                     "WHERE ext = file_type(OLD.path); END")
+        conn.execute("CREATE TRIGGER IF NOT EXISTS file_types_update AFTER UPDATE OF b ON manifest "
+                     "WHEN file_type(NEW.path) IS NOT NULL BEGIN "
+                     "UPDATE file_types SET num_bytes = num_bytes - CAST(OLD.b AS INTEGER) + CAST(NEW.b AS INTEGER) "
+                     "WHERE ext = file_type(NEW.path); END")
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Context manager to run a set of changes in a single write transaction, rolling back if an error occurs
+
+        Transactions do not nest. Methods that modify the index join the active transaction if there is one.
+
+        Returns:
+            sqlite3.Connection
+        """
+        with self._lock:
+            conn = self._connect()
+            if conn.in_transaction:
+                yield conn
+                return
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+
+    @property
+    def is_built(self) -> bool:
+        """Property indicating if the index has been fully built from the manifest files
+
+        Returns:
+            bool
+        """
+        with self._lock:
+            return self._connect().execute("PRAGMA user_version").fetchone()[0] == INDEX_VERSION
+
+    @property
+    def source_signature(self) -> Optional[str]:
+        """Property to get the signature of the manifest files the index was built from or last exported to
+
+        Returns:
+            str
+        """
+        with self._lock:
+            return self._connect().execute("SELECT signature FROM source").fetchone()[0]
+
+    def set_source_signature(self, signature: Optional[str]) -> None:
+        """Method to record the signature of the manifest files the index matches (e.g. after exporting changes)
+
+        Args:
+            signature: signature of the manifest files
+
+        Returns:
+            None
+        """
+        with self.transaction() as conn:
+            conn.execute("UPDATE source SET signature = ?", (signature,))
+
+    def _is_current(self, conn: sqlite3.Connection, signature: Optional[str]) -> bool:
+        """Helper to check if the index is built, and matches the manifest files if a signature is given"""
+        if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            return False
+        return signature is None or conn.execute("SELECT signature FROM source").fetchone()[0] == signature
+
+    def build(self, loader: Callable[[], Iterable[Tuple[str, Dict[str, Any]]]],
+              signature: Optional[str] = None) -> None:
+        """Method to populate the index if it has not been built yet, or if it is out of date
+
+        The check is repeated inside the write transaction, so if multiple processes try to build the same index at
+        once only the first one loads the manifest files.
+
+        Args:
+            loader: callable returning an iterable of (relative path, manifest entry) in manifest file order. Later
+                    entries for the same path replace earlier ones.
+            signature: optional signature of the manifest files. If given, an index built from manifest files with a
+                       different signature is rebuilt.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._is_current(self._connect(), signature):
+                return
+
+        with self.transaction() as conn:
+            if self._is_current(conn, signature):
+                return
+
+            # Statistics are computed once after loading, instead of by the triggers for every row
+            for trigger in STATISTICS_TRIGGERS:
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+            conn.execute("DELETE FROM manifest")
+            conn.execute("DELETE FROM file_types")
+            conn.executemany("INSERT OR REPLACE INTO manifest (path, h, m, b, fn, c) VALUES (?, ?, ?, ?, ?, ?)",
+                             ((key, value.get('h'), value.get('m'), value.get('b'), value['fn'], value.get('c'))
+                              for key, value in loader()))
+            conn.execute("INSERT INTO file_types (ext, num_files, num_bytes) "
+                         "SELECT ext, COUNT(*), SUM(CAST(b AS INTEGER)) FROM "
+                         "(SELECT file_type(path) AS ext, b FROM manifest) WHERE ext IS NOT NULL GROUP BY ext")
+
+            self._create_statistics_triggers(conn)
+            conn.execute("UPDATE source SET signature = ?", (signature,))
+            conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+
+    def invalidate(self) -> None:
+        """Method to remove all data from the index, so it is rebuilt from the manifest files on next access
+
+        Returns:
+            None
+        """
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM manifest")
+            conn.execute("DELETE FROM file_types")
+            conn.execute("PRAGMA user_version = 0")
+
+    @staticmethod
+    def _row_to_entry(row: Tuple) -> 'OrderedDict[str, Any]':
+        """Helper to convert a (h, m, b, fn, c) row to a manifest entry"""
+        entry = OrderedDict([('h', row[0]), ('m', row[1]), ('b', row[2]), ('fn', row[3])])
+        if row[4] is not None:
+            entry['c'] = row[4]
+        return entry
+
+    def __getitem__(self, relative_path: str) -> 'OrderedDict[str, Any]':
+        with self._lock:
+            row = self._connect().execute("SELECT h, m, b, fn, c FROM manifest WHERE path = ?",
+                                          (relative_path,)).fetchone()
+        if row is None:
+            raise KeyError(relative_path)
+        return self._row_to_entry(row)
+
+    def __contains__(self, relative_path: object) -> bool:
+        with self._lock:
+            row = self._connect().execute("SELECT 1 FROM manifest WHERE path = ?", (relative_path,)).fetchone()
+        return row is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for key, _ in self.scan():
+            yield key
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def items(self) -> Iterator[Tuple[str, 'OrderedDict[str, Any]']]:  # type: ignore
+        return self.scan()
+
+    def values(self) -> Iterator['OrderedDict[str, Any]']:  # type: ignore
+        for _, value in self.scan():
+            yield value
+
+    def count(self, prefix: Optional[str] = None) -> int:
+        """Method to count the entries in the index, optionally only those under a path prefix
+
+        Args:
+            prefix: optional path prefix (e.g. a directory with a trailing slash)
+
+        Returns:
+            int
+        """
+        with self._lock:
+            conn = self._connect()
+            if prefix:
+                return conn.execute("SELECT COUNT(*) FROM manifest WHERE path >= ? AND path < ?",
+                                    (prefix, prefix_upper_bound(prefix))).fetchone()[0]
+            return conn.execute("SELECT COUNT(*) FROM manifest").fetchone()[0]
+
+    def statistics(self) -> ManifestIndexStatistics:
+        """Method to get the number of files, total bytes, and number of files of each type in the manifest. These
+        are maintained as the index changes, so the cost does not depend on the number of files.
+
+        Directories, hidden files, and files without an extension are not counted.
+
+        Returns:
+            ManifestIndexStatistics
+        """
+        with self._lock:
+            rows = self._connect().execute("SELECT ext, num_files, num_bytes FROM file_types "
+                                           "WHERE num_files > 0").fetchall()
+
+        return ManifestIndexStatistics(num_files=sum([row[1] for row in rows]),
+                                       total_bytes=sum([row[2] for row in rows]),
+                                       file_types={row[0]: row[1] for row in rows})
+
+    def scan(self, start_after: Optional[str] = None, prefix: Optional[str] = None,
+             limit: Optional[int] = None, offset: int = 0) -> Iterator[Tuple[str, 'OrderedDict[str, Any]']]:
+        """Generator to scan entries in path order, optionally starting after a key and/or limited to a path prefix
+
+        Prefer `start_after` to `offset` when paging, since skipping `offset` rows still has to walk the index.
+
+        Args:
+            start_after: optional key to start after (exclusive)
+            prefix: optional path prefix (e.g. a directory with a trailing slash)
+            limit: optional max number of entries to return
+            offset: optional number of matching entries to skip
+
+        Returns:
+            Iterator of (relative path, manifest entry)
+        """
+        conditions = list()
+        params: list = list()
+        if prefix:
+            conditions.append("path >= ? AND path < ?")
+            params.extend([prefix, prefix_upper_bound(prefix)])
+
+        remaining = limit
+        last_key = start_after
+        while remaining is None or remaining > 0:
+            batch_size = SCAN_BATCH_SIZE if remaining is None else min(remaining, SCAN_BATCH_SIZE)
+            where = list(conditions)
+            batch_params = list(params)
+            if last_key is not None:
+                where.append("path > ?")
+                batch_params.append(last_key)
+            where_clause = f"WHERE {' AND '.join(where)} " if where else ""
+
+            with self._lock:
+                rows = self._connect().execute(f"SELECT path, h, m, b, fn, c FROM manifest {where_clause}"
+                                               f"ORDER BY path LIMIT ? OFFSET ?",
+                                               batch_params + [batch_size, offset]).fetchall()
+            # Only the first batch is offset, the rest continue from the last key
+            offset = 0
+
+            for row in rows:
+                yield row[0], self._row_to_entry(row[1:])
+
+            if len(rows) < batch_size:
+                break
+
+            last_key = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def find_by_hash(self, hashes: Iterable[str]) -> Iterator[Tuple[str, 'OrderedDict[str, Any]']]:
+        """Generator to find all entries whose content hash is in the provided collection. Since objects are stored
+        by content hash, this finds every file that is backed by the same object.
+
+        Args:
+            hashes: content hashes to look up
+
+        Returns:
+            Iterator of (relative path, manifest entry), in path order for each batch of hashes
+        """
+        hashes = sorted(set(hashes))
+        for start in range(0, len(hashes), HASH_LOOKUP_BATCH_SIZE):
+            batch = hashes[start:start + HASH_LOOKUP_BATCH_SIZE]
+            with self._lock:
+                rows = self._connect().execute(f"SELECT path, h, m, b, fn, c FROM manifest WHERE h IN "
+                                               f"({', '.join('?' * len(batch))}) ORDER BY path", batch).fetchall()
+            for row in rows:
+                yield row[0], self._row_to_entry(row[1:])
+
+    def upsert_many(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """Method to add or update many entries
+
+        Args:
+            entries: dict of relative path -> manifest entry (including the `fn` attribute)
+
+        Returns:
+            None
+        """
+        with self.transaction() as conn:
+            for key, value in entries.items():
+                row = (value.get('h'), value.get('m'), value.get('b'), value['fn'], value.get('c'), key)
+                cursor = conn.execute("UPDATE manifest SET h = ?, m = ?, b = ?, fn = ?, c = ? WHERE path = ?", row)
+                if cursor.rowcount == 0:
+                    conn.execute("INSERT INTO manifest (h, m, b, fn, c, path) VALUES (?, ?, ?, ?, ?, ?)", row)
+
+    def delete_many(self, relative_paths: Iterable[str]) -> None:
+        """Method to remove many entries
+
+        Args:
+            relative_paths: relative paths to remove
+
+        Returns:
+            None
+        """
+        with self.transaction() as conn:
+            conn.executemany("DELETE FROM manifest WHERE path = ?", [(p,) for p in relative_paths])
+
+    def close(self) -> None:
+        """Method to close the underlying database connection
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
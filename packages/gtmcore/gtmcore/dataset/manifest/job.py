@@ -76,6 +76,16 @@ class BackgroundHashJob:
 
         return self.is_complete
 
+    @property
+    def completed_bytes(self) -> int:
+        """Number of bytes processed so far, as reported by the running job"""
+        if self.is_complete:
+            return self.total_bytes
+        if not self._job_status or not self._job_status.meta:
+            return 0
+
+        return min(int(self._job_status.meta.get('completed_bytes', 0)), self.total_bytes)
+
     def get_hash_result(self) -> List[Optional[str]]:
         """Method to get the hash result for all files in self.file_list
 
@@ -1,12 +1,13 @@
-from typing import Callable, List, Dict, Any, Tuple, Optional, TYPE_CHECKING
+from typing import Callable, List, Dict, Any, Tuple, Optional, Iterable, Iterator, Set, TYPE_CHECKING
 import pickle
-from typing import List, Dict, Any, Tuple, Optional
 
 import os
 from enum import Enum
 import shutil
 import asyncio
-from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from collections import namedtuple
 from natsort import natsorted
 import copy
 from pathlib import Path
@@ -16,9 +17,15 @@ from gtmcore.activity import ActivityStore, ActivityRecord, ActivityDetailType,
     ActivityAction, ActivityDetailRecord
 from gtmcore.activity.utils import ImmutableList, DetailRecordList, TextData
 from gtmcore.dataset.manifest.hash import SmartHash
+from gtmcore.dataset.manifest.fasthash import is_fast_hash_file, FastHashStore
 from gtmcore.dataset.manifest.file import ManifestFileCache
+from gtmcore.dataset.manifest.index import ManifestIndex
+from gtmcore.dataset.manifest.chunking import ChunkStore, ContentDefinedChunker
+from gtmcore.dataset.manifest.pushqueue import PushQueue
 from gtmcore.dataset.cache import get_cache_manager_class, CacheManager
+from gtmcore.dataset.cache.objects import ObjectCacheManager
 from gtmcore.dataset.manifest.eventloop import get_event_loop
+from gtmcore.dataset.io import PushObject
 from gtmcore.logging import LMLogger
 
 if TYPE_CHECKING:
@@ -37,6 +44,18 @@ class FileChangeType(Enum):
 
 StatusResult = namedtuple('StatusResult', ['created', 'modified', 'deleted'])
 
+# Aggregate statistics for the files in a dataset. `file_type_distribution` is a list of (file type, number of files)
+# ordered from most to least common
+DatasetStatistics = namedtuple('DatasetStatistics', ['num_files', 'total_bytes', 'local_bytes',
+                                                     'file_type_distribution'])
+
+# Number of manifest entries linked per task when linking a revision across a thread pool
+LINK_BATCH_SIZE = 500
+
+# Number of threads moving hashed files into the object cache, and the max number of hashed files waiting for one
+STORE_WORKERS = 4
+STORE_QUEUE_SIZE = 64
+
 
 class Manifest(object):
     """Class to handle file file manifest"""
@@ -49,9 +68,12 @@ class Manifest(object):
         self.cache_mgr: CacheManager = cache_mgr_class(self.dataset, logged_in_username)
 
         self.hasher = SmartHash(dataset.root_dir, self.cache_mgr.cache_root,
-                                self.dataset.git.repo.head.commit.hexsha)
+                                self.dataset.git.repo.head.commit.hexsha,
+                                num_workers=self.get_num_hashing_cpus())
 
-        self._manifest_io = ManifestFileCache(dataset, logged_in_username)
+        self._manifest_io = ManifestFileCache(dataset, self.cache_mgr.cache_root, logged_in_username)
+        self._chunk_store: Optional[ChunkStore] = None
+        self._push_queue: Optional[PushQueue] = None
 
         # TODO: Support ignoring files
         # self.ignore_file = os.path.join(dataset.root_dir, ".gigantumignore")
@@ -82,14 +104,70 @@ class Manifest(object):
         return crd
 
     @property
-    def manifest(self) -> OrderedDict:
-        """Property to get the current manifest as the union of all manifest files, with caching supported
+    def manifest(self) -> ManifestIndex:
+        """Property to get the current manifest as the union of all manifest files, backed by an on-disk index
 
         Returns:
-            OrderedDict
+            ManifestIndex
         """
         return self._manifest_io.get_manifest()
 
+    @property
+    def chunk_store(self) -> ChunkStore:
+        """Property to get the store that tracks files that are stored as chunks
+
+        Returns:
+            ChunkStore
+        """
+        if self._chunk_store is None:
+            self._chunk_store = ChunkStore(self.cache_mgr.cache_root)
+        return self._chunk_store
+
+    @property
+    def push_queue(self) -> PushQueue:
+        """Property to get the queue of objects that need to be pushed to the storage backend
+
+        Returns:
+            PushQueue
+        """
+        if self._push_queue is None:
+            self._push_queue = PushQueue(self.cache_mgr.cache_root)
+        return self._push_queue
+
+    def get_chunker(self) -> Optional[ContentDefinedChunker]:
+        """Method to get the chunker used to split large files, if chunking is enabled for this dataset
+
+        Chunking is only used for managed datasets, since only they push objects to a remote
+
+        Returns:
+            ContentDefinedChunker
+        """
+        chunk_config = self.dataset.client_config.config['datasets'].get('chunking')
+        if not chunk_config or not chunk_config.get('enabled') or not self.dataset.backend.is_managed:
+            return None
+
+        return ContentDefinedChunker(avg_chunk_size=int(chunk_config['avg_chunk_size']),
+                                     min_chunk_size=int(chunk_config['min_chunk_size']),
+                                     max_chunk_size=int(chunk_config['max_chunk_size']))
+
+    def _get_object_chunker(self, object_path: str) -> Optional[ContentDefinedChunker]:
+        """Helper to get the chunker to split an object with, if it should be stored as chunks
+
+        Args:
+            object_path: absolute path to the whole file object
+
+        Returns:
+            ContentDefinedChunker, or None if the object should be stored whole
+        """
+        chunker = self.get_chunker()
+        if chunker is None:
+            return None
+
+        chunk_config = self.dataset.client_config.config['datasets']['chunking']
+        if os.path.getsize(object_path) < int(chunk_config['min_file_size']):
+            return None
+        return chunker
+
     @staticmethod
     def _get_object_subdirs(object_id) -> Tuple[str, str]:
         """Get the subdirectories when accessing an object ID
@@ -148,9 +226,9 @@ class Manifest(object):
     def queue_to_push(self, obj: str, rel_path: str, revision: str) -> None:
         """Method to queue and object for push to remote storage backend
 
-        Objects to push are stored in a file named with the revision at which the files were written. This is different
-        from the revision that contains the files (after written and untracked, changes are committed and then an
-        activity record is created with another commit)
+        Objects to push are queued with the revision at which the files were written. This is different from the
+        revision that contains the files (after written and untracked, changes are committed and then an activity
+        record is created with another commit)
 
         Args:
             obj: object path
@@ -163,12 +241,7 @@ class Manifest(object):
         if not os.path.exists(obj):
             raise ValueError("Object does not exist. Failed to add to push queue.")
 
-        push_dir = os.path.join(self.cache_mgr.cache_root, 'objects', '.push')
-        if not os.path.exists(push_dir):
-            os.makedirs(push_dir)
-
-        with open(os.path.join(push_dir, revision), 'at') as fh:
-            fh.write(f"{rel_path},{obj}\n")
+        self.push_queue.enqueue_many([PushObject(object_path=obj, revision=revision, dataset_path=rel_path)])
 
     def get_change_type(self, path) -> FileChangeType:
         """Helper method to get the type of change from the manifest/fast hash
@@ -193,65 +266,89 @@ class Manifest(object):
                 result = FileChangeType.CREATED
         return result
 
+    def _scan_revision_directory(self, revision_directory: str) -> Iterator[Tuple[str, Optional[os.stat_result]]]:
+        """Generator to walk a revision directory with os.scandir, yielding each entry's relative path and stat result
+
+        The stat result is taken from the DirEntry, so each entry is only stat'd once. Directories are represented
+        with a trailing slash. Like os.walk, symlinked directories are yielded but not descended into.
+
+        Args:
+            revision_directory: absolute path to the revision directory to scan
+
+        Returns:
+            Iterator of (relative path, stat result or None if the entry could not be stat'd)
+        """
+        dirs_to_scan = [(revision_directory, '')]
+        while dirs_to_scan:
+            abs_dir, rel_dir = dirs_to_scan.pop()
+            try:
+                entries = list(os.scandir(abs_dir))
+            except OSError:
+                # Matches os.walk behavior, which skips directories it cannot list
+                continue
+
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+
+                if is_dir:
+                    # TODO: Check for ignored
+                    rel_path = f"{rel_dir}{entry.name}/"  # All folders are represented with a trailing slash
+                    if not entry.is_symlink():
+                        dirs_to_scan.append((entry.path, rel_path))
+                else:
+                    # TODO: Check for ignored
+                    if entry.name in ['.DS_STORE', '.DS_Store'] or is_fast_hash_file(entry.name):
+                        continue
+                    rel_path = f"{rel_dir}{entry.name}"
+
+                try:
+                    file_info: Optional[os.stat_result] = entry.stat()
+                except OSError:
+                    file_info = None
+
+                yield rel_path, file_info
+
     def status(self) -> StatusResult:
         """Method to compute the changes (create, modified, delete) of a dataset, comparing local state to the
         manifest and fast hash
 
+        The fast hash index is loaded once and each entry is only stat'd once while scanning, so no-change status
+        checks are fast even for datasets with many files. The manifest is only loaded if there are files without a
+        fast hash.
+
         Returns:
             StatusResult
         """
-        # TODO: think about how to send batches to get_change_type
-        status: Dict[str, List] = {"created": [], "modified": [], "deleted": []}
-        all_files = list()
+        created: List[str] = list()
+        modified: List[str] = list()
+        all_files: Set[str] = set()
         revision_directory = os.path.join(self.cache_mgr.cache_root, self.dataset_revision)
 
-        for root, dirs, files in os.walk(revision_directory):
-            _, folder = root.split(revision_directory)
-            if len(folder) > 0:
-                if folder[0] == os.path.sep:
-                    folder = folder[1:]
-
-            for d in dirs:
-                # TODO: Check for ignored
-                rel_path = os.path.join(folder, d) + os.path.sep  # All folders are represented with a trailing slash
-                all_files.append(rel_path)
-                change = self.get_change_type(rel_path)
-                if change == FileChangeType.NOCHANGE:
-                    continue
-                elif change == FileChangeType.MODIFIED:
-                    # Don't record directory modifications
-                    pass
-                elif change == FileChangeType.CREATED:
-                    status['created'].append(rel_path)
-                else:
-                    raise ValueError(f"Invalid Change type: {change}")
-
-            for file in files:
-                # TODO: Check for ignored
-                if file in ['.smarthash', '.DS_STORE', '.DS_Store']:
-                    continue
-
-                rel_path = os.path.join(folder, file)
-                all_files.append(rel_path)
-                change = self.get_change_type(rel_path)
-                if change == FileChangeType.NOCHANGE:
-                    continue
-                elif change == FileChangeType.MODIFIED:
-                    status['modified'].append(rel_path)
-                elif change == FileChangeType.CREATED:
-                    status['created'].append(rel_path)
-                else:
-                    raise ValueError(f"Invalid Change type: {change}")
-
-        # De-dup and sort
-        status['created'] = list(set(status['created']))
-        status['modified'] = list(set(status['modified']))
-        status['modified'] = natsorted(status['modified'])
-        status['created'] = natsorted(status['created'])
+        fast_hash_data = self.hasher.fast_hash_data.snapshot()
+        for rel_path, file_info in self._scan_revision_directory(revision_directory):
+            all_files.add(rel_path)
+            is_dir = rel_path[-1] == '/'
+
+            # This is the same logic as `get_change_type()`, using the stat result from the scan
+            previous_stat = fast_hash_data.get(rel_path)
+            if previous_stat is not None:
+                if file_info is None or (file_info.st_size, file_info.st_mtime) != previous_stat:
+                    if not is_dir:
+                        # Don't record directory modifications
+                        modified.append(rel_path)
+            elif rel_path in self.manifest:
+                # No fast hash, but exists in manifest. User just edited a file that hasn't been pulled
+                if not is_dir:
+                    modified.append(rel_path)
+            else:
+                # No fast hash, not in manifest.
+                created.append(rel_path)
 
-        all_files = list(set(all_files))
-        return StatusResult(created=status.get('created'), modified=status.get('modified'),
-                            deleted=self.hasher.get_deleted_files(all_files))
+        deleted = sorted([p for p in fast_hash_data if p not in all_files])
+        return StatusResult(created=natsorted(created), modified=natsorted(modified), deleted=deleted)
 
     @staticmethod
     def _blocking_move_and_link(source, destination):
@@ -276,60 +373,121 @@ class Manifest(object):
         except PermissionError:
             os.symlink(destination, source)
 
-    async def _move_to_object_cache(self, relative_path, hash_str):
-        """Method to move a file to the object cache
+    def _store_object(self, revision: str, relative_path: str, hash_str: Optional[str]) -> Optional[os.stat_result]:
+        """Blocking method to move a hashed file into the object cache, link it back into the revision directory, and
+        queue the new object(s) to be pushed
 
         Args:
+            revision: the current revision of the dataset
             relative_path: relative path to the file
-            hash_str: content hash of the file
+            hash_str: content hash of the file, or None if it could not be hashed
 
         Returns:
-
+            the stat result of the file once it has been linked back (None if it no longer exists), used to compute
+            its fast hash without a second pass over the files
         """
-        source = os.path.join(self.cache_mgr.cache_root, self.dataset_revision, relative_path)
-        if os.path.isfile(source):
+        source = os.path.join(self.cache_mgr.cache_root, revision, relative_path)
+        if hash_str and os.path.isfile(source):
             level1, level2 = self._get_object_subdirs(hash_str)
-
-            os.makedirs(os.path.join(self.cache_mgr.cache_root, 'objects', level1), exist_ok=True)
             os.makedirs(os.path.join(self.cache_mgr.cache_root, 'objects', level1, level2), exist_ok=True)
 
             destination = os.path.join(self.cache_mgr.cache_root, 'objects', level1, level2, hash_str)
 
             # Move file to new object
-            loop = get_event_loop()
-            await loop.run_in_executor(None, self._blocking_move_and_link, source, destination)
+            self._blocking_move_and_link(source, destination)
 
-            # Queue new object for push
-            self.queue_to_push(destination, relative_path, self.dataset_revision)
-        else:
-            destination = source
+            chunker = self._get_object_chunker(destination)
+            if chunker is not None:
+                # Only new chunks (and the chunk list) need to be pushed
+                push_objects = self.chunk_store.chunk_object(hash_str, chunker)
+            else:
+                push_objects = [destination]
 
-        return destination
+            # Queue new objects for push in a single transaction
+            self.push_queue.enqueue_many([PushObject(object_path=obj, revision=revision, dataset_path=relative_path)
+                                          for obj in push_objects])
 
-    def hash_files(self, update_files: List[str]) -> Tuple[List[Optional[str]], List[Optional[str]]]:
-        """Method to run the update process on the manifest based on change status (optionally computing changes if
-        status is not set)
+        try:
+            return os.stat(source)
+        except FileNotFoundError:
+            return None
+
+    async def _hash_and_store(self, update_files: List[str], progress_update_fn: Optional[Callable] = None) \
+            -> Tuple[List[Optional[str]], List[Optional[str]]]:
+        """Method to hash files and move them into the object cache as a single pipeline
+
+        Hashing is the producer. Each file is handed to a pool of consumers as soon as its own hash completes, which
+        move it into the object cache, link it back, and stat it for its fast hash. The queue between the two is
+        bounded, so hashing pauses if storing falls behind.
 
         Args:
-            update_files: The current change status of the dataset, of omitted, it will be computed
+            update_files: relative paths to the files to process
+            progress_update_fn: Optional callable with arg "completed_bytes" (int), called as each file is stored
 
         Returns:
-            StatusResult
+            tuple of the content hashes and fast hashes, in the same order as `update_files`
         """
-        # Hash Files
         loop = get_event_loop()
-        hash_task = asyncio.ensure_future(self.hasher.hash(update_files))
-        loop.run_until_complete(asyncio.gather(hash_task))
+        revision = self.dataset_revision
+        hash_result: List[Optional[str]] = [None] * len(update_files)
+        file_info: List[Optional[os.stat_result]] = [None] * len(update_files)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STORE_QUEUE_SIZE)
+
+        async def produce():
+            async for idx, hash_str in self.hasher.hash_as_completed(update_files):
+                hash_result[idx] = hash_str
+                await queue.put(idx)
+
+            # Signal each consumer that there are no more files
+            for _ in range(STORE_WORKERS):
+                await queue.put(None)
+
+        async def consume(executor: ThreadPoolExecutor):
+            while True:
+                idx = await queue.get()
+                if idx is None:
+                    return
+
+                file_info[idx] = await loop.run_in_executor(executor, self._store_object, revision,
+                                                            update_files[idx], hash_result[idx])
+                if progress_update_fn and file_info[idx]:
+                    progress_update_fn(completed_bytes=file_info[idx].st_size)
+
+        with ThreadPoolExecutor(max_workers=STORE_WORKERS) as executor:
+            tasks = [asyncio.ensure_future(produce())]
+            tasks.extend([asyncio.ensure_future(consume(executor)) for _ in range(STORE_WORKERS)])
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # If any step failed, stop the rest of the pipeline
+                for task in tasks:
+                    task.cancel()
+
+        # Save fast hashes for every file in a single transaction
+        fast_hash_result = [self.hasher._format_fast_hash(p, st) for p, st in zip(update_files, file_info)]
+        self.hasher.fast_hash_data.update_many({p: h for p, h in zip(update_files, fast_hash_result) if h},
+                                               inodes={p: st.st_ino for p, st in zip(update_files, file_info) if st})
 
-        # Move files into object cache and link back to the revision directory
-        hash_result = hash_task.result()
-        tasks = [asyncio.ensure_future(self._move_to_object_cache(f, h)) for f, h in zip(update_files, hash_result)]
-        loop.run_until_complete(asyncio.gather(*tasks))
+        return hash_result, fast_hash_result
 
-        # Update fast hash after objects have been moved/relinked
-        fast_hash_result = self.hasher.fast_hash(update_files, save=True)
+    def hash_files(self, update_files: List[str],
+                   progress_update_fn: Optional[Callable] = None) -> Tuple[List[Optional[str]], List[Optional[str]]]:
+        """Method to hash files, move them into the object cache, link them back into the current revision, and
+        update their fast hashes
 
-        return hash_result, fast_hash_result
+        Each file goes through every step as soon as its own hash completes (see `_hash_and_store()`), so a large
+        import takes roughly a single pass over the files.
+
+        Args:
+            update_files: relative paths to the files that have been created or modified
+            progress_update_fn: Optional callable with arg "completed_bytes" (int), called as each file is stored
+
+        Returns:
+            tuple of the content hashes and fast hashes, in the same order as `update_files`
+        """
+        self.hasher.current_revision = self.dataset_revision
+        loop = get_event_loop()
+        return loop.run_until_complete(self._hash_and_store(update_files, progress_update_fn))
 
     def update(self, status: StatusResult = None) -> StatusResult:
         """Method to run the update process on the manifest based on change status (optionally computing changes if
@@ -356,7 +514,7 @@ class Manifest(object):
                     raise ValueError(f"Failed to update manifest for {f}. File not found.")
 
                 _, file_bytes, mtime = fh.split("||")
-                self._manifest_io.add_or_update(f, h, mtime, file_bytes)
+                self._manifest_io.add_or_update(f, h, mtime, file_bytes, self.chunk_store.get_chunk_list_id(h))
 
         if status.deleted:
             self.hasher.delete_fast_hashes(status.deleted)
@@ -403,6 +561,28 @@ class Manifest(object):
                 'is_dir': is_dir,
                 'modified_at': stat.st_mtime}
 
+    def statistics(self) -> DatasetStatistics:
+        """Method to get aggregate statistics for the files in the dataset
+
+        The counts are maintained by the manifest index and the fast hash index of the current revision as files
+        change, so this does not scan the manifest or the revision directory. Directories, hidden files, and files
+        without an extension are not included in `num_files`, `total_bytes`, or `file_type_distribution`.
+
+        Returns:
+            DatasetStatistics
+        """
+        manifest_stats = self.manifest.statistics()
+        file_type_distribution = sorted(manifest_stats.file_types.items(), key=lambda x: (-x[1], x[0]))
+
+        fast_hash_data = FastHashStore(self.current_revision_dir)
+        local_bytes = fast_hash_data.local_bytes()
+        fast_hash_data.close()
+
+        return DatasetStatistics(num_files=manifest_stats.num_files,
+                                 total_bytes=manifest_stats.total_bytes,
+                                 local_bytes=local_bytes,
+                                 file_type_distribution=file_type_distribution)
+
     def get(self, dataset_path: str) -> dict:
         """Method to get the file info for a single file from the manifest
 
@@ -415,14 +595,16 @@ class Manifest(object):
         return self._file_info(dataset_path, item)
 
     def list(self, first: int = None, after_index: int = 0) -> Tuple[List[Dict[str, Any]], List[int]]:
-        """
+        """Method to list file info by position in the manifest (ordered by path)
+
+        Note: skipping to `after_index` still walks the index, so use `list_page()` when paging through large datasets
 
         Args:
-            first:
-            after_index:
+            first: optional max number of items to return
+            after_index: optional position to start after
 
         Returns:
-
+            list of file info, list of positions
         """
         if first:
             if first <= 0:
@@ -437,18 +619,55 @@ class Manifest(object):
         if after_index != 0:
             after_index = after_index + 1
 
-        if first is not None:
-            end = min(first + after_index, len(self.manifest))
-        else:
-            end = len(self.manifest)
-
-        data = list(self.manifest.items())
-        for idx in range(after_index, end):
-            result.append(self._file_info(data[idx][0], data[idx][1]))
+        for idx, (key, item) in enumerate(self.manifest.scan(limit=first, offset=after_index), start=after_index):
+            result.append(self._file_info(key, item))
             indexes.append(idx)
 
         return result, indexes
 
+    def list_page(self, first: Optional[int] = None, after: Optional[str] = None,
+                  after_index: Optional[int] = None,
+                  prefix: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """Method to list a page of file info in path order, reading only the requested page from the index
+
+        Pages should be requested using the key of the last item of the previous page (`after`). `after_index` is
+        supported for positional cursors, but requires walking the index up to that position.
+
+        Args:
+            first: optional max number of items to return
+            after: optional key to start after (exclusive)
+            after_index: optional position to start after, ignored if `after` is set. With a `prefix`, positions
+                         don't include the directory itself
+            prefix: optional directory (with a trailing slash) to list the contents of, recursively. The directory
+                    itself is not listed
+
+        Returns:
+            list of file info, bool indicating if there are more items after this page
+        """
+        if first is not None and first <= 0:
+            raise ValueError("`first` must be greater than 0")
+        if after_index is not None and after_index < 0:
+            raise ValueError("`after_index` must be greater or equal than 0")
+
+        offset = 0
+        if after is None:
+            if prefix:
+                # Don't include the directory itself, so positions count the entries in the directory
+                after = prefix
+            if after_index is not None:
+                offset = after_index + 1
+
+        # Fetch one extra item to check if there is a next page
+        limit = first + 1 if first is not None else None
+        items = list(self.manifest.scan(start_after=after, prefix=prefix, limit=limit, offset=offset))
+
+        has_next_page = False
+        if first is not None and len(items) > first:
+            has_next_page = True
+            items = items[:first]
+
+        return [self._file_info(key, item) for key, item in items], has_next_page
+
     def delete(self, path_list: List[str]) -> None:
         """Method to delete a list of files/folders from the dataset
 
@@ -548,7 +767,7 @@ class Manifest(object):
 
             # create dir
             os.makedirs(new_directory_path)
-            self.update()
+            status = self.update()
             if relative_path not in self.manifest:
                 raise ValueError("Failed to add directory to manifest")
 
@@ -576,45 +795,39 @@ class Manifest(object):
             ars.create_activity_record(ar)
 
             # Relink after the commit
-            self.link_revision()
-            if os.path.isdir(os.path.join(self.cache_mgr.cache_root, previous_revision)):
-                shutil.rmtree(os.path.join(self.cache_mgr.cache_root, previous_revision))
+            self.link_committed_revision(previous_revision, status)
 
             return self.gen_file_info(relative_path)
 
-    def link_revision(self) -> None:
-        """Method to link all the objects in the cache to the current revision directory, so that all files are
-        accessible with the correct file names.
+    def _link_objects(self, revision_directory: str, items: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+        """Blocking method to create directories and hard link objects into a revision directory for a batch of
+        manifest entries
 
-        Note: This update the current revision in the hashing class
+        Args:
+            revision_directory: absolute path to the revision directory
+            items: list of (relative path, manifest entry)
 
         Returns:
-            None
+            list of the ids of objects that are linked into the revision
         """
-        current_revision = self.dataset_revision
-        self.hasher.current_revision = current_revision
-
-        revision_directory = os.path.join(self.cache_mgr.cache_root, current_revision)
-
-        if not os.path.exists(revision_directory):
-            os.makedirs(revision_directory)
-
-        for f in self.manifest:
-            hash_str = self.manifest[f].get('h')
-            level1, level2 = self._get_object_subdirs(hash_str)
-
+        linked_objects: List[str] = list()
+        for f, item in items:
             target = os.path.join(revision_directory, f)
             if target[-1] == os.path.sep:
                 # Create directory from manifest
-                if not os.path.exists(target):
-                    os.makedirs(target)
+                os.makedirs(target, exist_ok=True)
             else:
+                hash_str = item.get('h')
+                if not hash_str:
+                    # The file has not been hashed, so there is no object to link
+                    logger.warning(f"Skipping linking {f}, which has no content hash in the manifest")
+                    continue
+
                 # Link file
+                level1, level2 = self._get_object_subdirs(hash_str)
                 source = os.path.join(self.cache_mgr.cache_root, 'objects', level1, level2, hash_str)
 
-                target_dir = os.path.dirname(target)
-                if not os.path.exists(target_dir):
-                    os.makedirs(target_dir)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
 
                 # Link if not already linked
                 if not os.path.exists(target):
@@ -626,9 +839,109 @@ class Manifest(object):
                         logger.exception(err)
                         continue
 
-        # Completely re-compute the fast hash index
-        self.hasher.fast_hash_data = dict()
-        self.hasher.fast_hash(list(self.manifest.keys()))
+                if os.path.exists(target):
+                    linked_objects.append(hash_str)
+
+        return linked_objects
+
+    def link_revision(self, changed_keys: Optional[Iterable[str]] = None) -> None:
+        """Method to link all the objects in the cache to the current revision directory, so that all files are
+        accessible with the correct file names.
+
+        If `changed_keys` is provided and the revision directory already exists, only those keys are linked and
+        updated in the fast hash index. Otherwise (e.g. after a checkout) every key is linked and the fast hash
+        index is completely re-computed. Linking is done across a thread pool in both cases.
+
+        Note: This update the current revision in the hashing class
+
+        Args:
+            changed_keys: Optional list of keys that have changed (added, updated, downloaded, or removed)
+
+        Returns:
+            None
+        """
+        current_revision = self.dataset_revision
+        self.hasher.current_revision = current_revision
+
+        revision_directory = os.path.join(self.cache_mgr.cache_root, current_revision)
+
+        if changed_keys is not None and not os.path.exists(revision_directory):
+            # Nothing to update incrementally
+            changed_keys = None
+
+        os.makedirs(revision_directory, exist_ok=True)
+
+        if changed_keys is None:
+            items: Iterator[Tuple[str, Dict[str, Any]]] = self.manifest.items()
+        else:
+            changed_items = dict()
+            for key in set(changed_keys):
+                item = self.manifest.get(key)
+                if item is not None:
+                    changed_items[key] = item
+
+            # Files with identical contents share an object, so link every file backed by a changed object
+            changed_items.update(self.manifest.find_by_hash(item['h'] for key, item in changed_items.items()
+                                                            if key[-1] != os.path.sep))
+
+            changed_keys = sorted(set(changed_keys).union(changed_items.keys()))
+            items = iter(sorted(changed_items.items()))
+
+        with ThreadPoolExecutor() as executor:
+            futures = list()
+            while True:
+                batch = list(islice(items, LINK_BATCH_SIZE))
+                if not batch:
+                    break
+                futures.append(executor.submit(self._link_objects, revision_directory, batch))
+
+            linked_objects = list()
+            for future in futures:
+                linked_objects.extend(future.result())
+
+        # Keep track of object use, so the least recently used objects can be evicted from the cache
+        object_cache = ObjectCacheManager(self.cache_mgr)
+        object_cache.record_access(linked_objects)
+        object_cache.close()
+
+        if changed_keys is None:
+            # Completely re-compute the fast hash index
+            self.hasher.fast_hash_data.clear()
+            self.hasher.fast_hash(list(self.manifest))
+        else:
+            # Only update the fast hash of changed keys, removing any that no longer exist
+            fast_hash_result = self.hasher.fast_hash(changed_keys)
+            self.hasher.delete_fast_hashes([k for k, fh in zip(changed_keys, fast_hash_result) if not fh])
+
+    def link_committed_revision(self, previous_revision: str, status: StatusResult) -> None:
+        """Method to link the revision created by committing changes to the manifest, and remove the previous
+        revision directory
+
+        The previous revision directory (including its fast hash index) already contains every unchanged file, so
+        it is moved to the new revision and only the changed keys are re-linked.
+
+        Args:
+            previous_revision: the revision before changes were committed
+            status: the changes that were committed
+
+        Returns:
+            None
+        """
+        previous_revision_directory = os.path.join(self.cache_mgr.cache_root, previous_revision)
+        revision_directory = os.path.join(self.cache_mgr.cache_root, self.dataset_revision)
+
+        changed_keys: Optional[List[str]] = None
+        if previous_revision == self.dataset_revision:
+            changed_keys = status.created + status.modified + status.deleted
+        elif os.path.isdir(previous_revision_directory) and not os.path.exists(revision_directory):
+            # Close the fast hash index before moving the directory that contains it
+            self.hasher.fast_hash_data.close()
+            os.rename(previous_revision_directory, revision_directory)
+            changed_keys = status.created + status.modified + status.deleted
+
+        self.link_revision(changed_keys=changed_keys)
+        if previous_revision != self.dataset_revision and os.path.isdir(previous_revision_directory):
+            shutil.rmtree(previous_revision_directory)
 
     def create_update_activity_record(self, status: StatusResult, upload: bool = False, extra_msg: str = None) -> None:
         """
@@ -727,9 +1040,7 @@ class Manifest(object):
         self.create_update_activity_record(status, upload=upload, extra_msg=extra_msg)
 
         # Re-link new revision
-        self.link_revision()
-        if os.path.isdir(os.path.join(self.cache_mgr.cache_root, previous_revision)):
-            shutil.rmtree(os.path.join(self.cache_mgr.cache_root, previous_revision))
+        self.link_committed_revision(previous_revision, status)
 
     def force_reload(self) -> None:
         """Method to force reloading manifest data from the filesystem
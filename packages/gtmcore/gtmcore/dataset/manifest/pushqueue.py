@@ -0,0 +1,261 @@
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+import os
+import shutil
+import sqlite3
+
+from gtmcore.dataset.io import PushObject
+from gtmcore.dataset.sqlitestore import SQLiteStore
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+# Name of the SQLite push queue, stored in the dataset's cache root
+PUSH_QUEUE_FILE = ".push_queue.db"
+
+# Name of the legacy directory of push files (one per revision, with a `dataset path,object path` line per object).
+# It is migrated into the queue on first access
+LEGACY_PUSH_DIR = os.path.join('objects', '.push')
+
+
+class PushQueue(SQLiteStore):
+    """Class to provide an indexed, on-disk queue of the objects that need to be pushed to a dataset's backend
+
+    Each row is keyed by the revision at which the object was written, the object id, and the file's relative path.
+    Objects are queued in a transaction as files are stored (see `Manifest.queue_to_push()`) and removed once
+    pushed. The number of objects queued in each revision is maintained by triggers, so pending objects can be counted
+    without reading them. The database file is only created on the first write.
+
+    Objects are queued with the revision at which they were written. This is different from the revision that contains
+    the files (after written and untracked, changes are committed and then an activity record is created with another
+    commit), so callers filter the queue by the revisions in the current branch.
+    """
+    def __init__(self, cache_root: str) -> None:
+        self.cache_root = cache_root
+        super().__init__(os.path.join(cache_root, PUSH_QUEUE_FILE))
+
+    @property
+    def index_file(self) -> str:
+        """Property to get the absolute path to the SQLite push queue"""
+        return self.db_file
+
+    @property
+    def legacy_dir(self) -> str:
+        """Property to get the absolute path to the legacy directory of push files"""
+        return os.path.join(self.cache_root, LEGACY_PUSH_DIR)
+
+    def _exists(self) -> bool:
+        return super()._exists() or os.path.isdir(self.legacy_dir)
+
+    def _initialize(self, conn: sqlite3.Connection) -> None:
+        conn.execute("CREATE TABLE IF NOT EXISTS push_queue (revision TEXT NOT NULL, "
+                     "object_id TEXT NOT NULL, dataset_path TEXT NOT NULL, object_path TEXT NOT NULL, "
+                     "PRIMARY KEY (revision, object_id, dataset_path))")
+        conn.execute("CREATE INDEX IF NOT EXISTS push_queue_object_id ON push_queue (object_id)")
+        self._create_count_triggers(conn)
+        self._migrate_legacy_dir()
+
+    @staticmethod
+    def _create_count_triggers(conn: sqlite3.Connection) -> None:
+        """Method to create the table holding the number of objects queued in each revision, and the triggers that
+        maintain it
+
+        Args:
+            conn: connection to the queue
+
+        Returns:
+            None
+        """
+        conn.execute("CREATE TABLE IF NOT EXISTS push_queue_counts (revision TEXT PRIMARY KEY NOT NULL, "
+                     "num_objects INTEGER NOT NULL)")
+        conn.execute("CREATE TRIGGER IF NOT EXISTS push_queue_insert AFTER INSERT ON push_queue BEGIN "
+                     "INSERT OR IGNORE INTO push_queue_counts (revision, num_objects) VALUES (NEW.revision, 0); "
+                     "UPDATE push_queue_counts SET num_objects = num_objects + 1 WHERE revision = NEW.revision; END")
+        conn.execute("CREATE TRIGGER IF NOT EXISTS push_queue_delete AFTER DELETE ON push_queue BEGIN "
+                     "UPDATE push_queue_counts SET num_objects = num_objects - 1 WHERE revision = OLD.revision; "
+                     "DELETE FROM push_queue_counts WHERE revision = OLD.revision AND num_objects <= 0; END")
+
+    def _migrate_legacy_dir(self) -> None:
+        """Method to load legacy push files into the queue and remove them
+
+        Returns:
+            None
+        """
+        if not os.path.isdir(self.legacy_dir):
+            return
+
+        objects = list()
+        for revision in os.listdir(self.legacy_dir):
+            push_file = os.path.join(self.legacy_dir, revision)
+            if revision == '.DS_Store' or not os.path.isfile(push_file):
+                continue
+
+            with open(push_file, 'rt') as pfh:
+                for line in pfh:
+                    line = line.strip()
+                    if line:
+                        dataset_path, object_path = line.rsplit(',', 1)
+                        objects.append(PushObject(object_path=object_path, revision=revision,
+                                                  dataset_path=dataset_path))
+
+        self.enqueue_many(objects)
+        logger.info(f"Migrated {len(objects)} objects to push from {self.legacy_dir}")
+        shutil.rmtree(self.legacy_dir, ignore_errors=True)
+
+    def enqueue_many(self, objects: Iterable[PushObject]) -> None:
+        """Method to add objects to the queue in a single transaction. Objects already queued are ignored
+
+        Args:
+            objects: the objects to queue
+
+        Returns:
+            None
+        """
+        rows = [(obj.revision, os.path.basename(obj.object_path), obj.dataset_path, obj.object_path)
+                for obj in objects]
+        if not rows:
+            return
+
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR IGNORE INTO push_queue (revision, object_id, dataset_path, object_path) "
+                             "VALUES (?, ?, ?, ?)", rows)
+
+    def remove_object_ids(self, object_ids: Iterable[str]) -> None:
+        """Method to remove every queued object with one of a set of object ids in a single transaction (e.g. once
+        they have been pushed). Objects with the same contents are queued once for each file, so all are removed
+
+        Args:
+            object_ids: ids of the objects to remove
+
+        Returns:
+            None
+        """
+        rows = [(object_id,) for object_id in set(object_ids)]
+        if not rows:
+            return
+
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM push_queue WHERE object_id = ?", rows)
+
+    def clear(self) -> None:
+        """Method to remove every object from the queue
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if not self._connect():
+                return
+
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM push_queue")
+
+    def revisions(self) -> Dict[str, int]:
+        """Method to get the revisions that have objects queued, and the number of objects queued in each
+
+        Returns:
+            dict of revision -> number of objects
+        """
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return dict()
+            return {row[0]: row[1] for row in conn.execute("SELECT revision, num_objects FROM push_queue_counts")}
+
+    @contextmanager
+    def _selected_revisions(self, conn: sqlite3.Connection, revisions: Iterable[str]) -> Iterator[None]:
+        """Context manager to load revisions into a temporary table to filter queries with, since the number of
+        revisions may be more than the number of parameters SQLite allows. Must be used with the lock held
+
+        Args:
+            conn: connection to the queue
+            revisions: the revisions to select
+
+        Returns:
+            None
+        """
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS selected_revisions (revision TEXT PRIMARY KEY NOT NULL)")
+        conn.execute("DELETE FROM selected_revisions")
+        conn.executemany("INSERT OR IGNORE INTO selected_revisions (revision) VALUES (?)",
+                         [(r,) for r in revisions])
+        try:
+            yield
+        finally:
+            conn.execute("DELETE FROM selected_revisions")
+
+    def objects(self, revisions: Optional[Iterable[str]] = None, remove_duplicates: bool = False) -> List[PushObject]:
+        """Method to get the objects in the queue
+
+        Args:
+            revisions: Optional revisions to get objects from. Defaults to every revision
+            remove_duplicates: If True, only include one object for each object id
+
+        Returns:
+            list of PushObjects, ordered by revision and then relative path
+        """
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return list()
+
+            if revisions is None:
+                rows = conn.execute("SELECT revision, object_id, dataset_path, object_path FROM push_queue "
+                                    "ORDER BY revision, dataset_path").fetchall()
+            else:
+                with self._selected_revisions(conn, revisions):
+                    rows = conn.execute("SELECT revision, object_id, dataset_path, object_path FROM push_queue "
+                                        "WHERE revision IN (SELECT revision FROM selected_revisions) "
+                                        "ORDER BY revision, dataset_path").fetchall()
+
+        objects = list()
+        object_ids: Set[str] = set()
+        for revision, object_id, dataset_path, object_path in rows:
+            if remove_duplicates:
+                if object_id in object_ids:
+                    continue
+                object_ids.add(object_id)
+            objects.append(PushObject(object_path=object_path, revision=revision, dataset_path=dataset_path))
+        return objects
+
+    def count(self, revisions: Optional[Iterable[str]] = None, remove_duplicates: bool = False) -> int:
+        """Method to count the objects in the queue without loading them
+
+        Args:
+            revisions: Optional revisions to count objects from. Defaults to every revision
+            remove_duplicates: If True, count each object id once
+
+        Returns:
+            int
+        """
+        if not remove_duplicates:
+            counts = self.revisions()
+            if revisions is None:
+                return sum(counts.values())
+            return sum(counts.get(r, 0) for r in set(revisions))
+
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return 0
+
+            if revisions is None:
+                return conn.execute("SELECT COUNT(DISTINCT object_id) FROM push_queue").fetchone()[0]
+
+            with self._selected_revisions(conn, revisions):
+                return conn.execute("SELECT COUNT(DISTINCT object_id) FROM push_queue WHERE revision IN "
+                                    "(SELECT revision FROM selected_revisions)").fetchone()[0]
+
+    def object_ids(self) -> Set[str]:
+        """Method to get the ids of every object in the queue
+
+        Returns:
+            set
+        """
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return set()
+            return {row[0] for row in conn.execute("SELECT DISTINCT object_id FROM push_queue")}
+
+    def __len__(self) -> int:
+        return self.count()
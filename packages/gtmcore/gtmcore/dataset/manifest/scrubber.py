@@ -0,0 +1,446 @@
+from hashlib import blake2b
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+import os
+import sqlite3
+import time
+
+from redis import StrictRedis
+from redis.exceptions import RedisError
+
+from gtmcore.dataset.io.bandwidth import DEFAULT_BURST_BYTES, Throttle, TokenBucket
+from gtmcore.dataset.sqlitestore import SQLiteStore
+from gtmcore.logging import LMLogger
+
+if TYPE_CHECKING:
+    from gtmcore.dataset.manifest import Manifest
+
+logger = LMLogger.get_logger()
+
+# Name of the SQLite database (in the cache root) holding the scrubber's results and checkpoint
+SCRUB_STATE_FILE = ".scrub_state.db"
+
+# Redis key of the token bucket that limits the bytes read by every scrub
+SCRUB_BUCKET_KEY = "dataset_scrub:read"
+
+# Size of each read while hashing a file (1 MiB)
+SCRUB_READ_SIZE = 1048576
+
+# Defaults for the `datasets.scrubber` section of the client config
+DEFAULT_REVERIFY_AFTER = 7 * 24 * 60 * 60
+DEFAULT_CHECKPOINT_INTERVAL = 100
+
+# Seconds between checkpoints, regardless of the number of files verified
+CHECKPOINT_SECONDS = 5.0
+
+# Seconds a scrub job may hold its claim on a dataset's cache before another can be dispatched. This is longer than
+# the dispatcher's timeout for jobs, so a job that was stopped without releasing its claim is eventually replaced
+CLAIM_SECONDS = 3 * 60 * 60
+
+# A file whose contents matched the manifest, with its size and mtime when it was hashed
+VerifiedRecord = NamedTuple('VerifiedRecord', [('size', int), ('mtime_ns', int), ('hash', str),
+                                               ('verified_at', float)])
+
+# A file whose contents did not match the manifest
+MismatchRecord = NamedTuple('MismatchRecord', [('path', str), ('expected_hash', str), ('actual_hash', Optional[str]),
+                                               ('detected_at', float)])
+
+# Position of the current pass (the last path checked, or None if no pass is in progress) and when passes started and
+# completed
+ScrubCheckpoint = NamedTuple('ScrubCheckpoint', [('last_key', Optional[str]), ('pass_started_at', Optional[float]),
+                                                 ('last_pass_completed_at', Optional[float])])
+
+ScrubResult = NamedTuple('ScrubResult', [('num_verified', int), ('num_skipped', int), ('num_bytes', int),
+                                         ('pass_complete', bool), ('mismatches', List[str])])
+
+
+class ScrubState(SQLiteStore):
+    """Class to store the results and progress of the integrity scrubber for a dataset's cache
+
+    The state is kept in a SQLite database in the cache root: the files verified (so unchanged files can be skipped),
+    the files whose contents did not match the manifest, and a checkpoint of the current pass. Results are written
+    together with the checkpoint in a single transaction, so a scrub that is stopped resumes from the last checkpoint
+    with consistent results. The database file is only created on the first write.
+    """
+    def __init__(self, cache_root: str) -> None:
+        self.cache_root = cache_root
+        super().__init__(os.path.join(cache_root, SCRUB_STATE_FILE))
+
+    @property
+    def state_file(self) -> str:
+        """Property to get the absolute path to the SQLite database"""
+        return self.db_file
+
+    def _initialize(self, conn: sqlite3.Connection) -> None:
+        conn.execute("CREATE TABLE IF NOT EXISTS verified (path TEXT PRIMARY KEY NOT NULL, "
+                     "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL, "
+                     "verified_at REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS mismatches (path TEXT PRIMARY KEY NOT NULL, "
+                     "expected_hash TEXT NOT NULL, actual_hash TEXT, detected_at REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS checkpoint (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                     "last_key TEXT, pass_started_at REAL, last_pass_completed_at REAL, "
+                     "claimed_until REAL)")
+        conn.execute("INSERT OR IGNORE INTO checkpoint (id) VALUES (0)")
+
+    def get_verified(self, path: str) -> Optional[VerifiedRecord]:
+        """Method to get the record of the last time a file was verified
+
+        Args:
+            path: relative path of the file in the dataset
+
+        Returns:
+            VerifiedRecord, or None if the file has not been verified
+        """
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return None
+            row = conn.execute("SELECT size, mtime_ns, hash, verified_at FROM verified WHERE path = ?",
+                               (path,)).fetchone()
+        return VerifiedRecord(*row) if row else None
+
+    def checkpoint(self) -> ScrubCheckpoint:
+        """Method to get the checkpoint of the current pass
+
+        Returns:
+            ScrubCheckpoint
+        """
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return ScrubCheckpoint(None, None, None)
+            row = conn.execute("SELECT last_key, pass_started_at, last_pass_completed_at FROM checkpoint").fetchone()
+        return ScrubCheckpoint(*row)
+
+    def save(self, verified: Iterable[Tuple[str, VerifiedRecord]], mismatches: Iterable[MismatchRecord],
+             removed: Iterable[str], last_key: Optional[str], pass_started_at: float) -> None:
+        """Method to save the results of the files checked since the last checkpoint, and move the checkpoint
+
+        Args:
+            verified: (relative path, VerifiedRecord) of files whose contents matched the manifest
+            mismatches: files whose contents did not match the manifest
+            removed: relative paths of files that are no longer in the cache or the manifest
+            last_key: relative path of the last file checked
+            pass_started_at: time the current pass started
+
+        Returns:
+            None
+        """
+        verified = list(verified)
+        mismatches = list(mismatches)
+        removed_rows = [(p,) for p in removed]
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM verified WHERE path = ?", removed_rows + [(m.path,) for m in mismatches])
+            conn.executemany("DELETE FROM mismatches WHERE path = ?", removed_rows + [(p,) for p, _ in verified])
+            conn.executemany("INSERT OR REPLACE INTO verified (path, size, mtime_ns, hash, verified_at) "
+                             "VALUES (?, ?, ?, ?, ?)", ((p, *r) for p, r in verified))
+            conn.executemany("INSERT OR REPLACE INTO mismatches (path, expected_hash, actual_hash, detected_at) "
+                             "VALUES (?, ?, ?, ?)", mismatches)
+            conn.execute("UPDATE checkpoint SET last_key = ?, pass_started_at = ?", (last_key, pass_started_at))
+
+    def complete_pass(self, completed_at: float, stale_paths: Iterable[str]) -> None:
+        """Method to finish a pass, removing results for files that are no longer in the manifest
+
+        Args:
+            completed_at: time the pass completed
+            stale_paths: relative paths with results that are no longer in the manifest
+
+        Returns:
+            None
+        """
+        stale = [(p,) for p in stale_paths]
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM verified WHERE path = ?", stale)
+            conn.executemany("DELETE FROM mismatches WHERE path = ?", stale)
+            conn.execute("UPDATE checkpoint SET last_key = NULL, last_pass_completed_at = ?", (completed_at,))
+
+    def paths(self) -> List[str]:
+        """Method to get every path with a result
+
+        Returns:
+            list
+        """
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return list()
+            return [row[0] for row in conn.execute("SELECT path FROM verified UNION SELECT path FROM mismatches")]
+
+    def mismatches(self) -> List[MismatchRecord]:
+        """Method to get the files whose contents did not match the manifest when they were last checked
+
+        Returns:
+            list of MismatchRecords, ordered by path
+        """
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return list()
+            rows = conn.execute("SELECT path, expected_hash, actual_hash, detected_at FROM mismatches "
+                                "ORDER BY path").fetchall()
+        return [MismatchRecord(*row) for row in rows]
+
+    def try_claim(self, now: float, claim_seconds: float = CLAIM_SECONDS) -> bool:
+        """Method to claim the cache for a scrub job, so only one is queued or running at a time
+
+        Args:
+            now: the current time
+            claim_seconds: number of seconds until the claim expires if it is not released
+
+        Returns:
+            bool: True if the claim was made
+        """
+        with self._transaction() as conn:
+            claimed_until = conn.execute("SELECT claimed_until FROM checkpoint").fetchone()[0]
+            if claimed_until and claimed_until > now:
+                return False
+            conn.execute("UPDATE checkpoint SET claimed_until = ?", (now + claim_seconds,))
+            return True
+
+    def renew_claim(self, now: float, claim_seconds: float = CLAIM_SECONDS) -> None:
+        """Method to extend a claim made by `try_claim()`, e.g. when a scrub job queues the next one
+
+        Args:
+            now: the current time
+            claim_seconds: number of seconds until the claim expires if it is not released
+
+        Returns:
+            None
+        """
+        with self._transaction() as conn:
+            conn.execute("UPDATE checkpoint SET claimed_until = ?", (now + claim_seconds,))
+
+    def release_claim(self) -> None:
+        """Method to release the claim made by `try_claim()`
+
+        Returns:
+            None
+        """
+        with self._transaction() as conn:
+            conn.execute("UPDATE checkpoint SET claimed_until = NULL")
+
+
+def get_scrub_throttle(client_config: dict) -> Optional[Throttle]:
+    """Function to get the throttle that limits the bytes read by every scrub, with the rate from the client config
+
+    If Redis can't be reached, the scrub is not limited instead of failing.
+
+    Args:
+        client_config: the client configuration
+
+    Returns:
+        Throttle, or None if reads are not limited
+    """
+    redis_config = client_config['lock']['redis']
+    scrub_config = client_config['datasets'].get('scrubber') or dict()
+
+    bucket = TokenBucket(StrictRedis(host=redis_config['host'], port=redis_config['port'], db=redis_config['db']),
+                         SCRUB_BUCKET_KEY)
+    burst_bytes = int(scrub_config.get('burst_bytes') or DEFAULT_BURST_BYTES)
+    rate = scrub_config.get('read_rate')
+    try:
+        read_rate = None if rate is None or rate == "" else float(rate)
+    except ValueError:
+        logger.warning(f"Ignoring invalid scrubber read rate: {rate}")
+        read_rate = None
+
+    try:
+        bucket.set_rate(read_rate, burst_bytes)
+    except RedisError as err:
+        logger.warning(f"Failed to limit scrubber reads, continuing without a limit: {err}")
+        return None
+
+    return Throttle(bucket) if read_rate else None
+
+
+class IntegrityScrubber(object):
+    """Class to verify the files in a dataset's cache against the manifest incrementally, in the background
+
+    Files are checked in path order, reading at most the rate allowed by the throttle. Progress is checkpointed every
+    `checkpoint_interval` files (and every few seconds), so a scrub can be stopped at any time and the next one resumes
+    where it stopped. Files that matched the manifest less than `reverify_after` seconds ago, and whose size and mtime
+    have not changed since, are skipped. The latest mismatches are stored, so they can be read without hashing.
+    """
+    def __init__(self, manifest: 'Manifest', throttle: Optional[Throttle] = None,
+                 reverify_after: float = DEFAULT_REVERIFY_AFTER,
+                 checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+                 clock: Callable[[], float] = time.time) -> None:
+        self.manifest = manifest
+        self.throttle = throttle
+        self.reverify_after = reverify_after
+        self.checkpoint_interval = max(1, checkpoint_interval)
+        self.state = ScrubState(manifest.cache_mgr.cache_root)
+        self._clock = clock
+
+    @classmethod
+    def from_config(cls, manifest: 'Manifest', throttle: Optional[Throttle] = None) -> 'IntegrityScrubber':
+        """Method to create a scrubber with the settings in the `datasets.scrubber` section of the client config
+
+        Args:
+            manifest: the dataset's manifest
+            throttle: optional throttle to limit the bytes read
+
+        Returns:
+            IntegrityScrubber
+        """
+        scrub_config = manifest.dataset.client_config.config['datasets'].get('scrubber') or dict()
+        return cls(manifest, throttle=throttle,
+                   reverify_after=scrub_config.get('reverify_after', DEFAULT_REVERIFY_AFTER),
+                   checkpoint_interval=scrub_config.get('checkpoint_interval', DEFAULT_CHECKPOINT_INTERVAL))
+
+    def needs_scrub(self) -> bool:
+        """Method to check if a pass is in progress, or the last pass completed more than `reverify_after` seconds ago
+
+        Returns:
+            bool
+        """
+        checkpoint = self.state.checkpoint()
+        if checkpoint.last_key is not None or checkpoint.last_pass_completed_at is None:
+            return True
+        return self._clock() - checkpoint.last_pass_completed_at > self.reverify_after
+
+    def mismatches(self) -> List[str]:
+        """Method to get the files whose contents did not match the manifest in the latest scrub. Files that have been
+        changed in the manifest since they were checked are not included
+
+        Returns:
+            list of relative paths
+        """
+        index = self.manifest.manifest
+        results = list()
+        for record in self.state.mismatches():
+            item = index.get(record.path)
+            if item and item.get('h') == record.expected_hash:
+                results.append(record.path)
+        return results
+
+    def _hash_file(self, abs_path: str) -> Tuple[Optional[str], int]:
+        """Method to compute the blake2b hash of a file, reading no faster than the throttle allows
+
+        Args:
+            abs_path: absolute path to the file
+
+        Returns:
+            the hash (or None if the file could not be read), and the number of bytes read
+        """
+        h = blake2b()
+        num_bytes = 0
+        try:
+            with open(abs_path, 'rb') as fh:
+                while True:
+                    data = fh.read(SCRUB_READ_SIZE)
+                    if not data:
+                        break
+                    if self.throttle:
+                        self.throttle.acquire(len(data))
+                    h.update(data)
+                    num_bytes += len(data)
+        except OSError as err:
+            logger.warning(f"Failed to read {abs_path} while verifying it: {err}")
+            return None, num_bytes
+        return h.hexdigest(), num_bytes
+
+    def _is_recently_verified(self, path: str, expected_hash: str, file_info: os.stat_result) -> bool:
+        """Method to check if a file can be skipped because it matched the manifest recently and hasn't changed since
+
+        Args:
+            path: relative path of the file
+            expected_hash: the file's hash in the manifest
+            file_info: the current stat of the file
+
+        Returns:
+            bool
+        """
+        record = self.state.get_verified(path)
+        return record is not None and record.hash == expected_hash and record.size == file_info.st_size and \
+            record.mtime_ns == file_info.st_mtime_ns and self._clock() - record.verified_at < self.reverify_after
+
+    def scrub(self, max_seconds: Optional[float] = None, max_files: Optional[int] = None,
+              status_update_fn: Optional[Callable[[str], None]] = None) -> ScrubResult:
+        """Method to verify files, continuing the current pass (or starting a new one) until it completes or a limit
+        is reached
+
+        Args:
+            max_seconds: optional number of seconds after which to stop, checked between files
+            max_files: optional number of files to check (including skipped files) before stopping
+            status_update_fn: optional callable, accepting a string for logging/providing status to the UI
+
+        Returns:
+            ScrubResult
+        """
+        started_at = self._clock()
+        checkpoint = self.state.checkpoint()
+        pass_started_at = started_at
+        if checkpoint.last_key is not None and checkpoint.pass_started_at is not None:
+            pass_started_at = checkpoint.pass_started_at
+        if checkpoint.last_key is not None:
+            logger.info(f"Resuming integrity scrub of {self.manifest.dataset.name} after {checkpoint.last_key}")
+
+        revision_dir = os.path.join(self.manifest.cache_mgr.cache_root, self.manifest.dataset_revision)
+        verified: List[Tuple[str, VerifiedRecord]] = list()
+        mismatches: List[MismatchRecord] = list()
+        removed: List[str] = list()
+        num_pending = 0
+        last_checkpoint = started_at
+        num_checked = num_verified = num_skipped = num_bytes = 0
+        last_key = checkpoint.last_key
+        pass_complete = True
+
+        for key, item in self.manifest.manifest.scan(start_after=checkpoint.last_key):
+            if (max_files is not None and num_checked >= max_files) or \
+                    (max_seconds is not None and self._clock() - started_at >= max_seconds):
+                pass_complete = False
+                break
+
+            abs_path = os.path.join(revision_dir, key)
+            expected_hash = item.get('h')
+            file_info: Optional[os.stat_result]
+            try:
+                file_info = os.stat(abs_path)
+            except OSError:
+                file_info = None
+
+            if file_info is None or not os.path.isfile(abs_path) or not expected_hash:
+                # Only files in the cache with a hash in the manifest are verified
+                removed.append(key)
+            elif self._is_recently_verified(key, expected_hash, file_info):
+                num_skipped += 1
+            else:
+                actual_hash, file_bytes = self._hash_file(abs_path)
+                num_bytes += file_bytes
+                num_verified += 1
+                if actual_hash == expected_hash:
+                    verified.append((key, VerifiedRecord(file_info.st_size, file_info.st_mtime_ns, expected_hash,
+                                                         self._clock())))
+                else:
+                    mismatches.append(MismatchRecord(key, expected_hash, actual_hash, self._clock()))
+
+            num_checked += 1
+            num_pending += 1
+            last_key = key
+            if num_pending >= self.checkpoint_interval or self._clock() - last_checkpoint >= CHECKPOINT_SECONDS:
+                self.state.save(verified, mismatches, removed, last_key, pass_started_at)
+                verified, mismatches, removed = list(), list(), list()
+                num_pending = 0
+                last_checkpoint = self._clock()
+
+        self.state.save(verified, mismatches, removed, last_key, pass_started_at)
+        if pass_complete:
+            index = self.manifest.manifest
+            self.state.complete_pass(self._clock(), [p for p in self.state.paths() if p not in index])
+
+        results = self.mismatches()
+        if status_update_fn:
+            status = "Integrity check complete." if pass_complete else "Integrity check paused."
+            status_update_fn(f"{status} Verified {num_verified} files ({num_skipped} unchanged since they were "
+                             f"last verified). {len(results)} files have been modified.")
+
+        return ScrubResult(num_verified=num_verified, num_skipped=num_skipped, num_bytes=num_bytes,
+                           pass_complete=pass_complete, mismatches=results)
+
+    def close(self) -> None:
+        """Method to close the scrubber's state
+
+        Returns:
+            None
+        """
+        self.state.close()
@@ -0,0 +1,118 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore(object):
+    """Base class for the SQLite databases kept in a dataset's cache
+
+    The database file is only created on the first write, so reads of a store that doesn't exist yet don't create
+    files. The connection is shared by every thread in the process and guarded by a reentrant lock. Writes are made in
+    `BEGIN IMMEDIATE` transactions, so other processes always read a consistent state.
+
+    Subclasses create their tables (and migrate any legacy data) in `_initialize()`, and override `_exists()` if there
+    is legacy data to migrate before the database file exists.
+    """
+    def __init__(self, db_file: str) -> None:
+        self.db_file = db_file
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _initialize(self, conn: sqlite3.Connection) -> None:
+        """Method to create the tables of the store when a connection is opened
+
+        Args:
+            conn: the new connection
+
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+    def _exists(self) -> bool:
+        """Method to check if the store has data to read
+
+        Returns:
+            bool
+        """
+        return os.path.exists(self.db_file)
+
+    def _close_if_removed(self) -> None:
+        """Method to close the connection if the database file was removed while it was open (e.g. the cache directory
+        was deleted)
+
+        Returns:
+            None
+        """
+        if self._connection and not os.path.exists(self.db_file):
+            self.close()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Method to get a connection to the store, if it exists
+
+        Returns:
+            sqlite3.Connection, or None if the store has not been created
+        """
+        with self._lock:
+            self._close_if_removed()
+            if not self._connection and not self._exists():
+                return None
+            return self._connect_or_create()
+
+    def _connect_or_create(self) -> sqlite3.Connection:
+        """Method to get a connection to the store, creating it if it doesn't exist
+
+        Returns:
+            sqlite3.Connection
+        """
+        with self._lock:
+            self._close_if_removed()
+            if self._connection:
+                return self._connection
+
+            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=60, check_same_thread=False, isolation_level=None)
+            self._connection = conn
+            try:
+                self._initialize(conn)
+            except BaseException:
+                self.close()
+                raise
+            return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Context manager to run a set of changes in a single write transaction, rolling back if an error occurs
+
+        If a transaction is already open on the connection, the changes are made in it instead.
+
+        Returns:
+            sqlite3.Connection
+        """
+        with self._lock:
+            conn = self._connect_or_create()
+            if conn.in_transaction:
+                yield conn
+                return
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+
+    def close(self) -> None:
+        """Method to close the connection to the store
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
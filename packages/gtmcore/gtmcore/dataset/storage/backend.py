@@ -1,15 +1,21 @@
 import abc
 import os
 from pkg_resources import resource_filename
+from concurrent.futures import Executor
 from typing import Optional, List, Dict, Callable, Tuple
 import base64
 import asyncio
-import shutil
 import copy
 
+from redis.exceptions import RedisError
+
 from gtmcore.dataset.io import PushResult, PushObject, PullObject, PullResult
+from gtmcore.dataset.io.bandwidth import Throttle, get_bandwidth_limiter, PRIORITY_BACKGROUND
 from gtmcore.dataset.manifest.manifest import Manifest, StatusResult
 from gtmcore.dataset.manifest.eventloop import get_event_loop
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
 
 
 class StorageBackend(metaclass=abc.ABCMeta):
@@ -21,6 +27,18 @@ class StorageBackend(metaclass=abc.ABCMeta):
         # Configuration is populated from the Dataset at runtime (via a file and in-memory secrets)
         self.configuration = dict()
 
+        # Summary of how the number of in-flight requests was adjusted during the last push or pull, for backends
+        # that use an AdaptiveConcurrencyController
+        self.concurrency_summary: Optional[dict] = None
+
+        # Optional process pool for CPU bound work during a transfer (e.g. compressing objects), set by the
+        # TransferEngine while it runs. If None, backends use threads in the current process
+        self.compression_executor: Optional[Executor] = None
+
+        # Priority class of the current transfer when sharing bandwidth with other transfers, set by the
+        # TransferEngine while it runs
+        self.transfer_priority = PRIORITY_BACKGROUND
+
         # Attributes used to store the required keys for a backend
         self._required_configuration_params = [{'parameter': 'username',
                                                 'description': "the Gigantum username for the logged in user",
@@ -102,6 +120,29 @@ class StorageBackend(metaclass=abc.ABCMeta):
         self.configuration['gigantum_bearer_token'] = bearer_token
         self.configuration['gigantum_id_token'] = id_token
 
+    def _bandwidth_throttle(self, dataset, direction: str) -> Optional[Throttle]:
+        """Method to get a throttle for the current transfer, with rates from the client config and the dataset's
+        backend configuration
+
+        If Redis can't be reached, the transfer is not limited instead of failing.
+
+        Args:
+            dataset: the current dataset
+            direction: 'upload' or 'download'
+
+        Returns:
+            Throttle, or None if the transfer is not limited
+        """
+        try:
+            limiter = get_bandwidth_limiter(dataset.client_config.config['lock']['redis'])
+            limiter.configure(dataset.client_config.config['datasets'].get('bandwidth'))
+            return limiter.throttle(direction, self.transfer_priority,
+                                    dataset_id=f"{dataset.namespace}/{dataset.name}",
+                                    rate_limit=self.configuration.get(f'{direction}_rate_limit'))
+        except RedisError as err:
+            logger.warning(f"Failed to limit bandwidth, continuing transfer without a limit: {err}")
+            return None
+
     def _required_configuration(self) -> List[Dict[str, str]]:
         """A private method to return a list of parameters that must be set for a backend to be fully configured
 
@@ -228,10 +269,10 @@ class StorageBackend(metaclass=abc.ABCMeta):
 
         m = Manifest(dataset, self.configuration.get('username'))
         keys_to_verify = list()
-        for item in m.manifest:
-            if os.path.isfile(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, item)):
+        for relative_path in m.manifest:
+            if os.path.isfile(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, relative_path)):
                 # File exists locally
-                keys_to_verify.append(item)
+                keys_to_verify.append(relative_path)
 
         # re-hash files
         status_update_fn(f"Validating contents of {len(keys_to_verify)} files. Please wait.")
@@ -280,6 +321,21 @@ class ManagedStorageBackend(StorageBackend):
         """
         raise NotImplemented
 
+    def remove_existing_objects(self, dataset, objects: List[PushObject]) -> List[PushObject]:
+        """Method to remove objects that the remote storage backend already has from a list of objects to push
+
+        This is called before objects are divided into push batches. Backends that can't check which objects exist
+        simply return all objects.
+
+        Args:
+            dataset: The dataset instance
+            objects: A list of PushObjects that need to be pushed
+
+        Returns:
+            list of the PushObjects that still need to be pushed
+        """
+        return objects
+
     def push_objects(self, dataset, objects: List[PushObject], progress_update_fn: Callable) -> PushResult:
         """Method to push objects to the remote storage backend
 
@@ -382,9 +438,7 @@ class UnmanagedStorageBackend(StorageBackend):
         m.create_update_activity_record(status)
 
         # Link the revision dir
-        m.link_revision()
-        if os.path.isdir(os.path.join(m.cache_mgr.cache_root, previous_revision)):
-            shutil.rmtree(os.path.join(m.cache_mgr.cache_root, previous_revision))
+        m.link_committed_revision(previous_revision, status)
 
         status_update_fn("Update complete.")
 
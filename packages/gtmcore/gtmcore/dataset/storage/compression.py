@@ -0,0 +1,363 @@
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+import math
+import os
+
+import numpy as np
+import snappy
+import zstandard
+
+# Every codec writes the chunk layout of the snappy framing format: a 1 byte chunk type, a 3 byte little-endian length,
+# and the chunk data. The first chunk is a stream identifier that records the codec, so it can be detected when an
+# object is downloaded and objects written with any codec (including objects written before codecs were added, which
+# are all snappy) can be read. Because chunks are self-delimiting, a download can resume at any chunk boundary.
+CHUNK_HEADER_SIZE = 4
+MAX_CHUNK_SIZE = 2 ** 24 - 1
+
+CHUNK_TYPE_STREAM_IDENTIFIER = 0xff
+CHUNK_TYPE_PADDING = 0xfe
+# Chunk types in the snappy framing format's reserved, unskippable range, so snappy decoders reject them
+CHUNK_TYPE_ZSTD_FRAME = 0x02
+CHUNK_TYPE_STORED = 0x03
+
+# The first chunk of every snappy framed stream
+SNAPPY_STREAM_IDENTIFIER = b'\xff\x06\x00\x00sNaPpY'
+ZSTD_STREAM_IDENTIFIER = b'\xff\x06\x00\x00gtZSTD'
+STORE_STREAM_IDENTIFIER = b'\xff\x06\x00\x00gtSTOR'
+STREAM_IDENTIFIER_SIZE = len(SNAPPY_STREAM_IDENTIFIER)
+
+# Extensions of formats that are already compressed, so compressing them again wastes CPU and can grow them
+INCOMPRESSIBLE_EXTENSIONS = frozenset(['.7z', '.avi', '.avif', '.br', '.bz2', '.docx', '.flac', '.gif', '.gz',
+                                       '.heic', '.jar', '.jpeg', '.jpg', '.lz4', '.m4a', '.mkv', '.mov', '.mp3',
+                                       '.mp4', '.npz', '.ogg', '.parquet', '.png', '.pptx', '.rar', '.snappy',
+                                       '.tgz', '.webm', '.webp', '.whl', '.xlsx', '.xz', '.zip', '.zst'])
+
+
+def _chunk(chunk_type: int, data: bytes) -> bytes:
+    """Function to frame data as a single chunk
+
+    Args:
+        chunk_type: the chunk type
+        data: the chunk data
+
+    Returns:
+        bytes
+    """
+    if len(data) > MAX_CHUNK_SIZE:
+        raise ValueError(f"Chunk of {len(data)} bytes is larger than the maximum of {MAX_CHUNK_SIZE} bytes")
+    return bytes([chunk_type]) + len(data).to_bytes(3, 'little') + data
+
+
+def iter_chunks(data: bytes) -> Iterable[Tuple[int, memoryview]]:
+    """Function to iterate over the complete chunks in a buffer
+
+    Args:
+        data: buffer of complete chunks, starting at a chunk boundary
+
+    Returns:
+        iterable of (chunk type, chunk data)
+    """
+    view = memoryview(data)
+    offset = 0
+    while offset < len(view):
+        if offset + CHUNK_HEADER_SIZE > len(view):
+            raise IOError("Compressed data ended in the middle of a chunk header")
+        length = int.from_bytes(view[offset + 1:offset + CHUNK_HEADER_SIZE], 'little')
+        end = offset + CHUNK_HEADER_SIZE + length
+        if end > len(view):
+            raise IOError("Compressed data ended in the middle of a chunk")
+        yield view[offset], view[offset + CHUNK_HEADER_SIZE:end]
+        offset = end
+
+
+def compress_frames(data: bytes, include_stream_identifier: bool) -> bytes:
+    """Function to snappy-compress a block of an object into framed format
+
+    Frames are compressed independently, so blocks that are a multiple of the frame size can be compressed separately
+    (e.g. in a process pool) and concatenated. This is a module level function so it can be sent to a process pool
+    worker.
+
+    Args:
+        data: the block to compress
+        include_stream_identifier: True for the first block of the stream
+
+    Returns:
+        bytes
+    """
+    frames = snappy.StreamCompressor().add_chunk(data)
+    if not include_stream_identifier:
+        frames = frames[len(SNAPPY_STREAM_IDENTIFIER):]
+    return frames
+
+
+class Decompressor(object):
+    """Class to decompress a stream of complete chunks, fed in order"""
+    def decompress(self, data: bytes) -> bytes:
+        """Method to decompress complete chunks
+
+        Args:
+            data: one or more complete chunks
+
+        Returns:
+            bytes
+        """
+        raise NotImplementedError
+
+
+class SnappyDecompressor(Decompressor):
+    def __init__(self, resume: bool) -> None:
+        self._decompressor = snappy.StreamDecompressor()
+        if resume:
+            # Start a new decompressor at a chunk boundary by giving it the identifier it expects first
+            self._decompressor.decompress(SNAPPY_STREAM_IDENTIFIER)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+
+class ChunkDecompressor(Decompressor):
+    """Class to decompress the chunks written by the zstd and store codecs"""
+    def __init__(self, stream_identifier: bytes, resume: bool) -> None:
+        self.stream_identifier = stream_identifier
+        self._has_identifier = resume
+        self._zstd: Optional[zstandard.ZstdDecompressor] = None
+
+    def decompress(self, data: bytes) -> bytes:
+        output = bytearray()
+        for chunk_type, chunk_data in iter_chunks(data):
+            if chunk_type == CHUNK_TYPE_STREAM_IDENTIFIER:
+                if bytes(chunk_data) != self.stream_identifier[CHUNK_HEADER_SIZE:]:
+                    raise IOError("Invalid stream identifier")
+                self._has_identifier = True
+            elif not self._has_identifier:
+                raise IOError("Compressed data does not start with a stream identifier")
+            elif chunk_type == CHUNK_TYPE_STORED:
+                output.extend(chunk_data)
+            elif chunk_type == CHUNK_TYPE_ZSTD_FRAME:
+                if self._zstd is None:
+                    self._zstd = zstandard.ZstdDecompressor()
+                output.extend(self._zstd.decompress(chunk_data))
+            elif chunk_type == CHUNK_TYPE_PADDING or 0x80 <= chunk_type <= 0xfd:
+                # Skippable chunks
+                continue
+            else:
+                raise IOError(f"Unsupported chunk type {chunk_type:#x}")
+        return bytes(output)
+
+
+class Codec(object):
+    """Class to compress blocks of an object into chunks that can be concatenated into a single stream
+
+    Codecs are sent to process pool workers with each block, so they only hold settings.
+    """
+    name = ""
+    stream_identifier = b""
+
+    def compress(self, data: bytes, include_stream_identifier: bool) -> bytes:
+        """Method to compress a block of an object. Blocks are compressed independently
+
+        Args:
+            data: the block to compress
+            include_stream_identifier: True for the first block of the stream
+
+        Returns:
+            bytes
+        """
+        raise NotImplementedError
+
+    def decompressor(self, resume: bool = False) -> Decompressor:
+        """Method to get a decompressor for a stream written by this codec
+
+        Args:
+            resume: True if the stream is read from a chunk boundary after the stream identifier
+
+        Returns:
+            Decompressor
+        """
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}()"
+
+
+class SnappyCodec(Codec):
+    """Snappy framing format, the format of all objects written before codecs were added. The output is identical to
+    `snappy.stream_compress()` if blocks are a multiple of the snappy frame size (64KiB)
+    """
+    name = "snappy"
+    stream_identifier = SNAPPY_STREAM_IDENTIFIER
+
+    def compress(self, data: bytes, include_stream_identifier: bool) -> bytes:
+        return compress_frames(data, include_stream_identifier)
+
+    def decompressor(self, resume: bool = False) -> Decompressor:
+        return SnappyDecompressor(resume)
+
+
+class ZstdCodec(Codec):
+    """Each block is compressed into a zstd frame, in its own chunk"""
+    name = "zstd"
+    stream_identifier = ZSTD_STREAM_IDENTIFIER
+
+    def __init__(self, level: int = 3) -> None:
+        self.level = level
+
+    def compress(self, data: bytes, include_stream_identifier: bool) -> bytes:
+        frame = zstandard.ZstdCompressor(level=self.level).compress(data)
+        chunk = _chunk(CHUNK_TYPE_ZSTD_FRAME, frame)
+        return self.stream_identifier + chunk if include_stream_identifier else chunk
+
+    def decompressor(self, resume: bool = False) -> Decompressor:
+        return ChunkDecompressor(self.stream_identifier, resume)
+
+    def __repr__(self) -> str:
+        return f"ZstdCodec(level={self.level})"
+
+
+class StoreCodec(Codec):
+    """Blocks are stored without compression, for content that is already compressed"""
+    name = "store"
+    stream_identifier = STORE_STREAM_IDENTIFIER
+
+    def compress(self, data: bytes, include_stream_identifier: bool) -> bytes:
+        chunk = _chunk(CHUNK_TYPE_STORED, data)
+        return self.stream_identifier + chunk if include_stream_identifier else chunk
+
+    def decompressor(self, resume: bool = False) -> Decompressor:
+        return ChunkDecompressor(self.stream_identifier, resume)
+
+
+CODECS: Dict[str, Type[Codec]] = {SnappyCodec.name: SnappyCodec, ZstdCodec.name: ZstdCodec,
+                                  StoreCodec.name: StoreCodec}
+
+
+def get_codec(name: str, level: Optional[int] = None) -> Codec:
+    """Function to get a codec by name
+
+    Args:
+        name: snappy, zstd, or store
+        level: compression level, for codecs that have levels
+
+    Returns:
+        Codec
+    """
+    if name not in CODECS:
+        raise ValueError(f"Unsupported compression codec `{name}`. Use one of: {', '.join(CODECS.keys())}")
+    if name == ZstdCodec.name and level is not None:
+        return ZstdCodec(level)
+    return CODECS[name]()
+
+
+def detect_codec(data: bytes) -> Optional[Codec]:
+    """Function to detect the codec of a stream from its first chunk
+
+    Args:
+        data: at least the first `STREAM_IDENTIFIER_SIZE` bytes of the stream
+
+    Returns:
+        Codec, or None if the stream identifier is not recognized
+    """
+    for codec in CODECS.values():
+        if bytes(data[:STREAM_IDENTIFIER_SIZE]) == codec.stream_identifier:
+            return codec()
+    return None
+
+
+def byte_entropy(data: bytes) -> float:
+    """Function to compute the Shannon entropy of the byte values in a buffer
+
+    Args:
+        data: the buffer
+
+    Returns:
+        float: bits per byte, from 0 to 8
+    """
+    if not data:
+        return 0.0
+    counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    probabilities = counts[counts > 0] / len(data)
+    return float(-(probabilities * np.log2(probabilities)).sum())
+
+
+class CodecSelector(object):
+    """Class to choose the codec for each object as it is pushed
+
+    Objects with the extension of a compressed format are stored without compression. Otherwise a few blocks spread
+    across the object are sampled, and if their bytes have an entropy of at least `entropy_threshold` bits per byte the
+    object is also stored (compressed, encrypted, and random data are all close to 8). Everything else uses the
+    configured codec.
+    """
+    def __init__(self, codec: str = SnappyCodec.name, level: Optional[int] = None,
+                 detect_incompressible: bool = True, entropy_threshold: float = 7.5,
+                 incompressible_extensions: Optional[Iterable[str]] = None,
+                 sample_size: int = 65536, num_samples: int = 4) -> None:
+        self.codec = get_codec(codec, level)
+        self.detect_incompressible = detect_incompressible
+        self.entropy_threshold = entropy_threshold
+        if incompressible_extensions is None:
+            incompressible_extensions = INCOMPRESSIBLE_EXTENSIONS
+        self.incompressible_extensions = frozenset(e.lower() for e in incompressible_extensions)
+        self.sample_size = sample_size
+        self.num_samples = max(1, num_samples)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> 'CodecSelector':
+        """Method to create a selector from the `compression` section of a backend's configuration
+
+        Detecting incompressible objects is off unless enabled, because objects stored without compression can't be
+        pulled by clients that only read snappy.
+
+        Args:
+            config: dict with optional keys `codec`, `zstd_level`, `detect_incompressible`, `entropy_threshold` and
+                    `incompressible_extensions`
+
+        Returns:
+            CodecSelector
+        """
+        config = config or dict()
+        return cls(codec=config.get('codec', SnappyCodec.name),
+                   level=config.get('zstd_level'),
+                   detect_incompressible=config.get('detect_incompressible', False),
+                   entropy_threshold=config.get('entropy_threshold', 7.5),
+                   incompressible_extensions=config.get('incompressible_extensions'))
+
+    def _sample(self, object_path: str) -> bytes:
+        """Method to read evenly spaced blocks of an object
+
+        Args:
+            object_path: absolute path to the object
+
+        Returns:
+            bytes
+        """
+        size = os.path.getsize(object_path)
+        with open(object_path, 'rb') as fh:
+            if size <= self.sample_size * self.num_samples:
+                return fh.read()
+
+            samples: List[bytes] = list()
+            step = (size - self.sample_size) / (self.num_samples - 1) if self.num_samples > 1 else 0
+            for n in range(self.num_samples):
+                fh.seek(math.floor(n * step))
+                samples.append(fh.read(self.sample_size))
+            return b''.join(samples)
+
+    def choose(self, object_path: str, dataset_path: Optional[str] = None) -> Codec:
+        """Method to choose the codec for an object
+
+        Args:
+            object_path: absolute path to the object
+            dataset_path: the relative path of the file in the dataset, to check its extension
+
+        Returns:
+            Codec
+        """
+        if not self.detect_incompressible or isinstance(self.codec, StoreCodec):
+            return self.codec
+
+        if dataset_path and os.path.splitext(dataset_path)[1].lower() in self.incompressible_extensions:
+            return StoreCodec()
+
+        if byte_entropy(self._sample(object_path)) >= self.entropy_threshold:
+            return StoreCodec()
+
+        return self.codec
@@ -0,0 +1,179 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import json
+import os
+import sqlite3
+
+from gtmcore.dataset.sqlitestore import SQLiteStore
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+# Name of the SQLite database (in the cache root) holding the ETags of the objects in a dataset's remote bucket
+ETAG_STORE_FILE = ".etag_cache.db"
+
+# Number of keys looked up per query. This must stay below SQLite's limit on the number of host parameters (999).
+ETAG_LOOKUP_BATCH_SIZE = 500
+
+
+def parent_directories(key: str) -> List[str]:
+    """Helper to get every parent directory of an object key, each with a trailing slash
+
+    Args:
+        key: object key (e.g. `a/b/c.txt`)
+
+    Returns:
+        list, e.g. `['a/', 'a/b/']`
+    """
+    parts = key.split('/')[:-1]
+    return ['/'.join(parts[:i]) + '/' for i in range(1, len(parts) + 1)]
+
+
+class ETagStore(SQLiteStore):
+    """Class to provide an indexed, on-disk store of the ETags of the objects in a remote bucket
+
+    Each update from the remote is a "pass". As pages of the bucket listing are processed, the ETag listed for each
+    key is saved as pending and the key (and its parent directories) are marked as seen in the pass. Lookups return
+    the ETag of the last *applied* pass, so if an update fails before the manifest is updated, the changed objects are
+    detected again on the next update. When the update succeeds, `finish_pass()` applies the pending ETags and removes
+    keys that were not seen.
+
+    Only the keys being looked up are read, so memory does not depend on the number of objects in the bucket. A
+    legacy JSON ETag file is migrated into the store on first access. The database file is only created on the first
+    write.
+    """
+    def __init__(self, cache_root: str, legacy_file: Optional[str] = None) -> None:
+        self.cache_root = cache_root
+        self.legacy_file = legacy_file
+        super().__init__(os.path.join(cache_root, ETAG_STORE_FILE))
+
+    @property
+    def store_file(self) -> str:
+        """Property to get the absolute path to the SQLite database"""
+        return self.db_file
+
+    def _has_legacy_file(self) -> bool:
+        return self.legacy_file is not None and os.path.exists(self.legacy_file)
+
+    def _exists(self) -> bool:
+        return super()._exists() or self._has_legacy_file()
+
+    def _initialize(self, conn: sqlite3.Connection) -> None:
+        conn.execute("CREATE TABLE IF NOT EXISTS etags (key TEXT PRIMARY KEY NOT NULL, etag TEXT, "
+                     "pending_etag TEXT, last_seen INTEGER NOT NULL DEFAULT 0)")
+        conn.execute("CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY NOT NULL, "
+                     "last_seen INTEGER NOT NULL)")
+        self._migrate_legacy_file()
+
+    def _migrate_legacy_file(self) -> None:
+        """Method to load a legacy JSON ETag file into the store and remove it
+
+        Returns:
+            None
+        """
+        legacy_file = self.legacy_file
+        if legacy_file is None or not os.path.exists(legacy_file):
+            return
+
+        try:
+            with open(legacy_file, 'rt') as ef:
+                data = json.load(ef)
+            with self._transaction() as conn:
+                conn.executemany("INSERT OR IGNORE INTO etags (key, etag) VALUES (?, ?)", data.items())
+            logger.info(f"Migrated {len(data)} ETags from {legacy_file}")
+        except Exception as err:
+            # The ETags are just a cache. If they can't be migrated, objects will simply be downloaded again
+            logger.warning(f"Failed to migrate legacy ETag file {legacy_file}")
+            logger.exception(err)
+
+        os.remove(legacy_file)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Method to look up the applied ETags of a set of keys
+
+        Args:
+            keys: object keys
+
+        Returns:
+            dict of key -> ETag, for the keys that have one
+        """
+        keys = list(keys)
+        result: Dict[str, str] = dict()
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return result
+            for start in range(0, len(keys), ETAG_LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + ETAG_LOOKUP_BATCH_SIZE]
+                rows = conn.execute(f"SELECT key, etag FROM etags WHERE etag IS NOT NULL AND "
+                                    f"key IN ({','.join('?' * len(batch))})", batch).fetchall()
+                result.update(rows)
+        return result
+
+    def begin_pass(self) -> int:
+        """Method to start a new pass over the remote
+
+        Returns:
+            int, the id of the pass
+        """
+        with self._transaction() as conn:
+            return conn.execute("SELECT MAX(COALESCE((SELECT MAX(last_seen) FROM etags), 0), "
+                                "COALESCE((SELECT MAX(last_seen) FROM directories), 0)) + 1").fetchone()[0]
+
+    def record_page(self, pass_id: int, etags: Iterable[Tuple[str, str]]) -> None:
+        """Method to save the ETags listed in a page of the remote, marking the keys and their parent directories as
+        seen in the pass
+
+        Args:
+            pass_id: id of the current pass
+            etags: (key, ETag) of each object listed
+
+        Returns:
+            None
+        """
+        etags = list(etags)
+        directories = sorted({d for key, _ in etags for d in parent_directories(key)})
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR IGNORE INTO etags (key) VALUES (?)", ((key,) for key, _ in etags))
+            conn.executemany("UPDATE etags SET pending_etag = ?, last_seen = ? WHERE key = ?",
+                             ((etag, pass_id, key) for key, etag in etags))
+            conn.executemany("INSERT OR REPLACE INTO directories (path, last_seen) VALUES (?, ?)",
+                             ((d, pass_id) for d in directories))
+
+    def seen(self, pass_id: int, keys: Iterable[str]) -> Set[str]:
+        """Method to check which of a set of keys (objects or directories) were seen in a pass
+
+        Args:
+            pass_id: id of the pass
+            keys: object keys, or directories with a trailing slash
+
+        Returns:
+            set of the keys that were seen
+        """
+        keys = list(keys)
+        result: Set[str] = set()
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return result
+            for start in range(0, len(keys), ETAG_LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + ETAG_LOOKUP_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                rows = conn.execute(f"SELECT key FROM etags WHERE last_seen = ? AND key IN ({placeholders}) "
+                                    f"UNION SELECT path FROM directories WHERE last_seen = ? AND "
+                                    f"path IN ({placeholders})", [pass_id, *batch, pass_id, *batch]).fetchall()
+                result.update([row[0] for row in rows])
+        return result
+
+    def finish_pass(self, pass_id: int) -> None:
+        """Method to apply the ETags saved in a pass, and remove keys and directories that were not seen in it
+
+        Args:
+            pass_id: id of the pass
+
+        Returns:
+            None
+        """
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM etags WHERE last_seen != ?", (pass_id,))
+            conn.execute("DELETE FROM directories WHERE last_seen != ?", (pass_id,))
+            conn.execute("UPDATE etags SET etag = pending_etag, pending_etag = NULL WHERE pending_etag IS NOT NULL")
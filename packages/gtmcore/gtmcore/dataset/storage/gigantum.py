@@ -1,17 +1,23 @@
 import asyncio
 import aiohttp
+from hashlib import blake2b
 import aiofiles
 import copy
-import snappy
+import json
+import time
 import requests
-import math
 
 from gtmcore.dataset import Dataset
 from gtmcore.dataset.storage.backend import ManagedStorageBackend
-from typing import Optional, List, Dict, Callable, Tuple, NamedTuple
+from concurrent.futures import Executor
+from typing import BinaryIO, Optional, List, Dict, Callable, Tuple, NamedTuple, Set
 import os
 
 from gtmcore.dataset.io import PushResult, PushObject, PullResult, PullObject
+from gtmcore.dataset.io.bandwidth import Throttle
+from gtmcore.dataset.io.concurrency import AdaptiveConcurrencyController
+from gtmcore.dataset.storage.compression import CODECS, Codec, CodecSelector, SnappyCodec, STREAM_IDENTIFIER_SIZE, \
+    detect_codec, get_codec
 from gtmcore.logging import LMLogger
 from gtmcore.dataset.manifest.eventloop import get_event_loop
 
@@ -20,23 +26,120 @@ logger = LMLogger.get_logger()
 
 # Namedtuples to track parts in a multipart upload
 MultipartPart = NamedTuple("MultipartUploadPart", [('part_number', int), ('start_byte', int), ('end_byte', int)])
-MultipartPartCompleted = NamedTuple("MultipartUploadPart", [('part_number', int), ('etag', str)])
+MultipartPartCompleted = NamedTuple("MultipartUploadPart", [('part_number', int), ('etag', str),
+                                                             ('end_byte', int)])
 
 OBJ_SRV_TIMEOUT = aiohttp.ClientTimeout(total=5 * 60, connect=60, sock_connect=None, sock_read=None)
 
+# Size of the reads from an object while compressing it. For snappy, this must be a multiple of the snappy frame size
+# (64KiB) so the output is identical to `snappy.stream_compress()`
+COMPRESSION_READ_SIZE = 1048576
+
+
+class StreamingCompressor(object):
+    """Class to incrementally compress an object, so compressed output can be read in blocks (e.g. one multipart part
+    at a time) without writing the compressed object to disk
+
+    The codec is chosen by `codec_selector` when the first block is read. Without a selector objects are snappy
+    compressed, and the concatenated output is identical to compressing the whole object with
+    `snappy.stream_compress()`. If an executor is provided (e.g. a process pool), each block is compressed in it
+    instead of the calling thread.
+    """
+    def __init__(self, object_path: str, read_size: int = COMPRESSION_READ_SIZE,
+                 executor: Optional[Executor] = None, codec_selector: Optional[CodecSelector] = None,
+                 dataset_path: Optional[str] = None) -> None:
+        self.object_path = object_path
+        self.read_size = read_size
+        self.bytes_read = 0
+        self.codec_selector = codec_selector
+        self.dataset_path = dataset_path
+        self.codec: Optional[Codec] = None
+
+        self._fh: Optional[BinaryIO] = None
+        self._executor = executor
+        self._buffer = bytearray()
+        self._eof = False
+
+    @property
+    def is_complete(self) -> bool:
+        """Property indicating if all compressed output has been read"""
+        return self._eof and not self._buffer
+
+    def read(self, num_bytes: int) -> bytes:
+        """Blocking method to get the next block of compressed output
+
+        Args:
+            num_bytes: number of compressed bytes to return. Fewer are only returned at the end of the object
+
+        Returns:
+            bytes, empty once all compressed output has been read
+        """
+        if self._fh is None and not self._eof:
+            if self.codec is None:
+                self.codec = self.codec_selector.choose(self.object_path, self.dataset_path) \
+                    if self.codec_selector else SnappyCodec()
+            self._fh = open(self.object_path, 'rb')
+
+        while len(self._buffer) < num_bytes and not self._eof:
+            data = self._fh.read(self.read_size)  # type: ignore
+            if not data:
+                self.close()
+                break
+
+            include_stream_identifier = self.bytes_read == 0
+            self.bytes_read += len(data)
+            if self._executor:
+                self._buffer.extend(self._executor.submit(self.codec.compress, data,  # type: ignore
+                                                          include_stream_identifier).result())
+            else:
+                self._buffer.extend(self.codec.compress(data, include_stream_identifier))  # type: ignore
+
+        block = bytes(self._buffer[:num_bytes])
+        del self._buffer[:num_bytes]
+        return block
+
+    def close(self) -> None:
+        """Method to close the object file
+
+        Returns:
+            None
+        """
+        self._eof = True
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
 
 class PresignedS3Upload(object):
     def __init__(self, object_service_root: str, object_service_headers: dict,
                  multipart_chunk_size: int, upload_chunk_size: int,
-                 object_details: PushObject) -> None:
+                 object_details: PushObject, max_concurrent_parts: int = 1,
+                 compression_executor: Optional[Executor] = None, throttle: Optional[Throttle] = None,
+                 codec_selector: Optional[CodecSelector] = None) -> None:
         self.service_root = object_service_root
         self.object_service_headers = object_service_headers
         self.upload_chunk_size = upload_chunk_size
+        self.max_concurrent_parts = max(1, max_concurrent_parts)
+        self.compression_executor = compression_executor
+        self.codec_selector = codec_selector
+        self.throttle = throttle
 
         self.object_details = object_details
         self.skip_object = False
-        self._compressed_object_path: Optional[str] = None
-        self._compressed_object_size: Optional[int] = None
+
+        # Set once the upload has succeeded, failed or been skipped. Parts of a multipart upload are separate work
+        # items, so several workers may hold the same request
+        self.is_finished = False
+        self.is_completing = False
+        self.is_queued_for_parts = False
+        self._parts_in_flight = 0
+        self._part_lock: Optional[asyncio.Lock] = None
+
+        # Objects are compressed as they are uploaded, keeping at most the data for the current and the next part (or
+        # the whole object, if it is not sent as a multipart upload) in memory
+        self._compressor: Optional[StreamingCompressor] = None
+        self._object_data: Optional[bytes] = None
+        self._next_part_data: Optional[asyncio.Future] = None
 
         self.presigned_s3_url = ""
         self.s3_headers: Dict = dict()
@@ -45,7 +148,10 @@ class PresignedS3Upload(object):
         self.multipart_chunk_size = multipart_chunk_size
         self.multipart_upload_id = None
         self._multipart_parts: List[MultipartPart] = list()
+        self._multipart_part_data: Dict[int, bytes] = dict()
         self._multipart_completed_parts: List[MultipartPartCompleted] = list()
+        self._next_part_number = 1
+        self._next_part_start_byte = 0
 
     @property
     def is_presigned(self) -> bool:
@@ -56,26 +162,18 @@ class PresignedS3Upload(object):
         """
         return self.presigned_s3_url != ""
 
-    @property
-    def compressed_object_size(self) -> int:
-        """Property to get the size of the compressed object
-
-        Returns:
-            bool
-        """
-        if not self._compressed_object_size:
-            self._compressed_object_size = os.path.getsize(self.compressed_object_path)
-        return self._compressed_object_size
-
     @property
     def is_multipart(self) -> bool:
         """Property to check if this object is over the multi-part threshold and should be sent via multi-part upload
         process
 
+        The object is compressed while it is uploaded, so the threshold is checked against the uncompressed size.
+        Parts are always `multipart_chunk_size` bytes of compressed output (except the last).
+
         Returns:
             bool
         """
-        return self.compressed_object_size >= self.multipart_chunk_size
+        return os.path.getsize(self.object_details.object_path) >= self.multipart_chunk_size
 
     @property
     def current_part(self) -> Optional[MultipartPart]:
@@ -89,6 +187,36 @@ class PresignedS3Upload(object):
         else:
             return None
 
+    @property
+    def parts_in_flight(self) -> int:
+        """Property to get the number of parts of a multipart upload currently being uploaded"""
+        return self._parts_in_flight
+
+    @property
+    def can_start_part(self) -> bool:
+        """Property to check if a worker can start uploading another part of a multipart upload: a part is loaded and
+        fewer than `max_concurrent_parts` are being uploaded
+
+        Returns:
+            bool
+        """
+        return self.current_part is not None and not self.skip_object and \
+            self._parts_in_flight < self.max_concurrent_parts
+
+    @property
+    def needs_worker(self) -> bool:
+        """Property to check if a worker taking this request from the queue has anything to do. A multipart upload can
+        be in the queue after other workers have already started all of its remaining parts
+
+        Returns:
+            bool
+        """
+        if self.is_finished or self.is_completing:
+            return False
+        if self.multipart_upload_id and not self.skip_object:
+            return self.can_start_part
+        return True
+
     @property
     def object_id(self) -> str:
         """Property to get the object ID related to this instance
@@ -100,27 +228,135 @@ class PresignedS3Upload(object):
         _, obj_id = self.object_details.object_path.rsplit('/', 1)
         return obj_id
 
-    @property
-    def compressed_object_path(self) -> str:
-        """Property to get the compressed object path, and if not set, compress the object
+    def _get_compressor(self) -> StreamingCompressor:
+        """Method to get the compressor for this object, creating it if needed
 
         Returns:
-            str
+            StreamingCompressor
         """
-        if not self._compressed_object_path:
-            self._compressed_object_path = os.path.join('/tmp', self.object_id)
-            with open(self.object_details.object_path, "rb") as src_file:
-                with open(self._compressed_object_path, "wb") as compressed_file:
-                    snappy.stream_compress(src_file, compressed_file)
+        if not self._compressor:
+            self._compressor = StreamingCompressor(self.object_details.object_path,
+                                                   executor=self.compression_executor,
+                                                   codec_selector=self.codec_selector,
+                                                   dataset_path=self.object_details.dataset_path)
+        return self._compressor
 
-        return self._compressed_object_path
+    async def _read_compressed(self, num_bytes: int) -> bytes:
+        """Method to compress the next block of the object in the loop's default executor
 
-    def remove_compressed_file(self) -> None:
-        try:
-            os.remove(self.compressed_object_path)
-        except FileNotFoundError:
-            # Temp file never got created, just move on
-            pass
+        Args:
+            num_bytes: number of compressed bytes to read
+
+        Returns:
+            bytes
+        """
+        return await get_event_loop().run_in_executor(None, self._get_compressor().read, num_bytes)
+
+    async def get_object_data(self) -> bytes:
+        """Method to get the compressed contents of an object that is not sent as a multipart upload. The object is
+        compressed in memory on first call, and kept until the upload completes so retries do not compress it again
+
+        Returns:
+            bytes
+        """
+        if self._object_data is None:
+            compressor = self._get_compressor()
+            data = list()
+            while not compressor.is_complete:
+                data.append(await self._read_compressed(self.multipart_chunk_size))
+            self._object_data = b''.join(data)
+        return self._object_data
+
+    async def load_next_part(self) -> None:
+        """Method to compress the next part of a multipart upload, if there is no current part
+
+        Part boundaries are computed on the compressed output. Once a part is loaded the one after it is compressed in
+        the background, so compression overlaps with uploading the current part. If all parts have been loaded,
+        `current_part` remains None.
+
+        Returns:
+            None
+        """
+        if self.current_part:
+            return
+
+        if self._next_part_data:
+            data = await self._next_part_data
+            self._next_part_data = None
+        else:
+            data = await self._read_compressed(self.multipart_chunk_size)
+
+        if not data and self._next_part_number > 1:
+            # All parts are loaded (an empty object is still sent as a single empty part)
+            return
+
+        part_number = self._next_part_number
+        start_byte = self._next_part_start_byte
+        self._multipart_parts.append(MultipartPart(part_number=part_number, start_byte=start_byte,
+                                                   end_byte=start_byte + len(data)))
+        self._multipart_part_data[part_number] = data
+        self._next_part_number += 1
+        self._next_part_start_byte += len(data)
+
+        if not self._get_compressor().is_complete:
+            self._next_part_data = asyncio.ensure_future(self._read_compressed(self.multipart_chunk_size))
+
+    async def start_next_part(self) -> Optional[MultipartPart]:
+        """Method to take the current part of a multipart upload for a worker to upload, and load the part after it.
+        Workers must call `finish_part()` once the part is done
+
+        Args:
+
+        Returns:
+            MultipartPart, or None if no part can be started
+        """
+        if self._part_lock is None:
+            # Created on first use so it is bound to the running loop
+            self._part_lock = asyncio.Lock()
+
+        async with self._part_lock:
+            if not self.can_start_part:
+                return None
+
+            part = self._multipart_parts.pop(0)
+            self._parts_in_flight += 1
+            await self.load_next_part()
+            return part
+
+    def finish_part(self) -> None:
+        """Method to record that a worker is done with a part started with `start_next_part()`
+
+        Returns:
+            None
+        """
+        self._parts_in_flight -= 1
+
+    def release_compressed_data(self) -> None:
+        """Method to drop any compressed data held in memory and close the object, once the upload is done or failed
+
+        Returns:
+            None
+        """
+        self._object_data = None
+        self._multipart_part_data = dict()
+        if self._next_part_data:
+            self._next_part_data.cancel()
+            self._next_part_data = None
+        if self._compressor:
+            self._compressor.close()
+
+    def _mark_part_complete(self, part: MultipartPart, etag: str) -> None:
+        """Method to record a part as successfully uploaded. Parts may complete in any order
+
+        Args:
+            part: the part that was uploaded
+            etag: the ETag returned by S3 for the part
+
+        Returns:
+            None
+        """
+        self._multipart_part_data.pop(part.part_number, None)
+        self._multipart_completed_parts.append(MultipartPartCompleted(part.part_number, etag, part.end_byte))
 
     def mark_current_part_complete(self, etag: str) -> None:
         """Method to mark the current part as successfully uploaded
@@ -129,7 +365,7 @@ class PresignedS3Upload(object):
             None
         """
         current_part: MultipartPart = self._multipart_parts.pop(0)
-        self._multipart_completed_parts.append(MultipartPartCompleted(current_part.part_number, etag))
+        self._mark_part_complete(current_part, etag)
         self.presigned_s3_url = ""
 
     def get_completed_parts(self) -> List[dict]:
@@ -138,7 +374,8 @@ class PresignedS3Upload(object):
         Returns:
             List
         """
-        return [dict(ETag=p.etag, PartNumber=p.part_number) for p in self._multipart_completed_parts]
+        return [dict(ETag=p.etag, PartNumber=p.part_number)
+                for p in sorted(self._multipart_completed_parts, key=lambda p: p.part_number)]
 
     def set_s3_headers(self, encryption_key_id: str) -> None:
         """Method to set the header property for S3
@@ -169,11 +406,38 @@ class PresignedS3Upload(object):
             if not self.current_part:
                 raise ValueError("No parts remain to get presigned URL.")
 
-            part_num = self.current_part.part_number
-            url = f"{self.service_root}/{self.object_id}/multipart/{self.multipart_upload_id}/part/{part_num}"
+            self.presigned_s3_url = await self._presign_part(session, self.current_part)
         else:
-            url = f"{self.service_root}/{self.object_id}"
+            self.presigned_s3_url = await self._presign(session, f"{self.service_root}/{self.object_id}")
+
+    async def _presign_part(self, session: aiohttp.ClientSession, part: MultipartPart) -> str:
+        """Method to make a request to the object service and pre-sign an S3 PUT for a part of a multipart upload
+
+        Args:
+            session: The current aiohttp session
+            part: The part to pre-sign
+
+        Returns:
+            str
+        """
+        if not self.multipart_upload_id:
+            raise ValueError("A multipart upload must be created before parts can be pre-signed")
+
+        return await self._presign(session, f"{self.service_root}/{self.object_id}/multipart/"
+                                            f"{self.multipart_upload_id}/part/{part.part_number}")
+
+    async def _presign(self, session: aiohttp.ClientSession, url: str) -> str:
+        """Method to request a pre-signed S3 PUT URL from the object service, retrying on errors
+
+        If the object already exists, `skip_object` is set and an empty string is returned.
+
+        Args:
+            session: The current aiohttp session
+            url: The object service URL for the object or part
 
+        Returns:
+            str
+        """
         try_count = 0
         error_status = None
         error_msg = None
@@ -183,14 +447,13 @@ class PresignedS3Upload(object):
                     if response.status == 200:
                         # Successfully signed the request
                         response_data = await response.json()
-                        self.presigned_s3_url = response_data.get("presigned_url")
                         self.set_s3_headers(response_data.get("key_id"))
-                        return
+                        return response_data.get("presigned_url")
                     elif response.status == 403:
                         # Forbidden indicates Object already exists,
                         # don't need to re-push since we deduplicate so mark it skip
                         self.skip_object = True
-                        return
+                        return ""
                     else:
                         # Something when wrong while trying to pre-sign the URL.
                         error_msg = await response.json()
@@ -209,41 +472,24 @@ class PresignedS3Upload(object):
                       f"{self.object_details.dataset_path}:{self.object_id}."
                       f" Status: {error_status}. Response: {error_msg}")
 
-    async def _file_loader(self, filename: str, progress_update_fn: Callable):
-        """Method to provide non-blocking chunked reads of files, useful if large.
+    async def _data_loader(self, data: bytes, progress_update_fn: Callable):
+        """Method to stream compressed data in chunks, reporting progress as each chunk is sent
 
         Args:
-            filename: absolute path to the file to upload
+            data: compressed data to upload (the whole object or the current part)
             progress_update_fn: A callable with arg "completed_bytes" (int) indicating how many bytes have been
                                 uploaded in since last called
         """
-        async with aiofiles.open(filename, 'rb') as f:
-            if self.is_multipart:
-                if not self.current_part:
-                    raise ValueError("No parts remain to get presigned URL.")
-
-                # if multipart, seek to the proper spot in the file
-                await f.seek(self.current_part.start_byte)
-
-            read_bytes = 0
-            chunk = await f.read(self.upload_chunk_size)
-            while chunk:
-                progress_update_fn(completed_bytes=len(chunk))
-                read_bytes += len(chunk)
-                yield chunk
-
-                if self.is_multipart:
-                    if not self.current_part:
-                        raise ValueError("No parts remain to get presigned URL.")
-                    if self.current_part.start_byte + read_bytes >= self.current_part.end_byte:
-                        # You're done reading for this part
-                        break
-
-                # Keep reading and streaming chunks for this part
-                chunk = await f.read(self.upload_chunk_size)
+        view = memoryview(data)
+        for start in range(0, len(data), self.upload_chunk_size):
+            chunk = view[start:start + self.upload_chunk_size]
+            if self.throttle:
+                await self.throttle.acquire_async(len(chunk))
+            progress_update_fn(completed_bytes=len(chunk))
+            yield bytes(chunk)
 
     async def prepare_multipart_upload(self, session: aiohttp.ClientSession) -> None:
-        """Method to prepare a multipart upload by computing parts and getting an upload ID
+        """Method to prepare a multipart upload by getting an upload ID and compressing the first part
 
         Args:
             session: The current aiohttp session
@@ -251,22 +497,6 @@ class PresignedS3Upload(object):
         Returns:
             None
         """
-        num_parts = math.floor(float(self.compressed_object_size) / float(self.multipart_chunk_size))
-        start_byte = 0
-        for part in range(1, num_parts + 1):
-            self._multipart_parts.append(MultipartPart(part_number=part, start_byte=start_byte,
-                                                       end_byte=start_byte + self.multipart_chunk_size))
-            start_byte = start_byte + self.multipart_chunk_size
-
-        remainder = self.compressed_object_size - (self.multipart_chunk_size * num_parts)
-        if remainder:
-            # If not perfectly divisible by the chunk size, add one more partial part
-            self._multipart_parts.append(MultipartPart(part_number=len(self._multipart_parts) + 1,
-                                                       start_byte=start_byte,
-                                                       end_byte=start_byte + remainder))
-
-        logger.info(self._multipart_parts)
-
         # Make a call and create a multipart upload
         try_count = 0
         error_status = None
@@ -280,8 +510,10 @@ class PresignedS3Upload(object):
                         data = await response.json()
                         self.multipart_upload_id = data['upload_id']
                         logger.info(f"Created multipart upload for {self.object_details.dataset_path} at"
-                                    f" {self.object_details.revision[0:8]}, with {len(self._multipart_parts)} "
-                                    f"parts: {self.multipart_upload_id}")
+                                    f" {self.object_details.revision[0:8]}: {self.multipart_upload_id}")
+
+                        # Compress the first part
+                        await self.load_next_part()
                         return
                     elif response.status == 403:
                         # Forbidden indicates Object already exists,
@@ -337,7 +569,7 @@ class PresignedS3Upload(object):
                         # All good.
                         logger.info(f"Completed multipart upload {self.multipart_upload_id} for "
                                     f"{self.object_details.dataset_path} at {self.object_details.revision[0:8]}.")
-                        self.remove_compressed_file()
+                        self.release_compressed_data()
                         return
 
             except asyncio.TimeoutError:
@@ -401,16 +633,55 @@ class PresignedS3Upload(object):
         Returns:
             None
         """
-        # Set the Content-Length of the PUT explicitly since it won't happen automatically due to streaming IO
-        headers = copy.deepcopy(self.s3_headers)
-
-        # compress object before upload
+        # Get the compressed data for the object or the current part
         if self.is_multipart:
             if not self.current_part:
                 raise ValueError(f"Failed to put_object part. No parts remain for {self.object_id}")
-            headers['Content-Length'] = str(self.current_part.end_byte - self.current_part.start_byte)
+            data = self._multipart_part_data[self.current_part.part_number]
         else:
-            headers['Content-Length'] = str(self.compressed_object_size)
+            data = await self.get_object_data()
+
+        return await self._put_data(session, self.presigned_s3_url, data, progress_update_fn)
+
+    async def upload_part(self, session: aiohttp.ClientSession, part: MultipartPart,
+                          progress_update_fn: Callable) -> None:
+        """Method to pre-sign and upload a single part of a multipart upload, and record its ETag
+
+        Args:
+            session: The current aiohttp session
+            part: The part to upload. Its data must already be loaded
+            progress_update_fn: A callable with arg "completed_bytes" (int) indicating how many bytes have been
+                                uploaded in since last called
+
+        Returns:
+            None
+        """
+        presigned_url = await self._presign_part(session, part)
+        if self.skip_object:
+            # The object already exists in the backend, so there is nothing left to upload
+            return
+
+        etag = await self._put_data(session, presigned_url, self._multipart_part_data[part.part_number],
+                                    progress_update_fn)
+        self._mark_part_complete(part, etag)
+
+    async def _put_data(self, session: aiohttp.ClientSession, presigned_url: str, data: bytes,
+                        progress_update_fn: Callable) -> str:
+        """Method to PUT compressed data to a pre-signed S3 URL, retrying on errors
+
+        Args:
+            session: The current aiohttp session
+            presigned_url: The pre-signed URL for the object or part
+            data: The compressed data to upload
+            progress_update_fn: A callable with arg "completed_bytes" (int) indicating how many bytes have been
+                                uploaded in since last called
+
+        Returns:
+            str: the ETag of the uploaded data
+        """
+        # Set the Content-Length of the PUT explicitly since it won't happen automatically due to streaming IO
+        headers = copy.deepcopy(self.s3_headers)
+        headers['Content-Length'] = str(len(data))
 
         # Stream the file up to S3
         try_count = 0
@@ -419,9 +690,8 @@ class PresignedS3Upload(object):
         timeout = aiohttp.ClientTimeout(total=15*60, connect=2*60, sock_connect=None, sock_read=None)
         while try_count < 3:
             try:
-                async with session.put(self.presigned_s3_url, headers=headers, timeout=timeout,
-                                       data=self._file_loader(filename=self.compressed_object_path,
-                                                              progress_update_fn=progress_update_fn)) as response:
+                async with session.put(presigned_url, headers=headers, timeout=timeout,
+                                       data=self._data_loader(data, progress_update_fn)) as response:
                     if response.status != 200:
                         # An error occurred, retry
                         error_msg = await response.text()
@@ -441,17 +711,130 @@ class PresignedS3Upload(object):
                       f" Status: {error_status}. Response: {error_msg}")
 
 
+# Number of attempts to download an object, resuming from the last completed frame each time
+DOWNLOAD_ATTEMPTS = 3
+
+# Download progress is saved after this many compressed bytes or seconds, and when the download stops
+PROGRESS_SAVE_BYTES = 8388608
+PROGRESS_SAVE_SECONDS = 5.0
+
+# Length of a hex blake2b digest, the format of object ids
+OBJECT_ID_LENGTH = 128
+
+# The codec is the name of the codec detected from the start of the object. Progress saved before codecs were added
+# has no codec, and is always snappy
+DownloadProgress = NamedTuple("DownloadProgress", [('compressed_bytes', int), ('decompressed_bytes', int),
+                                                   ('codec', Optional[str])])
+
+
+def snappy_frame_boundary(data: bytearray) -> int:
+    """Function to find the end of the last complete chunk in a buffer of compressed data. Every codec uses the chunk
+    layout of the snappy framing format
+
+    Each chunk is a 1 byte type, a 3 byte little-endian length, and the chunk data.
+
+    Args:
+        data: buffer starting at a chunk boundary
+
+    Returns:
+        int: number of bytes at the start of the buffer that make up complete chunks
+    """
+    offset = 0
+    while offset + 4 <= len(data):
+        end = offset + 4 + int.from_bytes(data[offset + 1:offset + 4], 'little')
+        if end > len(data):
+            break
+        offset = end
+    return offset
+
+
 class PresignedS3Download(object):
     def __init__(self, object_service_root: str, object_service_headers: dict, download_chunk_size: int,
-                 object_details: PullObject) -> None:
+                 object_details: PullObject, throttle: Optional[Throttle] = None) -> None:
         self.service_root = object_service_root
         self.object_service_headers = object_service_headers
         self.download_chunk_size = download_chunk_size
+        self.throttle = throttle
 
         self.object_details = object_details
 
         self.presigned_s3_url = ""
 
+        # Objects are downloaded to a hidden file next to the object, and renamed once complete and verified. Progress
+        # is saved as data is written, so a failed download can resume where it stopped.
+        obj_dir, obj_id = self.object_details.object_path.rsplit('/', 1)
+        self.partial_path = os.path.join(obj_dir, f".{obj_id}.partial")
+        self.progress_path = os.path.join(obj_dir, f".{obj_id}.progress")
+
+        # Hash of the partial file, updated as data is written
+        self._hasher: Optional[blake2b] = None
+        self._hashed_bytes = 0
+
+        # Decompressed bytes reported to the progress callback
+        self._reported_bytes = 0
+
+    @property
+    def expected_hash(self) -> Optional[str]:
+        """Property to get the hash the downloaded object must have. Object ids are the blake2b hash of the object
+        contents, so if the object id is not a blake2b digest, it is not verified
+
+        Returns:
+            str
+        """
+        _, obj_id = self.object_details.object_path.rsplit('/', 1)
+        if len(obj_id) == OBJECT_ID_LENGTH and all(c in '0123456789abcdef' for c in obj_id):
+            return obj_id
+        return None
+
+    def load_progress(self) -> DownloadProgress:
+        """Method to load the progress of a previous attempt to download this object
+
+        Returns:
+            DownloadProgress, with 0 bytes if there is no usable partial download
+        """
+        try:
+            with open(self.progress_path, 'rt') as pf:
+                data = json.load(pf)
+            data.setdefault('codec', SnappyCodec.name)
+            progress = DownloadProgress(**data)
+            # A partial download can only be resumed with the codec it was started with
+            if os.path.getsize(self.partial_path) >= progress.decompressed_bytes and \
+                    (not progress.compressed_bytes or progress.codec in CODECS):
+                return progress
+        except (OSError, ValueError, TypeError):
+            pass
+        return DownloadProgress(0, 0, None)
+
+    def save_progress(self, progress: DownloadProgress) -> None:
+        """Method to save the progress of this download. Only call after the data has been flushed to the partial file
+
+        The progress is written to a temporary file that replaces the progress file, so an interrupted save leaves
+        the previous progress in place.
+
+        Args:
+            progress: number of compressed bytes received and decompressed bytes written, at a frame boundary, and
+                      the codec of the object
+
+        Returns:
+            None
+        """
+        tmp_path = f"{self.progress_path}.tmp"
+        with open(tmp_path, 'wt') as pf:
+            json.dump(progress._asdict(), pf)
+        os.replace(tmp_path, self.progress_path)
+
+    def remove_partial_download(self) -> None:
+        """Method to remove a partial download and its progress, so the next attempt starts over
+
+        Returns:
+            None
+        """
+        for path in [self.partial_path, self.progress_path, f"{self.progress_path}.tmp"]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
     @property
     def is_presigned(self) -> bool:
         """Method to check if this upload request has successfully been presigned
@@ -488,6 +871,10 @@ class PresignedS3Download(object):
     async def get_object(self, session: aiohttp.ClientSession, progress_update_fn: Callable) -> None:
         """Method to get the object from S3 after the pre-signed URL has been obtained
 
+        If the download fails, it is retried from the last complete frame using a range request, including across
+        calls (e.g. on the next pull). The object is only written to its path once the whole object has been
+        received and its contents match the object id.
+
         Args:
             session: The current aiohttp session
             progress_update_fn: A callable with arg "completed_bytes" (int) indicating how many bytes have been
@@ -496,30 +883,169 @@ class PresignedS3Download(object):
         Returns:
             None
         """
+        try_count = 0
+        while True:
+            try:
+                await self._download_object(session, progress_update_fn)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError, IOError) as err:
+                try_count += 1
+                if try_count >= DOWNLOAD_ATTEMPTS:
+                    logger.exception(err)
+                    raise IOError(f"Failed to get {self.object_details.dataset_path} from storage backend. {err}")
+
+                logger.warning(f"Failed to get {self.object_details.dataset_path}, resuming. "
+                               f"Try {try_count + 1} of {DOWNLOAD_ATTEMPTS}: {err}")
+                await asyncio.sleep(try_count ** 2)
+            except Exception as err:
+                logger.exception(err)
+                raise IOError(f"Failed to get {self.object_details.dataset_path} from storage backend. {err}")
+
         try:
-            decompressor = snappy.StreamDecompressor()
-            timeout = aiohttp.ClientTimeout(total=None, connect=2 * 60, sock_connect=None, sock_read=5*60)
+            await get_event_loop().run_in_executor(None, self._verify_and_finalize)
+        except Exception as err:
+            logger.exception(err)
+            raise IOError(f"Failed to get {self.object_details.dataset_path} from storage backend. {err}")
 
-            async with session.get(self.presigned_s3_url, timeout=timeout) as response:
-                if response.status != 200:
-                    # An error occurred
-                    body = await response.text()
-                    raise IOError(f"Failed to get {self.object_details.dataset_path} to storage backend."
-                                  f" Status: {response.status}. Response: {body}")
+    async def _download_object(self, session: aiohttp.ClientSession, progress_update_fn: Callable) -> None:
+        """Method to download the object to the partial file, resuming from saved progress if possible
 
-                async with aiofiles.open(self.object_details.object_path, 'wb') as fd:
+        Args:
+            session: The current aiohttp session
+            progress_update_fn: A callable with arg "completed_bytes" (int) indicating how many bytes have been
+                                downloaded in since last called
+
+        Returns:
+            None
+        """
+        progress = self.load_progress()
+        headers = dict()
+        if progress.compressed_bytes:
+            headers['Range'] = f"bytes={progress.compressed_bytes}-"
+
+        timeout = aiohttp.ClientTimeout(total=None, connect=2 * 60, sock_connect=None, sock_read=5*60)
+        async with session.get(self.presigned_s3_url, headers=headers, timeout=timeout) as response:
+            if response.status == 206 and progress.compressed_bytes:
+                logger.info(f"Resuming download of {self.object_details.dataset_path} at "
+                            f"{progress.decompressed_bytes} bytes")
+                if progress.decompressed_bytes > self._reported_bytes:
+                    # Count data from a previous pull as complete
+                    progress_update_fn(completed_bytes=progress.decompressed_bytes - self._reported_bytes)
+                    self._reported_bytes = progress.decompressed_bytes
+            elif response.status in [200, 416]:
+                # The full object was sent, or the saved progress was invalid, so start over
+                if progress.compressed_bytes:
+                    self.remove_partial_download()
+                    progress = DownloadProgress(0, 0, None)
+                    if response.status == 416:
+                        raise IOError("Failed to resume download, invalid range")
+            else:
+                # An error occurred
+                body = await response.text()
+                raise IOError(f"Failed to get {self.object_details.dataset_path} to storage backend."
+                              f" Status: {response.status}. Response: {body}")
+
+            # When resuming, the codec was detected from the start of the object by the previous attempt
+            decompressor = None
+            if progress.compressed_bytes and progress.codec:
+                decompressor = get_codec(progress.codec).decompressor(resume=True)
+
+            # Drop anything written after the last saved progress
+            with open(self.partial_path, 'ab') as partial_file:
+                partial_file.truncate(progress.decompressed_bytes)
+
+            if self.expected_hash and (self._hasher is None or self._hashed_bytes != progress.decompressed_bytes):
+                # Resuming a download from a previous pull, so hash what has already been written
+                await get_event_loop().run_in_executor(None, self._hash_partial_file)
+
+            # Progress is saved in the executor, and only every PROGRESS_SAVE_BYTES or PROGRESS_SAVE_SECONDS
+            saved_progress = progress
+            saved_time = time.monotonic()
+            frames = bytearray()
+            try:
+                async with aiofiles.open(self.partial_path, 'ab') as fd:
                     while True:
                         chunk = await response.content.read(self.download_chunk_size)
                         if not chunk:
-                            fd.write(decompressor.flush())
                             break
-
-                        decompressed_chunk = decompressor.decompress(chunk)
+                        if self.throttle:
+                            await self.throttle.acquire_async(len(chunk))
+
+                        # Only decompress complete frames, so progress is always saved at a frame boundary
+                        frames.extend(chunk)
+                        num_bytes = snappy_frame_boundary(frames)
+                        if not num_bytes:
+                            continue
+
+                        if decompressor is None:
+                            # The first chunk identifies the codec
+                            codec = detect_codec(bytes(frames[:STREAM_IDENTIFIER_SIZE]))
+                            if codec is None:
+                                raise ValueError(f"{self.object_details.dataset_path} was compressed with an "
+                                                 f"unsupported codec")
+                            decompressor = codec.decompressor()
+                            progress = DownloadProgress(progress.compressed_bytes, progress.decompressed_bytes,
+                                                        codec.name)
+
+                        decompressed_chunk = decompressor.decompress(bytes(frames[:num_bytes]))
+                        del frames[:num_bytes]
                         await fd.write(decompressed_chunk)
+                        await fd.flush()
+                        if self._hasher:
+                            self._hasher.update(decompressed_chunk)
+                            self._hashed_bytes += len(decompressed_chunk)
+
+                        progress = DownloadProgress(progress.compressed_bytes + num_bytes,
+                                                    progress.decompressed_bytes + len(decompressed_chunk),
+                                                    progress.codec)
+                        if progress.compressed_bytes - saved_progress.compressed_bytes >= PROGRESS_SAVE_BYTES or \
+                                time.monotonic() - saved_time >= PROGRESS_SAVE_SECONDS:
+                            await get_event_loop().run_in_executor(None, self.save_progress, progress)
+                            saved_progress = progress
+                            saved_time = time.monotonic()
                         progress_update_fn(completed_bytes=len(decompressed_chunk))
-        except Exception as err:
-            logger.exception(err)
-            raise IOError(f"Failed to get {self.object_details.dataset_path} from storage backend. {err}")
+                        self._reported_bytes += len(decompressed_chunk)
+            finally:
+                # Save where the download stopped, so a failed download resumes from there
+                if progress != saved_progress:
+                    await get_event_loop().run_in_executor(None, self.save_progress, progress)
+
+            if frames:
+                raise IOError(f"Download of {self.object_details.dataset_path} ended in the middle of a frame")
+
+    def _hash_partial_file(self) -> None:
+        """Method to restart the hash of the download from the contents of the partial file
+
+        Returns:
+            None
+        """
+        self._hasher = blake2b()
+        self._hashed_bytes = 0
+        with open(self.partial_path, 'rb') as fd:
+            while True:
+                data = fd.read(self.download_chunk_size)
+                if not data:
+                    break
+                self._hasher.update(data)
+                self._hashed_bytes += len(data)
+
+    def _verify_and_finalize(self) -> None:
+        """Method to check a completed download against the object id and move it to the object path
+
+        Returns:
+            None
+        """
+        expected_hash = self.expected_hash
+        if expected_hash:
+            actual_hash = self._hasher.hexdigest() if self._hasher else None
+            if actual_hash != expected_hash:
+                # The data is bad, so don't resume from it
+                self.remove_partial_download()
+                raise ValueError(f"Downloaded contents of {self.object_details.dataset_path} do not match the "
+                                 f"object id. Got {actual_hash}")
+
+        os.replace(self.partial_path, self.object_details.object_path)
+        self.remove_partial_download()
 
 
 class GigantumObjectStore(ManagedStorageBackend):
@@ -620,6 +1146,21 @@ to Gigantum Cloud will count towards your storage quota and include all versions
                 'Content-Type': 'application/json',
                 'Accept': 'application/json'}
 
+    @staticmethod
+    def _concurrency_controller(backend_config: dict) -> AdaptiveConcurrencyController:
+        """Method to create the controller that adjusts the number of requests in flight during a push or pull
+
+        Args:
+            backend_config: the `gigantum_object_v1` section of the client config
+
+        Returns:
+            AdaptiveConcurrencyController
+        """
+        num_workers = backend_config['num_workers']
+        return AdaptiveConcurrencyController(min_limit=backend_config.get('min_workers', num_workers),
+                                             max_limit=backend_config.get('max_workers', num_workers),
+                                             initial_limit=num_workers)
+
     def prepare_push(self, dataset, objects: List[PushObject]) -> None:
         """Gigantum Object Service only requires that the user's tokens have been set
 
@@ -651,6 +1192,49 @@ to Gigantum Cloud will count towards your storage quota and include all versions
         raise IOError("Failed to push files to Gigantum Cloud. You either have read-only permissions or "
                       "the Dataset does not exist.")
 
+    def remove_existing_objects(self, dataset, objects: List[PushObject]) -> List[PushObject]:
+        """Method to remove objects that the Gigantum Object Service already has from a list of objects to push
+
+        Objects are stored by the hash of their contents, so after a fork or re-import most of the objects to push
+        may already exist remotely. Object ids are checked in batches of `existence_check_batch_size`. If the user's
+        session is not set or the check fails, all objects are pushed.
+
+        Args:
+            dataset: The current dataset instance
+            objects: A list of PushObjects that need to be pushed
+
+        Returns:
+            list of the PushObjects that still need to be pushed
+        """
+        backend_config = dataset.client_config.config['datasets']['backends']['gigantum_object_v1']
+        batch_size = backend_config.get('existence_check_batch_size', 1000)
+        if not objects or not batch_size or 'gigantum_bearer_token' not in self.configuration.keys():
+            return objects
+
+        url = f"{self._object_service_endpoint(dataset)}/{dataset.namespace}/{dataset.name}/exists"
+        object_ids = sorted(set(os.path.basename(obj.object_path) for obj in objects))
+        existing_ids: Set[str] = set()
+        for start in range(0, len(object_ids), batch_size):
+            batch = object_ids[start:start + batch_size]
+            try:
+                response = requests.post(url, headers=self._object_service_headers(),
+                                         json={'object_ids': batch}, timeout=60)
+            except requests.exceptions.RequestException as err:
+                logger.warning(f"Failed to check which objects already exist, pushing all objects: {err}")
+                return objects
+
+            if response.status_code != 200:
+                logger.warning(f"Failed to check which objects already exist ({response.status_code}), "
+                               f"pushing all objects")
+                return objects
+
+            existing_ids.update(set(response.json().get('existing', list())).intersection(batch))
+
+        if existing_ids:
+            logger.info(f"Skipping {len(existing_ids)} of {len(object_ids)} objects that already exist in "
+                        f"{dataset.namespace}/{dataset.name}")
+        return [obj for obj in objects if os.path.basename(obj.object_path) not in existing_ids]
+
     def finalize_push(self, dataset) -> None:
         pass
 
@@ -708,19 +1292,21 @@ to Gigantum Cloud will count towards your storage quota and include all versions
             # Process S3 Upload
             try:
                 await presigned_request.put_object(session, progress_update_fn)
+                presigned_request.is_finished = True
                 self.successful_requests.append(presigned_request)
-                presigned_request.remove_compressed_file()
-            except Exception:
-                presigned_request.remove_compressed_file()
-                raise
+            finally:
+                presigned_request.release_compressed_data()
 
     async def _process_multipart_upload(self, queue: asyncio.LifoQueue, session: aiohttp.ClientSession,
                                         presigned_request: PresignedS3Upload, progress_update_fn: Callable) -> None:
         """Method to handle the complex multipart upload workflow.
 
         1. Create a multipart upload and get the ID
-        2. Upload all parts
-        3. Complete the part and mark the PresignedS3Upload object as successful
+        2. Upload parts. Each part is a separate work item: while a worker uploads a part, the request is put back in
+           the queue so an idle worker can upload the next one, up to `max_concurrent_parts` at a time. A worker keeps
+           uploading parts until none are left, so large objects don't leave workers idle at the end of a push.
+        3. The worker that finishes the last part completes the upload and marks the PresignedS3Upload object as
+           successful
 
         Args:
             queue: The current work queue
@@ -740,26 +1326,47 @@ to Gigantum Cloud will count towards your storage quota and include all versions
             queue.put_nowait(presigned_request)
         else:
             try:
-                if presigned_request.current_part:
-                    if not presigned_request.is_presigned:
-                        # Fetch the signed URL
-                        await presigned_request.get_presigned_s3_url(session)
-                        queue.put_nowait(presigned_request)
-                    else:
-                        # Process S3 Upload, mark the part as done, and requeue it
-                        etag = await presigned_request.put_object(session, progress_update_fn)
-                        presigned_request.mark_current_part_complete(etag)
+                while True:
+                    part = await presigned_request.start_next_part()
+                    if part is None:
+                        break
+
+                    if presigned_request.can_start_part and not presigned_request.is_queued_for_parts:
+                        # Hand the next part to any idle worker
+                        presigned_request.is_queued_for_parts = True
                         queue.put_nowait(presigned_request)
-                else:
-                    # If you get here, you are done and should complete the upload
-                    await presigned_request.complete_multipart_upload(session)
-                    self.successful_requests.append(presigned_request)
+
+                    try:
+                        await presigned_request.upload_part(session, part, progress_update_fn)
+                    finally:
+                        presigned_request.finish_part()
+
+                    if presigned_request.is_finished:
+                        # Another part failed
+                        return
+
+                if presigned_request.parts_in_flight or presigned_request.is_completing \
+                        or presigned_request.is_finished:
+                    # Another worker is still uploading a part, and will finish the upload
+                    return
+
+                if presigned_request.skip_object:
+                    # The object was found to already exist while uploading, requeue so it's handled as a skip
+                    presigned_request.release_compressed_data()
+                    queue.put_nowait(presigned_request)
+                    return
+
+                presigned_request.is_completing = True
+                await presigned_request.complete_multipart_upload(session)
+                presigned_request.is_finished = True
+                self.successful_requests.append(presigned_request)
             except Exception:
-                presigned_request.remove_compressed_file()
+                presigned_request.release_compressed_data()
                 raise
 
     async def _push_object_consumer(self, queue: asyncio.LifoQueue, session: aiohttp.ClientSession,
-                                    progress_update_fn: Callable) -> None:
+                                    progress_update_fn: Callable,
+                                    controller: AdaptiveConcurrencyController) -> None:
         """Async Queue consumer worker for pushing objects to the object service/s3
 
         Args:
@@ -767,38 +1374,63 @@ to Gigantum Cloud will count towards your storage quota and include all versions
             session: The current aiohttp session
             progress_update_fn: A callable with arg "completed_bytes" (int) indicating how many bytes have been
                                 uploaded in since last called
+            controller: The controller that limits how many requests are in flight
 
         Returns:
             None
         """
         while True:
             presigned_request: PresignedS3Upload = await queue.get()
+            presigned_request.is_queued_for_parts = False
+            if not presigned_request.needs_worker:
+                # e.g. other workers already started every remaining part of a multipart upload
+                queue.task_done()
+                continue
+
+            await controller.acquire()
+            request_bytes = 0
+            request_error = False
+            request_start = time.monotonic()
+
+            def request_progress_fn(completed_bytes: int) -> None:
+                nonlocal request_bytes
+                request_bytes += completed_bytes
+                progress_update_fn(completed_bytes=completed_bytes)
 
             try:
                 if presigned_request.skip_object is False:
                     if presigned_request.is_multipart:
                         # Run multipart upload workflow
-                        await self._process_multipart_upload(queue, session, presigned_request, progress_update_fn)
+                        await self._process_multipart_upload(queue, session, presigned_request, request_progress_fn)
                     else:
                         # Run standard, single-request workflow
-                        await self._process_standard_upload(queue, session, presigned_request, progress_update_fn)
+                        await self._process_standard_upload(queue, session, presigned_request, request_progress_fn)
                 else:
                     # Object skipped because it already exists in the backend (object level de-duplicating)
                     logger.info(f"Skipping duplicate download {presigned_request.object_details.dataset_path}")
                     progress_update_fn(os.path.getsize(presigned_request.object_details.object_path))
+                    presigned_request.is_finished = True
                     self.successful_requests.append(presigned_request)
 
             except Exception as err:
                 logger.exception(err)
-                self.failed_requests.append(presigned_request)
-                if presigned_request.is_multipart and presigned_request.multipart_upload_id is not None:
-                    # Make best effort to abort a multipart upload if needed
-                    try:
-                        await presigned_request.abort_multipart_upload(session)
-                    except Exception as err:
-                        logger.error(f"An error occured while trying to abort multipart upload "
-                                     f"{presigned_request.multipart_upload_id} for {presigned_request.object_id}")
-                        logger.exception(err)
+                request_error = True
+                if presigned_request.is_finished:
+                    # Another worker already reported a failure for a different part of the same object
+                    pass
+                else:
+                    presigned_request.is_finished = True
+                    self.failed_requests.append(presigned_request)
+                    if presigned_request.is_multipart and presigned_request.multipart_upload_id is not None:
+                        # Make best effort to abort a multipart upload if needed
+                        try:
+                            await presigned_request.abort_multipart_upload(session)
+                        except Exception as err:
+                            logger.error(f"An error occured while trying to abort multipart upload "
+                                         f"{presigned_request.multipart_upload_id} for {presigned_request.object_id}")
+                            logger.exception(err)
+
+            await controller.release(request_bytes, time.monotonic() - request_start, request_error)
 
             # Notify the queue that the item has been processed
             queue.task_done()
@@ -806,7 +1438,10 @@ to Gigantum Cloud will count towards your storage quota and include all versions
     @staticmethod
     async def _push_object_producer(queue: asyncio.LifoQueue, object_service_root: str, object_service_headers: dict,
                                     multipart_chunk_size: int, upload_chunk_size: int,
-                                    objects: List[PushObject]) -> None:
+                                    objects: List[PushObject], max_concurrent_parts: int = 1,
+                                    compression_executor: Optional[Executor] = None,
+                                    throttle: Optional[Throttle] = None,
+                                    codec_selector: Optional[CodecSelector] = None) -> None:
         """Async method to populate the queue with upload requests
 
         Args:
@@ -816,22 +1451,35 @@ to Gigantum Cloud will count towards your storage quota and include all versions
             multipart_chunk_size: Size in bytes for break a file apart for multi-part uploading
             upload_chunk_size: Size in bytes for streaming IO chunks
             objects: A list of PushObjects to push
+            max_concurrent_parts: the maximum number of parts of a single multipart upload to upload at once
+            compression_executor: optional executor to compress objects in
+            throttle: optional throttle to limit the upload bandwidth
+            codec_selector: optional selector of the codec for each object. If omitted, objects are snappy compressed
 
         Returns:
             None
         """
-        for obj in objects:
+        # The queue is last in, first out, so objects are added in reverse to start them in the order given
+        for obj in reversed(objects):
             presigned_request = PresignedS3Upload(object_service_root,
                                                   object_service_headers,
                                                   multipart_chunk_size,
                                                   upload_chunk_size,
-                                                  obj)
+                                                  obj,
+                                                  max_concurrent_parts=max_concurrent_parts,
+                                                  compression_executor=compression_executor,
+                                                  throttle=throttle,
+                                                  codec_selector=codec_selector)
             await queue.put(presigned_request)
 
     async def _run_push_pipeline(self, object_service_root: str, object_service_headers: dict,
                                  objects: List[PushObject], progress_update_fn: Callable,
                                  multipart_chunk_size: int, upload_chunk_size: int = 4194304,
-                                 num_workers: int = 4) -> None:
+                                 num_workers: int = 4, max_concurrent_parts: int = 1,
+                                 controller: Optional[AdaptiveConcurrencyController] = None,
+                                 compression_executor: Optional[Executor] = None,
+                                 throttle: Optional[Throttle] = None,
+                                 codec_selector: Optional[CodecSelector] = None) -> None:
         """Method to run the async upload pipeline
 
         Args:
@@ -842,20 +1490,31 @@ to Gigantum Cloud will count towards your storage quota and include all versions
                                 uploaded in since last called
             multipart_chunk_size: Size in bytes for break a file apart for multi-part uploading
             upload_chunk_size: Size in bytes for streaming IO chunks
-            num_workers: the number of consumer workers to start
+            num_workers: the number of consumer workers to start, if not using an adaptive controller
+            max_concurrent_parts: the maximum number of parts of a single multipart upload to upload at once
+            controller: controller that adjusts the number of requests in flight. If omitted, `num_workers` requests
+                        run at a time
+            compression_executor: optional executor to compress objects in. If omitted, objects are compressed in
+                                  the loop's default thread executor
+            throttle: optional throttle to limit the upload bandwidth
+            codec_selector: optional selector of the codec for each object. If omitted, objects are snappy compressed
 
         Returns:
 
         """
+        if controller is None:
+            controller = AdaptiveConcurrencyController(min_limit=num_workers, max_limit=num_workers)
+
         # We use a LifoQueue to ensure S3 uploads start as soon as they are ready to help ensure pre-signed urls do
         # not timeout before they can be used if there are a lot of files.
         queue: asyncio.LifoQueue = asyncio.LifoQueue()
 
         async with aiohttp.ClientSession() as session:
-            # Start workers
+            # Start enough workers for the highest limit. The controller limits how many are active at once.
             workers = []
-            for i in range(num_workers):
-                task = asyncio.ensure_future(self._push_object_consumer(queue, session, progress_update_fn))
+            for i in range(controller.max_limit):
+                task = asyncio.ensure_future(self._push_object_consumer(queue, session, progress_update_fn,
+                                                                        controller))
                 workers.append(task)
 
             # Populate the work queue
@@ -864,7 +1523,11 @@ to Gigantum Cloud will count towards your storage quota and include all versions
                                              object_service_headers,
                                              multipart_chunk_size,
                                              upload_chunk_size,
-                                             objects)
+                                             objects,
+                                             max_concurrent_parts=max_concurrent_parts,
+                                             compression_executor=compression_executor,
+                                             throttle=throttle,
+                                             codec_selector=codec_selector)
 
             # wait until the consumer has processed all items
             await queue.join()
@@ -894,7 +1557,10 @@ to Gigantum Cloud will count towards your storage quota and include all versions
         backend_config = dataset.client_config.config['datasets']['backends']['gigantum_object_v1']
         upload_chunk_size = backend_config['upload_chunk_size']
         multipart_chunk_size = backend_config['multipart_chunk_size']
-        num_workers = backend_config['num_workers']
+        max_concurrent_parts = backend_config.get('max_concurrent_parts', 1)
+        controller = self._concurrency_controller(backend_config)
+        throttle = self._bandwidth_throttle(dataset, 'upload')
+        codec_selector = CodecSelector.from_config(backend_config.get('compression'))
 
         object_service_root = f"{self._object_service_endpoint(dataset)}/{dataset.namespace}/{dataset.name}"
 
@@ -903,7 +1569,12 @@ to Gigantum Cloud will count towards your storage quota and include all versions
                                                         progress_update_fn=progress_update_fn,
                                                         multipart_chunk_size=multipart_chunk_size,
                                                         upload_chunk_size=upload_chunk_size,
-                                                        num_workers=num_workers))
+                                                        max_concurrent_parts=max_concurrent_parts,
+                                                        controller=controller,
+                                                        compression_executor=self.compression_executor,
+                                                        throttle=throttle,
+                                                        codec_selector=codec_selector))
+        self.concurrency_summary = controller.summary()
 
         successes = [x.object_details for x in self.successful_requests]
 
@@ -917,7 +1588,8 @@ to Gigantum Cloud will count towards your storage quota and include all versions
         return PushResult(success=successes, failure=failures, message=message)
 
     async def _pull_object_consumer(self, queue: asyncio.LifoQueue, session: aiohttp.ClientSession,
-                                    progress_update_fn: Callable) -> None:
+                                    progress_update_fn: Callable,
+                                    controller: AdaptiveConcurrencyController) -> None:
         """Async Queue consumer worker for downloading objects from the object service/s3
 
         Args:
@@ -925,12 +1597,22 @@ to Gigantum Cloud will count towards your storage quota and include all versions
             session: The current aiohttp session
             progress_update_fn: A callable with arg "completed_bytes" (int) indicating how many bytes have been
                                 downloaded in since last called
+            controller: The controller that limits how many requests are in flight
 
         Returns:
             None
         """
         while True:
             presigned_request: PresignedS3Download = await queue.get()
+            await controller.acquire()
+            request_bytes = 0
+            request_error = False
+            request_start = time.monotonic()
+
+            def request_progress_fn(completed_bytes: int) -> None:
+                nonlocal request_bytes
+                request_bytes += completed_bytes
+                progress_update_fn(completed_bytes=completed_bytes)
 
             try:
                 if not presigned_request.is_presigned:
@@ -939,19 +1621,23 @@ to Gigantum Cloud will count towards your storage quota and include all versions
                     queue.put_nowait(presigned_request)
                 else:
                     # Process S3 Download
-                    await presigned_request.get_object(session, progress_update_fn)
+                    await presigned_request.get_object(session, request_progress_fn)
                     self.successful_requests.append(presigned_request)
 
             except Exception as err:
                 logger.exception(err)
+                request_error = True
                 self.failed_requests.append(presigned_request)
 
+            await controller.release(request_bytes, time.monotonic() - request_start, request_error)
+
             # Notify the queue that the item has been processed
             queue.task_done()
 
     @staticmethod
     async def _pull_object_producer(queue: asyncio.LifoQueue, object_service_root: str, object_service_headers: dict,
-                                    download_chunk_size: int, objects: List[PullObject]) -> None:
+                                    download_chunk_size: int, objects: List[PullObject],
+                                    throttle: Optional[Throttle] = None) -> None:
         """Async method to populate the queue with download requests
 
         Args:
@@ -960,11 +1646,13 @@ to Gigantum Cloud will count towards your storage quota and include all versions
             object_service_headers: The headers to use when requesting signed urls, including auth info
             download_chunk_size: Size in bytes for streaming IO chunks
             objects: A list of PullObjects to push
+            throttle: optional throttle to limit the download bandwidth
 
         Returns:
             None
         """
-        for obj in objects:
+        # The queue is last in, first out, so objects are added in reverse to start them in the order given
+        for obj in reversed(objects):
             # Create object destination dir if needed
             obj_dir, _ = obj.object_path.rsplit('/', 1)
             os.makedirs(obj_dir, exist_ok=True)  # type: ignore
@@ -973,12 +1661,15 @@ to Gigantum Cloud will count towards your storage quota and include all versions
             presigned_request = PresignedS3Download(object_service_root,
                                                     object_service_headers,
                                                     download_chunk_size,
-                                                    obj)
+                                                    obj,
+                                                    throttle=throttle)
             await queue.put(presigned_request)
 
     async def _run_pull_pipeline(self, object_service_root: str, object_service_headers: dict,
                                  objects: List[PullObject], progress_update_fn: Callable,
-                                 download_chunk_size: int = 4194304, num_workers: int = 4) -> None:
+                                 download_chunk_size: int = 4194304, num_workers: int = 4,
+                                 controller: Optional[AdaptiveConcurrencyController] = None,
+                                 throttle: Optional[Throttle] = None) -> None:
         """Method to run the async download pipeline
 
         Args:
@@ -988,11 +1679,17 @@ to Gigantum Cloud will count towards your storage quota and include all versions
             progress_update_fn: A callable with arg "completed_bytes" (int) indicating how many bytes have been
                                 downloaded in since last called
             download_chunk_size: Size in bytes for streaming IO chunks
-            num_workers: the number of consumer workers to start
+            num_workers: the number of consumer workers to start, if not using an adaptive controller
+            controller: controller that adjusts the number of requests in flight. If omitted, `num_workers` requests
+                        run at a time
+            throttle: optional throttle to limit the download bandwidth
 
         Returns:
 
         """
+        if controller is None:
+            controller = AdaptiveConcurrencyController(min_limit=num_workers, max_limit=num_workers)
+
         # We use a LifoQueue to ensure S3 uploads start as soon as they are ready to help ensure pre-signed urls do
         # not timeout before they can be used if there are a lot of files.
         queue: asyncio.LifoQueue = asyncio.LifoQueue()
@@ -1001,9 +1698,11 @@ to Gigantum Cloud will count towards your storage quota and include all versions
                                         sock_connect=None, sock_read=None)
 
         async with aiohttp.ClientSession(timeout=timeout) as session:
+            # Start enough workers for the highest limit. The controller limits how many are active at once.
             workers = []
-            for i in range(num_workers):
-                task = asyncio.ensure_future(self._pull_object_consumer(queue, session, progress_update_fn))
+            for i in range(controller.max_limit):
+                task = asyncio.ensure_future(self._pull_object_consumer(queue, session, progress_update_fn,
+                                                                        controller))
                 workers.append(task)
 
             # Populate the work queue
@@ -1011,7 +1710,8 @@ to Gigantum Cloud will count towards your storage quota and include all versions
                                              object_service_root,
                                              object_service_headers,
                                              download_chunk_size,
-                                             objects)
+                                             objects,
+                                             throttle=throttle)
 
             # wait until the consumer has processed all items
             await queue.join()
@@ -1039,7 +1739,8 @@ to Gigantum Cloud will count towards your storage quota and include all versions
 
         backend_config = dataset.client_config.config['datasets']['backends']['gigantum_object_v1']
         download_chunk_size = backend_config['download_chunk_size']
-        num_workers = backend_config['num_workers']
+        controller = self._concurrency_controller(backend_config)
+        throttle = self._bandwidth_throttle(dataset, 'download')
 
         object_service_root = f"{self._object_service_endpoint(dataset)}/{dataset.namespace}/{dataset.name}"
 
@@ -1047,7 +1748,9 @@ to Gigantum Cloud will count towards your storage quota and include all versions
         loop.run_until_complete(self._run_pull_pipeline(object_service_root, self._object_service_headers(), objects,
                                                         progress_update_fn=progress_update_fn,
                                                         download_chunk_size=download_chunk_size,
-                                                        num_workers=num_workers))
+                                                        controller=controller,
+                                                        throttle=throttle))
+        self.concurrency_summary = controller.summary()
 
         successes = [x.object_details for x in self.successful_requests]
 
@@ -0,0 +1,197 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+import errno
+import os
+import shutil
+import sqlite3
+
+from gtmcore.dataset.sqlitestore import SQLiteStore
+from gtmcore.logging import LMLogger
+
+logger = LMLogger.get_logger()
+
+# ioctl request to clone a file's extents into another file on copy-on-write filesystems (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+# Methods to bring a file into the dataset cache, in the order they are tried by default. Hard links are tried before
+# a kernel copy because they don't duplicate any data.
+INGEST_METHODS = ['reflink', 'link', 'copy']
+
+# Number of bytes to copy per call when falling back to sendfile
+SENDFILE_BLOCK_SIZE = 67108864
+
+# Name of the SQLite index of previously imported files, stored in the dataset's cache root
+IMPORT_INDEX_FILE = ".local_import.db"
+
+# State of a source file when it was last imported, and the hash of its contents at that time
+ImportRecord = NamedTuple('ImportRecord', [('size', int), ('mtime_ns', int), ('inode', int), ('hash', str)])
+
+
+def _reflink(source: str, destination: str) -> None:
+    """Function to clone a file without copying data. Only supported on copy-on-write filesystems
+
+    Args:
+        source: absolute path to the file to clone
+        destination: absolute path to the new file
+
+    Returns:
+        None
+    """
+    import fcntl
+
+    with open(source, 'rb') as src:
+        with open(destination, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                dst.close()
+                os.remove(destination)
+                raise
+
+
+def _link(source: str, destination: str) -> None:
+    """Function to hard link a file. Only possible if the source and destination are on the same filesystem
+
+    Args:
+        source: absolute path to the file to link
+        destination: absolute path to the new link
+
+    Returns:
+        None
+    """
+    if os.stat(source).st_dev != os.stat(os.path.dirname(destination)).st_dev:
+        raise OSError(errno.EXDEV, "Cannot hard link across filesystems", source)
+    os.link(source, destination)
+
+
+def _copy(source: str, destination: str) -> None:
+    """Function to copy a file in the kernel (copy_file_range, or sendfile if not available), without reading the
+    data into userspace. Falls back to a regular copy if the kernel can't copy between these files.
+
+    Args:
+        source: absolute path to the file to copy
+        destination: absolute path to the new file
+
+    Returns:
+        None
+    """
+    # copy_file_range was added in Python 3.8
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    if copy_file_range is None and not hasattr(os, 'sendfile'):
+        shutil.copyfile(source, destination)
+        return
+
+    with open(source, 'rb') as src:
+        with open(destination, 'wb') as dst:
+            try:
+                file_size = os.fstat(src.fileno()).st_size
+                offset = 0
+                while offset < file_size:
+                    if copy_file_range is not None:
+                        num_bytes = copy_file_range(src.fileno(), dst.fileno(), file_size - offset)
+                    else:
+                        num_bytes = os.sendfile(dst.fileno(), src.fileno(), offset,
+                                                min(SENDFILE_BLOCK_SIZE, file_size - offset))
+                    if num_bytes == 0:
+                        break
+                    offset += num_bytes
+                return
+            except OSError as err:
+                if err.errno not in (errno.EINVAL, errno.ENOSYS, errno.EXDEV, errno.EOPNOTSUPP):
+                    raise
+
+    shutil.copyfile(source, destination)
+
+
+_INGEST_FUNCTIONS = {'reflink': _reflink, 'link': _link, 'copy': _copy}
+
+
+def ingest_file(source: str, destination: str, methods: Optional[List[str]] = None) -> str:
+    """Function to bring a file into the dataset cache, trying each method in order until one succeeds
+
+    Args:
+        source: absolute path to the file in the data directory
+        destination: absolute path to create. Must not already exist
+        methods: names of the methods to try (see INGEST_METHODS). Defaults to INGEST_METHODS
+
+    Returns:
+        str: the name of the method that succeeded
+    """
+    if methods is None:
+        methods = INGEST_METHODS
+
+    last_error: Optional[OSError] = None
+    for method in methods:
+        if method not in _INGEST_FUNCTIONS:
+            raise ValueError(f"Unsupported ingest method: {method}")
+        try:
+            _INGEST_FUNCTIONS[method](source, destination)
+            return method
+        except OSError as err:
+            last_error = err
+
+    if last_error is not None:
+        raise last_error
+    raise ValueError("At least one ingest method must be provided")
+
+
+def stat_matches(record: ImportRecord, file_info: os.stat_result) -> bool:
+    """Function to check if a file is unchanged since it was imported
+
+    Args:
+        record: the import record for the file
+        file_info: the current stat of the file
+
+    Returns:
+        bool
+    """
+    return record.size == file_info.st_size and record.mtime_ns == file_info.st_mtime_ns and \
+        record.inode == file_info.st_ino
+
+
+class ImportIndex(SQLiteStore):
+    """Class to provide an on-disk index of the files imported from a local data directory
+
+    Each row stores the size, mtime, and inode of a source file when it was imported, along with the hash of its
+    contents. If a source file still matches its row, it does not need to be re-hashed. The database file is only
+    created on the first write.
+    """
+    def __init__(self, cache_root: str) -> None:
+        self.cache_root = cache_root
+        super().__init__(os.path.join(cache_root, IMPORT_INDEX_FILE))
+
+    @property
+    def index_file(self) -> str:
+        """Property to get the absolute path to the SQLite index file"""
+        return self.db_file
+
+    def _initialize(self, conn: sqlite3.Connection) -> None:
+        conn.execute("CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY NOT NULL, "
+                     "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+                     "hash TEXT NOT NULL)")
+
+    def get_all(self) -> Dict[str, ImportRecord]:
+        """Method to load every record in the index
+
+        Returns:
+            dict of relative path -> ImportRecord
+        """
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return dict()
+            rows = conn.execute("SELECT path, size, mtime_ns, inode, hash FROM imports").fetchall()
+        return {row[0]: ImportRecord(*row[1:]) for row in rows}
+
+    def replace_all(self, records: Iterable[Tuple[str, ImportRecord]]) -> None:
+        """Method to replace the contents of the index in a single transaction
+
+        Args:
+            records: iterable of (relative path, ImportRecord)
+
+        Returns:
+            None
+        """
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM imports")
+            conn.executemany("INSERT INTO imports (path, size, mtime_ns, inode, hash) VALUES (?, ?, ?, ?, ?)",
+                             ((path, *record) for path, record in records))
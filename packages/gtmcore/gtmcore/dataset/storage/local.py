@@ -1,12 +1,16 @@
 from gtmcore.dataset import Dataset
 from gtmcore.dataset.storage.backend import UnmanagedStorageBackend
-from typing import List, Dict, Callable, Optional
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Callable, Iterator, Optional, Tuple
 import os
 
 from gtmcore.dataset.io import PullResult, PullObject
 from gtmcore.logging import LMLogger
 from gtmcore.configuration import Configuration
 from gtmcore.dataset.manifest.manifest import Manifest, StatusResult
+from gtmcore.dataset.manifest.fasthash import is_fast_hash_file
+from gtmcore.dataset.storage.ingest import INGEST_METHODS, ImportIndex, ImportRecord, ingest_file, stat_matches
 
 logger = LMLogger.get_logger()
 
@@ -105,6 +109,53 @@ more, check out the docs here: [https://docs.gigantum.com](https://docs.gigantum
     def finalize_pull(self, dataset) -> None:
         pass
 
+    def _ingest_files(self, dataset: Dataset, files: List[Tuple[str, str]],
+                      progress_update_fn: Optional[Callable] = None) -> List[Tuple[str, str]]:
+        """Method to bring files from the data directory into the dataset cache in parallel, replacing any file that
+        already exists at the destination
+
+        Each file is cloned, hard linked, or copied in the kernel, depending on what the filesystem supports (see
+        `ingest_file()`), so the data is not read into the client.
+
+        Args:
+            dataset: The current dataset
+            files: A list of (source, destination) absolute paths
+            progress_update_fn: Optional callable with arg "completed_bytes" (int), called as each file completes
+
+        Returns:
+            list of the (source, destination) pairs that could not be ingested
+        """
+        backend_config = dataset.client_config.config['datasets']['backends'].get('local_filesystem', dict())
+        methods = backend_config.get('ingest_methods', INGEST_METHODS)
+        num_workers = backend_config.get('num_workers', 8)
+
+        def _ingest(source: str, destination: str) -> str:
+            if os.path.lexists(destination):
+                os.remove(destination)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            return ingest_file(source, destination, methods)
+
+        failed = list()
+        method_counts: Counter = Counter()
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {executor.submit(_ingest, source, destination): (source, destination)
+                       for source, destination in files}
+            for future in as_completed(futures):
+                source, destination = futures[future]
+                try:
+                    method_counts[future.result()] += 1
+                except OSError as err:
+                    logger.error(f"Failed to ingest {source} into {destination}: {err}")
+                    failed.append((source, destination))
+                    continue
+
+                if progress_update_fn:
+                    progress_update_fn(os.path.getsize(destination))
+
+        if method_counts:
+            logger.info(f"Ingested {sum(method_counts.values())} files from the data directory: {dict(method_counts)}")
+        return failed
+
     def pull_objects(self, dataset: Dataset, objects: List[PullObject],
                      progress_update_fn: Callable) -> PullResult:
         """High-level method to simply link files from the source dir to the object directory to the revision directory
@@ -118,21 +169,32 @@ more, check out the docs here: [https://docs.gigantum.com](https://docs.gigantum
         Returns:
             PullResult
         """
-        # Link from local data directory to the object directory
+        local_data_dir = self._get_local_data_dir()
+
+        # Files with identical contents share an object, so only ingest each object once
+        objects_by_path: Dict[str, List[PullObject]] = dict()
         for obj in objects:
-            if os.path.exists(obj.object_path):
-                # Re-link to make 100% sure all links are consistent if a link already exists
-                os.remove(obj.object_path)
-            os.link(os.path.join(self._get_local_data_dir(), obj.dataset_path), obj.object_path)
-            progress_update_fn(os.path.getsize(obj.object_path))
+            objects_by_path.setdefault(obj.object_path, list()).append(obj)
+
+        # Ingest from local data directory to the object directory. If an object already exists it is replaced to
+        # make 100% sure it is consistent with the data directory
+        failed = self._ingest_files(dataset, [(os.path.join(local_data_dir, objs[0].dataset_path), object_path)
+                                              for object_path, objs in objects_by_path.items()],
+                                    progress_update_fn)
+        failed_paths = set(object_path for _, object_path in failed)
+
+        success = [obj for obj in objects if obj.object_path not in failed_paths]
+        failure = [obj for obj in objects if obj.object_path in failed_paths]
 
         # link from object dir through to revision dir
         m = Manifest(dataset, self.configuration.get('username'))
-        m.link_revision()
+        m.link_revision(changed_keys=[obj.dataset_path for obj in success])
 
-        return PullResult(success=objects,
-                          failure=[],
-                          message="Linked data directory. All files from the manifest should be available")
+        if failure:
+            message = f"Failed to link {len(failure)} files from the data directory."
+        else:
+            message = "Linked data directory. All files from the manifest should be available"
+        return PullResult(success=success, failure=failure, message=message)
 
     def can_update_from_remote(self) -> bool:
         """Property indicating if this backend can automatically update its contents to the latest on the remote
@@ -142,6 +204,30 @@ more, check out the docs here: [https://docs.gigantum.com](https://docs.gigantum
         """
         return True
 
+    def _walk_data_dir(self) -> Iterator[Tuple[str, Optional[os.stat_result]]]:
+        """Method to walk the local data directory
+
+        Yields:
+            tuple of the relative path of each item (folders have a trailing slash) and its stat (None for folders)
+        """
+        local_data_dir = self._get_local_data_dir()
+        for root, dirs, files in os.walk(local_data_dir):
+            _, folder = root.split(local_data_dir)
+            if len(folder) > 0:
+                if folder[0] == os.path.sep:
+                    folder = folder[1:]
+
+            for d in dirs:
+                # TODO: Check for ignored
+                yield os.path.join(folder, d) + os.path.sep, None  # All folders are represented with a trailing slash
+
+            for file in files:
+                # TODO: Check for ignored
+                if file in ['.DS_STORE', '.DS_Store'] or is_fast_hash_file(file):
+                    continue
+
+                yield os.path.join(folder, file), os.stat(os.path.join(root, file))
+
     def update_from_remote(self, dataset, status_update_fn: Callable) -> None:
         """Optional method that updates the dataset by comparing against the remote. Not all unmanaged dataset backends
         will be able to do this.
@@ -160,41 +246,34 @@ more, check out the docs here: [https://docs.gigantum.com](https://docs.gigantum
         # walk the local source dir, looking for additions/deletions
         all_files = list()
         added_files = list()
+        files_to_ingest = list()
+        source_stats: Dict[str, os.stat_result] = dict()
         local_data_dir = self._get_local_data_dir()
+        revision_dir = os.path.join(m.cache_mgr.cache_root, m.dataset_revision)
 
-        os.makedirs(os.path.join(m.cache_mgr.cache_root, m.dataset_revision), exist_ok=True)
+        os.makedirs(revision_dir, exist_ok=True)
 
-        for root, dirs, files in os.walk(local_data_dir):
-            _, folder = root.split(local_data_dir)
-            if len(folder) > 0:
-                if folder[0] == os.path.sep:
-                    folder = folder[1:]
-
-            for d in dirs:
-                # TODO: Check for ignored
-                rel_path = os.path.join(folder, d) + os.path.sep  # All folders are represented with a trailing slash
-                all_files.append(rel_path)
+        for rel_path, file_info in self._walk_data_dir():
+            all_files.append(rel_path)
+            if file_info is None:
                 if rel_path not in m.manifest:
                     added_files.append(rel_path)
                     # Create dir in current revision for linking to work
-                    os.makedirs(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, rel_path), exist_ok=True)
-
-            for file in files:
-                # TODO: Check for ignored
-                if file in ['.smarthash', '.DS_STORE', '.DS_Store']:
-                    continue
-
-                rel_path = os.path.join(folder, file)
-                all_files.append(rel_path)
-                if rel_path not in m.manifest:
-                    added_files.append(rel_path)
-                    # Symlink into current revision for downstream linking to work
-                    logger.warning(os.path.join(root, file))
-                    if not os.path.exists(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, rel_path)):
-                        os.link(os.path.join(root, file),
-                                os.path.join(m.cache_mgr.cache_root, m.dataset_revision, rel_path))
-
-                    # TODO: THINK ABOUT HERE....DO YOU NEED TO RUN THE MANIFEST LINKING HERE (but manifest not populated yet i'm pretty sure)
+                    os.makedirs(os.path.join(revision_dir, rel_path), exist_ok=True)
+                continue
+
+            source_stats[rel_path] = file_info
+            if rel_path not in m.manifest:
+                added_files.append(rel_path)
+                # Ingest into current revision for downstream linking to work
+                if not os.path.exists(os.path.join(revision_dir, rel_path)):
+                    files_to_ingest.append((os.path.join(local_data_dir, rel_path),
+                                            os.path.join(revision_dir, rel_path)))
+
+        status_update_fn(f"Importing {len(files_to_ingest)} new files from the data directory.")
+        failed = self._ingest_files(dataset, files_to_ingest)
+        if failed:
+            raise IOError(f"Failed to import {len(failed)} files from the data directory")
 
         deleted_files = sorted(list(set(m.manifest.keys()).difference(all_files)))
 
@@ -205,4 +284,133 @@ more, check out the docs here: [https://docs.gigantum.com](https://docs.gigantum
         m.link_revision()
 
         # Run local update
-        self.update_from_local(dataset, status_update_fn, status_result=status, verify_contents=True)
+        self._update_from_local(dataset, status_update_fn, source_stats, status_result=status, verify_contents=True)
+
+    def update_from_local(self, dataset, status_update_fn: Callable,
+                          verify_contents: bool = False,
+                          status_result: Optional[StatusResult] = None) -> None:
+        """Method to update the dataset manifest for changed files that exists locally
+
+        Args:
+            dataset: Dataset object
+            status_update_fn: A callable, accepting a string for logging/providing status to the UI
+            verify_contents: Boolean indicating if "verify_contents" should be run, and the results added to modified
+            status_result: Optional StatusResult object to include in the update (typically from update_from_remote())
+
+        Returns:
+            None
+        """
+        source_stats = {rel_path: file_info for rel_path, file_info in self._walk_data_dir() if file_info}
+        self._update_from_local(dataset, status_update_fn, source_stats, verify_contents=verify_contents,
+                                status_result=status_result)
+
+    def _update_from_local(self, dataset, status_update_fn: Callable, source_stats: Dict[str, os.stat_result],
+                           verify_contents: bool = False, status_result: Optional[StatusResult] = None) -> None:
+        """Method to update the dataset manifest, and then record the state of each source file and its hash so
+        unchanged files are not re-hashed next time
+
+        Args:
+            dataset: Dataset object
+            status_update_fn: A callable, accepting a string for logging/providing status to the UI
+            source_stats: stat of each file in the data directory, taken before any files were hashed
+            verify_contents: Boolean indicating if "verify_contents" should be run, and the results added to modified
+            status_result: Optional StatusResult object to include in the update
+
+        Returns:
+            None
+        """
+        super().update_from_local(dataset, status_update_fn, verify_contents=verify_contents,
+                                  status_result=status_result)
+
+        # If a file changed after it was stat'd, its record won't match next time and it will simply be re-hashed
+        m = Manifest(dataset, self.configuration.get('username'))
+        records = list()
+        for rel_path, file_info in source_stats.items():
+            item = m.manifest.get(rel_path)
+            if item:
+                records.append((rel_path, ImportRecord(file_info.st_size, file_info.st_mtime_ns, file_info.st_ino,
+                                                       item['h'])))
+
+        import_index = ImportIndex(m.cache_mgr.cache_root)
+        import_index.replace_all(records)
+        import_index.close()
+
+    def verify_contents(self, dataset, status_update_fn: Callable) -> List[str]:
+        """Method to verify the hashes of all local files and indicate if they have changed
+
+        Files whose size, mtime, and inode in the data directory are unchanged since they were last imported are not
+        re-hashed. If a changed file was copied into the dataset rather than linked, its current contents are
+        ingested again before hashing.
+
+        Args:
+            dataset: Dataset object
+            status_update_fn: A callable, accepting a string for logging/providing status to the UI
+
+        Returns:
+            list
+        """
+        if 'username' not in self.configuration:
+            raise ValueError("Dataset storage backend requires current logged in username to verify contents")
+
+        m = Manifest(dataset, self.configuration.get('username'))
+        local_data_dir = self._get_local_data_dir()
+        revision_dir = os.path.join(m.cache_mgr.cache_root, m.dataset_revision)
+
+        import_index = ImportIndex(m.cache_mgr.cache_root)
+        import_records = import_index.get_all()
+        import_index.close()
+
+        keys_to_verify = list()
+        keys_to_ingest = list()
+        num_unchanged = 0
+        for key, item in m.manifest.items():
+            revision_path = os.path.join(revision_dir, key)
+            if not os.path.isfile(revision_path):
+                continue
+
+            try:
+                source_info = os.stat(os.path.join(local_data_dir, key))
+            except FileNotFoundError:
+                # Removed from the data directory, which update_from_remote() handles as a deletion
+                continue
+
+            record = import_records.get(key)
+            if record and record.hash == item.get('h') and stat_matches(record, source_info):
+                num_unchanged += 1
+                continue
+
+            keys_to_verify.append(key)
+            if not os.path.samestat(source_info, os.stat(revision_path)):
+                keys_to_ingest.append(key)
+
+        failed = self._ingest_files(dataset, [(os.path.join(local_data_dir, key), os.path.join(revision_dir, key))
+                                              for key in keys_to_ingest])
+        if failed:
+            raise IOError(f"Failed to import {len(failed)} files from the data directory")
+
+        # re-hash files
+        status_update_fn(f"Validating contents of {len(keys_to_verify)} files "
+                         f"({num_unchanged} unchanged since the last import). Please wait.")
+        updated_hashes = self.hash_file_key_list(dataset, keys_to_verify)
+
+        modified_items = list()
+        for key, new_hash in zip(keys_to_verify, updated_hashes):
+            entry = m.manifest.get(key)
+            if entry:
+                if new_hash != entry.get('h'):
+                    modified_items.append(key)
+
+        # Copies of files that turned out to be unchanged are swapped back to links to their existing objects
+        unchanged_copies = [key for key in set(keys_to_ingest).difference(modified_items)
+                            if os.path.exists(m.dataset_to_object_path(key))]
+        for key in unchanged_copies:
+            os.remove(os.path.join(revision_dir, key))
+        if unchanged_copies:
+            m.link_revision(changed_keys=unchanged_copies)
+
+        if modified_items:
+            status_update_fn(f"Integrity check complete. {len(modified_items)} files have been modified.")
+        else:
+            status_update_fn(f"Integrity check complete. No files have been modified.")
+
+        return modified_items
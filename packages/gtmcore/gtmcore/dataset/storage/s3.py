@@ -1,10 +1,14 @@
 from gtmcore.dataset import Dataset
 from gtmcore.dataset.storage.backend import UnmanagedStorageBackend
-from typing import List, Dict, Callable, Optional
+from typing import List, Dict, Callable, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
 import os
-import json
+import threading
 
 from gtmcore.dataset.io import PullResult, PullObject
+from gtmcore.dataset.io.bandwidth import Throttle
+from gtmcore.dataset.storage.etags import ETAG_LOOKUP_BATCH_SIZE, ETagStore
 from gtmcore.logging import LMLogger
 from gtmcore.configuration import Configuration
 from gtmcore.dataset.manifest.manifest import Manifest, StatusResult
@@ -16,6 +20,9 @@ from botocore import UNSIGNED
 
 logger = LMLogger.get_logger()
 
+# Number of keys requested per page when listing the bucket to update from the remote (1000 is the S3 maximum)
+LIST_PAGE_SIZE = 1000
+
 
 class PublicS3Bucket(UnmanagedStorageBackend):
 
@@ -91,8 +98,18 @@ Due to the possibility of storing lots of data, when updating you can optionally
 
         return bucket, prefix
 
-    def _get_client(self):
-        return boto3.client('s3', config=Config(signature_version=UNSIGNED))
+    def _get_client(self, max_pool_connections: int = 10):
+        """Method to get an anonymous S3 client. The client is thread-safe, and its connection pool is shared by all
+        threads using it
+
+        Args:
+            max_pool_connections: maximum number of connections to keep open
+
+        Returns:
+            botocore.client.S3
+        """
+        return boto3.client('s3', config=Config(signature_version=UNSIGNED,
+                                                max_pool_connections=max_pool_connections))
 
     def confirm_configuration(self, dataset) -> Optional[str]:
         """Method to verify a configuration and optionally allow the user to confirm before proceeding
@@ -144,32 +161,77 @@ Due to the possibility of storing lots of data, when updating you can optionally
         pass
 
     def _get_etag_file(self, dataset) -> str:
-        """Helper to get the etag file, tracking S3 object hashes"""
+        """Helper to get the legacy etag file, which tracked S3 object hashes in the dataset repository"""
         return os.path.join(dataset.root_dir, '.gigantum', 'etag_cache.json')
 
-    def _load_etag_data(self, dataset) -> dict:
-        """Helper to load the saved etag data
+    def _get_etag_store(self, dataset, manifest: Manifest) -> ETagStore:
+        """Helper to get the store tracking S3 object hashes, migrating the legacy etag file if it exists
+
+        Args:
+            dataset: The current dataset
+            manifest: Manifest of the dataset
 
         Returns:
+            ETagStore
+        """
+        return ETagStore(manifest.cache_mgr.cache_root, legacy_file=self._get_etag_file(dataset))
+
+    @staticmethod
+    def _partial_path(obj: PullObject) -> str:
+        """Method to get the path an object is downloaded to before it is complete
+
+        Args:
+            obj: object being downloaded
 
+        Returns:
+            str
         """
-        etag_file = self._get_etag_file(dataset)
-        if os.path.exists(etag_file):
-            with open(etag_file, 'rt') as ef:
-                data = json.load(ef)
+        obj_dir, obj_id = obj.object_path.rsplit('/', 1)
+        return os.path.join(obj_dir, f".{obj_id}.partial")
+
+    @staticmethod
+    def _download_range(client, bucket: str, key: str, path: str, byte_range: Optional[Tuple[int, int]],
+                        chunk_size: int, progress_update_fn: Callable, throttle: Optional[Throttle] = None) -> None:
+        """Method to download an object, or an inclusive byte range of it, into an existing file
+
+        Args:
+            client: S3 client
+            bucket: bucket name
+            key: object key
+            path: file to write into, at the same offset as the range
+            byte_range: tuple of the first and last byte to download, or None for the whole object
+            chunk_size: number of bytes to read from the stream at a time
+            progress_update_fn: A callable with arg "completed_bytes" (int) indicating how many bytes have been
+                                downloaded in since last called
+            throttle: optional throttle to limit the download bandwidth
+
+        Returns:
+            None
+        """
+        if byte_range:
+            response = client.get_object(Bucket=bucket, Key=key, Range=f"bytes={byte_range[0]}-{byte_range[1]}")
         else:
-            data = dict()
+            response = client.get_object(Bucket=bucket, Key=key)
 
-        return data
+        status = response['ResponseMetadata']['HTTPStatusCode']
+        if status not in [200, 206]:
+            raise IOError(f"Failed to download {key}. Status: {status}")
 
-    def _save_etag_data(self, dataset, etag_data: dict) -> None:
-        etag_file = self._get_etag_file(dataset)
-        with open(etag_file, 'wt') as ef:
-            json.dump(etag_data, ef)
+        with open(path, 'r+b') as out_file:
+            out_file.seek(byte_range[0] if byte_range else 0)
+            for chunk in response['Body'].iter_chunks(chunk_size=chunk_size):
+                if throttle:
+                    throttle.acquire(len(chunk))
+                out_file.write(chunk)
+                progress_update_fn(len(chunk))
 
     def pull_objects(self, dataset: Dataset, objects: List[PullObject],
                      progress_update_fn: Callable) -> PullResult:
-        """High-level method to simply link files from the source dir to the object directory to the revision directory
+        """High-level method to download objects from the bucket into the object directory, and link them to the
+        revision directory
+
+        Objects are downloaded by a pool of threads sharing one connection pool. Objects at least
+        `range_request_size` bytes are split into range requests of that size, which are downloaded in parallel.
 
         Args:
             dataset: The current dataset
@@ -180,37 +242,80 @@ Due to the possibility of storing lots of data, when updating you can optionally
         Returns:
             PullResult
         """
-        client = self._get_client()
         bucket, prefix = self._get_s3_config()
 
         backend_config = dataset.client_config.config['datasets']['backends'][dataset.backend.storage_type]
         chunk_size = backend_config['download_chunk_size']
-        success = list()
-        failure = list()
-        message = f"Downloaded {len(objects)} objects successfully."
+        num_workers = backend_config.get('num_workers', 8)
+        range_request_size = backend_config.get('range_request_size', 16777216)
+        client = self._get_client(max_pool_connections=num_workers)
+        throttle = self._bandwidth_throttle(dataset, 'download')
+        m = Manifest(dataset, self.configuration.get('username'))
+
+        # Progress is reported from the download threads
+        progress_lock = threading.Lock()
+
+        def thread_progress_update_fn(completed_bytes: int) -> None:
+            with progress_lock:
+                progress_update_fn(completed_bytes)
 
+        # Files with the same contents share an object, which only needs to be downloaded once
+        objects_by_path: Dict[str, List[PullObject]] = dict()
         for obj in objects:
-            # Get object
-            response = client.get_object(Bucket=bucket,
-                                         Key=os.path.join(prefix, obj.dataset_path))
-
-            if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-                # Save file
-                with open(obj.object_path, 'wb') as out_file:
-                    for cnt, chunk in enumerate(response['Body'].iter_chunks(chunk_size=chunk_size)):
-                        out_file.write(chunk)
-                        progress_update_fn(len(chunk))
-
-                success.append(obj)
+            objects_by_path.setdefault(obj.object_path, list()).append(obj)
+
+        # Split each object into the requests needed to download it
+        requests: List[Tuple[PullObject, Optional[Tuple[int, int]]]] = list()
+        for obj in [objs[0] for objs in objects_by_path.values()]:
+            os.makedirs(os.path.dirname(obj.object_path), exist_ok=True)
+            with open(self._partial_path(obj), 'wb'):
+                pass
+
+            size = m.manifest.get(obj.dataset_path, {}).get('b')
+            size = int(size) if size else 0
+            if size >= range_request_size:
+                requests.extend([(obj, (start, min(start + range_request_size, size) - 1))
+                                 for start in range(0, size, range_request_size)])
             else:
-                failure.append(obj)
+                requests.append((obj, None))
 
+        remaining_requests: Dict[str, int] = dict()
+        for obj, _ in requests:
+            remaining_requests[obj.object_path] = remaining_requests.get(obj.object_path, 0) + 1
+
+        success = list()
+        failure = list()
+        failed_paths = set()
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {executor.submit(self._download_range, client, bucket, os.path.join(prefix, obj.dataset_path),
+                                       self._partial_path(obj), byte_range, chunk_size, thread_progress_update_fn,
+                                       throttle): obj
+                       for obj, byte_range in requests}
+
+            for future in as_completed(futures):
+                obj = futures[future]
+                try:
+                    future.result()
+                except Exception as err:
+                    logger.exception(err)
+                    failed_paths.add(obj.object_path)
+
+                remaining_requests[obj.object_path] -= 1
+                if remaining_requests[obj.object_path] == 0:
+                    # All requests for this object are done
+                    if obj.object_path in failed_paths:
+                        os.remove(self._partial_path(obj))
+                        failure.extend(objects_by_path[obj.object_path])
+                    else:
+                        os.replace(self._partial_path(obj), obj.object_path)
+                        success.extend(objects_by_path[obj.object_path])
+
+        message = f"Downloaded {len(objects)} objects successfully."
         if len(failure) > 0:
             message = f"Downloaded {len(success)} objects successfully, but {len(failure)} failed. Check results."
 
-        # link from object dir through to revision dir
-        m = Manifest(dataset, self.configuration.get('username'))
-        m.link_revision()
+        # link only the objects that were downloaded from object dir through to revision dir
+        m.link_revision(changed_keys=[obj.dataset_path for obj in success])
 
         return PullResult(success=success,
                           failure=failure,
@@ -224,10 +329,40 @@ Due to the possibility of storing lots of data, when updating you can optionally
         """
         return True
 
+    @staticmethod
+    def _download_key(client, bucket: str, key: str, revision_dir: str) -> None:
+        """Method to download an object, or create a "directory" object, in the revision directory
+
+        Args:
+            client: S3 client
+            bucket: bucket name
+            key: object key
+            revision_dir: absolute path to the revision directory
+
+        Returns:
+            None
+        """
+        path = os.path.join(revision_dir, key)
+        if key[-1] == "/":
+            # is a "directory"
+            os.makedirs(path, exist_ok=True)
+            return
+
+        if os.path.exists(path):
+            # Delete the current version, which is linked to an object in the cache
+            os.remove(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        client.download_file(bucket, key, path)
+
     def update_from_remote(self, dataset, status_update_fn: Callable) -> None:
         """Optional method that updates the dataset by comparing against the remote. Not all unmanaged dataset backends
         will be able to do this.
 
+        The bucket listing is streamed a page at a time. The keys in each page are compared against the ETag store,
+        and only new or modified objects are downloaded. The top level prefixes of the bucket are listed concurrently.
+        Objects that were removed from the bucket are then found by scanning the manifest in batches, so memory is
+        bounded by the page size and the number of changed files, not by the size of the bucket.
+
         Args:
             dataset: Dataset object
             status_update_fn: A callable, accepting a string for logging/providing status to the UI
@@ -238,68 +373,94 @@ Due to the possibility of storing lots of data, when updating you can optionally
         if 'username' not in self.configuration:
             raise ValueError("Dataset storage backend requires current logged in username to verify contents")
         m = Manifest(dataset, self.configuration.get('username'))
-
-        # Walk remote checking etags with cached versions
-        etag_data = self._load_etag_data(dataset)
+        # Load the manifest index before it is shared by the listing threads
+        manifest_index = m.manifest
 
         bucket, prefix = self._get_s3_config()
-        client = self._get_client()
-
+        backend_config = dataset.client_config.config['datasets']['backends'][dataset.backend.storage_type]
+        num_workers = backend_config.get('num_workers', 8)
+        list_workers = backend_config.get('list_workers', 4)
+        client = self._get_client(max_pool_connections=num_workers + list_workers)
         paginator = client.get_paginator('list_objects_v2')
-        response_iterator = paginator.paginate(Bucket=bucket, Prefix=prefix)
-
-        all_files = list()
-        added_files = list()
-        modified_files = list()
-        print_cnt = 0
 
         revision_dir = os.path.join(m.cache_mgr.cache_root, m.dataset_revision)
-        for x in response_iterator:
-            if print_cnt == 0:
-                status_update_fn("Processing Bucket Contents, please wait.")
-                print_cnt += 1
-            elif print_cnt == 1:
-                status_update_fn("Processing Bucket Contents, please wait..")
-                print_cnt += 1
-            else:
-                status_update_fn("Processing Bucket Contents, please wait...")
-                print_cnt = 0
+        etag_store = self._get_etag_store(dataset, m)
 
-            for item in x.get("Contents"):
-                key = item['Key']
-                all_files.append(key)
-                if key in m.manifest:
-                    # Object already tracked
-                    if etag_data[key] != item['ETag']:
-                        # Object has been modified since last update
-                        modified_files.append(key)
-                        if os.path.exists(os.path.join(revision_dir, key)):
-                            # Delete current version
-                            os.remove(os.path.join(revision_dir, key))
-
-                        if key[-1] == "/":
-                            # is a "directory
-                            os.makedirs(os.path.join(revision_dir, key), exist_ok=True)
-                        else:
-                            client.download_file(bucket, key, os.path.join(revision_dir, key))
-                else:
-                    # New Object
-                    etag_data[key] = item['ETag']
-                    added_files.append(key)
-
-                    if key[-1] == "/":
-                        # is a "directory
-                        os.makedirs(os.path.join(revision_dir, key), exist_ok=True)
-                    else:
-                        os.makedirs(os.path.dirname(os.path.join(revision_dir, key)), exist_ok=True)
-                        client.download_file(bucket, key, os.path.join(revision_dir, key))
-
-        deleted_files = sorted(list(set(m.manifest.keys()).difference(all_files)))
-
-        # Create StatusResult to force modifications
-        status = StatusResult(created=added_files, modified=modified_files, deleted=deleted_files)
+        added_files: List[str] = list()
+        modified_files: List[str] = list()
+        num_listed = 0
+        status_lock = threading.Lock()
 
-        self._save_etag_data(dataset, etag_data)
-
-        # Run local update
-        self.update_from_local(dataset, status_update_fn, status_result=status)
+        try:
+            pass_id = etag_store.begin_pass()
+
+            def process_page(contents: List[dict], download_executor: ThreadPoolExecutor) -> None:
+                """Download the new and modified objects in a page of the listing, then save its ETags"""
+                nonlocal num_listed
+                listed = [(item['Key'], item['ETag']) for item in contents]
+                current_etags = etag_store.get_many([key for key, _ in listed])
+                changed = [key for key, etag in listed if current_etags.get(key) != etag]
+
+                futures = [download_executor.submit(self._download_key, client, bucket, key, revision_dir)
+                           for key in changed]
+                for future in futures:
+                    future.result()
+
+                # ETags are saved as pending, and only applied once the manifest has been updated
+                etag_store.record_page(pass_id, listed)
+
+                with status_lock:
+                    for key in changed:
+                        if key in manifest_index:
+                            modified_files.append(key)
+                        else:
+                            added_files.append(key)
+                    num_listed += len(listed)
+                    status_update_fn(f"Processed {num_listed} objects in the bucket,"
+                                     f" {len(added_files) + len(modified_files)} new or modified")
+
+            def process_prefix(sub_prefix: str, download_executor: ThreadPoolExecutor) -> None:
+                for page in paginator.paginate(Bucket=bucket, Prefix=sub_prefix,
+                                               PaginationConfig={'PageSize': LIST_PAGE_SIZE}):
+                    process_page(page.get("Contents", []), download_executor)
+
+            status_update_fn("Processing Bucket Contents, please wait...")
+            with ThreadPoolExecutor(max_workers=num_workers) as download_executor, \
+                    ThreadPoolExecutor(max_workers=list_workers) as list_executor:
+                prefix_futures = list()
+                try:
+                    # Objects at the top level are processed here, and each top level prefix is listed in parallel
+                    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/',
+                                                   PaginationConfig={'PageSize': LIST_PAGE_SIZE}):
+                        prefix_futures.extend([list_executor.submit(process_prefix, p['Prefix'], download_executor)
+                                               for p in page.get("CommonPrefixes", [])])
+                        process_page(page.get("Contents", []), download_executor)
+
+                    for future in as_completed(prefix_futures):
+                        future.result()
+                except Exception:
+                    for future in prefix_futures:
+                        future.cancel()
+                    raise
+
+            # Anything in the manifest that was not listed has been deleted. Directories are usually not listed as
+            # objects, so a directory is kept if it still contains a listed object.
+            status_update_fn("Checking for files removed from the bucket")
+            deleted_files: List[str] = list()
+            manifest_keys = (key for key, _ in manifest_index.scan())
+            while True:
+                batch = list(islice(manifest_keys, ETAG_LOOKUP_BATCH_SIZE))
+                if not batch:
+                    break
+                seen = etag_store.seen(pass_id, batch)
+                deleted_files.extend([key for key in batch if key not in seen])
+
+            # Create StatusResult to force modifications
+            status = StatusResult(created=sorted(added_files), modified=sorted(modified_files), deleted=deleted_files)
+
+            # Run local update
+            self.update_from_local(dataset, status_update_fn, status_result=status)
+
+            etag_store.finish_pass(pass_id)
+        finally:
+            etag_store.close()
@@ -0,0 +1,186 @@
+import asyncio
+import time
+import uuid
+
+from mock import patch
+import pytest
+import redis
+
+from gtmcore.dataset.io.bandwidth import BandwidthLimiter, Throttle, TokenBucket, PRIORITY_BACKGROUND, \
+    PRIORITY_INTERACTIVE, PRIORITY_POLL_INTERVAL, WAITER_TIMEOUT
+from gtmcore.fixtures.datasets import mock_dataset_with_cache_dir, mock_dataset_with_manifest
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def redis_client():
+    """Fixture to provide a Redis client and a unique key prefix, removing the keys when done"""
+    client = redis.StrictRedis(db=7)
+    key_prefix = f"test_bandwidth:{uuid.uuid4().hex}"
+    yield client, key_prefix
+    for key in client.scan_iter(f"{key_prefix}*"):
+        client.delete(key)
+
+
+class TestTokenBucket(object):
+    def test_unlimited(self, redis_client):
+        client, key_prefix = redis_client
+        bucket = TokenBucket(client, key_prefix)
+        assert bucket.rate is None
+        for _ in range(10):
+            assert bucket.try_acquire(100000000) == 0
+
+        bucket.set_rate(1000, 500)
+        assert bucket.rate == 1000
+        bucket.set_rate(None, 500)
+        assert bucket.rate is None
+        assert bucket.try_acquire(100000000) == 0
+
+    def test_rate(self, redis_client):
+        client, key_prefix = redis_client
+        clock = FakeClock()
+        bucket = TokenBucket(client, key_prefix, clock=clock)
+        bucket.set_rate(1000, 500)
+        assert bucket.burst_bytes == 500
+
+        assert bucket.try_acquire(500) == 0
+        assert bucket.try_acquire(100) == pytest.approx(0.1)
+
+        clock.now += 0.1
+        assert bucket.try_acquire(100) == 0
+
+        # Tokens don't accumulate past the burst size
+        clock.now += 10
+        assert bucket.try_acquire(500) == 0
+        assert bucket.try_acquire(1) > 0
+
+    def test_chunk_larger_than_burst(self, redis_client):
+        client, key_prefix = redis_client
+        clock = FakeClock()
+        bucket = TokenBucket(client, key_prefix, clock=clock)
+        bucket.set_rate(1000, 500)
+
+        # A full bucket is enough for a large chunk, but the bucket is left in debt
+        assert bucket.try_acquire(2000) == 0
+        assert bucket.try_acquire(100) == pytest.approx(1.6)
+
+    def test_priority(self, redis_client):
+        client, key_prefix = redis_client
+        clock = FakeClock()
+        bucket = TokenBucket(client, key_prefix, clock=clock)
+        bucket.set_rate(1000, 500)
+
+        with bucket._waiting(PRIORITY_INTERACTIVE) as refresh:
+            refresh(0.1)
+            # Background transfers hold off while an interactive transfer is waiting, even if tokens are available
+            assert bucket.try_acquire(100, PRIORITY_BACKGROUND) == PRIORITY_POLL_INTERVAL
+            assert bucket.try_acquire(100, PRIORITY_INTERACTIVE) == 0
+
+            # A waiting transfer that stopped refreshing is ignored
+            clock.now += 0.1 + WAITER_TIMEOUT + 1
+            assert bucket.try_acquire(100, PRIORITY_BACKGROUND) == 0
+
+            refresh(0.1)
+            assert bucket.try_acquire(100, PRIORITY_BACKGROUND) == PRIORITY_POLL_INTERVAL
+
+        assert bucket.try_acquire(100, PRIORITY_BACKGROUND) == 0
+
+    def test_acquire(self, redis_client):
+        client, key_prefix = redis_client
+        bucket = TokenBucket(client, key_prefix)
+        bucket.set_rate(2000000, 100000)
+
+        start = time.monotonic()
+        for _ in range(10):
+            bucket.acquire(100000)
+        assert time.monotonic() - start >= 0.4
+
+        async def send():
+            for _ in range(10):
+                await bucket.acquire_async(100000, PRIORITY_INTERACTIVE)
+
+        start = time.monotonic()
+        asyncio.get_event_loop().run_until_complete(send())
+        assert time.monotonic() - start >= 0.4
+        assert client.zcard(f"{key_prefix}:waiting:{PRIORITY_INTERACTIVE}") == 0
+
+
+class TestBandwidthLimiter(object):
+    def test_configure(self, redis_client):
+        client, key_prefix = redis_client
+        limiter = BandwidthLimiter(client, key_prefix)
+
+        limiter.configure({'upload_rate': 1000, 'download_rate': None, 'burst_bytes': 500})
+        assert limiter.upload.rate == 1000
+        assert limiter.upload.burst_bytes == 500
+        assert limiter.download.rate is None
+
+        # Invalid rates are ignored
+        limiter.configure({'upload_rate': "fast"})
+        assert limiter.upload.rate is None
+
+        limiter.configure({'upload_rate': 1000})
+        throttle = limiter.throttle('upload', PRIORITY_INTERACTIVE)
+        assert throttle.bucket is limiter.upload
+        assert throttle.priority == PRIORITY_INTERACTIVE
+
+        with pytest.raises(ValueError):
+            limiter.throttle('sideways')
+
+    def test_unlimited_transfers_skip_redis(self, redis_client):
+        client, key_prefix = redis_client
+        limiter = BandwidthLimiter(client, key_prefix)
+        limiter.configure({'upload_rate': 1000, 'download_rate': None})
+
+        assert limiter.throttle('download') is None
+        assert limiter.throttle('upload', dataset_id='default/dataset-1', rate_limit="0") is None
+        assert limiter.throttle('upload', dataset_id='default/dataset-1', rate_limit="") is not None
+
+    def test_dataset_override(self, redis_client):
+        client, key_prefix = redis_client
+        limiter = BandwidthLimiter(client, key_prefix)
+        limiter.configure({'upload_rate': 1000, 'download_rate': None})
+
+        throttle = limiter.throttle('download', dataset_id='default/dataset-1', rate_limit="2000")
+        assert throttle.bucket.key == f"{key_prefix}:download:dataset:default/dataset-1"
+        assert throttle.bucket.rate == 2000
+
+        # The override only applies to the dataset's transfers
+        assert limiter.download.rate is None
+        assert limiter.throttle('download', dataset_id='default/dataset-2') is None
+
+        # Invalid overrides fall back to the client config
+        throttle = limiter.throttle('upload', dataset_id='default/dataset-1', rate_limit="fast")
+        assert throttle.bucket is limiter.upload
+
+    def test_redis_unavailable(self):
+        client = redis.StrictRedis(port=1)
+        bucket = TokenBucket(client, "test_bandwidth:unavailable")
+        throttle = Throttle(bucket)
+
+        # Transfers continue without a limit
+        throttle.acquire(100)
+        assert throttle.disabled is True
+        asyncio.get_event_loop().run_until_complete(throttle.acquire_async(100))
+
+        limiter = BandwidthLimiter(client, "test_bandwidth:unavailable")
+        with pytest.raises(redis.exceptions.RedisError):
+            limiter.configure({'upload_rate': 1000})
+
+        throttle = Throttle(bucket)
+        asyncio.get_event_loop().run_until_complete(throttle.acquire_async(100))
+        assert throttle.disabled is True
+
+    def test_backend_redis_unavailable(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        limiter = BandwidthLimiter(redis.StrictRedis(port=1), "test_bandwidth:unavailable")
+
+        with patch('gtmcore.dataset.storage.backend.get_bandwidth_limiter', return_value=limiter):
+            assert ds.backend._bandwidth_throttle(ds, 'upload') is None
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import time
+
+from gtmcore.dataset.benchmark.runner import generate_file_sizes, write_synthetic_objects, run_benchmark, \
+    format_results, FILE_SIZE_DISTRIBUTIONS
+from gtmcore.dataset.benchmark.service import SimulatedLink, StandInObjectService, StandInObjectServiceProcess
+from gtmcore.fixtures.datasets import mock_dataset_with_cache_dir
+
+
+class TestTransferBenchmark(object):
+    def test_generate_file_sizes(self):
+        for distribution in FILE_SIZE_DISTRIBUTIONS:
+            sizes = generate_file_sizes(distribution, 100000000, seed=1)
+            assert sum(sizes) >= 100000000
+            assert sizes == generate_file_sizes(distribution, 100000000, seed=1)
+
+        small = generate_file_sizes('small', 100000000)
+        large = generate_file_sizes('large', 100000000)
+        assert len(small) > 100 * len(large)
+
+    def test_write_synthetic_objects(self, tmpdir):
+        paths = write_synthetic_objects(str(tmpdir), [10, 10, 200000], seed=1)
+        assert len(set(paths)) == 3
+        assert [os.path.getsize(p) for p in paths] == [10, 10, 200000]
+        assert all(len(os.path.basename(p)) == 128 for p in paths)
+
+    def test_simulated_link(self):
+        link = SimulatedLink(bandwidth=1000000)
+
+        async def send():
+            await asyncio.gather(*[link.transfer(100000) for _ in range(3)])
+
+        start = time.monotonic()
+        asyncio.get_event_loop().run_until_complete(send())
+        assert time.monotonic() - start >= 0.29
+
+    def test_run_benchmark(self, mock_dataset_with_cache_dir, tmpdir):
+        ds = mock_dataset_with_cache_dir[0]
+        backend_config = ds.client_config.config['datasets']['backends']['gigantum_object_v1']
+        backend_config['multipart_chunk_size'] = 1048576
+
+        # Two small files, and one incompressible file large enough to be uploaded in 3 parts
+        object_paths = write_synthetic_objects(os.path.join(str(tmpdir), 'objects'), [1000, 50000],
+                                               compressible_fraction=0.5)
+        object_paths.extend(write_synthetic_objects(os.path.join(str(tmpdir), 'objects'), [3000000],
+                                                    compressible_fraction=0.0, seed=1))
+
+        with StandInObjectService(latency=0.001) as service:
+            results = run_benchmark(ds, service, object_paths, str(tmpdir))
+            assert len(service.objects) == 3
+            assert not service.multipart_uploads
+
+        assert [r.operation for r in results] == ['push', 'pull']
+        for r in results:
+            assert r.num_files == 3
+            assert r.failures == 0
+            assert r.num_bytes == 3051000
+            assert r.num_requests > 0
+            assert r.peak_rss_bytes > 0
+
+        # Pulled objects are verified against their object id, so they match the pushed files
+        for path in object_paths:
+            pulled_path = os.path.join(str(tmpdir), 'pulled', os.path.basename(path))
+            with open(path, 'rb') as src, open(pulled_path, 'rb') as dst:
+                assert src.read() == dst.read()
+
+        table = format_results(results)
+        assert len(table.splitlines()) == 3
+
+    def test_run_benchmark_service_process(self, mock_dataset_with_cache_dir, tmpdir):
+        ds = mock_dataset_with_cache_dir[0]
+        object_paths = write_synthetic_objects(os.path.join(str(tmpdir), 'objects'), [1000, 2000, 3000])
+
+        with StandInObjectServiceProcess() as service:
+            results = run_benchmark(ds, service, object_paths, str(tmpdir))
+            assert service.request_count > 0
+
+        assert [r.failures for r in results] == [0, 0]
+        assert all(r.num_requests > 0 for r in results)
@@ -0,0 +1,135 @@
+import pytest
+import os
+import time
+
+from gtmcore.dataset.cache.objects import ObjectCacheManager, STALE_TEMP_FILE_SECONDS
+from gtmcore.dataset.io.manager import IOManager
+from gtmcore.dataset.manifest.chunking import temp_file_path
+from gtmcore.fixtures.datasets import mock_dataset_with_cache_dir, mock_dataset_with_manifest, helper_append_file
+
+
+@pytest.fixture()
+def mock_dataset_with_objects(mock_dataset_with_manifest):
+    """A pytest fixture that creates a dataset with 3 committed files that have been pushed"""
+    ds, manifest, working_dir = mock_dataset_with_manifest
+    helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test1.txt", "a" * 100)
+    helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test2.txt", "b" * 200)
+    helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test3.txt", "c" * 300)
+    manifest.sweep_all_changes()
+
+    # Clear the push queue, as if all objects had been pushed
+    manifest.push_queue.clear()
+
+    object_cache = ObjectCacheManager(manifest.cache_mgr)
+    now = time.time()
+    object_cache.record_access([manifest.manifest['test1.txt']['h']], now - 30)
+    object_cache.record_access([manifest.manifest['test2.txt']['h']], now - 10)
+    object_cache.record_access([manifest.manifest['test3.txt']['h']], now - 20)
+
+    yield ds, manifest, object_cache
+    object_cache.close()
+
+
+class TestObjectCacheManager(object):
+    def test_list_objects(self, mock_dataset_with_objects):
+        ds, manifest, object_cache = mock_dataset_with_objects
+        assert object_cache.max_bytes is None
+
+        objects = {obj.object_id: obj for obj in object_cache.list_objects()}
+        assert len(objects) == 3
+        assert objects[manifest.manifest['test2.txt']['h']].size == 200
+        assert objects[manifest.manifest['test2.txt']['h']].num_links == 2
+        assert object_cache.total_bytes() == 600
+
+    def test_list_objects_temp_files(self, mock_dataset_with_objects):
+        """Temporary files are not objects, and stale ones left by interrupted writes are removed"""
+        ds, manifest, object_cache = mock_dataset_with_objects
+        object_path = manifest.dataset_to_object_path('test1.txt')
+        fresh_path = temp_file_path(object_path)
+        stale_path = temp_file_path(object_path)
+        for path in [fresh_path, stale_path]:
+            with open(path, 'wb') as fh:
+                fh.write(b'x' * 1000)
+        stale_time = time.time() - STALE_TEMP_FILE_SECONDS - 60
+        os.utime(stale_path, (stale_time, stale_time))
+
+        assert len(object_cache.list_objects()) == 3
+        assert object_cache.total_bytes() == 600
+        assert os.path.exists(fresh_path)
+        assert not os.path.exists(stale_path)
+
+    def test_record_access_on_link(self, mock_dataset_with_objects):
+        ds, manifest, object_cache = mock_dataset_with_objects
+        before = time.time()
+        manifest.link_revision(changed_keys=['test1.txt'])
+
+        objects = {obj.object_id: obj for obj in object_cache.list_objects()}
+        assert objects[manifest.manifest['test1.txt']['h']].last_access >= before
+        assert objects[manifest.manifest['test2.txt']['h']].last_access < before
+
+    def test_evict_within_budget(self, mock_dataset_with_objects):
+        ds, manifest, object_cache = mock_dataset_with_objects
+
+        result = object_cache.evict()
+        assert result.evicted == []
+        assert result.total_bytes == 600
+
+        result = object_cache.evict(max_bytes=600)
+        assert result.evicted == []
+
+    def test_evict_lru(self, mock_dataset_with_objects):
+        ds, manifest, object_cache = mock_dataset_with_objects
+        revision_dir = manifest.current_revision_dir
+
+        # test1.txt is the least recently used, then test3.txt
+        result = object_cache.evict(max_bytes=250)
+        assert result.evicted == [manifest.manifest['test1.txt']['h'], manifest.manifest['test3.txt']['h']]
+        assert result.bytes_freed == 400
+        assert result.total_bytes == 200
+        assert object_cache.total_bytes() == 200
+
+        assert not os.path.exists(os.path.join(revision_dir, 'test1.txt'))
+        assert not os.path.exists(os.path.join(revision_dir, 'test3.txt'))
+        assert os.path.exists(os.path.join(revision_dir, 'test2.txt'))
+        assert not os.path.exists(manifest.dataset_to_object_path('test1.txt'))
+
+        # Evicted files are not deleted from the dataset, and will be pulled again
+        status = manifest.status()
+        assert status.deleted == []
+        assert status.modified == []
+        assert 'test1.txt' in manifest.manifest
+        iom = IOManager(ds, manifest)
+        assert sorted(iom._get_pull_all_keys()) == ['test1.txt', 'test3.txt']
+
+    def test_evict_unreferenced_first(self, mock_dataset_with_objects):
+        ds, manifest, object_cache = mock_dataset_with_objects
+
+        # An object that is no longer linked into any revision is evicted first, even if recently used
+        os.remove(os.path.join(manifest.current_revision_dir, 'test2.txt'))
+        result = object_cache.evict(max_bytes=500)
+        assert result.evicted == [manifest.manifest['test2.txt']['h']]
+        assert os.path.exists(os.path.join(manifest.current_revision_dir, 'test1.txt'))
+
+    def test_evict_keep_and_pinned(self, mock_dataset_with_objects):
+        ds, manifest, object_cache = mock_dataset_with_objects
+
+        result = object_cache.evict(max_bytes=250, keep=[manifest.manifest['test1.txt']['h']])
+        assert result.evicted == [manifest.manifest['test3.txt']['h'], manifest.manifest['test2.txt']['h']]
+
+        # Objects that have not been pushed yet are never evicted
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test4.txt", "d" * 400)
+        manifest.sweep_all_changes()
+        result = object_cache.evict(max_bytes=0)
+        assert result.evicted == [manifest.manifest['test1.txt']['h']]
+        assert result.total_bytes == 400
+        assert os.path.exists(os.path.join(manifest.current_revision_dir, 'test4.txt'))
+
+    def test_evict_configured_budget(self, mock_dataset_with_objects):
+        ds, manifest, object_cache = mock_dataset_with_objects
+        ds.client_config.config['datasets']['cache_max_bytes'] = 350
+
+        configured_cache = ObjectCacheManager(manifest.cache_mgr)
+        assert configured_cache.max_bytes == 350
+        result = configured_cache.evict()
+        assert result.evicted == [manifest.manifest['test1.txt']['h'], manifest.manifest['test3.txt']['h']]
+        configured_cache.close()
@@ -0,0 +1,179 @@
+import pytest
+import io
+import os
+import random
+
+import numpy as np
+
+from gtmcore.dataset.io.manager import IOManager
+from gtmcore.dataset.manifest.chunking import ContentDefinedChunker, ChunkStore, GEAR_TABLE, gear_fingerprints, \
+    encode_chunk_list, decode_chunk_list, is_temp_file, temp_file_path
+from gtmcore.fixtures.datasets import mock_dataset_with_cache_dir, mock_dataset_with_manifest
+
+
+def helper_random_bytes(num_bytes, seed=42):
+    return random.Random(seed).getrandbits(8 * num_bytes).to_bytes(num_bytes, 'little')
+
+
+def helper_write_bytes(manifest, rel_path, data):
+    with open(os.path.join(manifest.cache_mgr.cache_root, manifest.dataset_revision, rel_path), 'wb') as fh:
+        fh.write(data)
+
+
+@pytest.fixture()
+def mock_dataset_with_chunking(mock_dataset_with_manifest):
+    """A pytest fixture that creates a dataset with chunking enabled for files of at least 8KB"""
+    ds, manifest, working_dir = mock_dataset_with_manifest
+    ds.client_config.config['datasets']['chunking'] = {'enabled': True,
+                                                       'min_file_size': 8192,
+                                                       'avg_chunk_size': 1024,
+                                                       'min_chunk_size': 256,
+                                                       'max_chunk_size': 4096}
+    yield ds, manifest, working_dir
+
+
+class TestContentDefinedChunker(object):
+    def test_gear_fingerprints(self):
+        values = GEAR_TABLE[np.frombuffer(helper_random_bytes(1000), dtype=np.uint8)]
+        for window in [1, 2, 7, 13, 22]:
+            fingerprints = gear_fingerprints(values, window)
+            assert len(fingerprints) == len(values) - window + 1
+            for j in [0, 10, len(fingerprints) - 1]:
+                expected = sum(int(values[j + window - 1 - k]) << k for k in range(window)) & 0xffffffff
+                assert int(fingerprints[j]) == expected
+
+    def test_invalid_sizes(self):
+        with pytest.raises(ValueError):
+            ContentDefinedChunker(1000, 256, 4096)
+        with pytest.raises(ValueError):
+            ContentDefinedChunker(1024, 2048, 4096)
+
+    def test_chunks(self):
+        data = helper_random_bytes(200000)
+        chunker = ContentDefinedChunker(1024, 256, 4096, read_size=3000)
+        chunks = list(chunker.chunks(io.BytesIO(data)))
+
+        assert b''.join(chunks) == data
+        assert min([len(c) for c in chunks[:-1]]) >= 256
+        assert max([len(c) for c in chunks]) <= 4096
+
+        # Boundaries don't depend on how the file is read
+        chunker = ContentDefinedChunker(1024, 256, 4096, read_size=65536)
+        assert list(chunker.chunks(io.BytesIO(data))) == chunks
+
+    def test_chunks_max_size(self):
+        chunker = ContentDefinedChunker(1024, 256, 4096, read_size=3000)
+        assert [len(c) for c in chunker.chunks(io.BytesIO(bytes(10000)))] == [4096, 4096, 1808]
+        assert list(chunker.chunks(io.BytesIO(b''))) == []
+
+    def test_edits_only_change_nearby_chunks(self):
+        data = helper_random_bytes(200000)
+        chunker = ContentDefinedChunker(1024, 256, 4096)
+        chunks = list(chunker.chunks(io.BytesIO(data)))
+
+        edited = data[:100000] + b'inserted data' + data[100000:] + b'appended data'
+        edited_chunks = list(chunker.chunks(io.BytesIO(edited)))
+        assert len(set(chunks) - set(edited_chunks)) <= 3
+
+    def test_chunk_list_encoding(self):
+        chunks = [('abc', 10), ('def', 20)]
+        assert decode_chunk_list(encode_chunk_list(chunks)) == chunks
+        with pytest.raises(ValueError):
+            decode_chunk_list(b'{"v": 100, "chunks": []}')
+
+
+class TestChunkedObjects(object):
+    def test_large_files_are_chunked(self, mock_dataset_with_chunking):
+        ds, manifest, working_dir = mock_dataset_with_chunking
+        iom = IOManager(ds, manifest)
+        data = helper_random_bytes(100000)
+        helper_write_bytes(manifest, "large.bin", data)
+        helper_write_bytes(manifest, "small.bin", data[:1000])
+        manifest.sweep_all_changes()
+
+        # The whole object is still stored and linked locally
+        large_entry = manifest.manifest['large.bin']
+        assert 'c' not in manifest.manifest['small.bin']
+        assert os.path.isfile(manifest.dataset_to_object_path('large.bin'))
+        with open(os.path.join(manifest.current_revision_dir, 'large.bin'), 'rb') as fh:
+            assert fh.read() == data
+
+        # Only the chunks and the chunk list are pushed
+        chunk_list = manifest.chunk_store.read_chunk_list(large_entry['c'])
+        assert sum([size for _, size in chunk_list]) == 100000
+        pushed = {os.path.basename(obj.object_path) for obj in iom.objects_to_push() if obj.dataset_path == 'large.bin'}
+        assert pushed == {chunk_id for chunk_id, _ in chunk_list} | {large_entry['c']}
+
+        # The chunk list is exported to the manifest files, so it survives a rebuild of the index
+        manifest.force_reload()
+        assert manifest.manifest['large.bin']['c'] == large_entry['c']
+
+    def test_only_new_chunks_are_pushed(self, mock_dataset_with_chunking):
+        ds, manifest, working_dir = mock_dataset_with_chunking
+        iom = IOManager(ds, manifest)
+        data = helper_random_bytes(100000)
+        helper_write_bytes(manifest, "large.bin", data)
+        manifest.sweep_all_changes()
+        pushed = {obj.object_path for obj in iom.objects_to_push()}
+
+        with open(os.path.join(manifest.current_revision_dir, "large.bin"), 'ab') as fh:
+            fh.write(b'a few more rows')
+        manifest.sweep_all_changes()
+
+        # Just the last chunk and the new chunk list
+        new_objects = {obj.object_path for obj in iom.objects_to_push()} - pushed
+        assert len(new_objects) == 2
+        assert manifest.chunk_store.object_path(manifest.manifest['large.bin']['c']) in new_objects
+
+    def test_remove_chunk_objects(self, mock_dataset_with_chunking):
+        ds, manifest, working_dir = mock_dataset_with_chunking
+        helper_write_bytes(manifest, "large.bin", helper_random_bytes(50000))
+        manifest.sweep_all_changes()
+
+        chunk_store = manifest.chunk_store
+        chunk_list = chunk_store.read_chunk_list(manifest.manifest['large.bin']['c'])
+        chunk_ids = [chunk_id for chunk_id, _ in chunk_list]
+        assert chunk_store.find_chunk(chunk_ids[1]) == (chunk_store.object_path(chunk_ids[1]), 0)
+
+        # Chunks are only removed when the data is still stored in the whole object
+        chunk_store.remove_chunk_objects(chunk_ids + [manifest.manifest['large.bin']['h']])
+        assert not os.path.exists(chunk_store.object_path(chunk_ids[1]))
+        assert os.path.isfile(manifest.dataset_to_object_path('large.bin'))
+
+        first_chunk_size = chunk_list[0][1]
+        assert chunk_store.find_chunk(chunk_ids[1]) == (manifest.dataset_to_object_path('large.bin'), first_chunk_size)
+
+    def test_assemble_object(self, mock_dataset_with_chunking):
+        ds, manifest, working_dir = mock_dataset_with_chunking
+        data = helper_random_bytes(50000)
+        helper_write_bytes(manifest, "large.bin", data)
+        manifest.sweep_all_changes()
+        entry = manifest.manifest['large.bin']
+
+        os.remove(os.path.join(manifest.current_revision_dir, 'large.bin'))
+        os.remove(manifest.dataset_to_object_path('large.bin'))
+
+        chunk_store = ChunkStore(manifest.cache_mgr.cache_root)
+        assert chunk_store.missing_chunks(entry['c']) == []
+        chunk_store.assemble_object(entry['h'], entry['c'])
+        with open(manifest.dataset_to_object_path('large.bin'), 'rb') as fh:
+            assert fh.read() == data
+
+        # Contents are verified before the object is written
+        os.remove(manifest.dataset_to_object_path('large.bin'))
+        with pytest.raises(IOError):
+            chunk_store.assemble_object('0' * 128, entry['c'])
+        assert not os.path.exists(chunk_store.object_path('0' * 128))
+        assert os.listdir(os.path.dirname(chunk_store.object_path('0' * 128))) == []
+        chunk_store.close()
+
+    def test_temp_file_path(self, tmpdir):
+        object_path = os.path.join(str(tmpdir), 'objects', 'abcd1234', 'efgh5678', 'abcd1234efgh5678')
+        temp_path = temp_file_path(object_path)
+        assert os.path.dirname(temp_path) == os.path.dirname(object_path)
+        assert os.path.basename(temp_path).startswith('.abcd1234efgh5678.')
+        assert is_temp_file(os.path.basename(temp_path))
+        assert temp_file_path(object_path) != temp_path
+
+        assert not is_temp_file('abcd1234efgh5678')
+        assert not is_temp_file('.abcd1234efgh5678.partial')
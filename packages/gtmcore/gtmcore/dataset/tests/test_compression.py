@@ -0,0 +1,174 @@
+from concurrent.futures import ProcessPoolExecutor
+import io
+import os
+import random
+
+import pytest
+import snappy
+
+from gtmcore.dataset.storage.compression import CodecSelector, SnappyCodec, StoreCodec, ZstdCodec, byte_entropy, \
+    detect_codec, get_codec
+from gtmcore.dataset.storage.gigantum import StreamingCompressor, snappy_frame_boundary
+
+
+def helper_text(num_bytes):
+    rng = random.Random(1)
+    words = ['dataset', 'object', 'compression', 'codec', 'gigantum', 'snappy', 'zstd', 'chunk']
+    text = ' '.join(rng.choice(words) for _ in range(num_bytes // 5)).encode()
+    return text[:num_bytes]
+
+
+def helper_write(directory, name, data):
+    path = os.path.join(str(directory), name)
+    with open(path, 'wb') as fh:
+        fh.write(data)
+    return path
+
+
+def helper_compress(object_path, codec, read_size=65536, executor=None):
+    compressor = StreamingCompressor(object_path, read_size=read_size, executor=executor,
+                                     codec_selector=CodecSelector(codec.name, getattr(codec, 'level', None),
+                                                                  detect_incompressible=False))
+    blocks = list()
+    while not compressor.is_complete:
+        blocks.append(compressor.read(10000))
+    compressor.close()
+    return b''.join(blocks)
+
+
+class TestCompression(object):
+    @pytest.mark.parametrize('codec', [SnappyCodec(), ZstdCodec(1), ZstdCodec(10), StoreCodec()])
+    def test_round_trip(self, tmpdir, codec):
+        data = helper_text(300000) + os.urandom(100000)
+        compressed = helper_compress(helper_write(tmpdir, 'object', data), codec)
+
+        assert isinstance(detect_codec(compressed), codec.__class__)
+        assert snappy_frame_boundary(bytearray(compressed)) == len(compressed)
+
+        # Decompress in pieces made of complete chunks, as downloads do
+        decompressor = codec.decompressor()
+        output = bytearray()
+        buffer = bytearray()
+        for offset in range(0, len(compressed), 7000):
+            buffer.extend(compressed[offset:offset + 7000])
+            num_bytes = snappy_frame_boundary(buffer)
+            output.extend(decompressor.decompress(bytes(buffer[:num_bytes])))
+            del buffer[:num_bytes]
+        assert not buffer
+        assert bytes(output) == data
+
+    @pytest.mark.parametrize('codec', [SnappyCodec(), ZstdCodec(), StoreCodec()])
+    def test_resume_at_chunk_boundary(self, tmpdir, codec):
+        data = helper_text(500000)
+        compressed = helper_compress(helper_write(tmpdir, 'object', data), codec)
+
+        resume_at = snappy_frame_boundary(bytearray(compressed[:len(compressed) // 2]))
+        assert 0 < resume_at < len(compressed)
+
+        first = codec.decompressor().decompress(compressed[:resume_at])
+        rest = get_codec(codec.name).decompressor(resume=True).decompress(compressed[resume_at:])
+        assert first + rest == data
+
+    def test_zstd_is_smaller_than_snappy(self, tmpdir):
+        object_path = helper_write(tmpdir, 'object', helper_text(1000000))
+        snappy_size = len(helper_compress(object_path, SnappyCodec()))
+        zstd_size = len(helper_compress(object_path, ZstdCodec(3)))
+        assert zstd_size < snappy_size
+        assert len(helper_compress(object_path, ZstdCodec(19))) <= zstd_size
+
+    def test_store_does_not_grow_incompressible_data(self, tmpdir):
+        data = os.urandom(1000000)
+        object_path = helper_write(tmpdir, 'object', data)
+        stored = helper_compress(object_path, StoreCodec())
+
+        # Only the stream identifier and a chunk header per block are added
+        assert len(stored) == len(data) + 10 + 4 * 16
+        assert len(helper_compress(object_path, SnappyCodec())) > len(stored)
+
+    def test_legacy_snappy_objects(self):
+        data = helper_text(200000)
+        with io.BytesIO(data) as src, io.BytesIO() as dst:
+            snappy.stream_compress(src, dst)
+            compressed = dst.getvalue()
+
+        codec = detect_codec(compressed)
+        assert isinstance(codec, SnappyCodec)
+        assert codec.decompressor().decompress(compressed) == data
+
+    def test_detect_unknown_codec(self):
+        assert detect_codec(b'not a compressed object') is None
+        assert detect_codec(b'') is None
+
+    def test_decompress_errors(self, tmpdir):
+        compressed = helper_compress(helper_write(tmpdir, 'object', b'abcd' * 1000), ZstdCodec())
+        with pytest.raises(IOError):
+            StoreCodec().decompressor().decompress(compressed)
+        with pytest.raises(IOError):
+            ZstdCodec().decompressor().decompress(compressed[10:])
+        with pytest.raises(IOError):
+            ZstdCodec().decompressor().decompress(compressed[:-1])
+
+    def test_get_codec(self):
+        assert get_codec('zstd', 7).level == 7
+        assert get_codec('zstd').level == 3
+        assert isinstance(get_codec('store', 7), StoreCodec)
+        with pytest.raises(ValueError):
+            get_codec('gzip')
+
+    def test_in_process_pool(self, tmpdir):
+        object_path = helper_write(tmpdir, 'object', helper_text(300000))
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            compressed = helper_compress(object_path, ZstdCodec(5), executor=executor)
+        assert compressed == helper_compress(object_path, ZstdCodec(5))
+
+    def test_byte_entropy(self):
+        assert byte_entropy(b'') == 0.0
+        assert byte_entropy(b'a' * 1000) == 0.0
+        assert byte_entropy(bytes(range(256)) * 10) == pytest.approx(8.0)
+        assert byte_entropy(helper_text(100000)) < 5
+        assert byte_entropy(os.urandom(100000)) > 7.9
+
+
+class TestCodecSelector(object):
+    def test_choose_by_extension(self, tmpdir):
+        selector = CodecSelector('zstd')
+        object_path = helper_write(tmpdir, 'object', helper_text(10000))
+
+        assert isinstance(selector.choose(object_path, 'photos/image.JPG'), StoreCodec)
+        assert isinstance(selector.choose(object_path, 'data/table.parquet'), StoreCodec)
+        assert isinstance(selector.choose(object_path, 'data/table.csv'), ZstdCodec)
+        assert isinstance(selector.choose(object_path), ZstdCodec)
+
+    def test_choose_by_entropy(self, tmpdir):
+        selector = CodecSelector('snappy', sample_size=4096, num_samples=4)
+        assert isinstance(selector.choose(helper_write(tmpdir, 'random', os.urandom(100000)), 'a.bin'),
+                          StoreCodec)
+        assert isinstance(selector.choose(helper_write(tmpdir, 'text', helper_text(100000)), 'a.bin'),
+                          SnappyCodec)
+        assert isinstance(selector.choose(helper_write(tmpdir, 'empty', b''), 'a.bin'), SnappyCodec)
+
+        # Only the sampled blocks are checked: a compressible file with a random header is still compressed
+        mixed = os.urandom(4096) + helper_text(200000)
+        assert isinstance(selector.choose(helper_write(tmpdir, 'mixed', mixed), 'a.bin'), SnappyCodec)
+
+    def test_detection_disabled(self, tmpdir):
+        selector = CodecSelector('zstd', detect_incompressible=False)
+        object_path = helper_write(tmpdir, 'random', os.urandom(10000))
+        assert isinstance(selector.choose(object_path, 'image.png'), ZstdCodec)
+
+    def test_from_config(self):
+        selector = CodecSelector.from_config({'codec': 'zstd', 'zstd_level': 9, 'entropy_threshold': 7.0,
+                                              'incompressible_extensions': ['.H5']})
+        assert selector.codec.level == 9
+        assert selector.entropy_threshold == 7.0
+        assert selector.incompressible_extensions == {'.h5'}
+
+        selector = CodecSelector.from_config(None)
+        assert isinstance(selector.codec, SnappyCodec)
+        assert selector.detect_incompressible is False
+
+        selector = CodecSelector.from_config({'detect_incompressible': True})
+        assert selector.detect_incompressible is True
+
+        with pytest.raises(ValueError):
+            CodecSelector.from_config({'codec': 'lzma'})
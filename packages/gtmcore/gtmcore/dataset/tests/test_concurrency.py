@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+
+from gtmcore.dataset.io.concurrency import AdaptiveConcurrencyController
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def helper_run_window(controller, clock, num_bytes, latency, errors=0):
+    """Record a full window of requests, taking one second"""
+    clock.now += 1.0
+    for i in range(controller.window_size):
+        controller.record(num_bytes, latency, error=i < errors)
+
+
+class TestAdaptiveConcurrencyController(object):
+    def test_invalid_limits(self):
+        with pytest.raises(ValueError):
+            AdaptiveConcurrencyController(min_limit=0)
+        with pytest.raises(ValueError):
+            AdaptiveConcurrencyController(min_limit=8, max_limit=4)
+
+        controller = AdaptiveConcurrencyController(min_limit=2, max_limit=4, initial_limit=10)
+        assert controller.limit == 4
+
+    def test_additive_increase(self):
+        clock = FakeClock()
+        controller = AdaptiveConcurrencyController(min_limit=1, max_limit=4, initial_limit=2, window_size=4,
+                                                   clock=clock)
+        helper_run_window(controller, clock, 1000, 0.1)
+        assert controller.limit == 3
+        helper_run_window(controller, clock, 1000, 0.1)
+        assert controller.limit == 4
+        helper_run_window(controller, clock, 1000, 0.1)
+        assert controller.limit == 4
+
+        assert [d.reason for d in controller.decisions] == ["increase", "increase", "at ceiling"]
+        assert controller.decisions[0].throughput == 4000
+        assert controller.decisions[0].latency == pytest.approx(0.1)
+
+    def test_multiplicative_decrease_on_errors(self):
+        clock = FakeClock()
+        controller = AdaptiveConcurrencyController(min_limit=2, max_limit=16, initial_limit=12, window_size=4,
+                                                   clock=clock)
+        helper_run_window(controller, clock, 1000, 0.1, errors=1)
+        assert controller.limit == 6
+        assert controller.decisions[-1].error_rate == 0.25
+        helper_run_window(controller, clock, 1000, 0.1, errors=4)
+        assert controller.limit == 3
+        helper_run_window(controller, clock, 1000, 0.1, errors=4)
+        assert controller.limit == 2
+        helper_run_window(controller, clock, 1000, 0.1, errors=4)
+        assert controller.limit == 2
+        assert controller.decisions[-1].reason == "errors, at floor"
+
+    def test_decrease_on_latency_without_throughput(self):
+        clock = FakeClock()
+        controller = AdaptiveConcurrencyController(min_limit=1, max_limit=16, initial_limit=8, window_size=4,
+                                                   clock=clock)
+        helper_run_window(controller, clock, 1000, 0.1)
+        assert controller.limit == 9
+
+        # Latency grew, but so did throughput, so keep increasing
+        helper_run_window(controller, clock, 2000, 0.5)
+        assert controller.limit == 10
+
+        # Latency grew and throughput did not, so requests are queueing
+        helper_run_window(controller, clock, 2000, 0.5)
+        assert controller.limit == 5
+        assert controller.decisions[-1].reason == "latency"
+
+    @pytest.mark.asyncio
+    async def test_acquire_respects_limit(self, event_loop):
+        controller = AdaptiveConcurrencyController(min_limit=1, max_limit=3, initial_limit=2, window_size=100)
+        in_flight = list()
+        max_in_flight = list()
+
+        async def request():
+            await controller.acquire()
+            in_flight.append(1)
+            max_in_flight.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+            await controller.release(num_bytes=10, latency=0.01)
+
+        await asyncio.gather(*[request() for _ in range(10)])
+        assert max(max_in_flight) == 2
+        assert controller.in_flight == 0
+
+    def test_summary(self):
+        clock = FakeClock()
+        controller = AdaptiveConcurrencyController(min_limit=1, max_limit=4, window_size=2, clock=clock)
+        for _ in range(5):
+            helper_run_window(controller, clock, 1000, 0.1)
+
+        summary = controller.summary(max_decisions=2)
+        assert summary['limit'] == 4
+        assert summary['min_limit'] == 1
+        assert summary['max_limit'] == 4
+        assert len(summary['decisions']) == 2
+        assert summary['decisions'][-1]['reason'] == "at ceiling"
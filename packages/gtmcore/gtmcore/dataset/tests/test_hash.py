@@ -1,6 +1,7 @@
 import pytest
 import os
 import time
+import pickle
 from pathlib import Path
 from hashlib import blake2b
 
@@ -32,7 +33,7 @@ class TestHashing(object):
         helper_append_file(cache_dir, revision, filename, "pupper")
         assert sh.fast_hash_data == {}
         assert sh.is_cached(filename) is False
-        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash")) is False
+        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash.db")) is False
 
         hash_result = await sh.hash([filename])
         hash_result = hash_result[0]
@@ -49,7 +50,7 @@ class TestHashing(object):
         helper_append_file(cache_dir, revision, filename, "asdfdsfgkdfshuhwedfgft345wfd" * 100000)
         assert sh.fast_hash_data == {}
         assert sh.is_cached(filename) is False
-        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash")) is False
+        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash.db")) is False
 
         hash_result = await sh.hash([filename])
         hash_result = hash_result[0]
@@ -73,7 +74,7 @@ class TestHashing(object):
         filename2 = "test2.txt"
         helper_append_file(cache_dir, revision, filename2, "gfggfgfgfgwee" * 100000)
         assert sh.is_cached(filename2) is False
-        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash")) is False
+        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash.db")) is False
         assert sh.fast_hash_data == {}
 
         h = blake2b()
@@ -139,6 +140,79 @@ class TestHashing(object):
         assert hash_results[1] != hash_results[3]
         assert hash_results[2] == hash_results[3]
 
+    @pytest.mark.asyncio
+    async def test_hash_process_pool(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        sh = SmartHash(ds.root_dir, manifest.cache_mgr.cache_root, manifest.dataset_revision, num_workers=3)
+        cache_dir = manifest.cache_mgr.cache_root
+        revision = manifest.dataset_revision
+
+        os.makedirs(os.path.join(cache_dir, revision, "test_dir"))
+        filenames = [f"test{i}.txt" for i in range(10)]
+        for cnt, f in enumerate(filenames):
+            helper_append_file(cache_dir, revision, f, "sdfadfgfdgh" * (cnt * 100000 + 1))
+        filenames.append('test_dir/')
+        filenames.append('missing.txt')
+
+        expected = list()
+        for f in filenames[:10]:
+            h = blake2b()
+            with open(sh.get_abs_path(f), 'rb') as fh:
+                h.update(fh.read())
+            expected.append(h.hexdigest())
+
+        hash_results = await sh.hash(filenames)
+        assert hash_results[:10] == expected
+        assert len(hash_results[10]) == 128
+        assert hash_results[11] is None
+
+    @pytest.mark.asyncio
+    async def test_hash_as_completed(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        sh = SmartHash(ds.root_dir, manifest.cache_mgr.cache_root, manifest.dataset_revision, num_workers=2)
+        cache_dir = manifest.cache_mgr.cache_root
+        revision = manifest.dataset_revision
+
+        filenames = ["test1.txt", "test2.txt", "test3.txt"]
+        for f in filenames:
+            helper_append_file(cache_dir, revision, f, f"contents of {f}")
+
+        ordered_result = await sh.hash(filenames)
+        streamed_result = dict()
+        async for idx, hash_str in sh.hash_as_completed(filenames):
+            streamed_result[idx] = hash_str
+
+        assert sorted(streamed_result.keys()) == [0, 1, 2]
+        assert [streamed_result[i] for i in range(3)] == ordered_result
+
+    @pytest.mark.asyncio
+    async def test_hash_as_completed_backpressure(self, mock_dataset_with_manifest, monkeypatch):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        sh = SmartHash(ds.root_dir, manifest.cache_mgr.cache_root, manifest.dataset_revision, num_workers=1)
+        cache_dir = manifest.cache_mgr.cache_root
+        revision = manifest.dataset_revision
+
+        filenames = [f"test{i}.txt" for i in range(10)]
+        for f in filenames:
+            helper_append_file(cache_dir, revision, f, f"contents of {f}")
+
+        submitted = list()
+        original = sh._indexed_file_hash
+
+        async def tracked_file_hash(index, path, executor):
+            submitted.append(index)
+            return await original(index, path, executor)
+        monkeypatch.setattr(sh, '_indexed_file_hash', tracked_file_hash)
+
+        # Files are only submitted as results are consumed
+        results = list()
+        async for idx, hash_str in sh.hash_as_completed(filenames, max_in_flight=3):
+            assert len(submitted) <= len(results) + 3
+            results.append((idx, hash_str))
+
+        assert sorted(idx for idx, _ in results) == list(range(10))
+        assert dict(results) == dict(enumerate(await sh.hash(filenames)))
+
     def test_fast_hash_save(self, mock_dataset_with_manifest):
         ds, manifest, working_dir = mock_dataset_with_manifest
         sh = SmartHash(ds.root_dir, manifest.cache_mgr.cache_root, manifest.dataset_revision)
@@ -146,18 +220,18 @@ class TestHashing(object):
         revision = manifest.dataset_revision
 
         assert sh.fast_hash_data == {}
-        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash")) is False
+        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash.db")) is False
         filename = "test1.txt"
         helper_append_file(cache_dir, revision, filename, "pupper")
 
         hash_result1 = sh.fast_hash([filename], save=False)
         assert sh.fast_hash_data == {}
-        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash")) is False
+        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash.db")) is False
         hash_result2 = sh.fast_hash([filename])
 
         assert hash_result1 == hash_result2
         assert filename in sh.fast_hash_data
-        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash")) is True
+        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash.db")) is True
 
     def test_has_changed_fast(self, mock_dataset_with_manifest):
         ds, manifest, working_dir = mock_dataset_with_manifest
@@ -166,7 +240,7 @@ class TestHashing(object):
         revision = manifest.dataset_revision
 
         assert sh.fast_hash_data == {}
-        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash")) is False
+        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash.db")) is False
         filename = "test1.txt"
         helper_append_file(cache_dir, revision, filename, "pupper")
 
@@ -178,7 +252,7 @@ class TestHashing(object):
         assert fname == "test1.txt"
         assert fsize == '6'
         assert sh.fast_hash_data is not None
-        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash")) is True
+        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash.db")) is True
         assert sh.is_cached(filename) is True
 
         assert sh.has_changed_fast(filename) is False
@@ -217,7 +291,7 @@ class TestHashing(object):
         assert fname == "test1.txt"
         assert fsize == '6'
         assert sh.fast_hash_data is not None
-        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash")) is True
+        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash.db")) is True
         assert sh.is_cached(filename) is True
         assert sh.has_changed_fast(filename) is False
 
@@ -310,3 +384,76 @@ class TestHashing(object):
         assert len(deleted) == 2
         assert deleted[0] == "test2.txt"
         assert deleted[1] == "test3.txt"
+
+    def test_fast_hash_migrate_legacy_file(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        cache_dir = manifest.cache_mgr.cache_root
+        revision = manifest.dataset_revision
+
+        filenames = ["test1.txt", "test2.txt"]
+        for f in filenames:
+            helper_append_file(cache_dir, revision, f, "sdfadfgfdgh")
+
+        sh = SmartHash(ds.root_dir, cache_dir, revision)
+        hash_results = sh.fast_hash(filenames, save=False)
+
+        # Write a fast hash file in the legacy pickle format
+        with open(os.path.join(cache_dir, revision, ".smarthash"), 'wb') as mf:
+            pickle.dump({f: h for f, h in zip(filenames, hash_results)}, mf, pickle.HIGHEST_PROTOCOL)
+
+        sh = SmartHash(ds.root_dir, cache_dir, revision)
+        assert sh.is_cached("test1.txt") is True
+        assert sh.has_changed_fast("test1.txt") is False
+        assert sh.fast_hash_data["test2.txt"] == hash_results[1]
+        assert len(sh.fast_hash_data) == 2
+        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash")) is False
+        assert os.path.exists(os.path.join(cache_dir, revision, ".smarthash.db")) is True
+
+    def test_delete_fast_hashes(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        sh = SmartHash(ds.root_dir, manifest.cache_mgr.cache_root, manifest.dataset_revision)
+        cache_dir = manifest.cache_mgr.cache_root
+        revision = manifest.dataset_revision
+
+        filenames = ["test1.txt", "test2.txt", "test3.txt"]
+        for f in filenames:
+            helper_append_file(cache_dir, revision, f, "sdfadfgfdgh")
+
+        sh.fast_hash(filenames)
+        sh.delete_fast_hashes(["test2.txt"])
+        assert sorted(sh.fast_hash_data.keys()) == ["test1.txt", "test3.txt"]
+
+        # Updating a single file only touches that entry
+        helper_append_file(cache_dir, revision, "test1.txt", "more")
+        assert sh.has_changed_fast("test1.txt") is True
+        sh.fast_hash(["test1.txt"])
+        assert sh.has_changed_fast("test1.txt") is False
+        assert sh.has_changed_fast("test3.txt") is False
+
+        sh2 = SmartHash(ds.root_dir, cache_dir, revision)
+        assert sorted(sh2.fast_hash_data.keys()) == ["test1.txt", "test3.txt"]
+        assert sh2.fast_hash_data.get_inode("test1.txt") == os.stat(sh2.get_abs_path("test1.txt")).st_ino
+
+    def test_local_bytes(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        sh = SmartHash(ds.root_dir, manifest.cache_mgr.cache_root, manifest.dataset_revision)
+        cache_dir = manifest.cache_mgr.cache_root
+        revision = manifest.dataset_revision
+        assert sh.fast_hash_data.local_bytes() == 0
+
+        os.makedirs(os.path.join(cache_dir, revision, "dir1"))
+        helper_append_file(cache_dir, revision, "test1.txt", "a" * 10)
+        helper_append_file(cache_dir, revision, "dir1/test2.txt", "b" * 20)
+        sh.fast_hash(["test1.txt", "dir1/", "dir1/test2.txt"])
+        assert sh.fast_hash_data.local_bytes() == 30
+
+        # Updates replace the previous size, and directories are not counted
+        helper_append_file(cache_dir, revision, "test1.txt", "a" * 5)
+        sh.fast_hash(["test1.txt"])
+        assert sh.fast_hash_data.local_bytes() == 35
+
+        sh.delete_fast_hashes(["dir1/test2.txt"])
+        assert sh.fast_hash_data.local_bytes() == 15
+
+        sh.fast_hash_data.clear()
+        assert sh.fast_hash_data.local_bytes() == 0
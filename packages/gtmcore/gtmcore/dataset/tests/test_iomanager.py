@@ -1,6 +1,6 @@
 import pytest
 import os
-import glob
+import json
 import uuid
 import shutil
 from aioresponses import aioresponses
@@ -12,6 +12,7 @@ from gtmcore.fixtures.datasets import mock_dataset_with_cache_dir, mock_dataset_
     USERNAME, helper_compress_file, mock_dataset_with_manifest_bg_tests
 from gtmcore.fixtures.fixtures import _create_temp_work_dir, mock_config_file_background_tests
 from gtmcore.dataset.io import PushResult, PushObject
+from gtmcore.dataset.manifest.pushqueue import PushQueue
 
 
 def chunk_update_callback(completed_chunk: bool):
@@ -28,12 +29,24 @@ def mock_dataset_head():
         yield
 
 
+class StandInObjectService(object):
+    """A local stand-in for the object service's batched existence check, backed by a set of stored object ids"""
+    def __init__(self, object_ids=None):
+        self.object_ids = set(object_ids or list())
+        self.checked_batches = list()
+
+    def exists_callback(self, request):
+        object_ids = json.loads(request.body)['object_ids']
+        self.checked_batches.append(object_ids)
+        return 200, {}, json.dumps({'existing': [x for x in object_ids if x in self.object_ids]})
+
+
 class TestIOManager(object):
     def test_init(self, mock_dataset_with_manifest):
         ds, manifest, working_dir = mock_dataset_with_manifest
         iom = IOManager(ds, manifest)
         assert isinstance(iom, IOManager)
-        assert isinstance(iom.push_dir, str)
+        assert isinstance(iom.push_queue, PushQueue)
 
     def test_objects_to_push(self, mock_dataset_with_manifest):
         ds, manifest, working_dir = mock_dataset_with_manifest
@@ -73,10 +86,6 @@ class TestIOManager(object):
         helper_append_file(manifest.cache_mgr.cache_root, revision, "other_dir/test4.txt", "test content 4")
         manifest.sweep_all_changes()
 
-        # Write a .DS_Store file in the objects dir to make sure it gets skipped
-        with open(os.path.join(manifest.cache_mgr.cache_root, 'objects', '.push', '.DS_Store'), 'wt') as ff:
-            ff.write("")
-
         obj_to_push = iom.objects_to_push(remove_duplicates=True)
 
         assert len(obj_to_push) == 2
@@ -175,11 +184,11 @@ class TestIOManager(object):
                                  headers={'Etag': '12341234'},
                                  status=200)
 
-            assert len(glob.glob(f'{iom.push_dir}/*')) == 1
+            assert len(iom.push_queue.revisions()) == 1
             iom.dataset.backend.set_default_configuration("test-user", "abcd", '1234')
 
             result = iom.push_objects(obj_to_push, chunk_update_callback)
-            assert len(glob.glob(f'{iom.push_dir}/*')) == 1
+            assert len(iom.push_queue.revisions()) == 1
 
             assert len(result.success) == 2
             assert len(result.failure) == 0
@@ -235,12 +244,12 @@ class TestIOManager(object):
                                  headers={'Etag': '12341234'},
                                  status=200)
 
-            assert len(glob.glob(f'{iom.push_dir}/*')) == 1
+            assert len(iom.push_queue.revisions()) == 1
             iom.dataset.backend.set_default_configuration("test-user", "abcd", '1234')
 
             obj_to_push = iom.objects_to_push(remove_duplicates=True)
             result = iom.push_objects(obj_to_push, chunk_update_callback)
-            assert len(glob.glob(f'{iom.push_dir}/*')) == 1
+            assert len(iom.push_queue.revisions()) == 1
 
             assert len(result.success) == 2
             assert len(result.failure) == 0
@@ -298,11 +307,11 @@ class TestIOManager(object):
                                  payload={},
                                  status=500)
     
-            assert len(glob.glob(f'{iom.push_dir}/*')) == 1
+            assert len(iom.push_queue.revisions()) == 1
             iom.dataset.backend.set_default_configuration("test-user", "abcd", '1234')
     
             result = iom.push_objects(obj_to_push, chunk_update_callback)
-            assert len(glob.glob(f'{iom.push_dir}/*')) == 1
+            assert len(iom.push_queue.revisions()) == 1
 
             assert len(result.success) == 1
             assert len(result.failure) == 1
@@ -374,11 +383,11 @@ class TestIOManager(object):
                                      body=data2.read(), status=200,
                                      content_type='application/octet-stream')
 
-            assert len(glob.glob(f'{iom.push_dir}/*')) == 1
+            assert len(iom.push_queue.revisions()) == 1
             iom.dataset.backend.set_default_configuration("test-user", "abcd", '1234')
 
             result = iom.pull_objects(keys=["test1.txt"], progress_update_fn=chunk_update_callback)
-            assert len(glob.glob(f'{iom.push_dir}/*')) == 1
+            assert len(iom.push_queue.revisions()) == 1
             assert len(result.success) == 1
             assert len(result.failure) == 0
             assert result.success[0].object_path == obj_to_push[0].object_path
@@ -389,7 +398,7 @@ class TestIOManager(object):
                 assert "test content 1" == dd.read()
 
             result = iom.pull_objects(keys=["test2.txt"], progress_update_fn=chunk_update_callback)
-            assert len(glob.glob(f'{iom.push_dir}/*')) == 1
+            assert len(iom.push_queue.revisions()) == 1
             assert len(result.success) == 1
             assert len(result.failure) == 0
             assert result.success[0].object_path == obj_to_push[1].object_path
@@ -401,6 +410,64 @@ class TestIOManager(object):
             with open(obj2_target, 'rt') as dd:
                 assert "test content 2" == dd.read()
 
+    def test_pull_objects_chunked(self, mock_dataset_with_manifest, mock_dataset_head):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        ds.client_config.config['datasets']['chunking'] = {'enabled': True, 'min_file_size': 8192,
+                                                           'avg_chunk_size': 1024, 'min_chunk_size': 256,
+                                                           'max_chunk_size': 4096}
+        iom = IOManager(ds, manifest)
+
+        data = os.urandom(50000)
+        with open(os.path.join(manifest.current_revision_dir, "large.bin"), 'wb') as fh:
+            fh.write(data)
+        manifest.sweep_all_changes()
+        pushed_objects = {obj.object_path for obj in iom.objects_to_push()}
+        with open(os.path.join(manifest.current_revision_dir, "large.bin"), 'ab') as fh:
+            fh.write(b'new rows')
+        manifest.sweep_all_changes()
+
+        # Only the new chunk and chunk list are in the remote, since the first version is still stored locally
+        entry = manifest.manifest['large.bin']
+        new_objects = {obj.object_path for obj in iom.objects_to_push()} - pushed_objects
+        assert len(new_objects) == 2
+        remote_objects = dict()
+        for object_path in new_objects:
+            _, object_id = object_path.rsplit('/', 1)
+            remote_objects[object_id] = os.path.join('/tmp', uuid.uuid4().hex)
+            shutil.copyfile(object_path, f"{remote_objects[object_id]}.raw")
+            helper_compress_file(f"{remote_objects[object_id]}.raw", remote_objects[object_id])
+        assert entry['c'] in remote_objects
+
+        # Remove the latest version, its chunk list, and all chunk objects
+        manifest.chunk_store.remove_chunk_objects([os.path.basename(obj.object_path)
+                                                   for obj in iom.objects_to_push()])
+        os.remove(manifest.dataset_to_object_path('large.bin'))
+        os.remove(os.path.join(manifest.current_revision_dir, 'large.bin'))
+        os.remove(manifest.chunk_store.object_path(entry['c']))
+        iom.push_queue.clear()
+
+        with aioresponses() as mocked_responses:
+            for object_id, source in remote_objects.items():
+                mocked_responses.get(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{object_id}',
+                                     payload={"presigned_url": f"https://dummyurl.com/{object_id}?params=1",
+                                              "namespace": ds.namespace, "obj_id": object_id, "dataset": ds.name},
+                                     status=200)
+                with open(source, 'rb') as fh:
+                    mocked_responses.get(f"https://dummyurl.com/{object_id}?params=1", body=fh.read(), status=200,
+                                         content_type='application/octet-stream')
+
+            iom.dataset.backend.set_default_configuration("test-user", "abcd", '1234')
+            completed = list()
+            result = iom.pull_objects(keys=["large.bin"],
+                                      progress_update_fn=lambda completed_bytes: completed.append(completed_bytes))
+
+        assert len(result.success) == 1
+        assert len(result.failure) == 0
+        with open(os.path.join(manifest.current_revision_dir, 'large.bin'), 'rb') as fh:
+            assert fh.read() == data + b'new rows'
+        assert manifest.chunk_store.missing_chunks(entry['c']) == []
+        assert sum(completed) == 50008
+
     def test__get_pull_all_keys(self, mock_dataset_with_manifest):
         ds, manifest, working_dir = mock_dataset_with_manifest
         iom = IOManager(ds, manifest)
@@ -458,7 +525,7 @@ class TestIOManager(object):
         assert os.path.exists(file2) is True
         assert os.path.exists(file3) is False
 
-    def test_compute_pull_batches(self, mock_dataset_with_manifest_bg_tests):
+    def test_compute_pull_keys(self, mock_dataset_with_manifest_bg_tests):
         ds, manifest, working_dir = mock_dataset_with_manifest_bg_tests
         iom = IOManager(ds, manifest)
 
@@ -472,7 +539,7 @@ class TestIOManager(object):
         manifest.sweep_all_changes()
 
         with pytest.raises(ValueError):
-            iom.compute_pull_batches()
+            iom.compute_pull_keys()
 
         # Remove all files so everything needs to be pulled
         rev_dir = os.path.join(manifest.cache_mgr.cache_root, manifest.dataset_revision)
@@ -480,16 +547,13 @@ class TestIOManager(object):
         shutil.rmtree(rev_dir)
         shutil.rmtree(object_dir)
 
-        key_batches, total_bytes, num_files = iom.compute_pull_batches(pull_all=True)
-        assert num_files == 5
+        keys, total_bytes = iom.compute_pull_keys(pull_all=True)
+        assert len(keys) == 5
         assert total_bytes == (4*4300000) + (14*4)
-        assert len(key_batches) == 2
-        assert len(key_batches[0]) == 4
-        assert len(key_batches[1]) == 1
-        assert key_batches[1][0] == 'test1.txt'
+        assert sorted(keys) == ['other_dir/test3.txt', 'test1.txt', 'test2.txt', 'test4.txt', 'test5.txt']
 
-    def test_compute_push_batches(self, mock_dataset_with_manifest_bg_tests):
-        """Test compute push batches, verifying it works OK when you've deleted some files"""
+    def test_compute_push_objects(self, mock_dataset_with_manifest_bg_tests):
+        """Test compute push objects, verifying it works OK when you've deleted some files"""
         ds, manifest, working_dir = mock_dataset_with_manifest_bg_tests
         iom = IOManager(ds, manifest)
 
@@ -508,10 +572,59 @@ class TestIOManager(object):
         manifest.delete(['test5.txt'])
         assert len(manifest.manifest) == 5
 
-        key_batches, total_bytes, num_files = iom.compute_push_batches()
-        assert num_files == 5
+        objs, total_bytes = iom.compute_push_objects()
+        assert len(objs) == 5
         assert total_bytes == (4*4300000) + (14*4)
-        assert len(key_batches) == 2
-        assert len(key_batches[0]) == 4
-        assert len(key_batches[1]) == 1
-        assert key_batches[1][0].dataset_path == 'test1.txt'
+        assert sorted(obj.dataset_path for obj in objs) == ['other_dir/test3.txt', 'test1.txt', 'test2.txt', 'test4.txt',
+                                                            'test5.txt']
+
+    def test_compute_push_objects_skips_existing(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        iom = IOManager(ds, manifest)
+        ds.client_config.config['datasets']['backends']['gigantum_object_v1']['existence_check_batch_size'] = 3
+
+        revision = manifest.dataset_revision
+        for i in range(5):
+            helper_append_file(manifest.cache_mgr.cache_root, revision, f"test{i}.txt", f"test content {i}" * 100)
+        manifest.sweep_all_changes()
+
+        all_objects = iom.objects_to_push()
+        object_ids = [os.path.basename(obj.object_path) for obj in all_objects]
+        service = StandInObjectService(object_ids[0:2])
+
+        # Without a session, the check is skipped
+        objs, total_bytes = iom.compute_push_objects()
+        assert len(objs) == 5
+        assert iom.existing_push_objects == []
+
+        iom.dataset.backend.set_default_configuration("test-user", "abcd", '1234')
+        with responses.RequestsMock() as rsps:
+            rsps.add_callback(responses.POST, f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/exists',
+                              callback=service.exists_callback, content_type='application/json')
+            objs, total_bytes = iom.compute_push_objects()
+
+        assert [len(batch) for batch in service.checked_batches] == [3, 2]
+        assert len(objs) == 3
+        assert sorted(os.path.basename(obj.object_path) for obj in objs) == sorted(object_ids[2:])
+        assert sorted(obj.dataset_path for obj in iom.existing_push_objects) == ['test0.txt', 'test1.txt']
+        assert iom.existing_push_bytes == 2 * 1400
+        assert total_bytes == 3 * 1400
+
+    def test_compute_push_objects_existence_check_unsupported(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        iom = IOManager(ds, manifest)
+
+        revision = manifest.dataset_revision
+        helper_append_file(manifest.cache_mgr.cache_root, revision, "test1.txt", "test content 1")
+        helper_append_file(manifest.cache_mgr.cache_root, revision, "test2.txt", "test content 2")
+        manifest.sweep_all_changes()
+
+        iom.dataset.backend.set_default_configuration("test-user", "abcd", '1234')
+        with responses.RequestsMock() as rsps:
+            rsps.add(responses.POST, f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/exists',
+                     status=404)
+            objs, total_bytes = iom.compute_push_objects()
+
+        # All objects are pushed if the service can't tell which exist
+        assert len(objs) == 2
+        assert iom.existing_push_objects == []
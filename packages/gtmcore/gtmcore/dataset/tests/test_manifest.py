@@ -1,11 +1,13 @@
 import pytest
 import os
-from collections import OrderedDict
 import time
-import redis
 import glob
+import json
+from collections import OrderedDict
+from mock import patch
 
 from gtmcore.dataset import Manifest
+from gtmcore.dataset.manifest.index import ManifestIndex
 from gtmcore.inventory.inventory import InventoryManager
 
 from gtmcore.fixtures.datasets import mock_dataset_with_cache_dir, mock_dataset_with_manifest, helper_append_file, \
@@ -16,7 +18,7 @@ class TestManifest(object):
     def test_init(self, mock_dataset_with_manifest):
         ds, manifest, working_dir = mock_dataset_with_manifest
 
-        assert isinstance(manifest.manifest, OrderedDict)
+        assert isinstance(manifest.manifest, ManifestIndex)
         assert manifest.dataset_revision == ds.git.repo.head.commit.hexsha
 
     def test_get_num_hashing_cpus(self, mock_dataset_with_manifest):
@@ -163,6 +165,42 @@ class TestManifest(object):
         assert 'test1.txt' not in m2.manifest
         assert 'test2.txt' in m2.manifest
 
+    def test_status_no_change(self, mock_dataset_with_manifest):
+        """Computing status of unchanged files only compares the fast hash, without hashing or reading the manifest"""
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        revision_dir = os.path.join(manifest.cache_mgr.cache_root, manifest.dataset_revision)
+
+        all_paths = list()
+        for dir_idx in range(10):
+            dir_name = f"dir_{dir_idx}/"
+            os.makedirs(os.path.join(revision_dir, dir_name))
+            all_paths.append(dir_name)
+            for file_idx in range(100):
+                rel_path = f"{dir_name}file_{file_idx}.txt"
+                with open(os.path.join(revision_dir, rel_path), 'wt') as fh:
+                    fh.write(rel_path)
+                all_paths.append(rel_path)
+
+        manifest.hasher.fast_hash(all_paths)
+
+        with patch('gtmcore.dataset.manifest.hash.hash_file_contents', side_effect=AssertionError("rehashed")), \
+                patch.object(ManifestIndex, '__contains__', side_effect=AssertionError("manifest read")):
+            status = manifest.status()
+
+        assert status.created == []
+        assert status.modified == []
+        assert status.deleted == []
+
+        # Changes are still detected
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "dir_5/file_5.txt", "changed")
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "dir_5/new_file.txt", "new")
+        os.remove(os.path.join(revision_dir, "dir_7/file_7.txt"))
+
+        status = manifest.status()
+        assert status.created == ["dir_5/new_file.txt"]
+        assert status.modified == ["dir_5/file_5.txt"]
+        assert status.deleted == ["dir_7/file_7.txt"]
+
     def test_update_complex(self, mock_dataset_with_manifest):
         ds, manifest, working_dir = mock_dataset_with_manifest
 
@@ -289,6 +327,87 @@ class TestManifest(object):
         assert file_info[3]['is_local'] is False
         assert file_info[3]['is_dir'] is False
 
+    def test_list_page(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+
+        os.makedirs(os.path.join(manifest.cache_mgr.cache_root, manifest.dataset_revision, "other_dir"))
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test1.txt", "asdfasdf")
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test2.txt", "asdfasdf")
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "other_dir/test4.txt",
+                           "dfasdfhfgjhg")
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "other_dir/test5.txt",
+                           "fdghdfgsa")
+        manifest.update()
+
+        file_info, has_next_page = manifest.list_page()
+        assert [x['key'] for x in file_info] == ["other_dir/", "other_dir/test4.txt", "other_dir/test5.txt",
+                                                 "test1.txt", "test2.txt"]
+        assert has_next_page is False
+
+        file_info, has_next_page = manifest.list_page(first=2)
+        assert [x['key'] for x in file_info] == ["other_dir/", "other_dir/test4.txt"]
+        assert has_next_page is True
+
+        file_info, has_next_page = manifest.list_page(first=2, after="other_dir/test4.txt")
+        assert [x['key'] for x in file_info] == ["other_dir/test5.txt", "test1.txt"]
+        assert file_info[1]['size'] == '8'
+        assert has_next_page is True
+
+        file_info, has_next_page = manifest.list_page(first=2, after="test1.txt")
+        assert [x['key'] for x in file_info] == ["test2.txt"]
+        assert has_next_page is False
+
+        # Positional cursors are still supported
+        file_info, has_next_page = manifest.list_page(first=2, after_index=1)
+        assert [x['key'] for x in file_info] == ["other_dir/test5.txt", "test1.txt"]
+        assert has_next_page is True
+
+        # Directory listing
+        file_info, has_next_page = manifest.list_page(prefix="other_dir/")
+        assert [x['key'] for x in file_info] == ["other_dir/test4.txt", "other_dir/test5.txt"]
+        assert has_next_page is False
+
+        file_info, has_next_page = manifest.list_page(first=1, after="other_dir/test4.txt", prefix="other_dir/")
+        assert [x['key'] for x in file_info] == ["other_dir/test5.txt"]
+        assert has_next_page is False
+
+        with pytest.raises(ValueError):
+            manifest.list_page(first=0)
+
+    def test_list_page_prefix_positional(self, mock_dataset_with_manifest):
+        """Paging through a directory gives the same pages with positional cursors as with key cursors"""
+        ds, manifest, working_dir = mock_dataset_with_manifest
+
+        os.makedirs(os.path.join(manifest.cache_mgr.cache_root, manifest.dataset_revision, "other_dir", "sub"))
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test1.txt", "asdfasdf")
+        for name in ["other_dir/a.txt", "other_dir/b.txt", "other_dir/sub/c.txt", "other_dir/sub/d.txt"]:
+            helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, name, name)
+        manifest.update()
+        expected = ["other_dir/a.txt", "other_dir/b.txt", "other_dir/sub/", "other_dir/sub/c.txt",
+                    "other_dir/sub/d.txt"]
+
+        for first in [1, 2, 3]:
+            by_index = list()
+            by_key = list()
+            after_index = None
+            after = None
+            while True:
+                file_info, has_next_page = manifest.list_page(first=first, after_index=after_index,
+                                                              prefix="other_dir/")
+                by_index.extend(x['key'] for x in file_info)
+                after_index = len(by_index) - 1
+
+                key_info, key_has_next_page = manifest.list_page(first=first, after=after, prefix="other_dir/")
+                by_key.extend(x['key'] for x in key_info)
+                after = by_key[-1]
+
+                assert [x['key'] for x in file_info] == [x['key'] for x in key_info]
+                assert has_next_page is key_has_next_page
+                if not has_next_page:
+                    break
+
+            assert by_index == by_key == expected
+
     def test_get(self, mock_dataset_with_manifest):
         ds, manifest, working_dir = mock_dataset_with_manifest
 
@@ -330,6 +449,39 @@ class TestManifest(object):
         assert file_info['is_dir'] is True
         assert 'modified_at' in file_info
 
+    def test_hash_files(self, mock_dataset_with_manifest, monkeypatch):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        monkeypatch.setattr('gtmcore.dataset.manifest.manifest.STORE_QUEUE_SIZE', 2)
+        revision_dir = manifest.current_revision_dir
+
+        filenames = [f"test{i}.txt" for i in range(20)]
+        for i, f in enumerate(filenames):
+            helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, f, "a" * i)
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "dup.txt", "a" * 5)
+
+        completed = list()
+        hash_result, fast_hash_result = manifest.hash_files(filenames + ["dup.txt", "missing.txt"],
+                                                            progress_update_fn=lambda completed_bytes:
+                                                            completed.append(completed_bytes))
+        assert sorted(completed) == sorted(list(range(20)) + [5])
+        assert hash_result[-1] is None
+        assert fast_hash_result[-1] is None
+        assert hash_result[5] == hash_result[20]
+
+        # Every file is stored as an object, linked back, and fast hashed
+        for f, h, fh in zip(filenames + ["dup.txt"], hash_result, fast_hash_result):
+            object_path = os.path.join(manifest.cache_mgr.cache_root, 'objects', h[0:8], h[8:16], h)
+            assert os.path.isfile(object_path)
+            assert os.stat(object_path).st_ino == os.stat(os.path.join(revision_dir, f)).st_ino
+            assert manifest.hasher.fast_hash_data[f] == fh
+            assert manifest.hasher.has_changed_fast(f) is False
+
+        # Each object is queued once per file
+        queued = manifest.push_queue.objects([manifest.dataset_revision])
+        assert sorted(obj.dataset_path for obj in queued) == sorted(filenames + ["dup.txt"])
+        assert len(set(obj.object_path for obj in queued)) == 20
+        assert manifest.push_queue.count([manifest.dataset_revision], remove_duplicates=True) == 20
+
     def test_sweep_all_changes(self, mock_dataset_with_manifest):
         ds, manifest, working_dir = mock_dataset_with_manifest
 
@@ -393,6 +545,79 @@ class TestManifest(object):
         assert 'test2.txt' in manifest.manifest
         assert 'test3.txt' in manifest.manifest
 
+    def test_link_revision_incremental(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        os.makedirs(os.path.join(manifest.cache_mgr.cache_root, manifest.dataset_revision, "other_dir"))
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test1.txt", "asdfasdfdf")
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "other_dir/test2.txt", "asdf")
+        manifest.sweep_all_changes()
+        revision = manifest.dataset_revision
+
+        # Committing moves the previous revision directory, including its fast hash index
+        helper_append_file(manifest.cache_mgr.cache_root, revision, "test3.txt", "dfg")
+        manifest.sweep_all_changes()
+        assert manifest.dataset_revision != revision
+        assert not os.path.exists(os.path.join(manifest.cache_mgr.cache_root, revision))
+        assert manifest.hasher.is_cached("test1.txt")
+        assert manifest.hasher.is_cached("test3.txt")
+        assert len(manifest.status().created) == 0
+
+        # Incremental linking only re-links and re-hashes the changed keys
+        revision_dir = os.path.join(manifest.cache_mgr.cache_root, manifest.dataset_revision)
+        os.remove(os.path.join(revision_dir, "test1.txt"))
+        os.remove(os.path.join(revision_dir, "other_dir", "test2.txt"))
+        manifest.link_revision(changed_keys=["test1.txt", "not_in_manifest.txt"])
+        assert os.path.isfile(os.path.join(revision_dir, "test1.txt"))
+        assert not os.path.exists(os.path.join(revision_dir, "other_dir", "test2.txt"))
+        assert manifest.hasher.is_cached("test1.txt")
+        assert not manifest.hasher.is_cached("not_in_manifest.txt")
+
+        # A full pass links everything
+        manifest.link_revision()
+        assert os.path.isfile(os.path.join(revision_dir, "other_dir", "test2.txt"))
+        assert len(manifest.status().modified) == 0
+
+        # An entry without a content hash has no object to link, and is skipped
+        manifest.manifest.upsert_many({"no_hash.txt": OrderedDict([('h', None), ('m', '1550000000.123'),
+                                                                   ('b', '3'), ('fn', 'manifest-1234.json')])})
+        manifest.link_revision()
+        assert not os.path.exists(os.path.join(revision_dir, "no_hash.txt"))
+        assert os.path.isfile(os.path.join(revision_dir, "test3.txt"))
+
+    def test_statistics(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        stats = manifest.statistics()
+        assert stats.num_files == 0
+        assert stats.local_bytes == 0
+        assert stats.file_type_distribution == []
+
+        os.makedirs(os.path.join(manifest.cache_mgr.cache_root, manifest.dataset_revision, "dir1"))
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test1.txt", "a" * 10)
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "dir1/test2.txt", "b" * 20)
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "dir1/data.csv", "c" * 30)
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "README", "d" * 40)
+        manifest.sweep_all_changes()
+
+        stats = manifest.statistics()
+        assert stats.num_files == 3
+        assert stats.total_bytes == 60
+        assert stats.local_bytes == 100
+        assert stats.file_type_distribution == [('.txt', 2), ('.csv', 1)]
+
+        # Files that are not available locally still count towards the dataset, but not the local bytes
+        manifest.delete(["dir1/test2.txt"])
+        os.remove(os.path.join(manifest.current_revision_dir, "test1.txt"))
+        manifest.hasher.delete_fast_hashes(["test1.txt"])
+        stats = manifest.statistics()
+        assert stats.num_files == 2
+        assert stats.total_bytes == 40
+        assert stats.local_bytes == 70
+        assert stats.file_type_distribution == [('.csv', 1), ('.txt', 1)]
+
+        # Statistics are the same after the index is rebuilt
+        manifest.force_reload()
+        assert manifest.statistics() == stats
+
     def test_sweep_all_changes_directory(self, mock_dataset_with_manifest):
         ds, manifest, working_dir = mock_dataset_with_manifest
 
@@ -868,7 +1093,7 @@ class TestManifest(object):
 
         assert 'IdeaPF.pdf' not in manifest.manifest
 
-        # Test reloading (should be from cache)
+        # Test reloading (should be from index)
         m2 = Manifest(ds, 'tester')
         assert len(m2.manifest) == 3
         assert 'IdeaPF.pdf' not in m2.manifest
@@ -876,8 +1101,7 @@ class TestManifest(object):
         assert 'test1.txt' in m2.manifest
 
         # Test reloading (should be from files)
-        client = redis.StrictRedis(db=1)
-        client.delete(m2._manifest_io.manifest_cache_key)
+        m2._manifest_io.evict()
 
         m3 = Manifest(ds, 'tester')
         assert len(m3.manifest) == 3
@@ -924,7 +1148,7 @@ class TestManifest(object):
         assert len(manifest.manifest) == 4
         assert manifest.manifest['test3.txt']['b'] == '17'
 
-        # Test reloading (should be from cache)
+        # Test reloading (should be from index)
 
         # Load new context
         ds = im.load_dataset(USERNAME, USERNAME, ds.name)
@@ -937,8 +1161,7 @@ class TestManifest(object):
         assert manifest.manifest['test3.txt']['b'] == '17'
 
         # Test reloading (should be from files)
-        client = redis.StrictRedis(db=1)
-        client.delete(manifest._manifest_io.manifest_cache_key)
+        manifest._manifest_io.evict()
 
         ds = im.load_dataset(USERNAME, USERNAME, ds.name)
         manifest = Manifest(ds, USERNAME)
@@ -951,6 +1174,53 @@ class TestManifest(object):
 
         assert len(glob.glob(os.path.join(ds.root_dir, 'manifest', 'manifest-*'))) == 3
 
+        # Every checkout context shares the same index
+        assert os.listdir(os.path.join(manifest.cache_mgr.cache_root, '.manifest')) == ['index.db']
+
+    def test_manifest_files_changed(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test1.txt", "asdfasdf")
+        manifest.update()
+
+        # An index file left by a previous version, keyed by checkout context
+        index_dir = os.path.join(manifest.cache_mgr.cache_root, '.manifest')
+        with open(os.path.join(index_dir, 'dataset-1-1234.db'), 'wb'):
+            pass
+
+        # Change the manifest files outside of the index, as a sync would
+        with open(os.path.join(ds.root_dir, 'manifest', 'manifest-synced.json'), 'wt') as mf:
+            json.dump({"synced.txt": {"h": "abc", "m": "1550000000.123", "b": "3"}}, mf)
+
+        m2 = Manifest(ds, USERNAME)
+        assert sorted(m2.manifest.keys()) == ['synced.txt', 'test1.txt']
+        assert sorted(os.listdir(index_dir)) == ['index.db']
+
+    def test_persist_keeps_shadowed_entries(self, mock_dataset_with_manifest):
+        """Each manifest file is rewritten from its own contents, including entries another manifest file shadows"""
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        manifest_dir = os.path.join(ds.root_dir, 'manifest')
+        for name, unique_path in [('manifest-aaaa.json', 'a.txt'), ('manifest-bbbb.json', 'b.txt')]:
+            with open(os.path.join(manifest_dir, name), 'wt') as mf:
+                json.dump(OrderedDict([(unique_path, {"h": "abc", "m": "1550000000.123", "b": "3"}),
+                                       ("shared.txt", {"h": name, "m": "1550000000.123", "b": "3"})]), mf)
+
+        m2 = Manifest(ds, USERNAME)
+        assert sorted(m2.manifest.keys()) == ['a.txt', 'b.txt', 'shared.txt']
+
+        # Update the unique entry of the manifest file whose `shared.txt` entry is shadowed by the other file
+        shadowed_file = 'manifest-aaaa.json' if m2.manifest['shared.txt']['fn'] == 'manifest-bbbb.json' \
+            else 'manifest-bbbb.json'
+        unique_path = 'a.txt' if shadowed_file == 'manifest-aaaa.json' else 'b.txt'
+        m2._manifest_io.add_or_update(unique_path, 'def', '1550000001.123', '4')
+        m2._manifest_io.persist()
+
+        with open(os.path.join(manifest_dir, shadowed_file), 'rt') as mf:
+            data = json.load(mf, object_pairs_hook=OrderedDict)
+        assert list(data.keys()) == [unique_path, 'shared.txt']
+        assert data[unique_path] == {"h": "def", "m": "1550000001.123", "b": "4"}
+        assert data['shared.txt']['h'] == shadowed_file
+        assert m2.manifest[unique_path]['h'] == 'def'
+
     def test_evict(self, mock_config_class):
         im, conf_file, working_dir = mock_config_class
         ds = im.create_dataset(USERNAME, USERNAME, 'dataset-1', description="my dataset 1",
@@ -992,11 +1262,7 @@ class TestManifest(object):
         manifest_file = f'manifest-{checkout_id}.json'
         os.remove(os.path.join(ds.root_dir, 'manifest', manifest_file))
 
-        # Reload classes
-        ds = im.load_dataset(USERNAME, USERNAME, 'dataset-1')
-        m = Manifest(ds, USERNAME)
-
-        # Verify manifest hasn't changed
+        # Verify manifest hasn't changed (the index is only checked against the manifest files when first loaded)
         assert len(m.manifest) == 3
         file_info = m.get("test1.txt")
         assert file_info['key'] == "test1.txt"
@@ -0,0 +1,193 @@
+import pytest
+import os
+import json
+from collections import OrderedDict
+
+from gtmcore.dataset.manifest.index import ManifestIndex, prefix_upper_bound, file_type
+from gtmcore.fixtures.datasets import mock_dataset_with_cache_dir, mock_dataset_with_manifest, helper_append_file
+
+
+def helper_entry(content_hash, num_bytes, manifest_file='manifest-1234.json'):
+    return OrderedDict([('h', content_hash), ('m', '1550000000.123'), ('b', num_bytes), ('fn', manifest_file)])
+
+
+@pytest.fixture()
+def mock_index(tmpdir):
+    index = ManifestIndex(os.path.join(str(tmpdir), '.manifest', 'test.db'))
+    data = [("test1.txt", helper_entry('aaa', '10')),
+            ("dir1/", helper_entry('bbb', '4096')),
+            ("dir1/test2.txt", helper_entry('ccc', '20')),
+            ("dir1/test3.txt", helper_entry('ddd', '30', 'manifest-5678.json')),
+            ("dir10/test4.txt", helper_entry('eee', '40')),
+            ("test0.txt", helper_entry('fff', '50', 'manifest-5678.json'))]
+    index.build(lambda: data)
+    yield index
+    index.close()
+
+
+class TestManifestIndex(object):
+    def test_prefix_upper_bound(self):
+        assert prefix_upper_bound("dir1/") == "dir10"
+        assert "dir1/test2.txt" < prefix_upper_bound("dir1/")
+        assert "dir10/test4.txt" >= prefix_upper_bound("dir1/")
+
+    def test_build(self, mock_index):
+        assert mock_index.is_built is True
+        assert len(mock_index) == 6
+        assert list(mock_index) == ["dir1/", "dir1/test2.txt", "dir1/test3.txt", "dir10/test4.txt",
+                                    "test0.txt", "test1.txt"]
+
+        # Building again is a no-op
+        mock_index.build(lambda: [("other.txt", helper_entry('zzz', '1'))])
+        assert len(mock_index) == 6
+        assert "other.txt" not in mock_index
+
+    def test_invalidate(self, mock_index):
+        mock_index.invalidate()
+        assert mock_index.is_built is False
+        assert len(mock_index) == 0
+
+        mock_index.build(lambda: [("other.txt", helper_entry('zzz', '1'))])
+        assert mock_index.is_built is True
+        assert list(mock_index) == ["other.txt"]
+
+    def test_build_signature(self, mock_index):
+        # An index built without a signature is rebuilt the first time one is given
+        mock_index.build(lambda: [("other.txt", helper_entry('zzz', '1'))], 'sig1')
+        assert list(mock_index) == ["other.txt"]
+        assert mock_index.source_signature == 'sig1'
+
+        mock_index.build(lambda: [("test1.txt", helper_entry('aaa', '10'))], 'sig1')
+        assert list(mock_index) == ["other.txt"]
+
+        # The signature of the manifest files changed
+        mock_index.build(lambda: [("test1.txt", helper_entry('aaa', '10'))], 'sig2')
+        assert list(mock_index) == ["test1.txt"]
+
+        mock_index.set_source_signature('sig3')
+        mock_index.build(lambda: [], 'sig3')
+        assert list(mock_index) == ["test1.txt"]
+
+    def test_point_lookup(self, mock_index):
+        assert "dir1/test2.txt" in mock_index
+        assert "dir1/test5.txt" not in mock_index
+        assert mock_index["dir1/test2.txt"] == helper_entry('ccc', '20')
+        assert mock_index.get("dir1/test5.txt") is None
+        with pytest.raises(KeyError):
+            _ = mock_index["dir1/test5.txt"]
+
+    def test_scan(self, mock_index):
+        assert [k for k, _ in mock_index.scan(limit=2)] == ["dir1/", "dir1/test2.txt"]
+        assert [k for k, _ in mock_index.scan(start_after="dir1/test2.txt", limit=3)] == \
+            ["dir1/test3.txt", "dir10/test4.txt", "test0.txt"]
+        assert [k for k, _ in mock_index.scan(start_after="test1.txt")] == []
+
+        items = list(mock_index.scan(start_after="dir10/test4.txt"))
+        assert items == [("test0.txt", helper_entry('fff', '50', 'manifest-5678.json')),
+                         ("test1.txt", helper_entry('aaa', '10'))]
+
+    def test_scan_batches(self, mock_index, monkeypatch):
+        monkeypatch.setattr('gtmcore.dataset.manifest.index.SCAN_BATCH_SIZE', 4)
+        assert len(list(mock_index.scan())) == 6
+        assert len(list(mock_index.scan(limit=5))) == 5
+        assert len(list(mock_index.scan(start_after="dir1/", limit=5))) == 5
+
+    def test_prefix(self, mock_index):
+        assert [k for k, _ in mock_index.scan(prefix="dir1/")] == ["dir1/", "dir1/test2.txt", "dir1/test3.txt"]
+        assert [k for k, _ in mock_index.scan(prefix="dir1/", start_after="dir1/")] == \
+            ["dir1/test2.txt", "dir1/test3.txt"]
+        assert [k for k, _ in mock_index.scan(prefix="dir1")] == ["dir1/", "dir1/test2.txt", "dir1/test3.txt",
+                                                                  "dir10/test4.txt"]
+        assert mock_index.count(prefix="dir1/") == 3
+        assert mock_index.count(prefix="dir2/") == 0
+        assert mock_index.count() == 6
+
+    def test_partial_updates(self, mock_index):
+        mock_index.upsert_many({"dir1/test2.txt": helper_entry('new', '21'),
+                                "test5.txt": helper_entry('ggg', '60', 'manifest-5678.json')})
+        mock_index.delete_many(["test0.txt"])
+
+        assert len(mock_index) == 6
+        assert mock_index["dir1/test2.txt"]['h'] == 'new'
+        assert "test0.txt" not in mock_index
+
+        assert mock_index["dir1/test2.txt"]['fn'] == 'manifest-1234.json'
+        assert mock_index["test5.txt"]['fn'] == 'manifest-5678.json'
+
+    def test_transaction_rollback(self, mock_index):
+        with pytest.raises(ValueError):
+            with mock_index.transaction():
+                mock_index.delete_many(["test0.txt", "test1.txt"])
+                assert len(mock_index) == 4
+                raise ValueError("fail")
+
+        assert len(mock_index) == 6
+        assert "test1.txt" in mock_index
+
+    def test_manifest_export(self, mock_dataset_with_manifest):
+        ds, manifest, working_dir = mock_dataset_with_manifest
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test1.txt", "asdfasdf")
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, "test2.txt", "dfg")
+        manifest.update()
+
+        index_file = manifest._manifest_io.index_file
+        assert os.path.exists(index_file)
+        assert index_file.startswith(manifest.cache_mgr.cache_root)
+
+        _, checkout_id = ds.checkout_id.rsplit('-', 1)
+        manifest_file = os.path.join(ds.root_dir, 'manifest', f'manifest-{checkout_id}.json')
+        with open(manifest_file, 'rt') as mf:
+            data = json.load(mf)
+        assert list(data.keys()) == ["test1.txt", "test2.txt"]
+        assert data["test2.txt"]['b'] == '3'
+        assert 'fn' not in data["test2.txt"]
+
+        # Rebuilding from the manifest files results in the same data
+        previous = list(manifest.manifest.items())
+        manifest.force_reload()
+        assert list(manifest.manifest.items()) == previous
+
+    def test_find_by_hash(self, mock_index, monkeypatch):
+        mock_index.upsert_many({"test5.txt": helper_entry('aaa', '10')})
+        assert [k for k, _ in mock_index.find_by_hash(['aaa'])] == ["test1.txt", "test5.txt"]
+        assert list(mock_index.find_by_hash(['zzz'])) == []
+
+        monkeypatch.setattr('gtmcore.dataset.manifest.index.HASH_LOOKUP_BATCH_SIZE', 1)
+        assert sorted(k for k, _ in mock_index.find_by_hash(['aaa', 'ccc', 'ccc'])) == \
+            ["dir1/test2.txt", "test1.txt", "test5.txt"]
+
+    def test_file_type(self):
+        assert file_type("dir1/test.txt") == ".txt"
+        assert file_type("data.tar.gz") == ".gz"
+        assert file_type("dir1/") is None
+        assert file_type("dir1/.hidden.txt") is None
+        assert file_type("README") is None
+
+    def test_statistics(self, mock_index):
+        stats = mock_index.statistics()
+        assert stats.num_files == 5
+        assert stats.total_bytes == 150
+        assert stats.file_types == {'.txt': 5}
+
+        mock_index.upsert_many({"dir1/test2.txt": helper_entry('new', '25'),
+                                "data.csv": helper_entry('ggg', '60'),
+                                ".hidden.csv": helper_entry('hhh', '70'),
+                                "README": helper_entry('iii', '80')})
+        mock_index.delete_many(["test0.txt"])
+        stats = mock_index.statistics()
+        assert stats.num_files == 5
+        assert stats.total_bytes == 165
+        assert stats.file_types == {'.txt': 4, '.csv': 1}
+
+        # Statistics are rolled back with the transaction
+        with pytest.raises(ValueError):
+            with mock_index.transaction():
+                mock_index.delete_many(["data.csv"])
+                raise ValueError("fail")
+        assert mock_index.statistics().file_types == {'.txt': 4, '.csv': 1}
+
+        # And recomputed when the index is rebuilt
+        mock_index.invalidate()
+        assert mock_index.statistics().num_files == 0
+        mock_index.build(lambda: [("a.txt", helper_entry('zzz', '1')), ("a.txt", helper_entry('zzz', '2'))])
+        assert mock_index.statistics() == (1, 2, {'.txt': 1})
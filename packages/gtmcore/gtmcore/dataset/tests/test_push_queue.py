@@ -0,0 +1,100 @@
+import pytest
+import os
+
+from gtmcore.dataset.io import PushObject
+from gtmcore.dataset.manifest.pushqueue import PushQueue, PUSH_QUEUE_FILE
+
+
+def helper_push_object(cache_root, revision, dataset_path, object_id):
+    return PushObject(object_path=os.path.join(cache_root, 'objects', object_id[0:8], object_id[8:16], object_id),
+                      revision=revision, dataset_path=dataset_path)
+
+
+@pytest.fixture()
+def mock_push_queue(tmpdir):
+    queue = PushQueue(str(tmpdir))
+    yield queue
+    queue.close()
+
+
+class TestPushQueue(object):
+    def test_empty(self, mock_push_queue):
+        assert mock_push_queue.objects() == []
+        assert mock_push_queue.count() == 0
+        assert mock_push_queue.revisions() == {}
+        assert mock_push_queue.object_ids() == set()
+        mock_push_queue.clear()
+
+        # Reading doesn't create the queue
+        assert not os.path.exists(os.path.join(mock_push_queue.cache_root, PUSH_QUEUE_FILE))
+
+    def test_enqueue_and_count(self, mock_push_queue):
+        root = mock_push_queue.cache_root
+        mock_push_queue.enqueue_many([helper_push_object(root, 'rev1', 'b.txt', 'a' * 32),
+                                      helper_push_object(root, 'rev1', 'a.txt', 'a' * 32),
+                                      helper_push_object(root, 'rev2', 'c.txt', 'c' * 32)])
+
+        # Queueing the same object again is ignored
+        mock_push_queue.enqueue_many([helper_push_object(root, 'rev1', 'b.txt', 'a' * 32)])
+
+        assert mock_push_queue.revisions() == {'rev1': 2, 'rev2': 1}
+        assert len(mock_push_queue) == 3
+        assert mock_push_queue.count(['rev1']) == 2
+        assert mock_push_queue.count(['rev1'], remove_duplicates=True) == 1
+        assert mock_push_queue.count(['rev1', 'rev3'], remove_duplicates=True) == 1
+        assert mock_push_queue.count(remove_duplicates=True) == 2
+        assert mock_push_queue.object_ids() == {'a' * 32, 'c' * 32}
+
+        assert [o.dataset_path for o in mock_push_queue.objects()] == ['a.txt', 'b.txt', 'c.txt']
+        assert [o.dataset_path for o in mock_push_queue.objects(['rev2'])] == ['c.txt']
+        assert [o.dataset_path for o in mock_push_queue.objects(remove_duplicates=True)] == ['a.txt', 'c.txt']
+        assert mock_push_queue.objects()[0] == helper_push_object(root, 'rev1', 'a.txt', 'a' * 32)
+
+    def test_remove_and_clear(self, mock_push_queue):
+        root = mock_push_queue.cache_root
+        objs = [helper_push_object(root, 'rev1', 'a.txt', 'a' * 32),
+                helper_push_object(root, 'rev1', 'b.txt', 'b' * 32),
+                helper_push_object(root, 'rev2', 'c.txt', 'c' * 32),
+                helper_push_object(root, 'rev2', 'd.txt', 'b' * 32)]
+        mock_push_queue.enqueue_many(objs)
+
+        # Every file with the contents of a removed object is removed
+        mock_push_queue.remove_object_ids(['b' * 32, 'c' * 32])
+        assert mock_push_queue.revisions() == {'rev1': 1}
+        assert mock_push_queue.objects() == objs[0:1]
+        mock_push_queue.remove_object_ids([])
+
+        mock_push_queue.clear()
+        assert mock_push_queue.revisions() == {}
+        assert mock_push_queue.count() == 0
+
+    def test_shared_between_instances(self, mock_push_queue):
+        root = mock_push_queue.cache_root
+        mock_push_queue.enqueue_many([helper_push_object(root, 'rev1', 'a.txt', 'a' * 32)])
+
+        other_queue = PushQueue(root)
+        try:
+            assert other_queue.count() == 1
+            other_queue.clear()
+        finally:
+            other_queue.close()
+
+        assert mock_push_queue.count() == 0
+
+    def test_migrate_legacy_push_files(self, mock_push_queue):
+        root = mock_push_queue.cache_root
+        a = helper_push_object(root, 'rev1', 'dir/a.txt', 'a' * 32)
+        b = helper_push_object(root, 'rev1', 'b.txt', 'b' * 32)
+        c = helper_push_object(root, 'rev2', 'c.txt', 'a' * 32)
+
+        os.makedirs(mock_push_queue.legacy_dir)
+        with open(os.path.join(mock_push_queue.legacy_dir, 'rev1'), 'wt') as fh:
+            fh.write(f"{a.dataset_path},{a.object_path}\n{b.dataset_path},{b.object_path}\n")
+        with open(os.path.join(mock_push_queue.legacy_dir, 'rev2'), 'wt') as fh:
+            fh.write(f"{c.dataset_path},{c.object_path}\n")
+        with open(os.path.join(mock_push_queue.legacy_dir, '.DS_Store'), 'wt') as fh:
+            fh.write("")
+
+        assert mock_push_queue.revisions() == {'rev1': 2, 'rev2': 1}
+        assert mock_push_queue.objects() == [b, a, c]
+        assert not os.path.exists(mock_push_queue.legacy_dir)
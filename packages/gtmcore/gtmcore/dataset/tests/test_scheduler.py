@@ -0,0 +1,11 @@
+import pytest
+
+from gtmcore.dataset.io.scheduler import order_largest_first
+
+
+class TestScheduler(object):
+    def test_order_largest_first(self):
+        assert order_largest_first(['a', 'b', 'c', 'd'], [1, 5, 1, 3]) == ['b', 'd', 'a', 'c']
+        assert order_largest_first([], []) == []
+        with pytest.raises(ValueError):
+            order_largest_first(['a'], [])
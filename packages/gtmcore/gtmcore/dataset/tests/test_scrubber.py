@@ -0,0 +1,197 @@
+import copy
+import pytest
+import os
+
+from gtmcore.dataset.manifest.scrubber import IntegrityScrubber, ScrubState, get_scrub_throttle
+from gtmcore.fixtures.datasets import mock_dataset_with_cache_dir, mock_dataset_with_manifest, helper_append_file
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingThrottle(object):
+    def __init__(self):
+        self.acquired = list()
+
+    def acquire(self, num_bytes):
+        self.acquired.append(num_bytes)
+
+
+def helper_modify_file(manifest, key, contents):
+    """Change a file in place, without updating the manifest"""
+    with open(os.path.join(manifest.cache_mgr.cache_root, manifest.dataset_revision, key), 'wt') as fh:
+        fh.write(contents)
+
+
+@pytest.fixture()
+def mock_dataset_with_files(mock_dataset_with_manifest):
+    """A pytest fixture that creates a dataset with 4 committed files"""
+    ds, manifest, working_dir = mock_dataset_with_manifest
+    os.makedirs(os.path.join(manifest.cache_mgr.cache_root, manifest.dataset_revision, "dir"))
+    for n, key in enumerate(["a.txt", "b.txt", "dir/c.txt", "d.txt"]):
+        helper_append_file(manifest.cache_mgr.cache_root, manifest.dataset_revision, key, str(n) * (100 * (n + 1)))
+    manifest.sweep_all_changes()
+    yield ds, manifest
+
+
+@pytest.fixture()
+def mock_scrubber(mock_dataset_with_files):
+    ds, manifest = mock_dataset_with_files
+    clock = FakeClock()
+    scrubber = IntegrityScrubber(manifest, throttle=RecordingThrottle(), reverify_after=3600, checkpoint_interval=2,
+                                 clock=clock)
+    yield scrubber, manifest, clock
+    scrubber.close()
+
+
+class TestIntegrityScrubber(object):
+    def test_scrub(self, mock_scrubber):
+        scrubber, manifest, clock = mock_scrubber
+        assert scrubber.needs_scrub() is True
+        assert scrubber.mismatches() == []
+
+        result = scrubber.scrub()
+        assert result.pass_complete is True
+        assert result.num_verified == 4
+        assert result.num_skipped == 0
+        assert result.num_bytes == 1000
+        assert result.mismatches == []
+        assert sum(scrubber.throttle.acquired) == 1000
+        assert scrubber.needs_scrub() is False
+
+        # A new pass is needed once the results are out of date
+        clock.now += 3601
+        assert scrubber.needs_scrub() is True
+
+    def test_skip_recently_verified(self, mock_scrubber):
+        scrubber, manifest, clock = mock_scrubber
+        scrubber.scrub()
+
+        clock.now += 60
+        helper_modify_file(manifest, "b.txt", "modified")
+        result = scrubber.scrub()
+        assert result.num_verified == 1
+        assert result.num_skipped == 3
+        assert result.mismatches == ["b.txt"]
+        assert scrubber.mismatches() == ["b.txt"]
+
+        # Once the results are out of date, every file is verified again
+        clock.now += 3601
+        result = scrubber.scrub()
+        assert result.num_verified == 4
+        assert result.num_skipped == 0
+        assert result.mismatches == ["b.txt"]
+
+    def test_resume_from_checkpoint(self, mock_scrubber):
+        scrubber, manifest, clock = mock_scrubber
+        helper_modify_file(manifest, "dir/c.txt", "modified")
+
+        # Files are checked in path order
+        result = scrubber.scrub(max_files=3)
+        assert result.pass_complete is False
+        assert result.num_verified == 3
+        assert result.mismatches == []
+        assert scrubber.state.checkpoint().last_key == "d.txt"
+        assert scrubber.needs_scrub() is True
+        scrubber.close()
+
+        # A new scrubber (e.g. after a restart) continues from the checkpoint
+        restarted = IntegrityScrubber(manifest, reverify_after=3600, clock=clock)
+        try:
+            result = restarted.scrub()
+            assert result.pass_complete is True
+            assert result.num_verified == 1
+            assert result.mismatches == ["dir/c.txt"]
+            assert restarted.state.checkpoint().last_key is None
+            assert restarted.needs_scrub() is False
+        finally:
+            restarted.close()
+
+    def test_time_limit(self, mock_scrubber):
+        scrubber, manifest, clock = mock_scrubber
+
+        def advance(num_bytes):
+            clock.now += 10
+        scrubber.throttle.acquire = advance
+
+        result = scrubber.scrub(max_seconds=15)
+        assert result.pass_complete is False
+        assert result.num_verified == 2
+
+    def test_manifest_changes(self, mock_scrubber):
+        scrubber, manifest, clock = mock_scrubber
+        helper_modify_file(manifest, "a.txt", "modified")
+        helper_modify_file(manifest, "b.txt", "modified")
+        assert scrubber.scrub().mismatches == ["a.txt", "b.txt"]
+
+        # Files changed in the manifest since they were checked are no longer reported
+        manifest.sweep_all_changes()
+        assert scrubber.mismatches() == []
+
+        # Results for files removed from the cache or the manifest are dropped on the next pass
+        os.remove(os.path.join(manifest.cache_mgr.cache_root, manifest.dataset_revision, "d.txt"))
+        manifest.sweep_all_changes()
+        clock.now += 3601
+        result = scrubber.scrub()
+        assert result.mismatches == []
+        assert sorted(scrubber.state.paths()) == ["a.txt", "b.txt", "dir/c.txt"]
+        assert scrubber.state.mismatches() == []
+
+    def test_from_config(self, mock_dataset_with_files):
+        ds, manifest = mock_dataset_with_files
+        scrubber = IntegrityScrubber.from_config(manifest)
+        try:
+            assert scrubber.reverify_after == 604800
+            assert scrubber.checkpoint_interval == 100
+        finally:
+            scrubber.close()
+
+    def test_get_scrub_throttle(self, mock_dataset_with_files):
+        ds, manifest = mock_dataset_with_files
+        client_config = copy.deepcopy(ds.client_config.config)
+
+        client_config['datasets']['scrubber'] = {'read_rate': None}
+        assert get_scrub_throttle(client_config) is None
+
+        client_config['datasets']['scrubber'] = {'read_rate': 1000}
+        assert get_scrub_throttle(client_config).bucket.rate == 1000
+
+        # Scrubs are not limited if Redis can't be reached
+        client_config['lock']['redis']['port'] = 1
+        assert get_scrub_throttle(client_config) is None
+
+
+class TestScrubState(object):
+    def test_empty(self, tmpdir):
+        state = ScrubState(str(tmpdir))
+        try:
+            assert state.checkpoint() == (None, None, None)
+            assert state.mismatches() == []
+            assert state.paths() == []
+            assert state.get_verified("a.txt") is None
+            assert not os.path.exists(state.state_file)
+        finally:
+            state.close()
+
+    def test_claim(self, tmpdir):
+        state = ScrubState(str(tmpdir))
+        other_state = ScrubState(str(tmpdir))
+        try:
+            assert state.try_claim(1000, claim_seconds=100) is True
+            assert other_state.try_claim(1050, claim_seconds=100) is False
+
+            # An expired claim can be taken
+            assert other_state.try_claim(1101, claim_seconds=100) is True
+            other_state.renew_claim(1150, claim_seconds=100)
+            assert state.try_claim(1201, claim_seconds=100) is False
+
+            other_state.release_claim()
+            assert state.try_claim(1202, claim_seconds=100) is True
+        finally:
+            state.close()
+            other_state.close()
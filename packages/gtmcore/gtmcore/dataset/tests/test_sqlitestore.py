@@ -0,0 +1,73 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from gtmcore.dataset.sqlitestore import SQLiteStore
+
+
+class StandInStore(SQLiteStore):
+    def _initialize(self, conn: sqlite3.Connection) -> None:
+        conn.execute("CREATE TABLE IF NOT EXISTS items (key TEXT PRIMARY KEY NOT NULL)")
+
+    def keys(self):
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return []
+            return [row[0] for row in conn.execute("SELECT key FROM items ORDER BY key")]
+
+    def add(self, key):
+        with self._transaction() as conn:
+            conn.execute("INSERT INTO items (key) VALUES (?)", (key,))
+
+
+class TestSQLiteStore(object):
+    def test_created_on_write(self, tmpdir):
+        store = StandInStore(os.path.join(str(tmpdir), 'cache', 'store.db'))
+        try:
+            assert store.keys() == []
+            assert not os.path.exists(store.db_file)
+
+            store.add('a')
+            assert os.path.exists(store.db_file)
+            assert store.keys() == ['a']
+        finally:
+            store.close()
+
+    def test_transaction(self, tmpdir):
+        store = StandInStore(os.path.join(str(tmpdir), 'store.db'))
+        try:
+            with pytest.raises(ValueError):
+                with store._transaction() as conn:
+                    conn.execute("INSERT INTO items (key) VALUES ('a')")
+                    raise ValueError("Roll back")
+            assert store.keys() == []
+
+            # Nested transactions are part of the outer transaction
+            with pytest.raises(ValueError):
+                with store._transaction():
+                    store.add('a')
+                    raise ValueError("Roll back")
+            assert store.keys() == []
+
+            with store._transaction():
+                store.add('a')
+                store.add('b')
+            assert store.keys() == ['a', 'b']
+        finally:
+            store.close()
+
+    def test_removed_while_open(self, tmpdir):
+        cache_root = os.path.join(str(tmpdir), 'cache')
+        store = StandInStore(os.path.join(cache_root, 'store.db'))
+        try:
+            store.add('a')
+            shutil.rmtree(cache_root)
+
+            assert store.keys() == []
+            store.add('b')
+            assert store.keys() == ['b']
+        finally:
+            store.close()
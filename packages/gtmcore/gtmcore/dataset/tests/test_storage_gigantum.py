@@ -1,4 +1,7 @@
 import pytest
+import asyncio
+import io
+import math
 from aioresponses import aioresponses
 import aiohttp
 import snappy
@@ -9,9 +12,15 @@ import random
 import string
 import os
 import uuid
+from hashlib import blake2b
+from mock import patch
 
 from gtmcore.dataset.storage import get_storage_backend
-from gtmcore.dataset.storage.gigantum import GigantumObjectStore, PresignedS3Download, PresignedS3Upload
+from gtmcore.dataset.storage.gigantum import GigantumObjectStore, PresignedS3Download, PresignedS3Upload, \
+    snappy_frame_boundary
+from gtmcore.dataset.benchmark.service import StandInObjectService
+from gtmcore.dataset.storage.compression import CodecSelector, STORE_STREAM_IDENTIFIER, ZSTD_STREAM_IDENTIFIER
+from gtmcore.dataset.manifest.eventloop import get_event_loop
 from gtmcore.fixtures.datasets import mock_dataset_with_cache_dir, helper_compress_file
 from gtmcore.dataset.io import PushResult, PushObject, PullResult, PullObject
 
@@ -227,20 +236,12 @@ class TestStorageBackendGigantum(object):
                 await psu.prepare_multipart_upload(session)
                 assert psu.multipart_upload_id == 'fakeid123'
                 assert psu._multipart_completed_parts == list()
-                assert len(psu._multipart_parts) == 4
+                # Only the first part has been compressed
+                assert len(psu._multipart_parts) == 1
                 assert psu._multipart_parts[0].part_number == 1
                 assert psu._multipart_parts[0].start_byte == 0
                 assert psu._multipart_parts[0].end_byte == multipart_chunk_size
-                assert psu._multipart_parts[1].part_number == 2
-                assert psu._multipart_parts[1].start_byte == multipart_chunk_size
-                assert psu._multipart_parts[1].end_byte == multipart_chunk_size * 2
-                assert psu._multipart_parts[2].part_number == 3
-                assert psu._multipart_parts[2].start_byte == multipart_chunk_size * 2
-                assert psu._multipart_parts[2].end_byte == multipart_chunk_size * 3
-                assert psu._multipart_parts[3].part_number == 4
-                assert psu._multipart_parts[3].start_byte == multipart_chunk_size * 3
-                assert psu._multipart_parts[3].end_byte < multipart_chunk_size * 4
-                assert psu._multipart_parts[3].end_byte > multipart_chunk_size * 3
+                assert len(psu._multipart_part_data[1]) == multipart_chunk_size
 
                 await psu.get_presigned_s3_url(session)
 
@@ -248,6 +249,28 @@ class TestStorageBackendGigantum(object):
                 assert psu.s3_headers == dict()
                 assert psu.skip_object is False
 
+                # Remaining parts are compressed as previous parts complete
+                parts = list()
+                compressed_data = list()
+                while psu.current_part:
+                    parts.append(psu.current_part)
+                    compressed_data.append(psu._multipart_part_data[psu.current_part.part_number])
+                    psu.mark_current_part_complete(f"etag{psu.current_part.part_number}")
+                    await psu.load_next_part()
+
+                assert [p.part_number for p in parts] == [1, 2, 3, 4]
+                for part_1, part_2 in zip(parts[:-1], parts[1:]):
+                    assert part_1.end_byte - part_1.start_byte == multipart_chunk_size
+                    assert part_2.start_byte == part_1.end_byte
+                assert multipart_chunk_size * 3 < parts[3].end_byte < multipart_chunk_size * 4
+                assert psu._multipart_part_data == dict()
+
+                # Parts concatenate to the snappy stream format
+                with open(helper_write_large_file, 'rb') as fh:
+                    decompressor = snappy.StreamDecompressor()
+                    assert decompressor.decompress(b''.join(compressed_data)) == fh.read()
+                psu.release_compressed_data()
+
     @pytest.mark.asyncio
     async def test_presigneds3upload_get_presigned_s3_url_skip(self, event_loop, mock_dataset_with_cache_dir):
         sb = get_storage_backend("gigantum_object_v1")
@@ -343,6 +366,48 @@ class TestStorageBackendGigantum(object):
 
         assert psu.presigned_s3_url == "https://dummyurl.com?params=2"
 
+    @pytest.mark.asyncio
+    async def test_presigneds3download_save_progress(self, event_loop, temp_directories):
+        """Progress is saved every PROGRESS_SAVE_BYTES and where the download stopped, not after every frame"""
+        object_dir, _ = temp_directories
+        data = os.urandom(1000000)
+        obj_id = blake2b(data).hexdigest()
+        with io.BytesIO(data) as src, io.BytesIO() as dst:
+            snappy.stream_compress(src, dst)
+            compressed = dst.getvalue()
+
+        # The connection drops in the middle of the last frame
+        cut = len(compressed) - 10
+        object_details = PullObject(object_path=os.path.join(object_dir, obj_id), revision='abcd',
+                                    dataset_path='myfile1.txt')
+        psd = PresignedS3Download("https://api.gigantum.com/object-v1/ns/ds", dict(), 65536, object_details)
+        psd.presigned_s3_url = f"https://dummyurl.com/{obj_id}?params=1"
+
+        saved = list()
+        save_progress = psd.save_progress
+
+        def record_save_progress(progress):
+            saved.append(progress)
+            save_progress(progress)
+
+        psd.save_progress = record_save_progress
+
+        with aioresponses() as mocked_responses, patch('gtmcore.dataset.storage.gigantum.PROGRESS_SAVE_BYTES', 400000):
+            mocked_responses.get(psd.presigned_s3_url, body=compressed[:cut], status=200,
+                                 content_type='application/octet-stream')
+            async with aiohttp.ClientSession() as session:
+                with pytest.raises(IOError):
+                    await psd._download_object(session, lambda completed_bytes: None)
+
+        # 15 complete frames were received, but progress was only saved after every 400000 bytes and at the end
+        assert len(saved) == 3
+        assert [p.compressed_bytes // 400000 for p in saved[:-1]] == [1, 2]
+        assert saved[-1].compressed_bytes == snappy_frame_boundary(bytearray(compressed[:cut]))
+
+        # The progress file is replaced atomically, so only the partial download and its progress remain
+        assert sorted(os.listdir(object_dir)) == [f".{obj_id}.partial", f".{obj_id}.progress"]
+        assert psd.load_progress() == saved[-1]
+
     @pytest.mark.asyncio
     async def test_presigneds3download_get_presigned_s3_url_error(self, event_loop, mock_dataset_with_cache_dir):
         sb = get_storage_backend("gigantum_object_v1")
@@ -475,6 +540,10 @@ class TestStorageBackendGigantum(object):
             assert result.success[0].object_path in [obj1_src_path, obj2_src_path]
             assert result.success[1].object_path in [obj1_src_path, obj2_src_path]
 
+            # The concurrency controller's decisions are kept for the job metadata
+            assert sb.concurrency_summary['min_limit'] <= sb.concurrency_summary['limit'] \
+                <= sb.concurrency_summary['max_limit']
+
     def test_push_objects_with_existing(self, mock_dataset_with_cache_dir, temp_directories):
         with aioresponses() as mocked_responses:
             sb = get_storage_backend("gigantum_object_v1")
@@ -935,6 +1004,80 @@ class TestStorageBackendGigantum(object):
                 dest1 = dd.read()
             assert source1.decode("utf-8") == dest1
 
+    def test_pull_objects_resume(self, mock_dataset_with_cache_dir, temp_directories):
+        with aioresponses() as mocked_responses:
+            sb = get_storage_backend("gigantum_object_v1")
+            ds = mock_dataset_with_cache_dir[0]
+            sb.set_default_configuration(ds.namespace, "abcd", '1234')
+
+            object_dir, compressed_dir = temp_directories
+
+            data = os.urandom(500000)
+            obj_id = blake2b(data).hexdigest()
+            obj_path = os.path.join(object_dir, obj_id)
+            with io.BytesIO(data) as src, io.BytesIO() as dst:
+                snappy.stream_compress(src, dst)
+                compressed = dst.getvalue()
+
+            # The connection drops in the middle of a frame
+            cut = len(compressed) // 2
+            resume_at = snappy_frame_boundary(bytearray(compressed[:cut]))
+            assert 0 < resume_at < cut
+
+            mocked_responses.get(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj_id}',
+                                 payload={"presigned_url": f"https://dummyurl.com/{obj_id}?params=1"},
+                                 status=200)
+            mocked_responses.get(f"https://dummyurl.com/{obj_id}?params=1",
+                                 body=compressed[:cut], status=200, content_type='application/octet-stream')
+            mocked_responses.get(f"https://dummyurl.com/{obj_id}?params=1",
+                                 body=compressed[resume_at:], status=206, content_type='application/octet-stream')
+
+            objects = [PullObject(object_path=obj_path, revision=ds.git.repo.head.commit.hexsha,
+                                  dataset_path='myfile1.txt')]
+            progress = list()
+            result = sb.pull_objects(ds, objects, lambda completed_bytes: progress.append(completed_bytes))
+            assert len(result.success) == 1
+            assert len(result.failure) == 0
+
+            # The second request only asked for the rest of the object
+            s3_requests = [r for (method, url), calls in mocked_responses.requests.items()
+                           for r in calls if str(url).startswith('https://dummyurl.com')]
+            assert s3_requests[-1].kwargs['headers'] == {'Range': f'bytes={resume_at}-'}
+
+            with open(obj_path, 'rb') as fh:
+                assert fh.read() == data
+            assert sum(progress) == len(data)
+            assert sorted(os.listdir(object_dir)) == [obj_id]
+
+    def test_pull_objects_verify_hash(self, mock_dataset_with_cache_dir, temp_directories):
+        with aioresponses() as mocked_responses:
+            sb = get_storage_backend("gigantum_object_v1")
+            ds = mock_dataset_with_cache_dir[0]
+            sb.set_default_configuration(ds.namespace, "abcd", '1234')
+
+            object_dir, compressed_dir = temp_directories
+
+            obj_id = blake2b(b'expected contents').hexdigest()
+            obj_path = os.path.join(object_dir, obj_id)
+            with io.BytesIO(b'corrupted contents') as src, io.BytesIO() as dst:
+                snappy.stream_compress(src, dst)
+                compressed = dst.getvalue()
+
+            mocked_responses.get(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj_id}',
+                                 payload={"presigned_url": f"https://dummyurl.com/{obj_id}?params=1"},
+                                 status=200)
+            mocked_responses.get(f"https://dummyurl.com/{obj_id}?params=1",
+                                 body=compressed, status=200, content_type='application/octet-stream')
+
+            objects = [PullObject(object_path=obj_path, revision=ds.git.repo.head.commit.hexsha,
+                                  dataset_path='myfile1.txt')]
+            result = sb.pull_objects(ds, objects, chunk_update_callback)
+            assert len(result.success) == 0
+            assert len(result.failure) == 1
+
+            # Bad data is not kept, or resumed from
+            assert os.listdir(object_dir) == []
+
     def test_finalize_pull(self, mock_dataset_with_cache_dir):
         sb = get_storage_backend("gigantum_object_v1")
         ds = mock_dataset_with_cache_dir[0]
@@ -1143,7 +1286,7 @@ class TestStorageBackendGigantum(object):
             assert os.path.exists(f'/tmp/{obj2_id}') is False
 
     @pytest.mark.asyncio
-    async def test_presigneds3upload_file_loader(self, event_loop, mock_dataset_with_cache_dir):
+    async def test_presigneds3upload_data_loader(self, event_loop, mock_dataset_with_cache_dir):
         """Test the async generator method used to load data into the request stream"""
         def update_fn(completed_bytes):
             assert completed_bytes > 0
@@ -1175,8 +1318,11 @@ class TestStorageBackendGigantum(object):
         # the + 12 is because of the string "dummy data: " that's added in the helper function
         assert os.path.getsize(obj1_src_path) == (3 * upload_chunk_size + 100) + 12
 
+        with open(obj1_src_path, 'rb') as fh:
+            data = fh.read()
+
         num_chunks = 0
-        iterator = psu._file_loader(obj1_src_path, update_fn)
+        iterator = psu._data_loader(data, update_fn)
         try:
             while True:
                 chunk = await iterator.__anext__()
@@ -1192,7 +1338,7 @@ class TestStorageBackendGigantum(object):
             assert num_chunks == 4
 
     @pytest.mark.asyncio
-    async def test_presigneds3upload_file_loader_multipart(self, event_loop, mock_dataset_with_cache_dir,
+    async def test_presigneds3upload_data_loader_multipart(self, event_loop, mock_dataset_with_cache_dir,
                                                            helper_write_two_part_file):
         with aioresponses() as mocked_responses:
             def update_fn(completed_bytes):
@@ -1218,11 +1364,6 @@ class TestStorageBackendGigantum(object):
 
             assert psu.is_multipart is True
 
-            iterator = psu._file_loader(helper_write_two_part_file, update_fn)
-            with pytest.raises(ValueError):
-                # Multipart upload and you haven't set up the parts yet
-                await iterator.__anext__()
-
             obj2_id = os.path.basename(helper_write_two_part_file)
             mocked_responses.post(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj2_id}/multipart',
                                   payload={
@@ -1240,7 +1381,7 @@ class TestStorageBackendGigantum(object):
 
             num_chunks = 0
             saved_data = bytes()
-            iterator = psu._file_loader(helper_write_two_part_file, update_fn)
+            iterator = psu._data_loader(psu._multipart_part_data[psu.current_part.part_number], update_fn)
 
             # Do the first chunk
             try:
@@ -1256,29 +1397,33 @@ class TestStorageBackendGigantum(object):
                 assert num_chunks == 16
 
             psu.mark_current_part_complete("fakeetag")
+            await psu.load_next_part()
 
             # Do the second chunk
             num_chunks = 0
-            iterator = psu._file_loader(helper_write_two_part_file, update_fn)
+            last_chunk = math.ceil((psu.current_part.end_byte - psu.current_part.start_byte) / upload_chunk_size)
+            iterator = psu._data_loader(psu._multipart_part_data[psu.current_part.part_number], update_fn)
             try:
                 while True:
                     chunk = await iterator.__anext__()
                     num_chunks += 1
                     saved_data = saved_data + chunk
-                    if num_chunks == 13:
-                        assert len(chunk) == 639872
-                    else:
+                    if num_chunks < last_chunk:
                         assert len(chunk) == upload_chunk_size
-                    if num_chunks > 13:
+                    if num_chunks > last_chunk:
                         assert "Too many chunks"
             except StopAsyncIteration:
                 # Raises StopAsyncIteration when no more byte
-                assert num_chunks == 13
+                assert num_chunks == last_chunk
+
+            psu.mark_current_part_complete("fakeetag")
+            await psu.load_next_part()
+            assert psu.current_part is None
 
-            # Make sure the content is correct
+            # Make sure the content is the compressed object
             with open(helper_write_two_part_file, 'rb') as source:
                 data = source.read()
-                assert data == saved_data
+                assert snappy.StreamDecompressor().decompress(saved_data) == data
 
     def test_push_objects_multipart_with_skip(self, mock_dataset_with_cache_dir, temp_directories, mock_dataset_head):
         with aioresponses() as mocked_responses:
@@ -1334,3 +1479,138 @@ class TestStorageBackendGigantum(object):
             assert result.success[0].object_path != result.success[1].object_path
             assert result.success[0].object_path in [obj1_src_path, obj2_src_path]
             assert result.success[1].object_path in [obj1_src_path, obj2_src_path]
+
+    def test_push_pipeline_spreads_parts_across_workers(self, mock_dataset_with_cache_dir, temp_directories):
+        """A large object's parts are handed to idle workers instead of all being uploaded by one worker"""
+        sb = get_storage_backend("gigantum_object_v1")
+        ds = mock_dataset_with_cache_dir[0]
+        object_dir, _ = temp_directories
+
+        # One small object, and one incompressible object uploaded in 6 parts
+        small_path = helper_write_object(object_dir, uuid.uuid4().hex, 'abcd')
+        large_path = os.path.join(object_dir, uuid.uuid4().hex)
+        with open(large_path, 'wb') as fh:
+            fh.write(os.urandom(6 * 1048576 - 1000))
+        objects = [PushObject(object_path=large_path, revision='abcd', dataset_path='large.bin'),
+                   PushObject(object_path=small_path, revision='abcd', dataset_path='small.txt')]
+
+        started_objects = list()
+        started_parts = list()
+        in_flight = list()
+        max_in_flight = list()
+        part_tasks = set()
+        get_presigned_s3_url = PresignedS3Upload.get_presigned_s3_url
+        prepare_multipart_upload = PresignedS3Upload.prepare_multipart_upload
+        upload_part = PresignedS3Upload.upload_part
+
+        async def record_get_presigned_s3_url(psu, session):
+            started_objects.append(psu.object_details.dataset_path)
+            await get_presigned_s3_url(psu, session)
+
+        async def record_prepare_multipart_upload(psu, session):
+            started_objects.append(psu.object_details.dataset_path)
+            await prepare_multipart_upload(psu, session)
+
+        async def record_upload_part(psu, session, part, progress_update_fn):
+            started_parts.append(part.part_number)
+            part_tasks.add(id(asyncio.current_task()))
+            in_flight.append(part.part_number)
+            max_in_flight.append(len(in_flight))
+            try:
+                await upload_part(psu, session, part, progress_update_fn)
+            finally:
+                in_flight.remove(part.part_number)
+
+        with StandInObjectService(latency=0.01, upload_bandwidth=20 * 1048576) as service:
+            with patch.object(PresignedS3Upload, 'get_presigned_s3_url', record_get_presigned_s3_url), \
+                    patch.object(PresignedS3Upload, 'prepare_multipart_upload', record_prepare_multipart_upload), \
+                    patch.object(PresignedS3Upload, 'upload_part', record_upload_part):
+                get_event_loop().run_until_complete(
+                    sb._run_push_pipeline(f"{service.url}/{ds.namespace}/{ds.name}", dict(), objects,
+                                          progress_update_fn=lambda completed_bytes: None,
+                                          multipart_chunk_size=1048576, upload_chunk_size=65536, num_workers=4,
+                                          max_concurrent_parts=3))
+
+            assert not service.multipart_uploads
+            assert len(service.objects) == 2
+            with open(large_path, 'rb') as fh:
+                assert snappy.StreamDecompressor().decompress(service.objects[os.path.basename(large_path)]) == \
+                    fh.read()
+
+        assert sorted(r.object_details for r in sb.successful_requests) == sorted(objects)
+        assert sb.failed_requests == []
+
+        # Objects start in the order given (largest first), and parts start in order, each exactly once
+        assert started_objects == ['large.bin', 'small.txt']
+        assert started_parts == [1, 2, 3, 4, 5, 6]
+
+        # Parts are shared between workers, but no more than `max_concurrent_parts` run at once
+        assert 1 < len(part_tasks) <= 3
+        assert 1 < max(max_in_flight) <= 3
+
+    def test_push_and_pull_with_codecs(self, mock_dataset_with_cache_dir, temp_directories):
+        """Objects are compressed with the codec chosen for each one, and pulled by detecting the codec"""
+        sb = get_storage_backend("gigantum_object_v1")
+        ds = mock_dataset_with_cache_dir[0]
+        object_dir, _ = temp_directories
+
+        contents = {'data.csv': b'a,b,c\n1,2,3\n' * 200000,
+                    'photo.jpg': b'not really a jpeg' * 1000,
+                    'random.bin': os.urandom(3 * 1048576)}
+        objects = list()
+        for dataset_path, data in contents.items():
+            object_path = os.path.join(object_dir, blake2b(data).hexdigest())
+            with open(object_path, 'wb') as fh:
+                fh.write(data)
+            objects.append(PushObject(object_path=object_path, revision='abcd', dataset_path=dataset_path))
+
+        with StandInObjectService() as service:
+            root = f"{service.url}/{ds.namespace}/{ds.name}"
+            get_event_loop().run_until_complete(
+                sb._run_push_pipeline(root, dict(), objects, progress_update_fn=lambda completed_bytes: None,
+                                      multipart_chunk_size=1048576, upload_chunk_size=65536,
+                                      codec_selector=CodecSelector('zstd', level=3)))
+            assert sb.failed_requests == []
+
+            stored = {o.dataset_path: service.objects[os.path.basename(o.object_path)] for o in objects}
+            assert stored['data.csv'].startswith(ZSTD_STREAM_IDENTIFIER)
+            assert len(stored['data.csv']) < len(contents['data.csv']) / 50
+            assert stored['photo.jpg'].startswith(STORE_STREAM_IDENTIFIER)
+            assert stored['random.bin'].startswith(STORE_STREAM_IDENTIFIER)
+
+            # Pull everything back
+            for o in objects:
+                os.remove(o.object_path)
+            pull_objects = [PullObject(object_path=o.object_path, revision='abcd', dataset_path=o.dataset_path)
+                            for o in objects]
+            progress = list()
+            get_event_loop().run_until_complete(
+                sb._run_pull_pipeline(root, dict(), pull_objects, lambda completed_bytes: progress.append(
+                    completed_bytes)))
+
+        assert sb.failed_requests == []
+        assert sum(progress) == sum(len(d) for d in contents.values())
+        for o in objects:
+            with open(o.object_path, 'rb') as fh:
+                assert fh.read() == contents[o.dataset_path]
+
+    def test_load_progress_codec(self, temp_directories):
+        object_dir, _ = temp_directories
+        obj_id = blake2b(b'contents').hexdigest()
+        download = PresignedS3Download("http://localhost", dict(), 4096,
+                                       PullObject(object_path=os.path.join(object_dir, obj_id), revision='abcd',
+                                                  dataset_path='a.txt'))
+        with open(download.partial_path, 'wb') as fh:
+            fh.write(b'cont')
+
+        # Progress saved before codecs were added is for a snappy object
+        with open(download.progress_path, 'wt') as fh:
+            fh.write('{"compressed_bytes": 20, "decompressed_bytes": 4}')
+        assert download.load_progress() == (20, 4, 'snappy')
+
+        download.save_progress(download.load_progress()._replace(codec='zstd'))
+        assert download.load_progress() == (20, 4, 'zstd')
+
+        # An unsupported codec can't be resumed
+        download.save_progress(download.load_progress()._replace(codec='lzma'))
+        assert download.load_progress() == (0, 0, None)
@@ -5,6 +5,7 @@ import os
 
 from gtmcore.dataset.storage import get_storage_backend
 from gtmcore.dataset.storage.local import LocalFilesystem
+from gtmcore.dataset.storage.ingest import ingest_file, ImportIndex
 from gtmcore.dataset.manifest.manifest import Manifest
 from gtmcore.fixtures.datasets import helper_compress_file, mock_dataset_with_cache_dir_local, USERNAME, \
     mock_enable_unmanaged_for_testing
@@ -225,3 +226,73 @@ class TestStorageBackendLocalFilesystem(object):
         assert os.path.isfile(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'subdir', 'test3.txt')) is True
         for key in keys:
             assert os.path.isfile(m.dataset_to_object_path(key)) is True
+
+    def test_ingest_file(self, mock_dataset_with_local_dir):
+        test_dir = os.path.join(mock_dataset_with_local_dir[1], "local_data", "test_dir")
+        source = os.path.join(test_dir, 'test1.txt')
+
+        destination = os.path.join(test_dir, 'linked.txt')
+        assert ingest_file(source, destination, ['link']) == 'link'
+        assert os.path.samefile(source, destination)
+
+        # Reflinks aren't supported on every filesystem, so fall back to copying if needed
+        destination = os.path.join(test_dir, 'copied.txt')
+        assert ingest_file(source, destination, ['reflink', 'copy']) in ['reflink', 'copy']
+        assert not os.path.samefile(source, destination)
+        with open(destination, 'rt') as df:
+            assert df.read() == "dummy data: temp contents 1"
+
+        with pytest.raises(ValueError):
+            ingest_file(source, os.path.join(test_dir, 'other.txt'), ['teleport'])
+
+    def test_update_from_remote_copy_reuses_hashes(self, mock_dataset_with_local_dir):
+        ds = mock_dataset_with_local_dir[0]
+        ds.client_config.config['datasets']['backends']['local_filesystem']['ingest_methods'] = ['copy']
+        test_dir = os.path.join(mock_dataset_with_local_dir[1], "local_data", "test_dir")
+
+        hashed_keys = list()
+        hash_file_key_list = ds.backend.hash_file_key_list
+
+        def _hash_file_key_list(dataset, keys):
+            hashed_keys.extend(keys)
+            return hash_file_key_list(dataset, keys)
+
+        ds.backend.hash_file_key_list = _hash_file_key_list
+
+        ds.backend.update_from_remote(ds, updater)
+        m = Manifest(ds, 'tester')
+        assert len(m.manifest.keys()) == 4
+        revision_file = os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test1.txt')
+        assert not os.path.samefile(revision_file, os.path.join(test_dir, 'test1.txt'))
+        assert os.path.samefile(revision_file, m.dataset_to_object_path('test1.txt'))
+        assert len(ImportIndex(m.cache_mgr.cache_root).get_all()) == 3
+
+        # Nothing changed in the data directory, so nothing is re-hashed
+        hashed_keys.clear()
+        ds.backend.update_from_remote(ds, updater)
+        assert hashed_keys == []
+
+        # Touching a file re-hashes it, but it is not modified and stays linked to its object
+        os.utime(os.path.join(test_dir, 'test2.txt'), ns=(1000000000, 1000000000))
+        ds.backend.update_from_remote(ds, updater)
+        assert hashed_keys == ['test2.txt']
+        m = Manifest(ds, 'tester')
+        assert os.path.samefile(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test2.txt'),
+                                m.dataset_to_object_path('test2.txt'))
+
+        # A modified file is copied in again, since the revision doesn't share its inode with the source
+        hashed_keys.clear()
+        with open(os.path.join(test_dir, 'test1.txt'), 'wt') as tf:
+            tf.write("This file got changed in the filesystem")
+        ds.backend.update_from_remote(ds, updater)
+        assert hashed_keys == ['test1.txt']
+
+        m = Manifest(ds, 'tester')
+        with open(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test1.txt'), 'rt') as tf:
+            assert tf.read() == "This file got changed in the filesystem"
+        with open(m.dataset_to_object_path('test1.txt'), 'rt') as tf:
+            assert tf.read() == "This file got changed in the filesystem"
+
+        hashed_keys.clear()
+        ds.backend.update_from_remote(ds, updater)
+        assert hashed_keys == []
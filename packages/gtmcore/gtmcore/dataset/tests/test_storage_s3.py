@@ -1,11 +1,14 @@
 import pytest
 import shutil
 
+import json
 import os
 import tempfile
 import boto3
+from mock import patch
 
 from gtmcore.dataset.storage import get_storage_backend
+from gtmcore.dataset.storage.etags import ETagStore
 from gtmcore.dataset.storage.s3 import PublicS3Bucket
 from gtmcore.dataset.manifest.manifest import Manifest
 from gtmcore.fixtures.datasets import helper_compress_file, mock_config_class, mock_public_bucket, \
@@ -25,6 +28,32 @@ def updater(msg):
     print(msg)
 
 
+def helper_configure_bucket(mock_config_class, bucket):
+    im = mock_config_class[0]
+    ds = im.create_dataset(USERNAME, USERNAME, 'dataset-1', description="my dataset 1",
+                           storage_type="public_s3_bucket")
+    ds.backend.set_default_configuration(USERNAME, 'fakebearertoken', 'fakeidtoken')
+    current_config = ds.backend_config
+    current_config['Bucket Name'] = bucket
+    current_config['Prefix'] = ""
+    ds.backend_config = current_config
+    return ds
+
+
+def helper_update_from_remote(ds):
+    """Update from the remote, returning the keys that were downloaded"""
+    downloaded = list()
+    download_key = PublicS3Bucket._download_key
+
+    def recording_download_key(client, bucket, key, revision_dir):
+        downloaded.append(key)
+        download_key(client, bucket, key, revision_dir)
+
+    with patch.object(PublicS3Bucket, '_download_key', side_effect=recording_download_key):
+        ds.backend.update_from_remote(ds, updater)
+    return sorted(downloaded)
+
+
 def chunk_update_callback(completed_bytes: int):
     """Method to update the job's metadata and provide feedback to the UI"""
     assert type(completed_bytes) == int
@@ -190,6 +219,73 @@ class TestStorageBackendS3PublicBuckets(object):
         with open(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test-file-1.bin'), 'rt') as tf:
             assert tf.read() == "This file has been updated!"
 
+    def test_update_from_remote_incremental(self, mock_config_class, mock_public_bucket):
+        ds = helper_configure_bucket(mock_config_class, mock_public_bucket)
+
+        # List 2 keys per page, so each prefix is processed over several pages
+        with patch('gtmcore.dataset.storage.s3.LIST_PAGE_SIZE', 2):
+            assert len(helper_update_from_remote(ds)) == 5
+
+            # Nothing is downloaded if the bucket has not changed
+            assert helper_update_from_remote(ds) == []
+
+            conn = boto3.resource('s3', region_name='us-east-1')
+            conn.meta.client.put_object(Bucket=mock_public_bucket, Key='metadata/test-file-3.bin', Body=b'modified')
+            conn.meta.client.put_object(Bucket=mock_public_bucket, Key='new/test-file-6.bin', Body=b'new file')
+            conn.meta.client.delete_object(Bucket=mock_public_bucket, Key='test-file-2.bin')
+            conn.meta.client.delete_object(Bucket=mock_public_bucket, Key='metadata/sub/test-file-5.bin')
+
+            assert helper_update_from_remote(ds) == ['metadata/test-file-3.bin', 'new/test-file-6.bin']
+
+        m = Manifest(ds, USERNAME)
+        assert sorted(m.manifest.keys()) == ['metadata/', 'metadata/test-file-3.bin', 'metadata/test-file-4.bin',
+                                             'new/', 'new/test-file-6.bin', 'test-file-1.bin']
+        revision_dir = os.path.join(m.cache_mgr.cache_root, m.dataset_revision)
+        with open(os.path.join(revision_dir, 'metadata/test-file-3.bin'), 'rb') as fh:
+            assert fh.read() == b'modified'
+        assert len(ds.backend.verify_contents(ds, updater)) == 0
+
+        # The previous version of the modified file is still cached
+        with open(os.path.join(revision_dir, 'metadata/test-file-4.bin'), 'rt') as fh:
+            assert fh.read() == '1234' * 100
+
+        assert helper_update_from_remote(ds) == []
+
+    def test_update_from_remote_failure(self, mock_config_class, mock_public_bucket):
+        ds = helper_configure_bucket(mock_config_class, mock_public_bucket)
+        ds.backend.update_from_remote(ds, updater)
+
+        conn = boto3.resource('s3', region_name='us-east-1')
+        conn.meta.client.put_object(Bucket=mock_public_bucket, Key='test-file-1.bin', Body=b'modified')
+
+        with patch.object(PublicS3Bucket, '_download_key', side_effect=IOError("Connection reset")):
+            with pytest.raises(IOError):
+                ds.backend.update_from_remote(ds, updater)
+
+        # The new ETag was not applied because the manifest was not updated, so the file is downloaded again
+        assert helper_update_from_remote(ds) == ['test-file-1.bin']
+        m = Manifest(ds, USERNAME)
+        with open(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test-file-1.bin'), 'rb') as fh:
+            assert fh.read() == b'modified'
+
+    def test_update_from_remote_legacy_etags(self, mock_config_class, mock_public_bucket):
+        ds = helper_configure_bucket(mock_config_class, mock_public_bucket)
+        ds.backend.update_from_remote(ds, updater)
+
+        # Replace the ETag store with a legacy ETag file
+        m = Manifest(ds, USERNAME)
+        client = boto3.client('s3', region_name='us-east-1')
+        etags = {item['Key']: item['ETag']
+                 for item in client.list_objects_v2(Bucket=mock_public_bucket)['Contents']}
+        os.remove(ds.backend._get_etag_store(ds, m).store_file)
+        etag_file = ds.backend._get_etag_file(ds)
+        with open(etag_file, 'wt') as ef:
+            json.dump(etags, ef)
+
+        assert helper_update_from_remote(ds) == []
+        assert not os.path.exists(etag_file)
+        assert len(Manifest(ds, USERNAME).manifest.keys()) == 7
+
     def test_pull(self, mock_config_class, mock_public_bucket):
         im = mock_config_class[0]
         ds = im.create_dataset(USERNAME, USERNAME, 'dataset-1', description="my dataset 1",
@@ -247,3 +343,104 @@ class TestStorageBackendS3PublicBuckets(object):
                                            'metadata', 'sub', 'test-file-5.bin')) is True
         for key in keys:
             assert os.path.isfile(m.dataset_to_object_path(key)) is True
+
+    def test_pull_range_requests(self, mock_config_class, mock_public_bucket):
+        im = mock_config_class[0]
+        ds = im.create_dataset(USERNAME, USERNAME, 'dataset-1', description="my dataset 1",
+                               storage_type="public_s3_bucket")
+        ds.backend.set_default_configuration(USERNAME, 'fakebearertoken', 'fakeidtoken')
+
+        current_config = ds.backend_config
+        current_config['Bucket Name'] = mock_public_bucket
+        current_config['Prefix'] = ""
+        ds.backend_config = current_config
+
+        ds.backend.update_from_remote(ds, updater)
+        m = Manifest(ds, 'tester')
+        revision_dir = os.path.join(m.cache_mgr.cache_root, m.dataset_revision)
+        with open(os.path.join(revision_dir, 'test-file-1.bin'), 'rb') as fh:
+            expected = fh.read()
+
+        shutil.rmtree(revision_dir)
+        keys = ['test-file-1.bin', 'metadata/test-file-3.bin']
+        pull_objects = [PullObject(object_path=m.dataset_to_object_path(key), revision=m.dataset_revision,
+                                   dataset_path=key) for key in keys]
+        for obj in pull_objects:
+            os.remove(obj.object_path)
+
+        # A file that is no longer in the bucket fails without affecting the others
+        pull_objects.append(PullObject(object_path=os.path.join(os.path.dirname(pull_objects[0].object_path),
+                                                                'deadbeef'),
+                                       revision=m.dataset_revision, dataset_path='missing-file.bin'))
+
+        # test-file-1.bin is 4000 bytes, so it is downloaded in 4 range requests
+        ds.client_config.config['datasets']['backends']['public_s3_bucket']['range_request_size'] = 1000
+        progress = list()
+        result = ds.backend.pull_objects(ds, pull_objects, lambda completed_bytes: progress.append(completed_bytes))
+
+        assert sorted([obj.dataset_path for obj in result.success]) == sorted(keys)
+        assert [obj.dataset_path for obj in result.failure] == ['missing-file.bin']
+        assert sum(progress) == 4000 + 400
+
+        with open(m.dataset_to_object_path('test-file-1.bin'), 'rb') as fh:
+            assert fh.read() == expected
+        with open(os.path.join(revision_dir, 'test-file-1.bin'), 'rb') as fh:
+            assert fh.read() == expected
+
+        # Failed files are not linked, and no partial downloads are left behind
+        assert os.path.isfile(os.path.join(revision_dir, 'metadata', 'test-file-3.bin'))
+        assert not os.path.exists(os.path.join(revision_dir, 'missing-file.bin'))
+        object_dir = os.path.dirname(pull_objects[0].object_path)
+        assert [f for f in os.listdir(object_dir) if f.startswith('.')] == []
+
+
+class TestETagStore(object):
+    def test_pass(self, tmpdir):
+        store = ETagStore(str(tmpdir))
+        try:
+            assert store.get_many(['a.txt']) == {}
+            assert not os.path.exists(store.store_file)
+
+            pass_id = store.begin_pass()
+            store.record_page(pass_id, [('a.txt', '"1"'), ('dir/sub/b.txt', '"2"')])
+            assert store.seen(pass_id, ['a.txt', 'dir/', 'dir/sub/', 'dir/sub/b.txt', 'c.txt']) == \
+                {'a.txt', 'dir/', 'dir/sub/', 'dir/sub/b.txt'}
+
+            # ETags are only applied when the pass finishes
+            assert store.get_many(['a.txt', 'dir/sub/b.txt']) == {}
+            store.finish_pass(pass_id)
+            assert store.get_many(['a.txt', 'dir/sub/b.txt']) == {'a.txt': '"1"', 'dir/sub/b.txt': '"2"'}
+
+            # Keys not seen in a pass are removed when it finishes
+            next_pass_id = store.begin_pass()
+            assert next_pass_id > pass_id
+            store.record_page(next_pass_id, [('a.txt', '"3"')])
+            assert store.seen(next_pass_id, ['a.txt', 'dir/']) == {'a.txt'}
+            store.finish_pass(next_pass_id)
+            assert store.get_many(['a.txt', 'dir/sub/b.txt']) == {'a.txt': '"3"'}
+        finally:
+            store.close()
+
+    def test_many_keys(self, tmpdir):
+        store = ETagStore(str(tmpdir))
+        try:
+            keys = [f"dir{n % 7}/file{n}.txt" for n in range(2000)]
+            pass_id = store.begin_pass()
+            store.record_page(pass_id, [(key, key) for key in keys])
+            store.finish_pass(pass_id)
+            assert store.get_many(keys) == {key: key for key in keys}
+            assert len(store.seen(pass_id, keys)) == 2000
+        finally:
+            store.close()
+
+    def test_legacy_file(self, tmpdir):
+        legacy_file = os.path.join(str(tmpdir), 'etag_cache.json')
+        with open(legacy_file, 'wt') as ef:
+            json.dump({'a.txt': '"1"', 'b.txt': '"2"'}, ef)
+
+        store = ETagStore(os.path.join(str(tmpdir), 'cache'), legacy_file=legacy_file)
+        try:
+            assert store.get_many(['a.txt', 'b.txt', 'c.txt']) == {'a.txt': '"1"', 'b.txt': '"2"'}
+            assert not os.path.exists(legacy_file)
+        finally:
+            store.close()
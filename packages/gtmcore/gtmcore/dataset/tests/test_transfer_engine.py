@@ -0,0 +1,125 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import pytest
+import snappy
+
+from gtmcore.dataset.io import PushObject, PushResult
+from gtmcore.dataset.io.bandwidth import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from gtmcore.dataset.io.engine import TransferEngine, TransferProgress
+from gtmcore.dataset.io.manager import IOManager
+from gtmcore.dataset.manifest import Manifest
+from gtmcore.dataset.storage.gigantum import StreamingCompressor
+from gtmcore.fixtures.datasets import mock_dataset_with_cache_dir
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTransferProgress(object):
+    def test_update_is_throttled(self):
+        clock = FakeClock()
+        reports = list()
+        progress = TransferProgress(1000, lambda completed, total: reports.append((completed, total)),
+                                    min_interval=0.5, clock=clock)
+
+        progress.update(100)
+        assert reports == [(100, 1000)]
+
+        # Updates within the interval are accumulated but not reported
+        clock.now = 0.2
+        progress.update(100)
+        clock.now = 0.4
+        progress.update(100)
+        assert reports == [(100, 1000)]
+        assert progress.completed_bytes == 300
+        assert progress.percent_complete == 30.0
+
+        clock.now = 0.6
+        progress.update(200)
+        assert reports == [(100, 1000), (500, 1000)]
+
+        clock.now = 0.7
+        progress.update(500)
+        progress.close()
+        assert reports == [(100, 1000), (500, 1000), (1000, 1000)]
+
+    def test_no_bytes(self):
+        reports = list()
+        progress = TransferProgress(0, lambda completed, total: reports.append((completed, total)))
+        assert progress.percent_complete == 0.0
+        progress.close()
+        assert reports == [(0, 0)]
+
+
+class TestTransferEngine(object):
+    def test_streaming_compressor_in_process_pool(self, tmpdir):
+        object_path = os.path.join(str(tmpdir), 'object')
+        with open(object_path, 'wb') as fh:
+            fh.write(os.urandom(200000))
+            fh.write(b'a' * 200000)
+
+        with open(object_path, 'rb') as fh:
+            expected = snappy.StreamCompressor().add_chunk(fh.read())
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            compressor = StreamingCompressor(object_path, read_size=65536, executor=executor)
+            blocks = list()
+            while not compressor.is_complete:
+                blocks.append(compressor.read(10000))
+            compressor.close()
+
+        assert b''.join(blocks) == expected
+
+    def test_push_sets_compression_executor(self, mock_dataset_with_cache_dir, monkeypatch):
+        ds = mock_dataset_with_cache_dir[0]
+        m = Manifest(ds, 'tester')
+        objs = [PushObject(object_path='/tmp/fake', revision='abcd', dataset_path='test1.txt')]
+
+        executors = list()
+
+        def push_objects(self, objs, progress_update_fn=None):
+            executors.append(self.dataset.backend.compression_executor)
+            progress_update_fn(10)
+            return PushResult(success=objs, failure=[], message="")
+
+        monkeypatch.setattr(IOManager, 'push_objects', push_objects)
+
+        reports = list()
+        engine = TransferEngine(ds, m, compression_workers=2)
+        result = engine.push(objs, TransferProgress(10, lambda completed, total: reports.append(completed)))
+        assert result.success == objs
+        assert isinstance(executors[0], ProcessPoolExecutor)
+        assert ds.backend.compression_executor is None
+        assert reports[-1] == 10
+
+        # With a single worker, compression runs in the transfer thread
+        engine = TransferEngine(ds, m, compression_workers=1)
+        engine.push(objs, TransferProgress(10, lambda completed, total: None))
+        assert executors[1] is None
+
+    def test_pull_reports_on_failure(self, mock_dataset_with_cache_dir, monkeypatch):
+        ds = mock_dataset_with_cache_dir[0]
+        m = Manifest(ds, 'tester')
+
+        def pull_objects(self, keys, progress_update_fn=None, link_revision=True):
+            assert link_revision is False
+            assert self.dataset.backend.transfer_priority == PRIORITY_INTERACTIVE
+            progress_update_fn(5)
+            raise IOError("connection lost")
+
+        monkeypatch.setattr(IOManager, 'pull_objects', pull_objects)
+
+        reports = list()
+        engine = TransferEngine(ds, m, priority=PRIORITY_INTERACTIVE)
+        with pytest.raises(IOError):
+            engine.pull(['test1.txt'], TransferProgress(10, lambda completed, total: reports.append(completed)))
+        assert ds.backend.transfer_priority == PRIORITY_BACKGROUND
+
+        # The final total is reported even if the transfer fails
+        assert reports == [5, 5]
@@ -8,7 +8,9 @@ from rq import get_current_job
 
 from gtmcore.configuration import Configuration
 from gtmcore.dataset import Manifest
+from gtmcore.dataset.cache.objects import ObjectCacheManager
 from gtmcore.dataset.manifest.job import generate_bg_hash_job_list
+from gtmcore.dataset.manifest.scrubber import IntegrityScrubber, get_scrub_throttle
 from gtmcore.dispatcher import Dispatcher
 from gtmcore.gitlib import GitAuthor, RepoLocation
 from gtmcore.inventory.inventory import InventoryManager, InventoryException
@@ -16,8 +18,8 @@ from gtmcore.logging import LMLogger
 from gtmcore.workflows import gitworkflows_utils
 from gtmcore.workflows.gitlab import GitLabManager
 from gtmcore.dataset.io.manager import IOManager
-from gtmcore.dataset.io.job import BackgroundDownloadJob
-from gtmcore.dataset.io import PushObject
+from gtmcore.dataset.io.bandwidth import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from gtmcore.dataset.io.engine import TransferEngine, TransferProgress
 
 
 def hash_dataset_files(logged_in_username: str, dataset_owner: str, dataset_name: str,
@@ -44,9 +46,19 @@ def hash_dataset_files(logged_in_username: str, dataset_owner: str, dataset_name
         ds = InventoryManager(config_file=config_file).load_dataset(logged_in_username, dataset_owner, dataset_name)
         manifest = Manifest(ds, logged_in_username)
 
-        hash_result, fast_hash_result = manifest.hash_files(file_list)
-
         job = get_current_job()
+        progress = {'completed_bytes': 0, 'last_update': time.time()}
+
+        def update_progress(completed_bytes: int) -> None:
+            """Method to report the bytes processed so far to the job that scheduled this one, at most once a second"""
+            progress['completed_bytes'] += completed_bytes
+            if job and time.time() - progress['last_update'] > 1:
+                job.meta['completed_bytes'] = progress['completed_bytes']
+                job.save_meta()
+                progress['last_update'] = time.time()
+
+        hash_result, fast_hash_result = manifest.hash_files(file_list, progress_update_fn=update_progress)
+
         if job:
             job.meta['hash_result'] = ",".join(['None' if v is None else v for v in hash_result])
             job.meta['fast_hash_result'] = ",".join(['None' if v is None else v for v in fast_hash_result])
@@ -166,8 +178,8 @@ def complete_dataset_upload_transaction(logged_in_username: str, logged_in_email
                     schedule_bg_hash_job()
 
                     # Refresh all job statuses and update status feedback
-                    completed_job_status = [x.refresh_status() for x in job_list]
-                    completed_bytes = sum([s.total_bytes for s, c in zip(job_list, completed_job_status) if c is True])
+                    [x.refresh_status() for x in job_list]
+                    completed_bytes = sum([x.completed_bytes for x in job_list])
                     update_feedback(f"Please wait while file contents are analyzed. "
                                     f"{format_size(completed_bytes)} of {format_size(total_bytes)} complete...",
                                     percent_complete=(float(completed_bytes)/float(total_bytes)) * 100)
@@ -190,7 +202,8 @@ def complete_dataset_upload_transaction(logged_in_username: str, logged_in_email
                                 continue
 
                             _, file_bytes, mtime = fh.split("||")
-                            manifest._manifest_io.add_or_update(f, h, mtime, file_bytes)
+                            manifest._manifest_io.add_or_update(f, h, mtime, file_bytes,
+                                                                manifest.chunk_store.get_chunk_list_id(h))
                     else:
                         failed_files.extend(job.file_list)
 
@@ -285,133 +298,6 @@ def check_and_import_dataset(logged_in_username: str, dataset_owner: str, datase
         raise
 
 
-def push_dataset_objects(objs: List[PushObject], logged_in_username: str, access_token: str, id_token: str,
-                         dataset_owner: str, dataset_name: str, config_file: str = None) -> None:
-    """Method to pull a collection of objects from a dataset's backend
-
-    Args:
-        objs: List if file PushObject to push
-        logged_in_username: username for the currently logged in user
-        access_token: bearer token
-        id_token: identity token
-        dataset_owner: Owner of the dataset containing the files to download
-        dataset_name: Name of the dataset containing the files to download
-        config_file: config file (used for test mocking)
-
-    Returns:
-        str: directory path of imported labbook
-    """
-    logger = LMLogger.get_logger()
-
-    def progress_update_callback(completed_bytes: int) -> None:
-        """Method to update the job's metadata and provide feedback to the UI"""
-        current_job = get_current_job()
-        if not current_job:
-            return
-        if 'completed_bytes' not in current_job.meta:
-            current_job.meta['completed_bytes'] = 0
-
-        current_job.meta['completed_bytes'] = int(current_job.meta['completed_bytes']) + completed_bytes
-        current_job.save_meta()
-
-    try:
-        p = os.getpid()
-        logger.info(f"(Job {p}) Starting push_dataset_objects(logged_in_username={logged_in_username},"
-                    f"dataset_owner={dataset_owner}, dataset_name={dataset_name}")
-
-        im = InventoryManager(config_file=config_file)
-        ds = im.load_dataset(logged_in_username, dataset_owner, dataset_name)
-
-        ds.namespace = dataset_owner
-        ds.backend.set_default_configuration(logged_in_username, access_token, id_token)
-        m = Manifest(ds, logged_in_username)
-        iom = IOManager(ds, m)
-
-        result = iom.push_objects(objs, progress_update_fn=progress_update_callback)
-
-        job = get_current_job()
-        if job:
-            job.meta['failures'] = ",".join([f"{x.object_path}|{x.dataset_path}|{x.revision}" for x in result.failure])
-            job.meta['message'] = result.message
-            job.save_meta()
-
-    except Exception as err:
-        logger.exception(err)
-        raise
-
-
-def pull_objects(keys: List[str], logged_in_username: str, access_token: str, id_token: str,
-                 dataset_owner: str, dataset_name: str,
-                 labbook_owner: Optional[str] = None, labbook_name: Optional[str] = None,
-                 config_file: str = None) -> None:
-    """Method to pull a collection of objects from a dataset's backend.
-
-    This runs the IOManager.pull_objects() method with `link_revision=False`. This is because this job can be run in
-    parallel multiple times with different sets of keys. You don't want to link until the very end, which is handled
-    in the `download_dataset_files` job, which is what scheduled this job.
-
-    Args:
-        keys: List if file keys to download
-        logged_in_username: username for the currently logged in user
-        access_token: bearer token
-        id_token: identity token
-        dataset_owner: Owner of the dataset containing the files to download
-        dataset_name: Name of the dataset containing the files to download
-        labbook_owner: Owner of the labbook if this dataset is linked
-        labbook_name: Name of the labbook if this dataset is linked
-        config_file: config file (used for test mocking)
-
-    Returns:
-        str: directory path of imported labbook
-    """
-    logger = LMLogger.get_logger()
-
-    def progress_update_callback(completed_bytes: int) -> None:
-        """Method to update the job's metadata and provide feedback to the UI"""
-        current_job = get_current_job()
-        if not current_job:
-            return
-        if 'completed_bytes' not in current_job.meta:
-            current_job.meta['completed_bytes'] = 0
-
-        current_job.meta['completed_bytes'] = int(current_job.meta['completed_bytes']) + completed_bytes
-        current_job.save_meta()
-
-    try:
-        p = os.getpid()
-        logger.info(f"(Job {p}) Starting pull_objects(logged_in_username={logged_in_username},"
-                    f"dataset_owner={dataset_owner}, dataset_name={dataset_name}, labbook_owner={labbook_owner},"
-                    f" labbook_name={labbook_name}")
-
-        im = InventoryManager(config_file=config_file)
-
-        if labbook_owner is not None and labbook_name is not None:
-            # This is a linked dataset, load repo from the Project
-            lb = im.load_labbook(logged_in_username, labbook_owner, labbook_name)
-            dataset_dir = os.path.join(lb.root_dir, '.gigantum', 'datasets', dataset_owner, dataset_name)
-            ds = im.load_dataset_from_directory(dataset_dir)
-        else:
-            # this is a normal dataset. Load repo from working dir
-            ds = im.load_dataset(logged_in_username, dataset_owner, dataset_name)
-
-        ds.namespace = dataset_owner
-        ds.backend.set_default_configuration(logged_in_username, access_token, id_token)
-        m = Manifest(ds, logged_in_username)
-        iom = IOManager(ds, m)
-
-        result = iom.pull_objects(keys=keys, progress_update_fn=progress_update_callback, link_revision=False)
-
-        job = get_current_job()
-        if job:
-            job.meta['failure_keys'] = ",".join([x.dataset_path for x in result.failure])
-            job.meta['message'] = result.message
-            job.save_meta()
-
-    except Exception as err:
-        logger.exception(err)
-        raise
-
-
 def download_dataset_files(logged_in_username: str, access_token: str, id_token: str,
                            dataset_owner: str, dataset_name: str,
                            labbook_owner: Optional[str] = None, labbook_name: Optional[str] = None,
@@ -419,8 +305,8 @@ def download_dataset_files(logged_in_username: str, access_token: str, id_token:
                            config_file: str = None) -> None:
     """Method to download files from a dataset in the background and provide status to the UI.
 
-    This job schedules `pull_objects` jobs after splitting up the download work into batches. At the end, the job
-    removes any partially downloaded files (due to failures) and links all the files for the dataset.
+    All files are downloaded in this job by a TransferEngine. At the end, the job removes any partially downloaded
+    files (due to failures) and links all the files for the dataset.
 
     Args:
         logged_in_username: username for the currently logged in user
@@ -437,8 +323,6 @@ def download_dataset_files(logged_in_username: str, access_token: str, id_token:
     Returns:
         str: directory path of imported labbook
     """
-    dispatcher_obj = Dispatcher()
-
     def update_feedback(msg: str, has_failures: Optional[bool] = None, failure_detail: Optional[str] = None,
                         percent_complete: Optional[float] = None) -> None:
         """Method to update the job's metadata and provide feedback to the UI"""
@@ -478,56 +362,38 @@ def download_dataset_files(logged_in_username: str, access_token: str, id_token:
         m = Manifest(ds, logged_in_username)
         iom = IOManager(ds, m)
 
-        key_batches, total_bytes, num_files = iom.compute_pull_batches(keys, pull_all=all_keys)
+        keys_to_pull, total_bytes = iom.compute_pull_keys(keys, pull_all=all_keys)
+        num_files = len(keys_to_pull)
 
         failure_keys = list()
-        if key_batches:
-            # Schedule jobs for batches
-            bg_jobs = list()
-            for keys in key_batches:
-                job_kwargs = {
-                    'keys': keys,
-                    'logged_in_username': logged_in_username,
-                    'access_token': access_token,
-                    'id_token': id_token,
-                    'dataset_owner': dataset_owner,
-                    'dataset_name': dataset_name,
-                    'labbook_owner': labbook_owner,
-                    'labbook_name': labbook_name,
-                    'config_file': config_file,
-                }
-                job_metadata = {'dataset': f"{logged_in_username}|{dataset_owner}|{dataset_name}",
-                                'method': 'pull_objects'}
-
-                job_key = dispatcher_obj.dispatch_task(method_reference=pull_objects,
-                                                       kwargs=job_kwargs,
-                                                       metadata=job_metadata,
-                                                       persist=True)
-                bg_jobs.append(BackgroundDownloadJob(dispatcher_obj, keys, job_key))
+        if keys_to_pull:
+            def report_progress(completed_bytes: int, total: int) -> None:
+                pc = (float(completed_bytes) / float(total)) * 100 if total else 0
+                update_feedback(f"Please wait - Downloading {num_files} files ({format_size(completed_bytes)} of "
+                                f"{format_size(total)}) - {round(pc)}% complete",
+                                percent_complete=pc)
 
             update_feedback(f"Please wait - Downloading {num_files} files ({format_size(total_bytes)}) - 0% complete",
                             percent_complete=0,
                             has_failures=False)
             logger.info(f"(Job {p}) Starting file downloads for"
-                        f" {logged_in_username}/{dataset_owner}/{dataset_name} with {len(key_batches)} jobs")
-
-            while sum([(x.is_complete or x.is_failed) for x in bg_jobs]) != len(bg_jobs):
-                # Refresh all job statuses and update status feedback
-                [j.refresh_status() for j in bg_jobs]
-                total_completed_bytes = sum([j.completed_bytes for j in bg_jobs])
-                pc = (float(total_completed_bytes) / float(total_bytes)) * 100
-                update_feedback(f"Please wait - Downloading {num_files} files ({format_size(total_completed_bytes)} of "
-                                f"{format_size(total_bytes)}) - {round(pc)}% complete",
-                                percent_complete=pc)
-                time.sleep(1)
-
-            # Aggregate failures if they exist
-            for j in bg_jobs:
-                if j.is_failed:
-                    # Whole job failed...assume entire batch should get re-uploaded for now
-                    failure_keys.extend(j.keys)
-                else:
-                    failure_keys.extend(j.get_failed_keys())
+                        f" {logged_in_username}/{dataset_owner}/{dataset_name}")
+
+            # Files the user selected are downloaded ahead of other transfers, like downloading an entire dataset
+            priority = PRIORITY_BACKGROUND if all_keys else PRIORITY_INTERACTIVE
+            engine = TransferEngine(ds, m, priority=priority)
+            try:
+                result = engine.pull(keys_to_pull, TransferProgress(total_bytes, report_progress))
+                failure_keys.extend([x.dataset_path for x in result.failure])
+            except Exception as err:
+                # The whole transfer failed...assume every file should get re-downloaded for now
+                logger.exception(err)
+                failure_keys.extend(keys_to_pull)
+
+            current_job = get_current_job()
+            if current_job and ds.backend.concurrency_summary:
+                current_job.meta['concurrency'] = ds.backend.concurrency_summary
+                current_job.save_meta()
 
         # Set final status for UI
         if len(failure_keys) == 0:
@@ -548,7 +414,14 @@ def download_dataset_files(logged_in_username: str, access_token: str, id_token:
             update_feedback("", has_failures=True, failure_detail=failure_detail_str)
 
         # Link dataset files, so anything that was successfully pulled will materialize
-        m.link_revision()
+        m.link_revision(changed_keys=keys_to_pull)
+
+        # Keep the object cache within its budget, without evicting any of the files that were just requested
+        object_cache = ObjectCacheManager(m.cache_mgr)
+        if object_cache.max_bytes:
+            requested_objects = [m.manifest[key]['h'] for key in keys_to_pull if key in m.manifest]
+            object_cache.evict(keep=requested_objects)
+        object_cache.close()
 
         if len(failure_keys) > 0:
             # If any downloads failed, exit non-zero to the UI knows there was an error
@@ -557,3 +430,90 @@ def download_dataset_files(logged_in_username: str, access_token: str, id_token:
     except Exception as err:
         logger.exception(err)
         raise
+
+
+def scrub_dataset_cache(logged_in_username: str, dataset_owner: str, dataset_name: str,
+                        labbook_owner: Optional[str] = None, labbook_name: Optional[str] = None,
+                        config_file: str = None) -> None:
+    """Method to verify the files in a dataset's cache against the manifest in the background
+
+    The job continues the current integrity scrub pass for up to `max_seconds_per_job` seconds (from the
+    `datasets.scrubber` section of the client config), and then queues another job to continue from the checkpoint if
+    the pass is not complete. Whoever dispatches the first job must claim the cache with `ScrubState.try_claim()`, and
+    the claim is released once the pass is complete or a job fails.
+
+    Args:
+        logged_in_username: username for the currently logged in user
+        dataset_owner: Owner of the dataset to verify
+        dataset_name: Name of the dataset to verify
+        labbook_owner: Owner of the labbook if this dataset is linked
+        labbook_name: Name of the labbook if this dataset is linked
+        config_file: config file (used for test mocking)
+
+    Returns:
+        None
+    """
+    def update_feedback(msg: str) -> None:
+        """Method to update the job's metadata and provide feedback to the UI"""
+        current_job = get_current_job()
+        if not current_job:
+            return
+        current_job.meta['feedback'] = msg
+        current_job.save_meta()
+
+    logger = LMLogger.get_logger()
+
+    p = os.getpid()
+    logger.info(f"(Job {p}) Starting scrub_dataset_cache(logged_in_username={logged_in_username},"
+                f" dataset_owner={dataset_owner}, dataset_name={dataset_name}, labbook_owner={labbook_owner},"
+                f" labbook_name={labbook_name}")
+
+    # The claim is stored in the dataset's cache, so if the dataset or its manifest can't be loaded it can't be
+    # released, and expires on its own
+    scrubber: Optional[IntegrityScrubber] = None
+    try:
+        im = InventoryManager(config_file=config_file)
+        if labbook_owner is not None and labbook_name is not None:
+            # This is a linked dataset, load repo from the Project
+            lb = im.load_labbook(logged_in_username, labbook_owner, labbook_name)
+            dataset_dir = os.path.join(lb.root_dir, '.gigantum', 'datasets', dataset_owner, dataset_name)
+            ds = im.load_dataset_from_directory(dataset_dir)
+        else:
+            ds = im.load_dataset(logged_in_username, dataset_owner, dataset_name)
+
+        scrubber = IntegrityScrubber.from_config(Manifest(ds, logged_in_username))
+        scrubber.throttle = get_scrub_throttle(ds.client_config.config)
+
+        scrub_config = ds.client_config.config['datasets'].get('scrubber') or dict()
+        result = scrubber.scrub(max_seconds=scrub_config.get('max_seconds_per_job'), status_update_fn=update_feedback)
+
+        current_job = get_current_job()
+        if current_job:
+            current_job.meta['modified_keys'] = result.mismatches
+            current_job.save_meta()
+
+        if result.pass_complete:
+            scrubber.state.release_claim()
+        else:
+            scrubber.state.renew_claim(time.time())
+            Dispatcher().dispatch_task(scrub_dataset_cache,
+                                       kwargs={'logged_in_username': logged_in_username,
+                                               'dataset_owner': dataset_owner,
+                                               'dataset_name': dataset_name,
+                                               'labbook_owner': labbook_owner,
+                                               'labbook_name': labbook_name,
+                                               'config_file': config_file},
+                                       metadata={'dataset': f"{logged_in_username}|{dataset_owner}|{dataset_name}",
+                                                 'method': 'scrub_dataset_cache'})
+    except Exception as err:
+        logger.exception(err)
+        if scrubber is not None:
+            try:
+                scrubber.state.release_claim()
+            except Exception as release_err:
+                logger.error(f"(Job {p}) Failed to release the scrub claim on {dataset_owner}/{dataset_name}")
+                logger.exception(release_err)
+        raise
+    finally:
+        if scrubber is not None:
+            scrubber.close()
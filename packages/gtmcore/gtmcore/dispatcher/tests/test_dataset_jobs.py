@@ -6,14 +6,15 @@ import uuid
 from aioresponses import aioresponses
 import snappy
 from mock import patch
-from collections import namedtuple
 import responses
 
 import gtmcore
 import gtmcore.dispatcher.dataset_jobs
+from gtmcore.dataset.io.engine import TransferEngine
 from gtmcore.configuration import Configuration
 from gtmcore.dataset.io.manager import IOManager
 from gtmcore.dataset.manifest import Manifest
+from gtmcore.dataset.manifest.scrubber import IntegrityScrubber
 from gtmcore.dispatcher import jobs
 
 from gtmcore.dataset.tests.test_storage_local import mock_dataset_with_local_dir
@@ -38,214 +39,6 @@ def mock_dataset_head():
 
 @pytest.mark.skipif(BG_SKIP_TEST, reason=BG_SKIP_MSG)
 class TestDatasetBackgroundJobs(object):
-    def test_pull_objects(self, mock_config_file, mock_dataset_head):
-        im = InventoryManager(mock_config_file[0])
-        ds = im.create_dataset('default', 'default', "dataset100", storage_type="gigantum_object_v1", description="100")
-        m = Manifest(ds, 'default')
-        iom = IOManager(ds, m)
-
-        os.makedirs(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, "other_dir"))
-        helper_append_file(m.cache_mgr.cache_root, m.dataset_revision, "test1.txt", "asdfadfsdf")
-        helper_append_file(m.cache_mgr.cache_root, m.dataset_revision, "test2.txt", "fdsfgfd")
-        m.sweep_all_changes()
-
-        obj_to_push = iom.objects_to_push()
-        assert len(obj_to_push) == 2
-        _, obj_id_1 = obj_to_push[0].object_path.rsplit('/', 1)
-        _, obj_id_2 = obj_to_push[1].object_path.rsplit('/', 1)
-        obj1_target = obj_to_push[0].object_path
-        obj2_target = obj_to_push[1].object_path
-
-        obj1_source = os.path.join('/tmp', uuid.uuid4().hex)
-        obj2_source = os.path.join('/tmp', uuid.uuid4().hex)
-
-        assert os.path.exists(obj1_target) is True
-        assert os.path.exists(obj2_target) is True
-        helper_compress_file(obj1_target, obj1_source)
-        helper_compress_file(obj2_target, obj2_source)
-        assert os.path.isfile(obj1_target) is False
-        assert os.path.isfile(obj2_target) is False
-        assert os.path.isfile(obj1_source) is True
-        assert os.path.isfile(obj2_source) is True
-
-        # Clear out from linked dir
-        os.remove(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test1.txt'))
-        os.remove(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test2.txt'))
-
-        with patch.object(Configuration, 'find_default_config', lambda self: mock_config_file[0]):
-            with aioresponses() as mocked_responses:
-                mocked_responses.get(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj_id_1}',
-                                     payload={
-                                             "presigned_url": f"https://dummyurl.com/{obj_id_1}?params=1",
-                                             "namespace": ds.namespace,
-                                             "obj_id": obj_id_1,
-                                             "dataset": ds.name
-                                     },
-                                     status=200)
-
-                with open(obj1_source, 'rb') as data1:
-                    mocked_responses.get(f"https://dummyurl.com/{obj_id_1}?params=1",
-                                         body=data1.read(), status=200,
-                                         content_type='application/octet-stream')
-
-                mocked_responses.get(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj_id_2}',
-                                     payload={
-                                             "presigned_url": f"https://dummyurl.com/{obj_id_2}?params=1",
-                                             "namespace": ds.namespace,
-                                             "obj_id": obj_id_2,
-                                             "dataset": ds.name
-                                     },
-                                     status=200)
-
-                with open(obj2_source, 'rb') as data2:
-                    mocked_responses.get(f"https://dummyurl.com/{obj_id_2}?params=1",
-                                         body=data2.read(), status=200,
-                                         content_type='application/octet-stream')
-
-                dl_kwargs = {
-                    'logged_in_username': "default",
-                    'access_token': "asdf",
-                    'id_token': "1234",
-                    'dataset_owner': "default",
-                    'dataset_name': "dataset100",
-                    'labbook_owner': None,
-                    'labbook_name': None,
-                    'keys': ["test1.txt"]
-                }
-
-                gtmcore.dispatcher.dataset_jobs.pull_objects(**dl_kwargs)
-
-                # Manually link since this is disabled by default in the job (because in real use, multiple jobs run
-                # in parallel and you only want to link once.
-                m.link_revision()
-
-                assert os.path.isfile(obj1_target) is True
-                assert os.path.isfile(obj2_target) is False
-
-                decompressor = snappy.StreamDecompressor()
-                with open(obj1_source, 'rb') as dd:
-                    source1 = decompressor.decompress(dd.read())
-                    source1 += decompressor.flush()
-                with open(obj1_target, 'rt') as dd:
-                    dest1 = dd.read()
-                assert source1.decode("utf-8") == dest1
-
-                # Download other file
-                dl_kwargs = {
-                    'logged_in_username': "default",
-                    'access_token': "asdf",
-                    'id_token': "1234",
-                    'dataset_owner': "default",
-                    'dataset_name': "dataset100",
-                    'labbook_owner': None,
-                    'labbook_name': None,
-                    'keys': ["test2.txt"]
-                }
-
-                gtmcore.dispatcher.dataset_jobs.pull_objects(**dl_kwargs)
-
-                # Manually link since this is disabled by default in the job (because in real use, multiple jobs run
-                # in parallel and you only want to link once.
-                m.link_revision()
-
-                assert os.path.isfile(obj1_target) is True
-                assert os.path.isfile(obj2_target) is True
-
-                with open(obj1_source, 'rb') as dd:
-                    source1 = decompressor.decompress(dd.read())
-                    source1 += decompressor.flush()
-                with open(obj1_target, 'rt') as dd:
-                    dest1 = dd.read()
-                assert source1.decode("utf-8") == dest1
-
-                with open(obj2_source, 'rb') as dd:
-                    source1 = decompressor.decompress(dd.read())
-                    source1 += decompressor.flush()
-                with open(obj2_target, 'rt') as dd:
-                    dest1 = dd.read()
-                assert source1.decode("utf-8") == dest1
-
-    def test_pull_objects_error(self, mock_config_file, mock_dataset_head):
-        im = InventoryManager(mock_config_file[0])
-        ds = im.create_dataset('default', 'default', "dataset100", storage_type="gigantum_object_v1", description="100")
-        m = Manifest(ds, 'default')
-        iom = IOManager(ds, m)
-
-        os.makedirs(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, "other_dir"))
-        helper_append_file(m.cache_mgr.cache_root, m.dataset_revision, "test1.txt", "asdfadfsdf")
-        helper_append_file(m.cache_mgr.cache_root, m.dataset_revision, "test2.txt", "fdsfgfd")
-        m.sweep_all_changes()
-
-        obj_to_push = iom.objects_to_push()
-        assert len(obj_to_push) == 2
-        _, obj_id_1 = obj_to_push[0].object_path.rsplit('/', 1)
-        _, obj_id_2 = obj_to_push[1].object_path.rsplit('/', 1)
-        obj1_target = obj_to_push[0].object_path
-        obj2_target = obj_to_push[1].object_path
-
-        obj1_source = os.path.join('/tmp', uuid.uuid4().hex)
-        obj2_source = os.path.join('/tmp', uuid.uuid4().hex)
-
-        assert os.path.exists(obj1_target) is True
-        assert os.path.exists(obj2_target) is True
-        helper_compress_file(obj1_target, obj1_source)
-        helper_compress_file(obj2_target, obj2_source)
-        assert os.path.isfile(obj1_target) is False
-        assert os.path.isfile(obj2_target) is False
-        assert os.path.isfile(obj1_source) is True
-        assert os.path.isfile(obj2_source) is True
-
-        # Clear out from linked dir
-        os.remove(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test1.txt'))
-        os.remove(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test2.txt'))
-
-        with patch.object(Configuration, 'find_default_config', lambda self: mock_config_file[0]):
-            with aioresponses() as mocked_responses:
-                mocked_responses.get(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj_id_1}',
-                                     payload={
-                                             "presigned_url": f"https://dummyurl.com/{obj_id_1}?params=1",
-                                             "namespace": ds.namespace,
-                                             "obj_id": obj_id_1,
-                                             "dataset": ds.name
-                                     },
-                                     status=200)
-
-                with open(obj1_source, 'rb') as data1:
-                    mocked_responses.get(f"https://dummyurl.com/{obj_id_1}?params=1",
-                                         body=data1.read(), status=200,
-                                         content_type='application/octet-stream')
-
-                mocked_responses.get(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj_id_2}',
-                                     payload={
-                                             "presigned_url": f"https://dummyurl.com/{obj_id_2}?params=1",
-                                             "namespace": ds.namespace,
-                                             "obj_id": obj_id_2,
-                                             "dataset": ds.name
-                                     },
-                                     status=400)
-
-                dl_kwargs = {
-                    'logged_in_username': "default",
-                    'access_token': "asdf",
-                    'id_token': "1234",
-                    'dataset_owner': "default",
-                    'dataset_name': "dataset100",
-                    'labbook_owner': None,
-                    'labbook_name': None,
-                    'keys': ['test1.txt', 'test2.txt']
-                }
-
-                gtmcore.dispatcher.dataset_jobs.pull_objects(**dl_kwargs)
-
-                # Manually link since this is disabled by default in the job (because in real use, multiple jobs run
-                # in parallel and you only want to link once.
-                m.link_revision()
-
-                assert os.path.isfile(obj1_target) is True
-                assert os.path.isfile(obj2_target) is False
-                assert os.path.isfile(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test1.txt')) is True
-                assert os.path.isfile(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test2.txt')) is False
-
     def test_update_from_remote(self, mock_dataset_with_local_dir):
         ds = mock_dataset_with_local_dir[0]
         m = Manifest(ds, 'tester')
@@ -418,6 +211,58 @@ class TestDatasetBackgroundJobs(object):
             assert job.meta['modified_keys'] == ["test1.txt"]
             assert 'Validating contents of 3 files.' in job.meta['feedback']
 
+    def test_scrub_dataset_cache(self, mock_config_file):
+        class JobMock():
+            def __init__(self):
+                self.meta = dict()
+
+            def save_meta(self):
+                pass
+
+        current_job = JobMock()
+
+        im = InventoryManager(mock_config_file[0])
+        ds = im.create_dataset('default', 'default', "dataset100", storage_type="gigantum_object_v1", description="100")
+        m = Manifest(ds, 'default')
+        helper_append_file(m.cache_mgr.cache_root, m.dataset_revision, "test1.txt", "asdfadfsdf")
+        helper_append_file(m.cache_mgr.cache_root, m.dataset_revision, "test2.txt", "fdsfgfd")
+        m.sweep_all_changes()
+
+        with open(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, "test2.txt"), 'wt') as tf:
+            tf.write("This file got changed in the cache")
+
+        scrubber = IntegrityScrubber(m)
+        assert scrubber.needs_scrub() is True
+        assert scrubber.state.try_claim(time.time()) is True
+
+        with patch('gtmcore.dispatcher.dataset_jobs.get_current_job', lambda: current_job):
+            gtmcore.dispatcher.dataset_jobs.scrub_dataset_cache('default', 'default', 'dataset100',
+                                                                config_file=mock_config_file[0])
+
+        assert current_job.meta['modified_keys'] == ["test2.txt"]
+        assert 'Integrity check complete. Verified 2 files' in current_job.meta['feedback']
+
+        # The pass is complete, so the claim was released and the results can be read without hashing
+        assert scrubber.needs_scrub() is False
+        assert scrubber.mismatches() == ["test2.txt"]
+        assert scrubber.state.try_claim(time.time()) is True
+        scrubber.close()
+
+    def test_scrub_dataset_cache_setup_fails(self, mock_config_file):
+        im = InventoryManager(mock_config_file[0])
+        ds = im.create_dataset('default', 'default', "dataset100", storage_type="gigantum_object_v1", description="100")
+        scrubber = IntegrityScrubber(Manifest(ds, 'default'))
+        assert scrubber.state.try_claim(time.time()) is True
+
+        with patch('gtmcore.dispatcher.dataset_jobs.get_scrub_throttle', side_effect=ValueError("No throttle")):
+            with pytest.raises(ValueError):
+                gtmcore.dispatcher.dataset_jobs.scrub_dataset_cache('default', 'default', 'dataset100',
+                                                                    config_file=mock_config_file[0])
+
+        # The claim was released, so the next request can dispatch a scrub
+        assert scrubber.state.try_claim(time.time()) is True
+        scrubber.close()
+
     def test_complete_dataset_upload_transaction_simple(self, mock_config_file_background_tests):
         im = InventoryManager(mock_config_file_background_tests[0])
         ds = im.create_dataset('default', 'default', "new-ds", storage_type="gigantum_object_v1", description="100")
@@ -710,29 +555,6 @@ class TestDatasetBackgroundJobs(object):
         assert ds.namespace == 'default'
 
     def test_download_dataset_files(self, mock_config_file_background_tests, mock_dataset_head):
-        def dispatch_query_mock(self, job_key):
-            JobStatus = namedtuple("JobStatus", ['status', 'meta'])
-            return JobStatus(status='finished', meta={'completed_bytes': '500'})
-
-        def dispatch_mock(self, method_reference, kwargs, metadata, persist):
-            with aioresponses() as mocked_responses:
-                mocked_responses.get(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj_id_1}',
-                                     payload={
-                                             "presigned_url": f"https://dummyurl.com/{obj_id_1}?params=1",
-                                             "namespace": ds.namespace,
-                                             "obj_id": obj_id_1,
-                                             "dataset": ds.name
-                                     },
-                                     status=200)
-
-                with open(obj1_source, 'rb') as data1:
-                    mocked_responses.get(f"https://dummyurl.com/{obj_id_1}?params=1",
-                                         body=data1.read(), status=200,
-                                         content_type='application/octet-stream')
-                gtmcore.dispatcher.dataset_jobs.pull_objects(**kwargs)
-
-                return "afakejobkey"
-
         im = InventoryManager(mock_config_file_background_tests[0])
         ds = im.create_dataset('default', 'default', "dataset100", storage_type="gigantum_object_v1", description="100")
         m = Manifest(ds, 'default')
@@ -757,41 +579,46 @@ class TestDatasetBackgroundJobs(object):
         os.remove(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test1.txt'))
 
         with patch.object(Configuration, 'find_default_config', lambda self: mock_config_file_background_tests[0]):
-            with patch.object(Dispatcher, 'dispatch_task', dispatch_mock):
-                with patch.object(Dispatcher, 'query_task', dispatch_query_mock):
-                    dl_kwargs = {
-                        'logged_in_username': "default",
-                        'access_token': "asdf",
-                        'id_token': "1234",
-                        'dataset_owner': "default",
-                        'dataset_name': "dataset100",
-                        'labbook_owner': None,
-                        'labbook_name': None,
-                        'keys': ["test1.txt"],
-                        'config_file': mock_config_file_background_tests[0]
-                    }
+            with aioresponses() as mocked_responses:
+                mocked_responses.get(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj_id_1}',
+                                     payload={
+                                             "presigned_url": f"https://dummyurl.com/{obj_id_1}?params=1",
+                                             "namespace": ds.namespace,
+                                             "obj_id": obj_id_1,
+                                             "dataset": ds.name
+                                     },
+                                     status=200)
 
-                    gtmcore.dispatcher.dataset_jobs.download_dataset_files(**dl_kwargs)
-                    assert os.path.isfile(obj1_target) is True
-
-                    decompressor = snappy.StreamDecompressor()
-                    with open(obj1_source, 'rb') as dd:
-                        source1 = decompressor.decompress(dd.read())
-                        source1 += decompressor.flush()
-                    with open(obj1_target, 'rt') as dd:
-                        dest1 = dd.read()
-                    assert source1.decode("utf-8") == dest1
-
-    def test_download_dataset_files_file_fail(self, mock_config_file_background_tests):
-        def dispatch_query_mock(self, job_key):
-            # mock the job actually running and returning status
-            JobStatus = namedtuple("JobStatus", ['status', 'meta'])
-            return JobStatus(status='finished', meta={'completed_bytes': '0', 'failure_keys': 'test1.txt'})
-
-        def dispatch_mock(self, method_reference, kwargs, metadata, persist):
-                gtmcore.dispatcher.dataset_jobs.pull_objects(**kwargs)
-                return "afakejobkey"
+                with open(obj1_source, 'rb') as data1:
+                    mocked_responses.get(f"https://dummyurl.com/{obj_id_1}?params=1",
+                                         body=data1.read(), status=200,
+                                         content_type='application/octet-stream')
+
+                dl_kwargs = {
+                    'logged_in_username': "default",
+                    'access_token': "asdf",
+                    'id_token': "1234",
+                    'dataset_owner': "default",
+                    'dataset_name': "dataset100",
+                    'labbook_owner': None,
+                    'labbook_name': None,
+                    'keys': ["test1.txt"],
+                    'config_file': mock_config_file_background_tests[0]
+                }
+
+                gtmcore.dispatcher.dataset_jobs.download_dataset_files(**dl_kwargs)
+                assert os.path.isfile(obj1_target) is True
+                assert os.path.isfile(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test1.txt'))
+
+                decompressor = snappy.StreamDecompressor()
+                with open(obj1_source, 'rb') as dd:
+                    source1 = decompressor.decompress(dd.read())
+                    source1 += decompressor.flush()
+                with open(obj1_target, 'rt') as dd:
+                    dest1 = dd.read()
+                assert source1.decode("utf-8") == dest1
 
+    def test_download_dataset_files_file_fail(self, mock_config_file_background_tests, mock_dataset_head):
         im = InventoryManager(mock_config_file_background_tests[0])
         ds = im.create_dataset('default', 'default', "dataset100", storage_type="gigantum_object_v1", description="100")
         m = Manifest(ds, 'default')
@@ -816,33 +643,29 @@ class TestDatasetBackgroundJobs(object):
         os.remove(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test1.txt'))
 
         with patch.object(Configuration, 'find_default_config', lambda self: mock_config_file_background_tests[0]):
-            with patch.object(Dispatcher, 'dispatch_task', dispatch_mock):
-                with patch.object(Dispatcher, 'query_task', dispatch_query_mock):
-                    dl_kwargs = {
-                        'logged_in_username': "default",
-                        'access_token': "asdf",
-                        'id_token': "1234",
-                        'dataset_owner': "default",
-                        'dataset_name': "dataset100",
-                        'labbook_owner': None,
-                        'labbook_name': None,
-                        'keys': ["test1.txt"],
-                        'config_file': mock_config_file_background_tests[0]
-                    }
-
-                    with pytest.raises(IOError):
-                        gtmcore.dispatcher.dataset_jobs.download_dataset_files(**dl_kwargs)
-                    assert os.path.isfile(obj1_target) is False
+            # The object service doesn't have the object, so the download fails
+            with aioresponses() as mocked_responses:
+                mocked_responses.get(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj_id_1}',
+                                     status=404)
+                dl_kwargs = {
+                    'logged_in_username': "default",
+                    'access_token': "asdf",
+                    'id_token': "1234",
+                    'dataset_owner': "default",
+                    'dataset_name': "dataset100",
+                    'labbook_owner': None,
+                    'labbook_name': None,
+                    'keys': ["test1.txt"],
+                    'config_file': mock_config_file_background_tests[0]
+                }
 
-    def test_download_dataset_files_job_fail(self, mock_config_file_background_tests):
-        def dispatch_query_mock(self, job_key):
-            # mock the job actually running and returning status
-            JobStatus = namedtuple("JobStatus", ['status', 'meta'])
-            return JobStatus(status='failed', meta={'completed_bytes': '0'})
+                with pytest.raises(IOError):
+                    gtmcore.dispatcher.dataset_jobs.download_dataset_files(**dl_kwargs)
+                assert os.path.isfile(obj1_target) is False
 
-        def dispatch_mock(self, method_reference, kwargs, metadata, persist):
-                gtmcore.dispatcher.dataset_jobs.pull_objects(**kwargs)
-                return "afakejobkey"
+    def test_download_dataset_files_job_fail(self, mock_config_file_background_tests):
+        def pull_mock(self, keys, progress):
+            raise IOError("The transfer failed")
 
         im = InventoryManager(mock_config_file_background_tests[0])
         ds = im.create_dataset('default', 'default', "dataset100", storage_type="gigantum_object_v1", description="100")
@@ -868,75 +691,19 @@ class TestDatasetBackgroundJobs(object):
         os.remove(os.path.join(m.cache_mgr.cache_root, m.dataset_revision, 'test1.txt'))
 
         with patch.object(Configuration, 'find_default_config', lambda self: mock_config_file_background_tests[0]):
-            with patch.object(Dispatcher, 'dispatch_task', dispatch_mock):
-                with patch.object(Dispatcher, 'query_task', dispatch_query_mock):
-                    dl_kwargs = {
-                        'logged_in_username': "default",
-                        'access_token': "asdf",
-                        'id_token': "1234",
-                        'dataset_owner': "default",
-                        'dataset_name': "dataset100",
-                        'labbook_owner': None,
-                        'labbook_name': None,
-                        'keys': ["test1.txt"],
-                        'config_file': mock_config_file_background_tests[0]
-                    }
-
-                    with pytest.raises(IOError):
-                        gtmcore.dispatcher.dataset_jobs.download_dataset_files(**dl_kwargs)
-                    assert os.path.isfile(obj1_target) is False
-
-    def test_push_objects(self, mock_config_file, mock_dataset_head):
-        im = InventoryManager(mock_config_file[0])
-        ds = im.create_dataset('default', 'default', "dataset100", storage_type="gigantum_object_v1", description="100")
-        manifest = Manifest(ds, 'default')
-        iom = IOManager(ds, manifest)
-
-        revision = manifest.dataset_revision
-        os.makedirs(os.path.join(manifest.cache_mgr.cache_root, revision, "other_dir"))
-        helper_append_file(manifest.cache_mgr.cache_root, revision, "test1.txt", "test content 1")
-        helper_append_file(manifest.cache_mgr.cache_root, revision, "test2.txt", "test content 2")
-        manifest.sweep_all_changes()
+            with patch.object(TransferEngine, 'pull', pull_mock):
+                dl_kwargs = {
+                    'logged_in_username': "default",
+                    'access_token': "asdf",
+                    'id_token': "1234",
+                    'dataset_owner': "default",
+                    'dataset_name': "dataset100",
+                    'labbook_owner': None,
+                    'labbook_name': None,
+                    'keys': ["test1.txt"],
+                    'config_file': mock_config_file_background_tests[0]
+                }
 
-        obj_to_push = iom.objects_to_push()
-        assert len(obj_to_push) == 2
-        _, obj1 = obj_to_push[0].object_path.rsplit('/', 1)
-        _, obj2 = obj_to_push[1].object_path.rsplit('/', 1)
-
-        with aioresponses() as mocked_responses:
-            mocked_responses.put(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj1}',
-                                 payload={
-                                     "presigned_url": f"https://dummyurl.com/{obj1}?params=1",
-                                     "namespace": ds.namespace,
-                                     "key_id": "hghghg",
-                                     "obj_id": obj1,
-                                     "dataset": ds.name
-                                 },
-                                 status=200)
-            mocked_responses.put(f"https://dummyurl.com/{obj1}?params=1",
-                                 payload={},
-                                 status=200)
-
-            mocked_responses.put(f'https://api.gigantum.com/object-v1/{ds.namespace}/{ds.name}/{obj2}',
-                                 payload={
-                                     "presigned_url": f"https://dummyurl.com/{obj2}?params=1",
-                                     "namespace": ds.namespace,
-                                     "key_id": "hghghg",
-                                     "obj_id": obj2,
-                                     "dataset": ds.name
-                                 },
-                                 status=200)
-            mocked_responses.put(f"https://dummyurl.com/{obj2}?params=1",
-                                 payload={},
-                                 status=200)
-
-            job_kwargs = {
-                'objs': obj_to_push,
-                'logged_in_username': "default",
-                'access_token': "faketoken",
-                'id_token': "faketoken",
-                'dataset_owner': ds.namespace,
-                'dataset_name': ds.name,
-                'config_file': ds.client_config.config_file,
-            }
-            gtmcore.dispatcher.dataset_jobs.push_dataset_objects(**job_kwargs)
+                with pytest.raises(IOError):
+                    gtmcore.dispatcher.dataset_jobs.download_dataset_files(**dl_kwargs)
+                assert os.path.isfile(obj1_target) is False
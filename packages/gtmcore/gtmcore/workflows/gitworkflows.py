@@ -1,9 +1,7 @@
 from abc import ABC, abstractmethod
 import os
-import time
 from enum import Enum
-import glob
-from typing import Optional, Callable, cast, List
+from typing import Optional, Callable, cast, List, Set
 from humanfriendly import format_size
 
 from gtmcore.configuration.utils import call_subprocess
@@ -19,9 +17,7 @@ from gtmcore.dataset import Dataset
 from gtmcore.inventory.branching import BranchManager
 from gtmcore.dataset.manifest import Manifest
 from gtmcore.dataset.io.manager import IOManager
-from gtmcore.dispatcher import Dispatcher
-import gtmcore.dispatcher.dataset_jobs
-from gtmcore.dataset.io.job import BackgroundUploadJob
+from gtmcore.dataset.io.engine import TransferEngine, TransferProgress
 
 logger = LMLogger.get_logger()
 
@@ -295,70 +291,55 @@ class DatasetWorkflow(GitWorkflow):
         Returns:
 
         """
-        dispatcher_obj = Dispatcher()
-
         try:
             self.dataset.backend.set_default_configuration(logged_in_username, access_token, id_token)
             m = Manifest(self.dataset, logged_in_username)
             iom = IOManager(self.dataset, m)
 
-            obj_batches, total_bytes, num_files = iom.compute_push_batches()
-
-            if obj_batches:
-                # Schedule jobs for batches
-                bg_jobs = list()
-                for objs in obj_batches:
-                    job_kwargs = {
-                        'objs': objs,
-                        'logged_in_username': logged_in_username,
-                        'access_token': access_token,
-                        'id_token': id_token,
-                        'dataset_owner': self.dataset.namespace,
-                        'dataset_name': self.dataset.name,
-                        'config_file': self.dataset.client_config.config_file,
-                    }
-                    job_metadata = {'dataset': f"{logged_in_username}|{self.dataset.namespace}|{self.dataset.name}",
-                                    'method': 'pull_objects'}
-
-                    feedback_callback(f"Preparing to upload {num_files} files. Please wait...")
-                    job_key = dispatcher_obj.dispatch_task(method_reference=gtmcore.dispatcher.dataset_jobs.push_dataset_objects,
-                                                           kwargs=job_kwargs,
-                                                           metadata=job_metadata,
-                                                           persist=True)
-                    bg_jobs.append(BackgroundUploadJob(dispatcher_obj, objs, job_key))
-                    logger.info(f"Schedule dataset object upload job for"
-                                f" {logged_in_username}/{self.dataset.namespace}/{self.dataset.name} with"
-                                f" {len(objs)} objects to upload")
-
-                while sum([(x.is_complete or x.is_failed) for x in bg_jobs]) != len(bg_jobs):
-                    # Refresh all job statuses and update status feedback
-                    [j.refresh_status() for j in bg_jobs]
-                    total_completed_bytes = sum([j.completed_bytes for j in bg_jobs])
-                    if total_completed_bytes > 0:
-                        pc = (float(total_completed_bytes) / float(total_bytes)) * 100
-                        feedback_callback(f"Please wait - Uploading {num_files} files ({format_size(total_completed_bytes)}"
-                                          f" of {format_size(total_bytes)}) - {round(pc)}% complete",
+            objs, total_bytes = iom.compute_push_objects()
+            num_files = len(objs)
+
+            # Objects that are already stored remotely don't need to be uploaded, but are handled as if pushed
+            existing_object_ids = [os.path.basename(obj.object_path) for obj in iom.existing_push_objects]
+            if existing_object_ids:
+                feedback_callback(f"Skipping {len(existing_object_ids)} files "
+                                  f"({format_size(iom.existing_push_bytes)}) that are already uploaded.")
+
+            if objs:
+                def report_progress(completed_bytes: int, total: int) -> None:
+                    if completed_bytes > 0:
+                        pc = (float(completed_bytes) / float(total)) * 100
+                        feedback_callback(f"Please wait - Uploading {num_files} files ({format_size(completed_bytes)}"
+                                          f" of {format_size(total)}) - {round(pc)}% complete",
                                           percent_complete=pc)
-                    time.sleep(1)
 
-                # if you get here, all jobs are done or failed.
-                # Remove all the push files so they can be regenerated if needed
-                for f in glob.glob(f'{iom.push_dir}/*'):
-                    os.remove(f)
+                feedback_callback(f"Preparing to upload {num_files} files. Please wait...")
+                logger.info(f"Uploading {len(objs)} objects for"
+                            f" {logged_in_username}/{self.dataset.namespace}/{self.dataset.name}")
+
+                engine = TransferEngine(self.dataset, m)
+                try:
+                    failed_push_objects = engine.push(objs, TransferProgress(total_bytes, report_progress)).failure
+                except Exception as err:
+                    # The whole transfer failed. Assume every object should get re-uploaded
+                    logger.exception(err)
+                    failed_push_objects = objs
 
                 # Aggregate failures if they exist
                 failure_keys: List[str] = list()
-                for j in bg_jobs:
-                    if j.is_failed:
-                        # Background job hard failed. Assume entire batch should get re-uploaded
-                        for obj in j.objs:
-                            failure_keys.append(f"{obj.dataset_path} at {obj.revision[0:8]}")
-                            m.queue_to_push(obj.object_path, obj.dataset_path, obj.revision)
-                    else:
-                        for obj in j.get_failed_objects():
-                            # Some individual objects failed
-                            failure_keys.append(f"{obj.dataset_path} at {obj.revision[0:8]}")
-                            m.queue_to_push(obj.object_path, obj.dataset_path, obj.revision)
+                failed_objects: Set[str] = set()
+                for obj in failed_push_objects:
+                    failure_keys.append(f"{obj.dataset_path} at {obj.revision[0:8]}")
+                    failed_objects.add(obj.object_path)
+
+                # Remove the objects that are now stored remotely from the push queue in a single transaction. Objects
+                # that failed, and objects queued while the push was running, stay queued
+                pushed_object_ids = [os.path.basename(obj.object_path) for obj in objs
+                                     if obj.object_path not in failed_objects] + existing_object_ids
+                m.push_queue.remove_object_ids(pushed_object_ids)
+
+                # Chunks that were pushed are still stored in the files they came from, so remove the copies
+                m.chunk_store.remove_chunk_objects(pushed_object_ids)
 
                 # Set final status for UI
                 if len(failure_keys) == 0:
@@ -376,6 +357,11 @@ class DatasetWorkflow(GitWorkflow):
                     raise IOError(
                         f"{len(failure_keys)} file(s) failed to upload. Check message detail for more information"
                         " and try to sync again.")
+            elif existing_object_ids:
+                # Everything was already uploaded, so just remove the objects from the push queue
+                m.push_queue.remove_object_ids(existing_object_ids)
+                m.chunk_store.remove_chunk_objects(existing_object_ids)
+                feedback_callback(f"Upload complete!", percent_complete=100, has_failures=False)
         except Exception as err:
             logger.exception(err)
             raise
@@ -8,9 +8,7 @@ import subprocess
 import os
 from pkg_resources import resource_filename
 import time
-import glob
 from mock import patch
-from collections import namedtuple
 
 from gtmcore.configuration.utils import call_subprocess
 from gtmcore.gitlib import RepoLocation
@@ -26,6 +24,8 @@ import gtmcore.dispatcher.dataset_jobs
 from gtmcore.dataset.manifest import Manifest
 from gtmcore.fixtures.datasets import helper_append_file
 from gtmcore.dataset.io.manager import IOManager
+from gtmcore.dataset.io.engine import TransferEngine
+from gtmcore.dataset.io import PushObject, PushResult
 
 
 def _mock_fetch(self, remote):
@@ -637,12 +637,9 @@ class TestGitWorkflowsMethods(object):
             assert has_failures is None or has_failures is False
             assert failure_detail is None
 
-        def dispatch_query_mock(self, job_key):
-            JobStatus = namedtuple("JobStatus", ['status', 'meta'])
-            return JobStatus(status='finished', meta={'completed_bytes': '500'})
-
-        def dispatch_mock(self, method_reference, kwargs, metadata, persist):
-                return "afakejobkey"
+        def push_mock(self, objs, progress):
+            progress.update(500)
+            return PushResult(success=objs, failure=[], message="Successfully synced all objects")
 
         username = 'test'
         im = InventoryManager(mock_config_file[0])
@@ -655,13 +652,12 @@ class TestGitWorkflowsMethods(object):
         m.sweep_all_changes()
 
         iom = IOManager(ds, m)
-        assert len(glob.glob(f'{iom.push_dir}/*')) == 1
+        assert len(iom.push_queue.revisions()) == 1
 
-        with patch.object(Dispatcher, 'dispatch_task', dispatch_mock):
-            with patch.object(Dispatcher, 'query_task', dispatch_query_mock):
-                wf.publish(username=username, feedback_callback=update_feedback)
-                assert os.path.exists(wf.remote)
-                assert len(glob.glob(f'{iom.push_dir}/*')) == 0
+        with patch.object(TransferEngine, 'push', push_mock):
+            wf.publish(username=username, feedback_callback=update_feedback)
+            assert os.path.exists(wf.remote)
+            assert len(iom.push_queue.revisions()) == 0
 
     @mock.patch('gtmcore.workflows.gitworkflows_utils.create_remote_gitlab_repo', new=_MOCK_create_remote_repo)
     def test_sync__dataset(self, mock_config_file):
@@ -671,12 +667,9 @@ class TestGitWorkflowsMethods(object):
             assert has_failures is None or has_failures is False
             assert failure_detail is None
 
-        def dispatch_query_mock(self, job_key):
-            JobStatus = namedtuple("JobStatus", ['status', 'meta'])
-            return JobStatus(status='finished', meta={'completed_bytes': '100'})
-
-        def dispatch_mock(self, method_reference, kwargs, metadata, persist):
-                return "afakejobkey"
+        def push_mock(self, objs, progress):
+            progress.update(100)
+            return PushResult(success=objs, failure=[], message="Successfully synced all objects")
 
         username = 'test'
         im = InventoryManager(mock_config_file[0])
@@ -685,19 +678,51 @@ class TestGitWorkflowsMethods(object):
         wf = DatasetWorkflow(ds)
 
         iom = IOManager(ds, m)
-        assert len(glob.glob(f'{iom.push_dir}/*')) == 0
+        assert len(iom.push_queue.revisions()) == 0
         wf.publish(username=username, feedback_callback=update_feedback)
 
         # Put a file into the dataset that needs to be pushed
         helper_append_file(m.cache_mgr.cache_root, m.dataset_revision, "test1.txt", "asdfadfsdf")
         m.sweep_all_changes()
 
-        assert len(glob.glob(f'{iom.push_dir}/*')) == 1
-        with patch.object(Dispatcher, 'dispatch_task', dispatch_mock):
-            with patch.object(Dispatcher, 'query_task', dispatch_query_mock):
-                wf.sync(username=username, feedback_callback=update_feedback)
-                assert os.path.exists(wf.remote)
-                assert len(glob.glob(f'{iom.push_dir}/*')) == 0
+        assert len(iom.push_queue.revisions()) == 1
+        with patch.object(TransferEngine, 'push', push_mock):
+            wf.sync(username=username, feedback_callback=update_feedback)
+            assert os.path.exists(wf.remote)
+            assert len(iom.push_queue.revisions()) == 0
+
+    @mock.patch('gtmcore.workflows.gitworkflows_utils.create_remote_gitlab_repo', new=_MOCK_create_remote_repo)
+    def test_sync__dataset_keeps_failed_and_new_objects_queued(self, mock_config_file):
+        queued_during_push = list()
+
+        def push_mock(self, objs, progress):
+            # Another file is written while the push is running
+            new_obj = PushObject(object_path=os.path.join(os.path.dirname(objs[0].object_path), 'f' * 32),
+                                 revision='abcdef12', dataset_path='new.txt')
+            m.push_queue.enqueue_many([new_obj])
+            queued_during_push.append(new_obj)
+
+            failed = [o for o in objs if o.dataset_path == 'test2.txt']
+            return PushResult(success=[o for o in objs if o not in failed], failure=failed, message="Failed")
+
+        username = 'test'
+        im = InventoryManager(mock_config_file[0])
+        ds = im.create_dataset(username, username, 'dataset-1', 'gigantum_object_v1')
+        m = Manifest(ds, username)
+        wf = DatasetWorkflow(ds)
+        wf.publish(username=username)
+
+        helper_append_file(m.cache_mgr.cache_root, m.dataset_revision, "test1.txt", "asdfadfsdf")
+        helper_append_file(m.cache_mgr.cache_root, m.dataset_revision, "test2.txt", "fdsfgfd")
+        m.sweep_all_changes()
+        assert m.push_queue.count() == 2
+
+        with patch.object(TransferEngine, 'push', push_mock):
+            with pytest.raises(Exception):
+                wf.sync(username=username)
+
+        assert sorted(o.dataset_path for o in m.push_queue.objects()) == ['new.txt', 'test2.txt']
+        assert queued_during_push[0] in m.push_queue.objects()
 
     @responses.activate
     @mock.patch('gtmcore.gitlib.git_fs_shim.GitFilesystemShimmed.fetch', new=_mock_fetch)